@@ -173,6 +173,39 @@ if __name__ == "__main__":
                        help="specify how jobs are executed: ge = Grid Engine, "
                        "simple = use local system. Default is '%s'" %
                        runner_type)
+    group.add_argument('--queue-policy',action='store',dest='queue_policy',
+                       choices=('fifo','longest_first','group'),
+                       default='fifo',
+                       help="specify the order that jobs are started in: "
+                       "fifo = order they were found, longest_first = "
+                       "largest input files first, group = one directory "
+                       "at a time. Default is 'fifo'")
+    group.add_argument('--metrics-file',action='store',dest='metrics_file',
+                       default=None,
+                       help="append timing and resource usage metrics for "
+                       "each job to METRICS_FILE (CSV if the name ends with "
+                       "'.csv', otherwise JSON lines)")
+    group.add_argument('--pack-size',action='store',dest='pack_size',
+                       type=int,default=None,
+                       help="pack up to PACK_SIZE jobs together into each "
+                       "submitted job (useful for large numbers of short "
+                       "jobs on Grid Engine; default is not to pack jobs)")
+    group.add_argument('--max-limit',action='store',dest='max_limit',
+                       type=int,default=None,
+                       help="adjust the number of concurrent jobs to the "
+                       "load on the cluster (Grid Engine only): start with "
+                       "the value of --limit and increase up to MAX_LIMIT "
+                       "when the cluster is quiet, or decrease down to "
+                       "--min-limit when it's busy")
+    group.add_argument('--min-limit',action='store',dest='min_limit',
+                       type=int,default=1,
+                       help="lowest number of concurrent jobs when using "
+                       "--max-limit (default 1)")
+    group.add_argument('--max-pending',action='store',dest='max_pending',
+                       type=int,default=0,
+                       help="number of jobs which can be waiting in the "
+                       "cluster queue before the cluster is considered to "
+                       "be busy when using --max-limit (default 0)")
 
     # Grid engine specific options
     group = p.add_argument_group("Grid Engine-specific options")
@@ -267,10 +300,31 @@ if __name__ == "__main__":
         sys.exit(1)
     runner.set_log_dir(arguments.log_dir)
 
+    # Set up throttle for adjusting the number of concurrent jobs
+    throttle = None
+    if arguments.max_limit is not None:
+        if arguments.runner != 'ge':
+            logging.error("--max-limit can only be used with the 'ge' runner")
+            sys.exit(1)
+        # Utilities (including cluster_load) are in the same
+        # directory as this script when installed
+        sys.path.append(os.path.join(SHARE_DIR,'utils'))
+        from cluster_load import cluster_usage
+        throttle = Pipeline.AdaptiveThrottle(
+            arguments.min_limit,
+            arguments.max_limit,
+            lambda queue=arguments.ge_queue: cluster_usage(queue=queue),
+            interval=poll_interval,
+            max_pending=arguments.max_pending)
+
     # Set up and run pipeline
     pipeline = Pipeline.PipelineRunner(runner,
                                        max_concurrent_jobs=\
                                        arguments.max_concurrent_jobs,
+                                       queue_policy=arguments.queue_policy,
+                                       metrics_file=arguments.metrics_file,
+                                       pack_size=arguments.pack_size,
+                                       throttle=throttle,
                                        jobCompletionHandler=JobCleanup,
                                        groupCompletionHandler=\
                                        lambda group,jobs,email=\
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+#
+#     AsyncJobRunner.py: asyncio interface to job runners
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# AsyncJobRunner.py
+#
+#########################################################################
+
+"""
+Asyncio interface for starting and waiting for jobs.
+
+Class AsyncJobRunner wraps any of the job runners from the 'JobRunner'
+module and provides coroutines to submit jobs and wait for them to
+complete from within an asyncio event loop, for example:
+
+>>> import asyncio
+>>> from bcftbx.JobRunner import GEJobRunner
+>>> from bcftbx.AsyncJobRunner import AsyncJobRunner
+>>> async def main():
+...     runner = AsyncJobRunner(GEJobRunner())
+...     job_ids = [await runner.submit('job%d' % i,'/data','qc.sh',(i,))
+...                for i in range(10)]
+...     async for job_id in runner.as_completed(job_ids):
+...         print("%s finished: %s" % (job_id,await runner.wait(job_id)))
+>>> asyncio.get_event_loop().run_until_complete(main())
+
+The status of all the jobs being waited for is checked by a single
+polling task for each AsyncJobRunner (which uses the 'list' and
+'wait_for_completion' methods of the underlying runner), so the cost
+of polling doesn't depend on the number of waiting coroutines. The
+polling task is started when a coroutine starts waiting for a job, and
+stops when there are no jobs left to wait for.
+
+Calls to the underlying runner (which may block, e.g. while running
+'qsub') are made in threads via the event loop's default executor.
+
+The 'run_pipeline' coroutine runs a 'PipelineRunner' using an
+AsyncJobRunner (see also the 'run_async' method of 'PipelineRunner').
+
+This module requires Python 3.6 or later.
+"""
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import asyncio
+import weakref
+import logging
+
+#######################################################################
+# Classes
+#######################################################################
+
+class AsyncJobRunner(object):
+    """Asyncio wrapper for a job runner
+
+    Provides coroutines for submitting jobs to the
+    underlying runner ('submit', 'submit_array',
+    'submit_many'), for waiting for jobs to complete
+    ('wait', 'wait_any' and the asynchronous iterator
+    returned by 'as_completed') and for terminating jobs
+    ('terminate').
+    """
+    def __init__(self,runner,poll_interval=5.0):
+        """Create a new AsyncJobRunner instance
+
+        Arguments:
+          runner: JobRunner instance to wrap
+          poll_interval: maximum time (in seconds) to wait
+            between checks on the status of the jobs (the
+            runner's 'wait_for_completion' method is used to
+            check sooner where possible; default 5s)
+        """
+        self.runner = runner
+        self.poll_interval = poll_interval
+        # Futures for the jobs being waited for
+        self._waiters = {}
+        # Polling task (and the loop it runs in)
+        self._poller = None
+        self._loop = None
+        # Number of times the job statuses have been checked
+        self.npolls = 0
+
+    def __repr__(self):
+        return "AsyncJobRunner(%r)" % self.runner
+
+    async def submit(self,name,working_dir,script,args):
+        """Submit a job to the runner
+
+        Arguments:
+          name: name to give the job
+          working_dir: directory to run the job in
+          script: script (or command) to run
+          args: list of arguments for the script
+
+        Returns:
+          Job id for the new job (or None if the job
+          failed to start).
+        """
+        return await self._call(self.runner.run,name,working_dir,
+                                script,args)
+
+    async def submit_array(self,name,working_dir,script,args_list):
+        """Submit multiple jobs running the same script
+
+        Uses the runner's 'run_array' method.
+
+        Returns:
+          List of job ids (one for each set of arguments).
+        """
+        return await self._call(self.runner.run_array,name,working_dir,
+                                script,args_list)
+
+    async def submit_many(self,jobs):
+        """Submit multiple jobs with arbitrary scripts
+
+        Uses the runner's 'run_many' method.
+
+        Arguments:
+          jobs: list of tuples of the form
+            (name,working_dir,script,args)
+
+        Returns:
+          List of job ids (in the same order as the jobs).
+        """
+        return await self._call(self.runner.run_many,jobs)
+
+    async def terminate(self,job_id):
+        """Terminate a job
+
+        Returns:
+          Value returned by the runner's 'terminate'
+          method.
+        """
+        return await self._call(self.runner.terminate,job_id)
+
+    async def wait(self,job_id):
+        """Wait for a job to complete
+
+        Returns:
+          Exit status of the job.
+        """
+        return await self._watch(job_id)
+
+    async def wait_any(self,job_ids):
+        """Wait for at least one of a set of jobs to complete
+
+        Arguments:
+          job_ids: list of job ids to wait for
+
+        Returns:
+          List of the ids of the jobs which have completed.
+        """
+        futures = dict([(self._watch(job_id),job_id)
+                        for job_id in job_ids])
+        if not futures:
+            return []
+        done,pending = await asyncio.wait(
+            list(futures.keys()),
+            return_when=asyncio.FIRST_COMPLETED)
+        for future in pending:
+            future.cancel()
+        return [futures[future] for future in done]
+
+    async def as_completed(self,job_ids):
+        """Iterate over jobs as they complete
+
+        Asynchronous generator which yields the ids of the
+        supplied jobs in the order that they complete, e.g.
+
+        >>> async for job_id in runner.as_completed(job_ids):
+        ...     print("%s finished" % job_id)
+
+        Arguments:
+          job_ids: list of job ids
+        """
+        completed = asyncio.Queue()
+        futures = []
+        for job_id in job_ids:
+            future = self._watch(job_id)
+            future.add_done_callback(
+                lambda f,job_id=job_id: completed.put_nowait(job_id))
+            futures.append(future)
+        try:
+            for i in range(len(futures)):
+                yield await completed.get()
+        finally:
+            # Stop waiting for the remaining jobs if the
+            # iteration is abandoned
+            for future in futures:
+                future.cancel()
+
+    async def _call(self,f,*args):
+        """Internal: call a runner method in the default executor
+        """
+        return await asyncio.get_event_loop().run_in_executor(None,f,*args)
+
+    def _watch(self,job_id):
+        """Internal: return a future for the completion of a job
+
+        Starts the polling task if it isn't already running.
+        """
+        loop = asyncio.get_event_loop()
+        if loop is not self._loop:
+            # Futures can't be shared between event loops
+            self._waiters = {}
+            self._poller = None
+            self._loop = loop
+        future = loop.create_future()
+        self._waiters.setdefault(job_id,[]).append(future)
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll())
+        return future
+
+    def _check_jobs(self,job_ids):
+        """Internal: check which of a set of jobs have finished
+
+        Runs in the executor: fetches the list of running jobs
+        from the runner once, and then the exit status of each
+        job which is no longer running.
+
+        Returns:
+          Dictionary mapping the ids of finished jobs to their
+          exit status.
+        """
+        self.npolls += 1
+        running = set(self.runner.list())
+        return dict([(job_id,self.runner.exit_status(job_id))
+                     for job_id in job_ids if job_id not in running])
+
+    async def _poll(self):
+        """Internal: check the status of the waited-for jobs
+
+        Runs as a task until there are no jobs left to wait
+        for, resolving the futures for each job as it
+        finishes.
+        """
+        while True:
+            # Discard abandoned waiters
+            for job_id in list(self._waiters.keys()):
+                futures = [f for f in self._waiters[job_id] if not f.done()]
+                if futures:
+                    self._waiters[job_id] = futures
+                else:
+                    del(self._waiters[job_id])
+            if not self._waiters:
+                break
+            try:
+                finished = await self._call(self._check_jobs,
+                                            list(self._waiters.keys()))
+            except Exception as ex:
+                # Pass the error on to all the waiters
+                logging.error("AsyncJobRunner: failed to check job "
+                              "status: %s" % ex)
+                for job_id in list(self._waiters.keys()):
+                    for future in self._waiters.pop(job_id):
+                        if not future.done():
+                            future.set_exception(ex)
+                break
+            for job_id in finished:
+                for future in self._waiters.pop(job_id,[]):
+                    if not future.done():
+                        future.set_result(finished[job_id])
+            if self._waiters and not finished:
+                await self._call(self.runner.wait_for_completion,
+                                 self.poll_interval)
+
+#######################################################################
+# Functions
+#######################################################################
+
+# AsyncJobRunners for each job runner
+_async_runners = weakref.WeakKeyDictionary()
+
+def async_runner(runner,poll_interval=5.0):
+    """Return the shared AsyncJobRunner for a job runner
+
+    Creates a new AsyncJobRunner the first time it is called
+    for a runner, and returns the same instance for subsequent
+    calls (so that all the coroutines waiting for jobs from
+    the runner share the same polling task).
+
+    Arguments:
+      runner: JobRunner instance
+      poll_interval: maximum time (in seconds) between
+        checks on the jobs (only used when a new instance
+        is created)
+    """
+    try:
+        return _async_runners[runner]
+    except KeyError:
+        _async_runners[runner] = AsyncJobRunner(runner,
+                                                poll_interval=poll_interval)
+        return _async_runners[runner]
+
+async def run_pipeline(pipeline):
+    """Run a PipelineRunner from an asyncio event loop
+
+    Starts the pipeline and then updates it each time one
+    of its running jobs completes (as reported by the shared
+    AsyncJobRunner for the pipeline's runner), until all the
+    jobs have finished. The pipeline's 'poll_interval' is used
+    as the maximum time between checks.
+
+    Arguments:
+      pipeline: PipelineRunner instance
+    """
+    runner = async_runner(pipeline.runner,
+                          poll_interval=pipeline.poll_interval)
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None,pipeline.run,False)
+    while pipeline.nWaiting() > 0 or pipeline.nRunning() > 0:
+        job_ids = [job.job_id for job in pipeline.running
+                   if job.job_id is not None]
+        if job_ids:
+            await runner.wait_any(job_ids)
+        else:
+            await asyncio.sleep(pipeline.poll_interval)
+        await loop.run_in_executor(None,pipeline.update)
+    print("Pipeline completed")
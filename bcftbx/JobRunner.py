@@ -16,6 +16,10 @@ Class BaseJobRunner is a template with methods that need to be implemented
 by subclasses. The subclasses implemented here are:
 
 * SimpleJobRunner: run jobs (e.g. scripts) on a local file system.
+* LocalSchedulerRunner: run jobs on a local system within a fixed
+                   number of cores, queueing jobs until slots are free
+* PythonFunctionRunner: run Python callables in a persistent pool of
+                   worker processes
 * GEJobRunner    : run jobs using Grid Engine (GE) i.e. qsub, qdel etc
 
 A single JobRunner instance can be used to start and manage multiple processes.
@@ -26,6 +30,34 @@ methods to check on and control the job.
 
 The runner's 'list' method returns a list of running job ids.
 
+The 'wait_for_completion' method blocks until one of the runner's jobs
+may have completed (or until a timeout is reached), so that callers can
+react to completions promptly without polling at a fixed interval:
+'SimpleJobRunner' is notified by a watcher thread for each job, while
+'GEJobRunner' checks for exit code files (or journal records) using an
+interval which starts short after each submission and backs off while
+no jobs complete.
+
+Multiple jobs which run the same script with different arguments can
+be started together using the 'run_array' method, which returns a list
+of job ids (one for each set of arguments). For 'GEJobRunner' this is
+submitted as a single Grid Engine array job, with each task having an
+id of the form 'JOBID.TASKID'.
+
+Multiple jobs with arbitrary scripts can be started together using the
+'run_many' method, which also returns a list of job ids (in the same order
+as the jobs were supplied). For 'GEJobRunner' the 'qsub' commands are run
+concurrently using a pool of threads, and submissions which fail because
+the Grid Engine master cannot be contacted are retried.
+
+Many short jobs can be packed into a single job using the 'run_pack'
+method, which runs the jobs one after another (or a few at a time)
+within the same job and returns a list of job ids (one for each of the
+packed jobs, which are each tracked separately). For 'GEJobRunner' this
+is submitted as a single Grid Engine job, with each packed job having
+an id of the form 'JOBID-N' and its own log files; other runners start
+the jobs separately using 'run_many'.
+
 Simple usage example:
 
 >>> # Create a JobRunner instance
@@ -51,6 +83,12 @@ specify more cores, for example:
 
 >>> multicore_runner = SimpleJobRunner(nslots=4)
 
+For 'LocalSchedulerRunner' the 'nslots' option sets the default number
+of slots used by each job, and jobs are only started when there are
+enough free slots within the runner's total number of cores:
+
+>>> local_runner = LocalSchedulerRunner(cores=64,nslots=4)
+
 For 'GEJobRunner' instances the number of cores is set by specifying
 '-pe smp.pe' as part of the 'ge_extra_args' option, for example:
 
@@ -63,9 +101,12 @@ For 'GEJobRunner' instances the number of cores is set by specifying
 #######################################################################
 
 from builtins import str
+import sys
 import os
 import io
 import logging
+import importlib
+import traceback
 import subprocess
 import time
 import tempfile
@@ -73,6 +114,15 @@ import shutil
 import atexit
 import uuid
 import random
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from os import scandir
+except ImportError:
+    # Python 2: use backport
+    from scandir import scandir
 
 #######################################################################
 # Classes
@@ -99,7 +149,15 @@ class BaseJobRunner(object):
     Optionally it can also implement the methods:
 
       errorState: indicates if running job is in an "error state"
+      list_error_state: lists the job ids in an "error state"
       isRunning : checks if a specific job is running
+      run_array : starts multiple jobs running the same script
+      run_many  : starts multiple jobs running arbitrary scripts
+      run_pack  : starts multiple jobs packed into a single job
+      wait_for_completion: waits until a job may have completed
+      metrics   : returns resource usage and timings for a job
+      checkpoint: returns data needed to reattach to running jobs
+      reattach  : reattaches to jobs from a checkpoint
 
     if the default implementations are not sufficient.
     """
@@ -121,6 +179,76 @@ class BaseJobRunner(object):
         """
         raise NotImplementedError("Subclass must implement 'run'")
 
+    def run_array(self,name,working_dir,script,args_list,names=None):
+        """Start multiple jobs running the same script
+
+        The default implementation starts a separate job for
+        each set of arguments using 'run'.
+
+        Arguments:
+          name: Name to give the jobs
+          working_dir: Directory to run the jobs in
+          script: Script file to run
+          args_list: List of argument lists, one for each job
+          names: (optional) list of names for each of the jobs
+            (used instead of 'name' for the individual jobs)
+
+        Returns:
+          List of job ids (one for each set of arguments), with
+          None for any job that failed to start
+        """
+        if names is None:
+            names = [name]*len(args_list)
+        return [self.run(job_name,working_dir,script,args)
+                for job_name,args in zip(names,args_list)]
+
+    def run_many(self,jobs):
+        """Start multiple jobs running
+
+        The default implementation starts each job in turn
+        using 'run'.
+
+        Arguments:
+          jobs: List of tuples of the form
+            (name,working_dir,script,args), one for each
+            job (see 'run' for the meaning of each item)
+
+        Returns:
+          List of job ids (one for each job, in the same order
+          as the jobs were supplied), with None for any job
+          that failed to start
+        """
+        return [self.run(name,working_dir,script,args)
+                for name,working_dir,script,args in jobs]
+
+    def run_pack(self,name,jobs,nparallel=1):
+        """Start multiple jobs packed into a single job
+
+        Packing is intended for large numbers of short jobs,
+        where the overhead of starting each one separately
+        (e.g. waiting in a batch queue) is significant. Each
+        of the packed jobs still has its own job id, log
+        files and exit status.
+
+        The default implementation doesn't do any packing and
+        starts the jobs separately using 'run_many'.
+
+        Arguments:
+          name: Name to give the packed job
+          jobs: List of tuples of the form
+            (name,working_dir,script,args), one for each
+            job (see 'run' for the meaning of each item)
+          nparallel: maximum number of the jobs to run at
+            the same time within the packed job (default: 1,
+            i.e. run the jobs one after the other)
+
+        Returns:
+          List of job ids (one for each job, in the same order
+          as the jobs were supplied), with None for any job
+          that failed to start
+        """
+        return self.run_many(jobs)
+
     def terminate(self,job_id):
         """Terminate a job
 
@@ -159,6 +287,97 @@ class BaseJobRunner(object):
         """
         return False
 
+    def list_error_state(self):
+        """Return a list of job ids which are in an error state
+
+        The default implementation checks each of the
+        running jobs using 'errorState'.
+        """
+        return [job_id for job_id in self.list()
+                if self.errorState(job_id)]
+
+    def metrics(self,job_id):
+        """Return resource usage and timing metrics for a job
+
+        Returns a dictionary with whichever of the following
+        items are available for the job:
+
+          submit_time: time the job was submitted (seconds
+                       since the epoch)
+          start_time : time the job started running
+          end_time   : time the job finished
+          queue      : queue that the job ran in
+          nslots     : number of slots used by the job
+          max_rss    : peak resident memory used (kB)
+          cpu_time   : CPU time used (user plus system, in
+                       seconds)
+
+        The default implementation returns an empty
+        dictionary.
+        """
+        return {}
+
+    def wait_for_completion(self,timeout):
+        """Wait until a job may have completed
+
+        Blocks until at least one of the runner's jobs may
+        have completed, or until 'timeout' seconds have
+        passed. The status of the jobs should be checked
+        afterwards in either case.
+
+        The default implementation simply waits for the
+        timeout period.
+
+        Arguments:
+          timeout: maximum time to wait (in seconds)
+
+        Returns:
+          True if a job may have completed, False if the
+          timeout was reached.
+        """
+        time.sleep(timeout)
+        return False
+
+    def checkpoint(self):
+        """Return data needed to reattach to the runner's jobs
+
+        Returns a dictionary (which can be serialised as
+        JSON) which can be passed to the 'reattach' method of
+        a new runner instance, for example after the program
+        which created the jobs has exited.
+
+        The default implementation returns None, indicating
+        that the runner doesn't support reattaching to jobs.
+        """
+        return None
+
+    def reattach(self,state):
+        """Reattach to jobs from a checkpoint
+
+        Arguments:
+          state: dictionary returned from the 'checkpoint'
+            method of another instance of the runner
+
+        Returns:
+          List of the ids of the jobs which were reattached
+          (the default implementation doesn't reattach any
+          jobs).
+        """
+        return []
+
+    def settings(self):
+        """Return the settings needed to recreate the runner
+
+        Returns a dictionary (which can be serialised as
+        JSON) of the keyword arguments which, along with the
+        runner's definition (i.e. its 'repr'), are needed to
+        create an equivalent runner via 'fetch_runner'.
+
+        The default implementation returns an empty
+        dictionary (i.e. the definition is sufficient).
+        """
+        return {}
+
     def exit_status(self,job_id):
         """Return the exit status code for the command
 
@@ -190,6 +409,10 @@ class SimpleJobRunner(BaseJobRunner):
     SimpleJobRunner starts jobs as processes on a local system;
     the status of jobs is determined using the Linux 'ps eu'
     command, and jobs are terminated using 'kill -9'.
+
+    Each job also has a watcher thread which waits for the
+    process to exit, so that 'wait_for_completion' returns as
+    soon as a job finishes.
     """
 
     def __init__(self,log_dir=None,join_logs=False,nslots=1):
@@ -223,8 +446,11 @@ class SimpleJobRunner(BaseJobRunner):
         self.__err_fp = {}
         self.__exit_status = {}
         self.__job_popen = {}
+        self.__metrics = {}
         # Job id lock
         self.__job_lock = ResourceLock()
+        # Signals job completion
+        self.__job_completed = threading.Event()
 
     def __repr__(self):
         name = 'SimpleJobRunner'
@@ -282,12 +508,16 @@ class SimpleJobRunner(BaseJobRunner):
         env = os.environ.copy()
         env['BCFTBX_RUNNER_NSLOTS'] = "%s" % self.nslots
         # Start the subprocess
+        start_time = time.time()
         p = subprocess.Popen(cmd,
                              cwd=working_dir,
                              stdout=log,stderr=err,
                              env=env)
         # Capture the job id from the output
         job_id = str(p.pid)
+        self.__metrics[job_id] = dict(submit_time=start_time,
+                                      start_time=start_time,
+                                      nslots=self.nslots)
         logging.debug("SimpleJobRunner: done - job id = %s" % job_id)
         # Do internal house keeping
         self.__job_list.append(job_id)
@@ -303,9 +533,49 @@ class SimpleJobRunner(BaseJobRunner):
         # Store name against job id
         if job_id is not None:
             self.__names[job_id] = name
+        # Watch for the job completing
+        watcher = threading.Thread(target=self.__watch_job,
+                                   args=(job_id,p))
+        watcher.daemon = True
+        watcher.start()
         # Return the job id
         return job_id
 
+    def __watch_job(self,job_id,p):
+        """Internal: wait for a job process to exit
+
+        Runs in a separate thread for each job: records the
+        resource usage of the process when it exits, and
+        signals 'wait_for_completion'.
+
+        This thread is the only one which waits for the
+        process (other methods check its 'returncode').
+        """
+        status,rusage = _wait_for_process(p)
+        self.__metrics[job_id]['end_time'] = time.time()
+        self.__metrics[job_id].update(_rusage_metrics(rusage))
+        p.returncode = status
+        self.__job_completed.set()
+
+    def wait_for_completion(self,timeout):
+        """Wait until a job may have completed
+
+        Returns as soon as any job started by the runner
+        has exited (or if one has exited since the last
+        call), or after 'timeout' seconds.
+
+        Arguments:
+          timeout: maximum time to wait (in seconds)
+
+        Returns:
+          True if a job has completed, False if the timeout
+          was reached.
+        """
+        if self.__job_completed.wait(timeout):
+            self.__job_completed.clear()
+            return True
+        return False
+
     def terminate(self,job_id):
         """Kill a running job using 'kill -9'
         """
@@ -317,7 +587,9 @@ class SimpleJobRunner(BaseJobRunner):
         logging.debug("KillJob: deleting job")
         p = self.__job_popen[job_id]
         p.terminate()
-        p.wait()
+        # Wait for the watcher to collect the process
+        while p.returncode is None:
+            time.sleep(0.01)
         if job_id not in self.list():
             logging.debug("KillJob: deleted job %s" % job_id)
             return True
@@ -366,7 +638,7 @@ class SimpleJobRunner(BaseJobRunner):
                               job_id)
                 self.__job_lock.release(lock)
                 continue
-            status = p.poll()
+            status = p.returncode
             if status is None:
                 job_ids.append(job_id)
             else:
@@ -396,6 +668,23 @@ class SimpleJobRunner(BaseJobRunner):
             self.__job_lock.release(lock)
         return job_ids
 
+    def list_error_state(self):
+        """Return a list of job ids which are in an error state
+
+        Jobs run by this runner are never in an error state,
+        so always returns an empty list.
+        """
+        return []
+
+    def metrics(self,job_id):
+        """Return resource usage and timing metrics for a job
+
+        The peak memory and CPU time are only available once
+        the job has finished (see 'BaseJobRunner.metrics' for
+        the items returned).
+        """
+        return dict(self.__metrics.get(job_id,{}))
+
     def exit_status(self,job_id):
         """Return exit status from command run by a job
         """
@@ -427,239 +716,1413 @@ class SimpleJobRunner(BaseJobRunner):
         self.__log_id += 1
         return (log_file,error_file)
 
-class GEJobRunner(BaseJobRunner):
-    """Class implementing job runner for Grid Engine
-
-    GEJobRunner submits jobs to a Grid Engine cluster using the
-    'qsub' command, determines the status of jobs using 'qstat'
-    and terminates then using 'qdel'.
-
-    Additionally the runner can be configured for a specific GE
-    queue on initialisation.
-
-    Each GEJobRunner instance creates a temporary directory which
-    it uses for internal admin; this will be removed at program
-    exit via 'atexit'.
+class LocalSchedulerRunner(BaseJobRunner):
+    """Class implementing a slot-aware job runner for a local system
+
+    LocalSchedulerRunner runs jobs as processes on the local
+    system (in the same way as SimpleJobRunner), but keeps a
+    budget of cores (by default the number of CPUs on the
+    system). Each job uses a number of slots (by default the
+    'nslots' value for the runner, which can be overridden for
+    individual jobs when they are submitted); jobs which would
+    exceed the budget are queued, and are started in order of
+    submission as running jobs finish and release their slots.
+
+    A job which needs more slots than are free blocks the jobs
+    queued behind it (so that jobs needing many slots aren't
+    starved by a stream of smaller jobs).
+
+    Optionally each job can be pinned to its own set of CPUs
+    (via 'sched_setaffinity', where this is available) so that
+    concurrent jobs don't compete for the same cores.
+
+    Jobs which are queued or running are reported as running
+    by 'isRunning' and 'list'; job ids are assigned when jobs
+    are submitted (rather than being the process ids).
     """
 
-    def __init__(self,queue=None,log_dir=None,ge_extra_args=None,
-                 poll_interval=5.0,timeout=30.0):
-        """Create a new GEJobRunner instance
+    def __init__(self,cores=None,log_dir=None,join_logs=False,nslots=1,
+                 pin_cpus=False):
+        """Create a new LocalSchedulerRunner instance
 
         Arguments:
-          queue:   Name of GE queue to use (set to 'None' to use default queue)
-          log_dir: Directory to write log files to (set to 'None' to use cwd)
-          ge_extra_args: Arbitrary additional arguments to supply to qsub
-          poll_interval: time interval to use when polling Grid Engine e.g.
-            to acquire qacct information (default 5s)
-          timeout: maximum length of time to wait before giving up when
-            polling Grid Engine (default 30s)
+          cores: Total number of slots available to jobs run by
+                 the runner (defaults to the number of CPUs)
+          log_dir: Directory to write log files to (set to 'None' to
+                   use cwd)
+          join_logs: Combine stderr and stdout into a single log file
+                   (by default stdout and stderr have their own log
+                   files)
+          nslots: Default number of slots used by each job
+          pin_cpus: if True then set the CPU affinity of each job
+                   to the set of CPUs assigned to it
         """
-        # Internal parameters
-        self.__admin_dir = self.__make_admin_dir()
-        self.__job_count = 0
-        self.__shell = "/bin/bash"
-        self.__ge_queue = queue
+        # Total number of cores
+        if cores is None:
+            cores = multiprocessing.cpu_count()
+        self.__cores = int(cores)
+        # Default number of slots per job
+        self.__nslots = nslots
         # Directory for log files
         self.set_log_dir(log_dir)
-        # Keep track of data (names, log dirs etc) for each job
-        self.__job_number = {}
+        # Join stderr to stdout
+        self.__join_logs = join_logs
+        # Base log id
+        self.__log_id = int(time.time())
+        # CPUs available for pinning jobs
+        self.__pin_cpus = pin_cpus
+        self.__free_cpus = None
+        if self.__pin_cpus:
+            try:
+                cpus = sorted(os.sched_getaffinity(0))
+            except AttributeError:
+                logging.warning("LocalSchedulerRunner: CPU affinity not "
+                                "supported on this system, jobs won't "
+                                "be pinned")
+                self.__pin_cpus = False
+            else:
+                if len(cpus) < self.__cores:
+                    logging.warning("LocalSchedulerRunner: only %d CPUs "
+                                    "available for %d cores, jobs won't "
+                                    "be pinned" % (len(cpus),self.__cores))
+                    self.__pin_cpus = False
+                else:
+                    self.__free_cpus = cpus[:self.__cores]
+        # Job data
+        self.__next_job_number = 0
         self.__names = {}
-        self.__log_dirs = {}
-        self.__error_state = {}
+        self.__job_nslots = {}
+        self.__job_cmd = {}
+        self.__working_dirs = {}
+        self.__log_files = {}
+        self.__err_files = {}
+        self.__job_cpus = {}
+        self.__job_popen = {}
         self.__exit_status = {}
-        self.__finalizing = {}
-        self.__queue = {}
-        self.__start_time = {}
-        self.__ge_extra_args = ge_extra_args
-        # Job id lock
-        self.__job_lock = ResourceLock()
-        # Job grace period lock
-        self.__updating_grace_period = ResourceLock()
-        # Job submission lock
-        self.__submit_lock = ResourceLock()
-        # Cached job list
-        self.__cached_job_list_lifetime = 2.0
-        self.__cached_job_list_timestamp = 0.0
-        self.__cached_job_list = []
-        self.__cached_job_list_force_update = True
-        # Cached qstat output
-        self.__cached_qstat_output_lifetime = 2.0
-        self.__cached_qstat_output_timestamp = 0.0
-        self.__cached_qstat_output = None
-        # Grace period for new jobs
-        self.__new_job_grace_period = 2.0
-        # Polling intervals and timeout periods (seconds)
-        self.__ge_poll_interval = poll_interval
-        self.__ge_timeout = timeout
-        # Register clean up function
-        atexit.register(self.__clean_up_admin_dir)
+        self.__metrics = {}
+        # Queue of jobs waiting for slots
+        self.__queue = []
+        # Number of slots currently in use
+        self.__slots_in_use = 0
+        # Lock for the scheduler state
+        self.__lock = threading.RLock()
+        # Signals job completion
+        self.__job_completed = threading.Event()
 
     def __repr__(self):
-        name = 'GEJobRunner'
-        if self.__ge_extra_args is not None:
-            name += '(%s)' % ' '.join(self.__ge_extra_args)
+        name = 'LocalSchedulerRunner'
+        args = ['cores=%s' % self.__cores]
+        if self.__nslots > 1:
+            args.append('nslots=%s' % self.__nslots)
+        args.append('join_logs=%s' % self.__join_logs)
+        if self.__pin_cpus:
+            args.append('pin_cpus=%s' % self.__pin_cpus)
+        name += '(%s)' % ' '.join(args)
         return name
 
-    def name(self,job_id):
-        """Return the name for a job
-        """
-        return self.__names[job_id]
-
-    @property
-    def ge_extra_args(self):
-        """Return the extra GE arguments
-        """
-        return self.__ge_extra_args
-
-    @property
-    def nslots(self):
-        """Return the number of associated slots
-
-        This is extracted from the 'ge_extra_args'
-        property, by looking for qsub options of the
-        form '-pe smp.pe N' (in which case 'nslots'
-        will be N).
-        """
-        nslots = 1
-        if self.ge_extra_args is not None:
-            try:
-                i = self.ge_extra_args.index('-pe')
-                nslots = int(self.ge_extra_args[i+2])
-            except ValueError:
-                pass
-        return nslots
+    def run(self,name,working_dir,script,args,nslots=None):
+        """Queue a command to run and return the job id
 
-    def run(self,name,working_dir,script,args):
-        """Submit a script or command to the cluster via 'qsub'
+        The job is started immediately if there are enough
+        free slots, otherwise it is queued until enough of
+        the running jobs have finished.
 
         Arguments:
           name: Name to give the job
           working_dir: Directory to run the job in
           script: Script file to run
           args: List of arguments to supply to the script
+          nslots: (optional) number of slots required by the
+            job (defaults to the runner's 'nslots' value)
 
         Returns:
           Job id for submitted job, or 'None' if job failed to
           start.
         """
-        logging.debug("GEJobRunner: submitting job")
+        if nslots is None:
+            nslots = self.__nslots
+        if nslots > self.__cores:
+            logging.warning("LocalSchedulerRunner: job '%s' requested "
+                            "%d slots but only %d cores available; "
+                            "reducing to %d" % (name,nslots,self.__cores,
+                                                self.__cores))
+            nslots = self.__cores
+        logging.debug("LocalSchedulerRunner: submitting job")
         logging.debug("Name       : %s" % name)
-        logging.debug("Queue      : %s" % self.__ge_queue)
-        logging.debug("Extra args : %s" % self.__ge_extra_args)
-        logging.debug("Log dir    : %s" % self.log_dir)
         logging.debug("Working_dir: %s" % working_dir)
+        logging.debug("Log dir    : %s" % self.log_dir)
+        logging.debug("Join logs  : %s" % self.__join_logs)
+        logging.debug("Nslots     : %s" % nslots)
         logging.debug("Script     : %s" % script)
         logging.debug("Arguments  : %s" % str(args))
-        # Wait for lock on job submission
-        start_time = time.time()
-        submit_lock = None
-        while submit_lock is None:
-            submit_lock = self.__submit_lock.acquire("job_submission",
-                                                     timeout=self.__ge_timeout)
-        # Get internal job number
-        self.__job_count += 1
-        job_number = self.__job_count
-        logging.debug("Internal job count: %s" % job_number)
-        # Release the lock
-        self.__submit_lock.release(submit_lock)
-        # Build script to run the command to be submitted
-        job_dir = os.path.join(self.__admin_dir,str(job_number))
-        logging.debug("Job admin dir     : %s" % job_dir)
-        os.mkdir(job_dir)
-        cmd_args = [script]
-        for arg in args:
-            # Quote arguments containing whitespace
-            if arg.count(' ') or arg.count('\t'):
-                arg = "\"%s\"" % arg
-            cmd_args.append(arg)
-        cmd = ' '.join(cmd_args)
-        job_script = os.path.join(job_dir,"job_script.sh")
-        with io.open(job_script,'wt') as fp:
-            fp.write(u"""#!{shell}
-export BCFTBX_RUNNER_NSLOTS=$NSLOTS
-echo "$QUEUE" > {job_dir}/__queue
-echo "$BCFTBX_RUNNER_NSLOTS" > {job_dir}/__jobrunner_nslots
-{cmd}
-exit_code=$?
-echo "$exit_code" > {job_dir}/__exit_code.tmp
-mv {job_dir}/__exit_code.tmp {job_dir}/__exit_code
-exit $exit_code
-""".format(shell=self.__shell,job_dir=job_dir,cmd=cmd))
-        os.chmod(job_script,0o755)
-        # Sanitize name for GE by replacing invalid characters
-        # (colon, asterisk...)
-        ge_name = self.__ge_name(name)
-        logging.debug("GE job name: %s" % ge_name)
-        # Build qsub command to submit script
-        qsub = ['qsub','-b','y','-V','-N',ge_name]
-        if self.__ge_queue:
-            qsub.extend(('-q',self.__ge_queue))
-        if self.log_dir:
-            qsub.extend(('-o',self.log_dir,'-e',self.log_dir))
-        if not working_dir:
-            qsub.append('-cwd')
+        # Build command to be run
+        cmd = [script]
+        cmd.extend(args)
+        # Check working directory
+        if working_dir:
+            working_dir = os.path.abspath(working_dir)
+            if not os.path.exists(working_dir):
+                logging.error("LocalSchedulerRunner: working dir '%s' "
+                              "doesn't exist!" % working_dir)
+                return None
         else:
-            qsub.extend(('-wd',working_dir))
-        if self.__ge_extra_args:
-            qsub.extend(self.__ge_extra_args)
-        qsub.append(job_script)
-        logging.debug("GEJobRunner: qsub command: %s" % qsub)
-        # Run the qsub job in the current directory
-        cwd = os.getcwd()
-        # Check that this exists
-        logging.debug("GEJobRunner: executing in %s" % cwd)
-        if not os.path.exists(cwd):
-            logging.error("GEJobRunner: cwd doesn't exist!")
-            return None
-        p = subprocess.Popen(qsub,cwd=cwd,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE,
-                             universal_newlines=True)
-        stdoutdata,stderrdata = p.communicate()
-        # Check stderr
-        error = stderrdata.strip()
-        if error:
-            # Just echo error message as a warning
-            logging.warning("GEJobRunner: '%s'" % error)
-        # Capture the job id from the output
-        job_id = None
-        for line in stdoutdata.split('\n'):
-            if line.startswith('Your job'):
-                job_id = line.split()[2]
-        logging.debug("GEJobRunner: done - job id = %s" % job_id)
-        # Store internal number, name and log dir against job id
-        if job_id is not None:
-            self.__job_number[job_id] = job_number
+            working_dir = os.getcwd()
+        with self.__lock:
+            # Assign job id
+            self.__next_job_number += 1
+            job_id = str(self.__next_job_number)
+            # Store job data
             self.__names[job_id] = name
-            if self.log_dir is None:
-                self.__log_dirs[job_id] = working_dir
+            self.__job_nslots[job_id] = nslots
+            self.__job_cmd[job_id] = cmd
+            self.__working_dirs[job_id] = working_dir
+            self.__metrics[job_id] = dict(submit_time=time.time(),
+                                          nslots=nslots)
+            lognames = self.__assign_log_files(name,working_dir)
+            self.__log_files[job_id] = lognames[0]
+            if not self.__join_logs:
+                self.__err_files[job_id] = lognames[1]
             else:
-                self.__log_dirs[job_id] = self.log_dir
-            self.__start_time[job_id] = time.time()
+                self.__err_files[job_id] = None
+            # Queue the job and start jobs if possible
+            self.__queue.append(job_id)
+            self.__start_queued_jobs()
+        logging.debug("LocalSchedulerRunner: done - job id = %s" % job_id)
+        return job_id
+
+    def __start_queued_jobs(self):
+        """Internal: start queued jobs while there are free slots
+
+        Must be called with the scheduler lock held.
+        """
+        while self.__queue:
+            job_id = self.__queue[0]
+            nslots = self.__job_nslots[job_id]
+            if self.__slots_in_use + nslots > self.__cores:
+                # Not enough free slots
+                return
+            self.__queue.pop(0)
+            self.__start_job(job_id)
+
+    def __start_job(self,job_id):
+        """Internal: start the process for a queued job
+
+        Must be called with the scheduler lock held.
+        """
+        nslots = self.__job_nslots[job_id]
+        cmd = self.__job_cmd.pop(job_id)
+        # Assign CPUs
+        cpus = None
+        preexec_fn = None
+        if self.__pin_cpus:
+            cpus = self.__free_cpus[:nslots]
+            self.__free_cpus = self.__free_cpus[nslots:]
+            preexec_fn = lambda: os.sched_setaffinity(0,cpus)
+        # Set up log files
+        log = io.open(self.__log_files[job_id],'wt')
+        if not self.__join_logs:
+            err = io.open(self.__err_files[job_id],'wt')
+        else:
+            err = subprocess.STDOUT
+        # Set up the environment
+        env = os.environ.copy()
+        env['BCFTBX_RUNNER_NSLOTS'] = "%s" % nslots
+        # Start the subprocess
+        logging.debug("LocalSchedulerRunner: starting job %s: %s" %
+                      (job_id,cmd))
+        self.__metrics[job_id]['start_time'] = time.time()
+        try:
+            p = subprocess.Popen(cmd,
+                                 cwd=self.__working_dirs[job_id],
+                                 stdout=log,stderr=err,
+                                 env=env,
+                                 preexec_fn=preexec_fn)
+        except OSError as ex:
+            logging.error("LocalSchedulerRunner: failed to start job "
+                          "%s: %s" % (job_id,ex))
+            log.close()
+            if not self.__join_logs:
+                err.close()
+            if cpus is not None:
+                self.__free_cpus = sorted(self.__free_cpus + cpus)
+            self.__exit_status[job_id] = 127
+            self.__job_completed.set()
+            return
+        self.__slots_in_use += nslots
+        self.__job_cpus[job_id] = cpus
+        self.__job_popen[job_id] = p
+        # Watch for the job completing
+        watcher = threading.Thread(target=self.__watch_job,
+                                   args=(job_id,p,log,err))
+        watcher.daemon = True
+        watcher.start()
+
+    def __watch_job(self,job_id,p,log,err):
+        """Internal: wait for a job process to exit
+
+        Runs in a separate thread for each job: when the
+        process exits, records the exit status and resource
+        usage, releases the job's slots and starts any queued
+        jobs which can now run.
+        """
+        status,rusage = _wait_for_process(p)
+        log.close()
+        if not self.__join_logs:
+            err.close()
+        with self.__lock:
+            logging.debug("Job id %s: finished (%s)" % (job_id,status))
+            self.__exit_status[job_id] = status
+            self.__metrics[job_id]['end_time'] = time.time()
+            self.__metrics[job_id].update(_rusage_metrics(rusage))
+            del(self.__job_popen[job_id])
+            self.__slots_in_use -= self.__job_nslots[job_id]
+            cpus = self.__job_cpus.pop(job_id)
+            if cpus is not None:
+                self.__free_cpus = sorted(self.__free_cpus + cpus)
+            self.__start_queued_jobs()
+        self.__job_completed.set()
+
+    def wait_for_completion(self,timeout):
+        """Wait until a job may have completed
+
+        Returns as soon as any job started by the runner
+        has exited (or if one has exited since the last
+        call), or after 'timeout' seconds.
+
+        Arguments:
+          timeout: maximum time to wait (in seconds)
+
+        Returns:
+          True if a job has completed, False if the timeout
+          was reached.
+        """
+        if self.__job_completed.wait(timeout):
+            self.__job_completed.clear()
+            return True
+        return False
+
+    def terminate(self,job_id):
+        """Terminate a queued or running job
+
+        Queued jobs are removed from the queue (and given
+        an exit status of -1); running jobs are killed.
+        """
+        with self.__lock:
+            if job_id in self.__queue:
+                logging.debug("KillJob: removing queued job %s" % job_id)
+                self.__queue.remove(job_id)
+                del(self.__job_cmd[job_id])
+                self.__exit_status[job_id] = -1
+                self.__start_queued_jobs()
+                return True
+            try:
+                p = self.__job_popen[job_id]
+            except KeyError:
+                logging.debug("Don't own job %s, can't delete" % job_id)
+                return False
+        logging.debug("KillJob: deleting job")
+        p.terminate()
+        # Wait for the watcher to finish with the job
+        while self.isRunning(job_id):
+            time.sleep(0.01)
+        logging.debug("KillJob: deleted job %s" % job_id)
+        return True
+
+    @property
+    def cores(self):
+        """Return the total number of cores available to jobs
+        """
+        return self.__cores
+
+    @property
+    def nslots(self):
+        """Return the default number of slots for each job
+        """
+        return self.__nslots
+
+    @property
+    def slots_in_use(self):
+        """Return the number of slots used by running jobs
+        """
+        return self.__slots_in_use
+
+    def name(self,job_id):
+        """Return the name for a job
+        """
+        return self.__names[job_id]
+
+    def cpus(self,job_id):
+        """Return the list of CPUs a running job is pinned to
+
+        Returns None if the job isn't running or isn't
+        pinned.
+        """
+        return self.__job_cpus.get(job_id)
+
+    def logFile(self,job_id):
+        """Return the log file name for a job
+        """
+        return self.__log_files[job_id]
+
+    def errFile(self,job_id):
+        """Return the error file name for a job
+        """
+        return self.__err_files[job_id]
+
+    def list(self):
+        """Return a list of queued and running job_ids
+        """
+        with self.__lock:
+            return list(self.__queue) + list(self.__job_popen.keys())
+
+    def list_error_state(self):
+        """Return a list of job ids which are in an error state
+
+        Jobs run by this runner are never in an error state,
+        so always returns an empty list.
+        """
+        return []
+
+    def isRunning(self,job_id):
+        """Check if a job is queued or running
+
+        Returns True if job is still queued or running,
+        False if not
+        """
+        with self.__lock:
+            return (job_id in self.__queue or job_id in self.__job_popen)
+
+    def metrics(self,job_id):
+        """Return resource usage and timing metrics for a job
+
+        The time spent waiting for free slots is the
+        difference between the 'submit_time' and the
+        'start_time'; the peak memory and CPU time are only
+        available once the job has finished (see
+        'BaseJobRunner.metrics' for the items returned).
+        """
+        with self.__lock:
+            return dict(self.__metrics.get(job_id,{}))
+
+    def exit_status(self,job_id):
+        """Return exit status from command run by a job
+
+        If the job is still queued or running then returns
+        'None'.
+        """
+        with self.__lock:
+            if job_id in self.__queue or job_id in self.__job_popen:
+                return None
+            try:
+                return self.__exit_status[job_id]
+            except KeyError:
+                logging.error("Don't know anything about job %s" % job_id)
+                return None
+
+    def __assign_log_files(self,name,working_dir):
+        """Internal: return log file names for stdout and stderr
+
+        Create names based on the timestamp plus the supplied
+        'name'
+        """
+        timestamp = self.__log_id
+        log_file = "%s.o%s" % (name,timestamp)
+        error_file = "%s.e%s" % (name,timestamp)
+        if self.log_dir is None:
+            log_dir = working_dir
+        else:
+            log_dir = self.log_dir
+        log_file = os.path.join(log_dir,log_file)
+        error_file = os.path.join(log_dir,error_file)
+        self.__log_id += 1
+        return (log_file,error_file)
+
+class PythonFunctionRunner(BaseJobRunner):
+    """Class implementing job runner for Python callables
+
+    PythonFunctionRunner runs Python functions (rather than
+    scripts) in a persistent pool of worker processes (via
+    'concurrent.futures.ProcessPoolExecutor'), so that short
+    tasks don't pay the cost of starting a new process and
+    Python interpreter for each job.
+
+    The 'script' supplied to 'run' can be either a callable
+    which can be pickled (e.g. a function defined at the top
+    level of a module), or a string giving the import path to
+    a callable (either 'package.module.function' or
+    'package.module:function'); it is called with the supplied
+    arguments in the working directory for the job. The
+    stdout and stderr of the worker process are redirected to
+    the job's log files while the function runs (at the file
+    descriptor level, so output from subprocesses and
+    extension modules is also captured).
+
+    The exit status of the job is the value returned by the
+    function if this is an integer (or the code supplied to
+    'sys.exit'), zero if it returns any other value, or one
+    if it raises an exception (in which case the traceback is
+    written to the job's stderr). If the callable can't be
+    imported then the exit status is 127.
+
+    Jobs can only be terminated before they've started
+    running.
+
+    The worker processes are started when the first job is
+    submitted, and persist until 'shutdown' is called (or the
+    program exits).
+    """
+
+    def __init__(self,max_workers=None,log_dir=None,join_logs=False,
+                 nslots=1):
+        """Create a new PythonFunctionRunner instance
+
+        Arguments:
+          max_workers: Number of worker processes (defaults to
+                   the number of CPUs)
+          log_dir: Directory to write log files to (set to 'None' to
+                   use cwd)
+          join_logs: Combine stderr and stdout into a single log file
+                   (by default stdout and stderr have their own log
+                   files)
+          nslots: Number of threads associated with this runner
+                   instance
+        """
+        if max_workers is None:
+            max_workers = multiprocessing.cpu_count()
+        self.__max_workers = max_workers
+        self.__executor = None
+        # Directory for log files
+        self.set_log_dir(log_dir)
+        # Join stderr to stdout
+        self.__join_logs = join_logs
+        # Number of slots
+        self.__nslots = nslots
+        # Base log id
+        self.__log_id = int(time.time())
+        # Job data
+        self.__next_job_number = 0
+        self.__names = {}
+        self.__log_files = {}
+        self.__err_files = {}
+        self.__futures = {}
+        self.__submit_times = {}
+        # Signals job completion
+        self.__job_completed = threading.Event()
+
+    def __repr__(self):
+        name = 'PythonFunctionRunner'
+        args = ['max_workers=%s' % self.__max_workers]
+        if self.__nslots > 1:
+            args.append('nslots=%s' % self.__nslots)
+        args.append('join_logs=%s' % self.__join_logs)
+        name += '(%s)' % ' '.join(args)
+        return name
+
+    def run(self,name,working_dir,script,args):
+        """Submit a Python callable to run and return the job id
+
+        Arguments:
+          name: Name to give the job
+          working_dir: Directory to run the job in
+          script: Callable (or import path of a callable) to
+            run
+          args: List of arguments to supply to the callable
+
+        Returns:
+          Job id for submitted job, or 'None' if job failed to
+          start.
+        """
+        logging.debug("PythonFunctionRunner: submitting job")
+        logging.debug("Name       : %s" % name)
+        logging.debug("Working_dir: %s" % working_dir)
+        logging.debug("Log dir    : %s" % self.log_dir)
+        logging.debug("Join logs  : %s" % self.__join_logs)
+        logging.debug("Function   : %s" % script)
+        logging.debug("Arguments  : %s" % str(args))
+        # Check working directory
+        if working_dir:
+            working_dir = os.path.abspath(working_dir)
+            if not os.path.exists(working_dir):
+                logging.error("PythonFunctionRunner: working dir '%s' "
+                              "doesn't exist!" % working_dir)
+                return None
+        else:
+            working_dir = os.getcwd()
+        # Set up log files
+        log_file,err_file = self.__assign_log_files(name,working_dir)
+        if self.__join_logs:
+            err_file = None
+        # Submit to the pool
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(
+                max_workers=self.__max_workers)
+        submit_time = time.time()
+        try:
+            future = self.__executor.submit(_timed_python_function,
+                                            script,
+                                            tuple(args),
+                                            working_dir,
+                                            log_file,
+                                            err_file,
+                                            self.__nslots)
+        except Exception as ex:
+            logging.error("PythonFunctionRunner: failed to submit "
+                          "job: %s" % ex)
+            return None
+        # Assign job id
+        self.__next_job_number += 1
+        job_id = str(self.__next_job_number)
+        self.__names[job_id] = name
+        self.__log_files[job_id] = log_file
+        self.__err_files[job_id] = err_file
+        self.__futures[job_id] = future
+        self.__submit_times[job_id] = submit_time
+        future.add_done_callback(lambda f: self.__job_completed.set())
+        logging.debug("PythonFunctionRunner: done - job id = %s" % job_id)
+        return job_id
+
+    def wait_for_completion(self,timeout):
+        """Wait until a job may have completed
+
+        Returns as soon as any job submitted to the runner
+        has finished (or if one has finished since the last
+        call), or after 'timeout' seconds.
+
+        Arguments:
+          timeout: maximum time to wait (in seconds)
+
+        Returns:
+          True if a job has completed, False if the timeout
+          was reached.
+        """
+        if self.__job_completed.wait(timeout):
+            self.__job_completed.clear()
+            return True
+        return False
+
+    def terminate(self,job_id):
+        """Cancel a job which hasn't started running yet
+
+        Returns True if the job was cancelled, False if
+        it's already running (or has finished).
+        """
+        try:
+            future = self.__futures[job_id]
+        except KeyError:
+            logging.debug("Don't own job %s, can't delete" % job_id)
+            return False
+        if future.cancel():
+            logging.debug("KillJob: cancelled job %s" % job_id)
+            return True
+        logging.warning("PythonFunctionRunner: unable to terminate "
+                        "job %s (already running or finished)" % job_id)
+        return False
+
+    def shutdown(self,wait=True):
+        """Shut down the pool of worker processes
+
+        Arguments:
+          wait: if True (the default) then wait for jobs
+            which are running or queued to finish
+        """
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=wait)
+            self.__executor = None
+
+    @property
+    def max_workers(self):
+        """Return the number of worker processes
+        """
+        return self.__max_workers
+
+    @property
+    def nslots(self):
+        """Return the number of associated slots
+        """
+        return self.__nslots
+
+    def name(self,job_id):
+        """Return the name for a job
+        """
+        return self.__names[job_id]
+
+    def logFile(self,job_id):
+        """Return the log file name for a job
+        """
+        return self.__log_files[job_id]
+
+    def errFile(self,job_id):
+        """Return the error file name for a job
+        """
+        return self.__err_files[job_id]
+
+    def list(self):
+        """Return a list of queued and running job_ids
+        """
+        return [job_id for job_id in list(self.__futures.keys())
+                if not self.__futures[job_id].done()]
+
+    def list_error_state(self):
+        """Return a list of job ids which are in an error state
+
+        Jobs run by this runner are never in an error state,
+        so always returns an empty list.
+        """
+        return []
+
+    def isRunning(self,job_id):
+        """Check if a job is queued or running
+
+        Returns True if job is still queued or running,
+        False if not
+        """
+        try:
+            return not self.__futures[job_id].done()
+        except KeyError:
+            return False
+
+    def exit_status(self,job_id):
+        """Return exit status from function run by a job
+
+        If the job is still queued or running then returns
+        'None'; jobs which were cancelled have an exit
+        status of -1.
+        """
+        try:
+            future = self.__futures[job_id]
+        except KeyError:
+            logging.error("Don't know anything about job %s" % job_id)
+            return None
+        if not future.done():
+            return None
+        if future.cancelled():
+            return -1
+        try:
+            return future.result()[0]
+        except Exception as ex:
+            logging.error("PythonFunctionRunner: job %s failed: %s" %
+                          (job_id,ex))
+            return 127
+
+    def metrics(self,job_id):
+        """Return resource usage and timing metrics for a job
+
+        The start and end times and the CPU time are measured
+        in the worker process, and are only available once the
+        job has finished; peak memory isn't available (as the
+        worker processes are shared between jobs). See
+        'BaseJobRunner.metrics' for the items returned.
+        """
+        try:
+            metrics = dict(submit_time=self.__submit_times[job_id],
+                           nslots=self.__nslots)
+            future = self.__futures[job_id]
+        except KeyError:
+            return {}
+        if future.done() and not future.cancelled():
+            try:
+                metrics.update(future.result()[1])
+            except Exception:
+                pass
+        return metrics
+
+    def __assign_log_files(self,name,working_dir):
+        """Internal: return log file names for stdout and stderr
+
+        Create names based on the timestamp plus the supplied
+        'name'
+        """
+        timestamp = self.__log_id
+        log_file = "%s.o%s" % (name,timestamp)
+        error_file = "%s.e%s" % (name,timestamp)
+        if self.log_dir is None:
+            log_dir = working_dir
+        else:
+            log_dir = self.log_dir
+        log_file = os.path.join(log_dir,log_file)
+        error_file = os.path.join(log_dir,error_file)
+        self.__log_id += 1
+        return (log_file,error_file)
+
+class GEJobRunner(BaseJobRunner):
+    """Class implementing job runner for Grid Engine
+
+    GEJobRunner submits jobs to a Grid Engine cluster using the
+    'qsub' command, determines the status of jobs using 'qstat'
+    and terminates then using 'qdel'.
+
+    Additionally the runner can be configured for a specific GE
+    queue on initialisation.
+
+    Multiple jobs running the same script can be submitted as a
+    single GE array job using the 'run_array' method; each task
+    in the array is given its own job id of the form 'JOBID.TASKID'
+    which can be used in the same way as the ids of other jobs.
+
+    Multiple short jobs can be packed into a single GE job using
+    the 'run_pack' method: the packed job runs each of the jobs
+    in turn (or up to 'nparallel' at a time, in which case the
+    slots for the packed job are shared between them) and each
+    job is given its own job id of the form 'JOBID-N', log files
+    and exit code file (or journal record). Jobs in a pack which
+    are terminated before they start are skipped; the packed job
+    itself is only deleted once all its jobs have been
+    terminated or have finished.
+
+    Each GEJobRunner instance creates a temporary directory which
+    it uses for internal admin; this will be removed at program
+    exit via 'atexit'.
+
+    The status of all the jobs is collected in a single pass
+    when the job list is refreshed: the admin directory is
+    scanned once (each job writes an '__exit_code.N' file into
+    the top level of this directory on completion) and 'qstat'
+    is run at most once per cache lifetime, with the output
+    shared between all jobs.
+
+    Multiple jobs can be submitted concurrently using the
+    'run_many' method, which runs up to 'submit_threads'
+    'qsub' commands at a time. Submissions which fail because
+    'qsub' is unable to contact the Grid Engine master are
+    retried up to 'submit_retries' times, waiting for an
+    increasing interval (starting from 'submit_retry_interval'
+    and doubling after each attempt) between attempts.
+
+    By default each job has its own subdirectory of the admin
+    directory, which holds the job script plus files written
+    by the job recording the queue, number of slots and exit
+    code. Alternatively if 'journal' is True then the runner
+    uses a single append-only journal file instead: each job
+    script is written directly into the admin directory, and
+    on completion the job appends a single tab-delimited
+    record to the journal with the fields:
+
+    JOB_NUMBER QUEUE NSLOTS EXIT_CODE START_TIME END_TIME
+
+    (where the job number is the runner's internal number for
+    the job, and the times are in seconds since the epoch).
+    The runner reads the new records from the end of the
+    journal each time the job list is refreshed. Records are
+    written using a single append (i.e. 'O_APPEND') write
+    and so don't interleave on local filesystems; note however
+    that some network filesystems (e.g. NFS) don't guarantee
+    atomic appends from multiple hosts. In this mode the queue
+    for a job is only available once the job has completed.
+
+    The jobs which are still outstanding can be reattached to
+    by a new GEJobRunner instance (e.g. after the program which
+    submitted them has exited) by passing the data returned by
+    'checkpoint' to the 'reattach' method of the new runner.
+    Once 'checkpoint' has been called the admin directory is
+    kept at exit while there are outstanding jobs, so that
+    their completion can still be detected.
+
+    'wait_for_completion' checks for exit code files (or new
+    journal records) repeatedly, starting with a short interval
+    after each submission and doubling the interval (up to a
+    maximum of 'poll_interval') each time no jobs have
+    completed.
+
+    The times that each job started and finished running are
+    recorded by the job itself (along with the exit code) and
+    are returned by the 'metrics' method. If 'qacct' is True
+    then the peak memory and CPU time are also fetched using
+    'qacct' when the metrics for a finished job are first
+    requested (this requires Grid Engine accounting to be
+    enabled; see also '__run_qacct').
+    """
+
+    def __init__(self,queue=None,log_dir=None,ge_extra_args=None,
+                 poll_interval=5.0,timeout=30.0,submit_threads=8,
+                 submit_retries=3,submit_retry_interval=1.0,
+                 journal=False,qacct=False):
+        """Create a new GEJobRunner instance
+
+        Arguments:
+          queue:   Name of GE queue to use (set to 'None' to use default queue)
+          log_dir: Directory to write log files to (set to 'None' to use cwd)
+          ge_extra_args: Arbitrary additional arguments to supply to qsub
+          poll_interval: time interval to use when polling Grid Engine e.g.
+            to acquire qacct information (default 5s)
+          timeout: maximum length of time to wait before giving up when
+            polling Grid Engine (default 30s)
+          submit_threads: maximum number of 'qsub' commands to run
+            concurrently when submitting jobs via 'run_many' (default 8)
+          submit_retries: number of times to retry submitting a job
+            when 'qsub' can't contact the GE master (default 3)
+          submit_retry_interval: initial time interval to wait before
+            retrying a failed submission (default 1s)
+          journal: if True then jobs record their completion in a
+            single append-only journal file, rather than in files
+            in a separate directory for each job (default False)
+          qacct: if True then use 'qacct' to get the peak memory
+            and CPU time for finished jobs (default False)
+        """
+        # Internal parameters
+        self.__admin_dir = self.__make_admin_dir()
+        self.__preserve_admin_dir = False
+        self.__job_count = 0
+        self.__shell = "/bin/bash"
+        self.__ge_queue = queue
+        # Directory for log files
+        self.set_log_dir(log_dir)
+        # Keep track of data (names, log dirs etc) for each job
+        self.__job_number = {}
+        self.__names = {}
+        self.__log_dirs = {}
+        self.__error_state = {}
+        self.__exit_status = {}
+        self.__finalizing = {}
+        self.__queue = {}
+        self.__start_time = {}
+        self.__submit_time = {}
+        self.__job_metrics = {}
+        self.__array_tasks = {}
+        self.__pack_ids = {}
+        self.__ge_extra_args = ge_extra_args
+        self.__use_qacct = qacct
+        # Job id lock
+        self.__job_lock = ResourceLock()
+        # Job grace period lock
+        self.__updating_grace_period = ResourceLock()
+        # Job submission lock
+        self.__submit_lock = ResourceLock()
+        # Cached job list
+        self.__cached_job_list_lifetime = 2.0
+        self.__cached_job_list_timestamp = 0.0
+        self.__cached_job_list = []
+        self.__cached_job_set = set()
+        self.__cached_job_list_force_update = True
+        # Cached qstat output
+        self.__cached_qstat_output_lifetime = 2.0
+        self.__cached_qstat_output_timestamp = 0.0
+        self.__cached_qstat_output = None
+        self.__cached_qstat_job_states = {}
+        self.__qstat_lock = ResourceLock()
+        # Grace period for new jobs
+        self.__new_job_grace_period = 2.0
+        # Polling intervals and timeout periods (seconds)
+        self.__ge_poll_interval = poll_interval
+        self.__ge_timeout = timeout
+        # Intervals for checking for job completion
+        self.__min_wait_interval = 0.1
+        self.__wait_interval = self.__min_wait_interval
+        # Concurrent submission and retries
+        self.__submit_threads = submit_threads
+        self.__submit_retries = submit_retries
+        self.__submit_retry_interval = submit_retry_interval
+        # Job journal
+        self.__journal_file = None
+        self.__journal_offset = 0
+        self.__journal_records = {}
+        self.__journal_lock = ResourceLock()
+        if journal:
+            self.__journal_file = os.path.join(self.__admin_dir,
+                                               "__journal")
+            io.open(self.__journal_file,'wb').close()
+        # Register clean up function
+        atexit.register(self.__clean_up_admin_dir)
+
+    def __repr__(self):
+        name = 'GEJobRunner'
+        if self.__ge_extra_args is not None:
+            name += '(%s)' % ' '.join(self.__ge_extra_args)
+        return name
+
+    def name(self,job_id):
+        """Return the name for a job
+        """
+        return self.__names[job_id]
+
+    @property
+    def ge_extra_args(self):
+        """Return the extra GE arguments
+        """
+        return self.__ge_extra_args
+
+    @property
+    def nslots(self):
+        """Return the number of associated slots
+
+        This is extracted from the 'ge_extra_args'
+        property, by looking for qsub options of the
+        form '-pe smp.pe N' (in which case 'nslots'
+        will be N).
+        """
+        nslots = 1
+        if self.ge_extra_args is not None:
+            try:
+                i = self.ge_extra_args.index('-pe')
+                nslots = int(self.ge_extra_args[i+2])
+            except ValueError:
+                pass
+        return nslots
+
+    def run(self,name,working_dir,script,args):
+        """Submit a script or command to the cluster via 'qsub'
+
+        Arguments:
+          name: Name to give the job
+          working_dir: Directory to run the job in
+          script: Script file to run
+          args: List of arguments to supply to the script
+
+        Returns:
+          Job id for submitted job, or 'None' if job failed to
+          start.
+        """
+        logging.debug("GEJobRunner: submitting job")
+        logging.debug("Name       : %s" % name)
+        logging.debug("Queue      : %s" % self.__ge_queue)
+        logging.debug("Extra args : %s" % self.__ge_extra_args)
+        logging.debug("Log dir    : %s" % self.log_dir)
+        logging.debug("Working_dir: %s" % working_dir)
+        logging.debug("Script     : %s" % script)
+        logging.debug("Arguments  : %s" % str(args))
+        # Get internal job number
+        job_number = self.__next_job_number()
+        logging.debug("Internal job count: %s" % job_number)
+        # Build script to run the command to be submitted
+        cmd = self.__cmd_line(script,args)
+        if self.__journal_file is not None:
+            job_script = self.__write_journal_job_script(job_number,cmd)
+        else:
+            job_script = self.__write_job_script(job_number,cmd)
+        # Submit the job
+        job_id = self.__submit(name,working_dir,job_script)
+        # Store internal number, name and log dir against job id
+        if job_id is not None:
+            self.__register_job(job_id,job_number,name,working_dir)
         # Force refresh of job list
         self.__cached_job_list_force_update = True
         # Return the job id
         return job_id
 
+    def __write_job_script(self,job_number,cmd):
+        """
+        Internal: write the script to run a job
+
+        The script is written into a new directory for
+        the job, and records the queue and number of slots
+        in files in that directory; on completion the exit
+        code, the start and end times and the number of
+        slots are written to the exit code file.
+
+        Returns the path to the script.
+        """
+        job_dir = os.path.join(self.__admin_dir,str(job_number))
+        logging.debug("Job admin dir     : %s" % job_dir)
+        os.mkdir(job_dir)
+        job_script = os.path.join(job_dir,"job_script.sh")
+        with io.open(job_script,'wt') as fp:
+            fp.write(u"""#!{shell}
+export BCFTBX_RUNNER_NSLOTS=$NSLOTS
+echo "$QUEUE" > {job_dir}/__queue
+echo "$BCFTBX_RUNNER_NSLOTS" > {job_dir}/__jobrunner_nslots
+start_time=$(date +%s)
+{cmd}
+exit_code=$?
+echo "$exit_code $start_time $(date +%s) $BCFTBX_RUNNER_NSLOTS" > {job_dir}/__exit_code.tmp
+mv {job_dir}/__exit_code.tmp {exit_code_file}
+exit $exit_code
+""".format(shell=self.__shell,job_dir=job_dir,cmd=cmd,
+           exit_code_file=self.__exit_code_file(job_number)))
+        os.chmod(job_script,0o755)
+        return job_script
+
+    def __write_journal_job_script(self,job_number,cmd,array=False):
+        """
+        Internal: write the script to run a job using the journal
+
+        The script is written directly into the admin
+        directory, and on completion appends a record to
+        the journal. For array jobs ('array' is True) the
+        job number in the record is extended with the task
+        id.
+
+        Returns the path to the script.
+        """
+        job_script = os.path.join(self.__admin_dir,
+                                  "job_script.%s.sh" % job_number)
+        if array:
+            job_number = "%s.$SGE_TASK_ID" % job_number
+        script = u"""#!{shell}
+export BCFTBX_RUNNER_NSLOTS=$NSLOTS
+start_time=$(date +%s)
+{cmd}
+exit_code=$?
+printf "%s\\t%s\\t%s\\t%s\\t%s\\t%s\\n" "{job_number}" "$QUEUE" "$BCFTBX_RUNNER_NSLOTS" "$exit_code" "$start_time" "$(date +%s)" >> {journal}
+exit $exit_code
+""".format(shell=self.__shell,cmd=cmd,job_number=job_number,
+           journal=self.__journal_file)
+        # Create the script with the execute permissions
+        # already set
+        fd = os.open(job_script,os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o755)
+        try:
+            os.write(fd,script.encode('utf-8'))
+        finally:
+            os.close(fd)
+        return job_script
+
+    def run_array(self,name,working_dir,script,args_list,names=None):
+        """Submit multiple jobs to the cluster as a GE array job
+
+        Writes a table with the command line for each task
+        and submits a single 'qsub -t 1-N' job, where each
+        task runs one of the command lines.
+
+        If 'names' are supplied then each task writes its
+        output to its own log files, named after the task in
+        the same way as for other jobs (i.e. '<NAME>.o<JOBID>'
+        and '<NAME>.e<JOBID>', where the job id is of the form
+        'JOBID.TASKID'), rather than to the log files for the
+        array job.
+
+        Arguments:
+          name: Name to give the array job
+          working_dir: Directory to run the jobs in
+          script: Script file to run
+          args_list: List of argument lists, one for each task
+          names: (optional) list of names for each of the tasks
+
+        Returns:
+          List of job ids of the form 'JOBID.TASKID' (one for
+          each set of arguments, in the same order), or a list
+          of 'None' values if the array job failed to start.
+        """
+        logging.debug("GEJobRunner: submitting array job")
+        logging.debug("Name       : %s" % name)
+        logging.debug("Script     : %s" % script)
+        logging.debug("Tasks      : %d" % len(args_list))
+        ntasks = len(args_list)
+        if not ntasks:
+            return []
+        # Get internal job number
+        job_number = self.__next_job_number()
+        logging.debug("Internal job count: %s" % job_number)
+        # Write the task table and the script to run the tasks
+        if self.__journal_file is not None:
+            job_dir = None
+            task_table = os.path.join(self.__admin_dir,
+                                      "tasks.%s" % job_number)
+        else:
+            job_dir = os.path.join(self.__admin_dir,str(job_number))
+            logging.debug("Job admin dir     : %s" % job_dir)
+            os.mkdir(job_dir)
+            task_table = os.path.join(job_dir,"tasks")
+        if names is None:
+            names = [name]*ntasks
+            log_files = None
+        else:
+            # Log files are named as for other jobs
+            log_dir = self.log_dir
+            if log_dir is None:
+                log_dir = working_dir
+            if log_dir is None:
+                log_dir = os.getcwd()
+            log_files = [os.path.join(os.path.abspath(log_dir),
+                                      self.__ge_name(task_name))
+                         for task_name in names]
+        with io.open(task_table,'wt') as fp:
+            for i,args in enumerate(args_list):
+                cmd = self.__cmd_line(script,args)
+                if log_files is not None:
+                    cmd = "(%s) >\"%s.o${JOB_ID}.${SGE_TASK_ID}\" " \
+                          "2>\"%s.e${JOB_ID}.${SGE_TASK_ID}\"" % \
+                          (cmd,log_files[i],log_files[i])
+                fp.write(u"%s\n" % cmd)
+        if self.__journal_file is not None:
+            cmd = "eval \"$(sed -n \"${SGE_TASK_ID}p\" %s)\"" % task_table
+            job_script = self.__write_journal_job_script(job_number,cmd,
+                                                         array=True)
+        else:
+            job_script = self.__write_array_job_script(job_number,
+                                                       task_table)
+        # Submit the array job
+        job_id = self.__submit(name,working_dir,job_script,
+                               qsub_args=('-t',"1-%d" % ntasks))
+        if job_id is None:
+            return [None]*ntasks
+        # Store internal numbers, names and log dirs against
+        # the task ids
+        task_ids = []
+        self.__array_tasks[job_number] = set()
+        for i in range(1,ntasks+1):
+            task_id = "%s.%d" % (job_id,i)
+            task_number = "%s.%d" % (job_number,i)
+            self.__array_tasks[job_number].add(task_number)
+            self.__register_job(task_id,task_number,names[i-1],
+                                working_dir)
+            task_ids.append(task_id)
+        # Force refresh of job list
+        self.__cached_job_list_force_update = True
+        # Return the task ids
+        return task_ids
+
+    def __write_array_job_script(self,job_number,task_table):
+        """
+        Internal: write the script to run the tasks of an array job
+
+        The script is written into the directory for the
+        job, and records the queue, number of slots, exit
+        code and start and end times for each task in files
+        in that directory.
+
+        Returns the path to the script.
+        """
+        job_dir = self.__job_dir(job_number)
+        job_script = os.path.join(job_dir,"job_script.sh")
+        with io.open(job_script,'wt') as fp:
+            fp.write(u"""#!{shell}
+export BCFTBX_RUNNER_NSLOTS=$NSLOTS
+echo "$QUEUE" > {job_dir}/__queue.$SGE_TASK_ID
+echo "$BCFTBX_RUNNER_NSLOTS" > {job_dir}/__jobrunner_nslots.$SGE_TASK_ID
+start_time=$(date +%s)
+eval "$(sed -n "${{SGE_TASK_ID}}p" {task_table})"
+exit_code=$?
+echo "$exit_code $start_time $(date +%s) $BCFTBX_RUNNER_NSLOTS" > {job_dir}/__exit_code.$SGE_TASK_ID.tmp
+mv {job_dir}/__exit_code.$SGE_TASK_ID.tmp {exit_code_file}.$SGE_TASK_ID
+exit $exit_code
+""".format(shell=self.__shell,job_dir=job_dir,task_table=task_table,
+           exit_code_file=self.__exit_code_file(job_number)))
+        os.chmod(job_script,0o755)
+        return job_script
+
+    def run_many(self,jobs):
+        """Submit multiple jobs to the cluster concurrently
+
+        Runs up to 'submit_threads' 'qsub' commands at
+        a time using a pool of threads (otherwise each job
+        is submitted in the same way as for 'run').
+
+        Arguments:
+          jobs: List of tuples of the form
+            (name,working_dir,script,args), one for each
+            job (see 'run' for the meaning of each item)
+
+        Returns:
+          List of job ids (one for each job, in the same order
+          as the jobs were supplied), with 'None' for any job
+          which failed to start.
+        """
+        nthreads = min(self.__submit_threads,len(jobs))
+        if nthreads <= 1:
+            return BaseJobRunner.run_many(self,jobs)
+        logging.debug("GEJobRunner: submitting %d jobs using %d threads" %
+                      (len(jobs),nthreads))
+        pool = ThreadPool(nthreads)
+        try:
+            return pool.map(lambda job: self.run(*job),jobs,chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def run_pack(self,name,jobs,nparallel=1):
+        """Submit multiple jobs to the cluster as a single packed job
+
+        Writes a table with the command line (including
+        changing to the working directory) for each of the
+        jobs and submits a single job which runs each command
+        line in turn, or up to 'nparallel' at a time. Each
+        of the packed jobs writes its own log files and exit
+        code file (or journal record).
+
+        Arguments:
+          name: Name to give the packed job
+          jobs: List of tuples of the form
+            (name,working_dir,script,args), one for each
+            job (see 'run' for the meaning of each item)
+          nparallel: maximum number of the jobs to run at
+            the same time (default: 1)
+
+        Returns:
+          List of job ids of the form 'JOBID-N' (one for each
+          job, in the same order), or a list of 'None' values
+          if the packed job failed to start.
+        """
+        logging.debug("GEJobRunner: submitting packed job")
+        logging.debug("Name       : %s" % name)
+        logging.debug("Jobs       : %d" % len(jobs))
+        logging.debug("Parallel   : %d" % nparallel)
+        njobs = len(jobs)
+        if not njobs:
+            return []
+        # Get internal job number
+        job_number = self.__next_job_number()
+        logging.debug("Internal job count: %s" % job_number)
+        # Write the task table and the script to run the tasks
+        if self.__journal_file is not None:
+            task_table = os.path.join(self.__admin_dir,
+                                      "tasks.%s" % job_number)
+        else:
+            job_dir = os.path.join(self.__admin_dir,str(job_number))
+            logging.debug("Job admin dir     : %s" % job_dir)
+            os.mkdir(job_dir)
+            task_table = os.path.join(job_dir,"tasks")
+        log_files = []
+        with io.open(task_table,'wt') as fp:
+            for task_name,working_dir,script,args in jobs:
+                cmd = self.__cmd_line(script,args)
+                if working_dir:
+                    cmd = "cd \"%s\" && %s" % (working_dir,cmd)
+                fp.write(u"%s\n" % cmd)
+                # Log files are named as for other jobs
+                log_dir = self.log_dir
+                if log_dir is None:
+                    log_dir = working_dir
+                if log_dir is None:
+                    log_dir = os.getcwd()
+                log_files.append(os.path.join(os.path.abspath(log_dir),
+                                              self.__ge_name(task_name)))
+        job_script = self.__write_pack_job_script(job_number,task_table,
+                                                  log_files,nparallel)
+        # Submit the packed job
+        job_id = self.__submit(name,jobs[0][1],job_script)
+        if job_id is None:
+            return [None]*njobs
+        # Store internal numbers, names and log dirs against
+        # the ids for the packed jobs
+        task_ids = []
+        self.__array_tasks[job_number] = set()
+        for i,job in enumerate(jobs,start=1):
+            task_id = "%s-%d" % (job_id,i)
+            task_number = "%s.%d" % (job_number,i)
+            self.__array_tasks[job_number].add(task_number)
+            self.__pack_ids[task_id] = job_id
+            self.__register_job(task_id,task_number,job[0],job[1])
+            task_ids.append(task_id)
+        # Force refresh of job list
+        self.__cached_job_list_force_update = True
+        # Return the ids for the packed jobs
+        return task_ids
+
+    def __write_pack_job_script(self,job_number,task_table,log_files,
+                                nparallel):
+        """
+        Internal: write the script to run the jobs in a pack
+
+        Each job is run by the 'run_task' function in the
+        script, which skips jobs which have been terminated
+        (i.e. which already have a journal record or a
+        '__terminated' file in the job directory), and otherwise records the queue, exit
+        code and start and end times for the job in the same
+        way as for array job tasks. If 'nparallel' is greater
+        than one then the jobs are run in the background, and
+        the number of slots is divided between them.
+
+        Returns the path to the script.
+        """
+        if self.__journal_file is not None:
+            job_script = os.path.join(self.__admin_dir,
+                                      "job_script.%s.sh" % job_number)
+            finished = "awk -F'\\t' -v n=\"%s.$1\" " \
+                       "'$1==n {f=1} END {exit !f}' %s" % \
+                       (job_number,self.__journal_file)
+            start = ""
+            finish = "printf \"%%s\\t%%s\\t%%s\\t%%s\\t%%s\\t%%s\\n\" " \
+                     "\"%s.$1\" \"$QUEUE\" \"$BCFTBX_RUNNER_NSLOTS\" " \
+                     "\"$exit_code\" \"$start_time\" \"$(date +%%s)\" " \
+                     ">> %s" % (job_number,self.__journal_file)
+        else:
+            job_dir = self.__job_dir(job_number)
+            job_script = os.path.join(job_dir,"job_script.sh")
+            exit_code_file = self.__exit_code_file(job_number)
+            finished = "[ -e %s.$1 -o -e %s/__terminated.$1 ]" % \
+                       (exit_code_file,job_dir)
+            start = "  echo \"$QUEUE\" > %s/__queue.$1\n" % job_dir
+            finish = "echo \"$exit_code $start_time $(date +%%s) " \
+                     "$BCFTBX_RUNNER_NSLOTS\" > %s/__exit_code.$1.tmp\n" \
+                     "  [ -e %s.$1 ] || mv %s/__exit_code.$1.tmp %s.$1" % \
+                     (job_dir,exit_code_file,job_dir,exit_code_file)
+        if nparallel > 1:
+            # Run jobs in the background, waiting for one to
+            # finish before starting another once the limit is
+            # reached
+            background = " &\nwhile [ $(jobs -rp | wc -l) -ge %d ] ; do " \
+                         "wait -n 2>/dev/null || sleep 1 ; done" % nparallel
+        else:
+            background = ""
+        tasks = []
+        for i,log_file in enumerate(log_files,start=1):
+            tasks.append(u"run_task %d \"%s.o${JOB_ID}-%d\" "
+                         "\"%s.e${JOB_ID}-%d\"%s" %
+                         (i,log_file,i,log_file,i,background))
+        script = u"""#!{shell}
+nslots=$(( ${{NSLOTS:-1}} / {nparallel} ))
+[ $nslots -lt 1 ] && nslots=1
+export BCFTBX_RUNNER_NSLOTS=$nslots
+run_task() {{
+  # Arguments: task number, log file, error file
+  {finished} && return
+{start}  start_time=$(date +%s)
+  (eval "$(sed -n "${{1}}p" {task_table})") >"$2" 2>"$3"
+  exit_code=$?
+  {finish}
+}}
+{tasks}
+wait
+exit 0
+""".format(shell=self.__shell,nparallel=nparallel,finished=finished,
+           start=start,finish=finish,task_table=task_table,
+           tasks='\n'.join(tasks))
+        # Create the script with the execute permissions
+        # already set
+        fd = os.open(job_script,os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o755)
+        try:
+            os.write(fd,script.encode('utf-8'))
+        finally:
+            os.close(fd)
+        return job_script
+
     def terminate(self,job_id):
         """Remove a job from the GE queue using 'qdel'
+
+        For jobs in a pack, the packed job is only removed
+        once there are no other outstanding jobs in the pack
+        (otherwise the job is just marked as terminated, so
+        that it will be skipped if it hasn't started yet).
         """
         logging.debug("GEJobRunner: deleting job")
-        qdel=('qdel',job_id)
-        p = subprocess.Popen(qdel,stdout=subprocess.PIPE)
-        stdoutdata,stderrdata = p.communicate()
-        message = stdoutdata.strip()
-        logging.debug("GEJobRunner: qdel: %s" % message)
+        if job_id in self.__pack_ids:
+            # Job in a pack
+            pack_id = self.__pack_ids[job_id]
+            outstanding = [j for j in list(self.__pack_ids.keys())
+                           if self.__pack_ids.get(j) == pack_id and
+                           j != job_id and
+                           j in self.__job_number and
+                           j not in self.__exit_status]
+            if outstanding:
+                qdel = None
+                if self.__journal_file is None:
+                    # Mark the job so that it will be skipped
+                    job_number = self.__job_number[job_id]
+                    io.open(os.path.join(self.__job_dir(job_number),
+                                         "__terminated.%s" %
+                                         job_number.split('.')[1]),
+                            'wb').close()
+            else:
+                qdel = ('qdel',pack_id)
+        elif '.' in job_id:
+            # Array job task
+            array_id,task_id = job_id.split('.')
+            qdel = ('qdel','-t',task_id,array_id)
+        else:
+            qdel = ('qdel',job_id)
+        if qdel is not None:
+            p = subprocess.Popen(qdel,stdout=subprocess.PIPE)
+            stdoutdata,stderrdata = p.communicate()
+            message = stdoutdata.strip()
+            logging.debug("GEJobRunner: qdel: %s" % message)
         if job_id in self.__start_time:
             del(self.__start_time[job_id])
-        # Write an exit code file for the job
-        exit_code_file = os.path.join(self.__admin_dir,
-                                      str(self.__job_number[job_id]),
-                                      "__exit_code")
-        with io.open("%s.tmp" % exit_code_file,'wt') as fp:
-            fp.write(u"-1\n")
-        os.rename("%s.tmp" % exit_code_file,exit_code_file)
+        # Write an exit code file (or journal record) for the job
+        if self.__journal_file is not None:
+            self.__append_journal_record(self.__job_number[job_id],-1)
+        else:
+            exit_code_file = self.__exit_code_file(self.__job_number[job_id])
+            with io.open("%s.tmp" % exit_code_file,'wt') as fp:
+                fp.write(u"-1\n")
+            os.rename("%s.tmp" % exit_code_file,exit_code_file)
         # Force update of cached job list
         self.__cached_job_list_force_update = True
         return True
@@ -709,6 +2172,22 @@ exit $exit_code
         # Not in error state
         return False
 
+    def list_error_state(self):
+        """Return a list of job ids which are in an error state
+
+        Returns the ids of the jobs for which qstat returns
+        the state as 'E..' (from a single run of qstat).
+        """
+        self.__run_qstat()
+        job_ids = []
+        for job_id in list(self.__job_number.keys()):
+            state = self.__cached_qstat_job_states.get(
+                self.__pack_ids.get(job_id,job_id),'')
+            if self.__error_state.get(job_id) or state.startswith('E'):
+                self.__error_state[job_id] = True
+                job_ids.append(job_id)
+        return job_ids
+
     def queue(self,job_id):
         """Fetch the job queue name
 
@@ -718,10 +2197,20 @@ exit $exit_code
         if job_id in self.__queue:
             # Return cached queue
             return self.__queue[job_id]
+        if self.__journal_file is not None:
+            # Queue is only available from the journal
+            # once the job has completed
+            try:
+                queue = self.__journal_records[
+                    str(self.__job_number[job_id])][0]
+            except KeyError:
+                return None
+            if not queue:
+                return None
+            self.__queue[job_id] = queue
+            return queue
         # Look for __queue file from job
-        queue_file = os.path.join(self.__admin_dir,
-                                  str(self.__job_number[job_id]),
-                                  "__queue")
+        queue_file = self.__queue_file(self.__job_number[job_id])
         logging.debug("GEJobRunner: queue file: %s" % queue_file)
         if not os.path.exists(queue_file):
             # No queue file available
@@ -743,58 +2232,188 @@ exit $exit_code
         """
         Get list of job ids which are queued or running
         """
-        # Check cached job list
-        use_cache = (not self.__cached_job_list_force_update)
-        if use_cache:
-            if (time.time() - self.__cached_job_list_timestamp) < \
-               self.__cached_job_list_lifetime:
-                logging.debug("GEJobRunner: using cached job list")
-                job_ids = self.__cached_job_list
-                # Add the jobs in grace period
-                grace_period_jobs = list(self.__start_time.keys())
-                for job_id in grace_period_jobs:
-                    if job_id not in job_ids:
-                        job_ids.append(job_id)
-                return job_ids
-        # Update jobs in grace period
-        for job_id in list(self.__start_time.keys()):
-            self.__update_job_grace_period(job_id)
-        grace_period_jobs = list(self.__start_time.keys())
-        # Build initial list from directory contents
-        job_ids = []
+        self.__update_job_list()
+        job_ids = [j for j in self.__cached_job_list]
+        # Add the jobs in the grace period
+        for job_id in list(self.__start_time.keys()):
+            if job_id not in self.__cached_job_set:
+                job_ids.append(job_id)
+        logging.debug("GEJobRunner: 'list' returning %s" % job_ids)
+        return job_ids
+
+    def isRunning(self,job_id):
+        """Check if a job is running
+
+        Returns True if job is still running, False if not
+        """
+        self.__update_job_list()
+        return (job_id in self.__cached_job_set or
+                job_id in self.__start_time)
+
+    def wait_for_completion(self,timeout):
+        """Wait until a job may have completed
+
+        Checks the admin directory for exit code files (or
+        the journal for new records), returning as soon as
+        any are found or after 'timeout' seconds. The
+        interval between checks starts short after a job is
+        submitted and doubles (up to 'poll_interval') each time
+        no completed jobs are found.
+
+        Arguments:
+          timeout: maximum time to wait (in seconds)
+
+        Returns:
+          True if a job has completed, False if the timeout
+          was reached.
+        """
+        start_time = time.time()
+        while True:
+            if self.__journal_file is not None:
+                finished_jobs = self.__read_journal()
+            else:
+                finished_jobs = self.__scan_admin_dir()[1]
+            job_numbers = set([str(n) for n in
+                               list(self.__job_number.values())])
+            if finished_jobs.intersection(job_numbers):
+                # Make sure the job list is refreshed
+                self.__cached_job_list_force_update = True
+                self.__wait_interval = self.__min_wait_interval
+                return True
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.__wait_interval,remaining))
+            self.__wait_interval = min(self.__wait_interval*2.0,
+                                       self.__ge_poll_interval)
+
+    def checkpoint(self):
+        """Return data needed to reattach to the runner's jobs
+
+        Returns a dictionary (which can be serialised as
+        JSON) with the admin directory and the internal data
+        for each outstanding job, which can be passed to the
+        'reattach' method of a new GEJobRunner.
+
+        After this method has been called the admin directory
+        is no longer removed at exit if there are outstanding
+        jobs.
+        """
+        self.__preserve_admin_dir = True
+        jobs = {}
         for job_id in list(self.__job_number.keys()):
             try:
-                job_number = self.__job_number[job_id]
+                jobs[job_id] = [self.__job_number[job_id],
+                                self.__names[job_id],
+                                self.__log_dirs[job_id]]
             except KeyError:
-                # Job has been removed since the list was
-                # fetched? Ignore
+                # Job has gone away
                 continue
-            job_dir = os.path.join(self.__admin_dir,str(job_number))
-            exit_code_file = os.path.join(job_dir,"__exit_code")
-            logging.debug("GEJobRunner: checking job %s (#%s)"
-                          % (job_id,job_number))
-            if os.path.exists(job_dir):
-                logging.debug("GEJobRunner: -- found %s" % job_dir)
-                # Job dir exists
-                if os.path.exists(exit_code_file):
-                    # Job has finished, handle completion
-                    self.__handle_job_completion(job_id)
-                else:
-                    # Job still running
-                    job_ids.append(job_id)
-        # Update cache
-        self.__cached_job_list_timestamp = time.time()
-        self.__cached_job_list = [j for j in job_ids]
-        self.__cached_job_list_force_update = False
-        # Add the jobs in the grace period
-        for job_id in grace_period_jobs:
-            if job_id not in job_ids:
-                job_ids.append(job_id)
-            else:
-                # Job now visible so no longer in grace period
-                self.__update_job_grace_period(job_id)
-        logging.debug("GEJobRunner: 'list' returning %s" % job_ids)
-        return job_ids
+        # Jobs which have finished (but which may not have been
+        # collected by the caller yet)
+        finished = {}
+        for job_id in list(self.__exit_status.keys()):
+            if job_id in jobs:
+                continue
+            try:
+                finished[job_id] = [self.__exit_status[job_id],
+                                    self.__names[job_id],
+                                    self.__log_dirs[job_id]]
+            except KeyError:
+                continue
+        array_tasks = dict([(str(n),sorted(self.__array_tasks[n]))
+                            for n in list(self.__array_tasks.keys())])
+        return dict(admin_dir=self.__admin_dir,
+                    job_count=self.__job_count,
+                    journal=(self.__journal_file is not None),
+                    jobs=jobs,
+                    finished=finished,
+                    array_tasks=array_tasks,
+                    packs=dict(self.__pack_ids))
+
+    def reattach(self,state):
+        """Reattach to jobs from a checkpoint
+
+        Switches the runner to the admin directory of the
+        runner which created the checkpoint, and resumes
+        monitoring of the jobs which were outstanding (which
+        are detected as completed via the usual exit code
+        files or journal records).
+
+        The runner must not have submitted any jobs of its
+        own.
+
+        Arguments:
+          state: dictionary returned from the 'checkpoint'
+            method of another GEJobRunner
+
+        Returns:
+          List of the ids of the jobs which were reattached.
+        """
+        if self.__job_number:
+            raise Exception("GEJobRunner: can't reattach to jobs: runner "
+                            "already has jobs")
+        admin_dir = state['admin_dir']
+        if not os.path.isdir(admin_dir):
+            logging.error("GEJobRunner: can't reattach to jobs: admin dir "
+                          "'%s' not found" % admin_dir)
+            return []
+        # Remove the runner's own (unused) admin dir
+        if self.__journal_file is not None:
+            try:
+                os.remove(self.__journal_file)
+            except OSError:
+                pass
+        try:
+            os.rmdir(self.__admin_dir)
+        except OSError as ex:
+            logging.warning("GEJobRunner: unable to remove unused admin "
+                            "dir '%s': %s" % (self.__admin_dir,ex))
+        # Switch to the checkpointed admin dir
+        self.__admin_dir = admin_dir
+        self.__job_count = max(self.__job_count,state['job_count'])
+        if state['journal']:
+            self.__journal_file = os.path.join(admin_dir,"__journal")
+        else:
+            self.__journal_file = None
+        self.__journal_offset = 0
+        self.__journal_records = {}
+        for job_id in state['jobs']:
+            job_number,name,log_dir = state['jobs'][job_id]
+            self.__job_number[job_id] = job_number
+            self.__names[job_id] = name
+            self.__log_dirs[job_id] = log_dir
+        finished = state.get('finished',{})
+        for job_id in finished:
+            exit_status,name,log_dir = finished[job_id]
+            self.__exit_status[job_id] = exit_status
+            self.__names[job_id] = name
+            self.__log_dirs[job_id] = log_dir
+        for n in state['array_tasks']:
+            self.__array_tasks[int(n)] = set(state['array_tasks'][n])
+        self.__pack_ids.update(state.get('packs',{}))
+        self.__preserve_admin_dir = True
+        self.__cached_job_list_force_update = True
+        logging.debug("GEJobRunner: reattached to %d jobs in '%s'" %
+                      (len(state['jobs']),admin_dir))
+        return list(state['jobs'].keys()) + list(finished.keys())
+
+    def settings(self):
+        """Return the settings needed to recreate the runner
+
+        Returns a dictionary with the queue, polling,
+        submission, journal and 'qacct' settings (i.e. the
+        keyword arguments which aren't included in the
+        runner's definition).
+        """
+        return dict(queue=self.__ge_queue,
+                    poll_interval=self.__ge_poll_interval,
+                    timeout=self.__ge_timeout,
+                    submit_threads=self.__submit_threads,
+                    submit_retries=self.__submit_retries,
+                    submit_retry_interval=self.__submit_retry_interval,
+                    journal=(self.__journal_file is not None),
+                    qacct=self.__use_qacct)
 
     def exit_status(self,job_id):
         """
@@ -817,6 +2436,38 @@ exit $exit_code
         # Return cached exit status
         return self.__exit_status[job_id]
 
+    def metrics(self,job_id):
+        """Return resource usage and timing metrics for a job
+
+        The start and end times and the number of slots
+        are only available once the job has finished; the
+        peak memory and CPU time are only available if the
+        runner was created with 'qacct' set to True, and
+        the accounting information for the job can be
+        retrieved (see 'BaseJobRunner.metrics' for the items
+        returned).
+        """
+        if job_id not in self.__job_metrics:
+            if job_id in self.__submit_time:
+                return dict(submit_time=self.__submit_time[job_id],
+                            queue=self.__queue.get(job_id))
+            return {}
+        metrics = self.__job_metrics[job_id]
+        if self.__use_qacct and 'cpu_time' not in metrics:
+            qacct = self.__run_qacct(job_id)
+            if qacct:
+                for key,name,conv in (('ru_maxrss','max_rss',
+                                       lambda x: int(float(x))),
+                                      ('cpu','cpu_time',float),
+                                      ('slots','nslots',int)):
+                    try:
+                        metrics[name] = conv(qacct[key])
+                    except (KeyError,ValueError):
+                        pass
+                if not metrics.get('queue'):
+                    metrics['queue'] = qacct.get('qname')
+        return dict(metrics)
+
     def __make_admin_dir(self):
         """Internal: create temporary directory for admin etc
 
@@ -843,6 +2494,17 @@ exit $exit_code
         Shouldn't be called directly; instead register with
         'atexit' to force clean up on program exit
         """
+        if self.__preserve_admin_dir and self.__job_number:
+            # Keep the admin dir so outstanding jobs can be
+            # reattached to later
+            logging.debug("GEJobRunner: keeping admin dir '%s' for %d "
+                          "outstanding jobs" % (self.__admin_dir,
+                                                len(self.__job_number)))
+            return
+        if not os.path.exists(self.__admin_dir):
+            # Already removed (e.g. by another runner which
+            # reattached to the same jobs)
+            return
         logging.debug("GEJobRunner: removing admin dir '%s'" %
                       self.__admin_dir)
         # Check if jobs are still being finalized
@@ -862,42 +2524,345 @@ exit $exit_code
                             "admin dir '%s': %s" %
                             (self.__admin_dir,ex))
 
-    def __update_job_grace_period(self,job_id):
+    def __update_job_list(self):
+        """
+        Internal: refresh the cached list of running jobs
+
+        Unless the cached list is still valid, collects the
+        status of all jobs from a single scan of the admin
+        directory (or from the new records in the journal, if
+        this is being used): jobs which have an '__exit_code.N'
+        file (or journal record) are finalized, and the others
+        are stored as still running.
+
+        Jobs in the grace period are not included in the
+        cached list.
+        """
+        # Check cached job list
+        if not self.__cached_job_list_force_update and \
+           (time.time() - self.__cached_job_list_timestamp) < \
+           self.__cached_job_list_lifetime:
+            logging.debug("GEJobRunner: using cached job list")
+            return
+        # Update jobs in grace period
+        self.__update_job_grace_periods()
+        # Collect the status of all jobs
+        if self.__journal_file is not None:
+            job_dirs = None
+            finished_jobs = self.__read_journal()
+        else:
+            job_dirs,finished_jobs = self.__scan_admin_dir()
+        job_ids = []
+        for job_id in list(self.__job_number.keys()):
+            try:
+                job_number = self.__job_number[job_id]
+            except KeyError:
+                # Job has been removed since the list was
+                # fetched? Ignore
+                continue
+            job_number = str(job_number)
+            if job_dirs is not None and \
+               job_number.split('.')[0] not in job_dirs:
+                continue
+            if job_number in finished_jobs:
+                # Job has finished, handle completion
+                self.__handle_job_completion(job_id)
+            else:
+                # Job still running
+                job_ids.append(job_id)
+        # Update cache
+        self.__cached_job_list_timestamp = time.time()
+        self.__cached_job_list = job_ids
+        self.__cached_job_set = set(job_ids)
+        self.__cached_job_list_force_update = False
+
+    def __scan_admin_dir(self):
+        """
+        Internal: collect job status from the admin directory
+
+        Lists the admin directory once and returns a tuple
+        of two sets: the internal job numbers which have a
+        job directory, and the job numbers which have an
+        '__exit_code.N' file (i.e. have finished).
+
+        Job numbers are returned as strings; array job tasks
+        have job numbers of the form 'N.TASKID'.
+        """
+        job_dirs = set()
+        finished_jobs = set()
+        try:
+            entries = list(scandir(self.__admin_dir))
+        except OSError as ex:
+            logging.warning("GEJobRunner: unable to list admin dir "
+                            "'%s': %s" % (self.__admin_dir,ex))
+            return (job_dirs,finished_jobs)
+        for entry in entries:
+            name = entry.name
+            if name.isdigit():
+                job_dirs.add(name)
+            elif name.startswith("__exit_code."):
+                finished_jobs.add(name[len("__exit_code."):])
+        return (job_dirs,finished_jobs)
+
+    def __read_journal(self):
+        """
+        Internal: read new records from the job journal
+
+        Reads from the end of the previous read to the
+        end of the last complete record, and stores the
+        queue, exit code, number of slots and start and end
+        times for each job from the new records.
+
+        Returns a set of the job numbers (as strings) of
+        all the jobs which have a record, i.e. which have
+        finished but haven't yet been cleaned up.
+        """
+        lock = None
+        while lock is None:
+            lock = self.__journal_lock.acquire("journal")
+        try:
+            with io.open(self.__journal_file,'rb') as fp:
+                fp.seek(self.__journal_offset)
+                data = fp.read()
+        except IOError as ex:
+            logging.warning("GEJobRunner: unable to read journal "
+                            "'%s': %s" % (self.__journal_file,ex))
+            data = b''
+        # Only handle complete records
+        data = data[:data.rfind(b'\n')+1]
+        self.__journal_offset += len(data)
+        for line in data.decode('utf-8').split('\n'):
+            if not line:
+                continue
+            try:
+                job_number,queue,nslots,exit_code,start_time,end_time = \
+                    line.split('\t')
+                exit_code = int(exit_code)
+            except ValueError:
+                logging.warning("GEJobRunner: bad journal record "
+                                "ignored: %s" % line)
+                continue
+            if job_number not in self.__journal_records:
+                self.__journal_records[job_number] = (queue,exit_code,
+                                                      nslots,start_time,
+                                                      end_time)
+        self.__journal_lock.release(lock)
+        return set(self.__journal_records.keys())
+
+    def __append_journal_record(self,job_number,exit_code):
+        """
+        Internal: append a record for a job to the journal
+
+        Used to record jobs which are terminated by the
+        runner (so the queue, number of slots and start
+        time are left blank).
+        """
+        record = u"%s\t\t\t%s\t\t%d\n" % (job_number,exit_code,
+                                             int(time.time()))
+        fd = os.open(self.__journal_file,os.O_WRONLY|os.O_APPEND)
+        try:
+            os.write(fd,record.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def __next_job_number(self):
+        """
+        Internal: return the next internal job number
+        """
+        # Wait for lock on job submission
+        submit_lock = None
+        while submit_lock is None:
+            submit_lock = self.__submit_lock.acquire("job_submission",
+                                                     timeout=self.__ge_timeout)
+        # Get internal job number
+        self.__job_count += 1
+        job_number = self.__job_count
+        # Release the lock
+        self.__submit_lock.release(submit_lock)
+        return job_number
+
+    def __cmd_line(self,script,args):
+        """
+        Internal: build the command line to run a script
+        """
+        cmd_args = [script]
+        for arg in args:
+            # Quote arguments containing whitespace
+            if arg.count(' ') or arg.count('\t'):
+                arg = "\"%s\"" % arg
+            cmd_args.append(arg)
+        return ' '.join(cmd_args)
+
+    def __submit(self,name,working_dir,job_script,qsub_args=None):
+        """
+        Internal: submit a job script via 'qsub'
+
+        Arguments:
+          name: Name to give the job
+          working_dir: Directory to run the job in
+          job_script: Job script to submit
+          qsub_args: optional list of additional arguments
+            for 'qsub'
+
+        Returns:
+          Job id for submitted job (for array jobs, the id
+          of the whole array), or 'None' if job failed to
+          start.
+        """
+        # Sanitize name for GE by replacing invalid characters
+        # (colon, asterisk...)
+        ge_name = self.__ge_name(name)
+        logging.debug("GE job name: %s" % ge_name)
+        # Build qsub command to submit script
+        qsub = ['qsub','-b','y','-V','-N',ge_name]
+        if qsub_args:
+            qsub.extend(qsub_args)
+        if self.__ge_queue:
+            qsub.extend(('-q',self.__ge_queue))
+        if self.log_dir:
+            qsub.extend(('-o',self.log_dir,'-e',self.log_dir))
+        if not working_dir:
+            qsub.append('-cwd')
+        else:
+            qsub.extend(('-wd',working_dir))
+        if self.__ge_extra_args:
+            qsub.extend(self.__ge_extra_args)
+        qsub.append(job_script)
+        logging.debug("GEJobRunner: qsub command: %s" % qsub)
+        # Run the qsub job in the current directory
+        cwd = os.getcwd()
+        # Check that this exists
+        logging.debug("GEJobRunner: executing in %s" % cwd)
+        if not os.path.exists(cwd):
+            logging.error("GEJobRunner: cwd doesn't exist!")
+            return None
+        retry_interval = self.__submit_retry_interval
+        for attempt in range(self.__submit_retries+1):
+            p = subprocess.Popen(qsub,cwd=cwd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+            stdoutdata,stderrdata = p.communicate()
+            # Check stderr
+            error = stderrdata.strip()
+            if error:
+                # Just echo error message as a warning
+                logging.warning("GEJobRunner: '%s'" % error)
+            # Capture the job id from the output
+            # e.g. 'Your job 12345 ("name") has been submitted'
+            # or 'Your job-array 12345.1-4:1 ("name") has been submitted'
+            job_id = None
+            for line in stdoutdata.split('\n'):
+                if line.startswith('Your job'):
+                    job_id = line.split()[2].split('.')[0]
+            if job_id is not None or \
+               attempt == self.__submit_retries or \
+               not self.__is_transient_qsub_error(error):
+                break
+            # Wait before retrying (with some random jitter, so
+            # that concurrent submissions don't retry in step)
+            delay = retry_interval*(1.0 + random.random()*0.5)
+            logging.warning("GEJobRunner: unable to submit job, retrying "
+                            "in %.1fs" % delay)
+            time.sleep(delay)
+            retry_interval *= 2.0
+        logging.debug("GEJobRunner: done - job id = %s" % job_id)
+        return job_id
+
+    def __is_transient_qsub_error(self,error):
+        """
+        Internal: check if a 'qsub' error is transient
+
+        Returns True if the error message indicates that
+        the GE master couldn't be contacted (so that the
+        submission can be retried).
+        """
+        error = error.lower()
+        return ("unable to contact qmaster" in error or
+                "failed receiving gdi request" in error or
+                "commlib error" in error)
+
+    def __register_job(self,job_id,job_number,name,working_dir):
+        """
+        Internal: store the data associated with a new job id
+
+        Also resets the interval used by 'wait_for_completion'
+        to the minimum, so that completions are checked for
+        frequently after submissions.
+        """
+        self.__wait_interval = self.__min_wait_interval
+        self.__job_number[job_id] = job_number
+        self.__names[job_id] = name
+        if self.log_dir is None:
+            self.__log_dirs[job_id] = working_dir
+        else:
+            self.__log_dirs[job_id] = self.log_dir
+        self.__start_time[job_id] = time.time()
+        self.__submit_time[job_id] = self.__start_time[job_id]
+
+    def __job_dir(self,job_number):
+        """
+        Internal: return path to the admin directory for a job
+
+        Array job tasks share the directory of the array job.
+        """
+        return os.path.join(self.__admin_dir,
+                            str(job_number).split('.')[0])
+
+    def __queue_file(self,job_number):
+        """
+        Internal: return path to the queue file for a job
+        """
+        job_number = str(job_number)
+        if '.' in job_number:
+            task_id = job_number.split('.')[1]
+            return os.path.join(self.__job_dir(job_number),
+                                "__queue.%s" % task_id)
+        return os.path.join(self.__job_dir(job_number),"__queue")
+
+    def __exit_code_file(self,job_number):
+        """
+        Internal: return path to the exit code file for a job
+        """
+        return os.path.join(self.__admin_dir,
+                            "__exit_code.%s" % job_number)
+
+    def __update_job_grace_periods(self):
         """
-        Internal: handling update of job in grace period
+        Internal: handling update of jobs in grace period
 
-        Checks if a job is still within the grace period
-        (i.e. has an entry in the `__start_time`
+        Checks if jobs are still within the grace period
+        (i.e. have an entry in the `__start_time`
         dictionary which is newer than the grace period).
 
-        If the job is no longer in the grace period then
-        removes its entry in the `__start_time`
+        Jobs which are no longer in the grace period have
+        their entries removed from the `__start_time`
         dictionary.
         """
-        logging.debug("GEJobRunner: update grace period for "
-                      "for job %s" % job_id)
+        logging.debug("GEJobRunner: update grace periods")
         lock = None
         while lock is None:
-            lock = self.__updating_grace_period.acquire(job_id)
+            lock = self.__updating_grace_period.acquire("grace_period")
         logging.debug("GEJobRunner: acquired lock for grace period "
                       "update: %s" % lock)
-        try:
-            start_time = self.__start_time[job_id]
-        except KeyError:
-            logging.debug("GEJobRunner: update grace period: job %s "
-                          "has gone away (ignored)" % job_id)
-            self.__updating_grace_period.release(lock)
-            return
-        if ((time.time() - start_time) > self.__new_job_grace_period):
-            # Job no longer in grace period
-            logging.debug("GEJobRunner: job %s no longer in grace "
-                          "period" % job_id)
+        now = time.time()
+        for job_id in list(self.__start_time.keys()):
             try:
-                del(self.__start_time[job_id])
+                start_time = self.__start_time[job_id]
             except KeyError:
-                logging.debug("GEJobRunner: update grace period: "
-                              "job %s has gone away (ignored)" %
-                              job_id)
+                logging.debug("GEJobRunner: update grace period: job %s "
+                              "has gone away (ignored)" % job_id)
+                continue
+            if ((now - start_time) > self.__new_job_grace_period):
+                # Job no longer in grace period
+                logging.debug("GEJobRunner: job %s no longer in grace "
+                              "period" % job_id)
+                try:
+                    del(self.__start_time[job_id])
+                except KeyError:
+                    logging.debug("GEJobRunner: update grace period: "
+                                  "job %s has gone away (ignored)" %
+                                  job_id)
         # Release update lock
         self.__updating_grace_period.release(lock)
 
@@ -907,10 +2872,11 @@ exit $exit_code
 
         Peforms the following operations:
 
-        - checks that an '__exit_code' file exists for
+        - checks that an '__exit_code.N' file exists for
           the job
         - read and store the exit status/return code from
-          this file
+          this file (along with the start and end times
+          and number of slots, if present)
         - ensure that the queue is set for the job
         - call the clean up function to remove all the
           associated files
@@ -935,22 +2901,48 @@ exit $exit_code
             self.__job_lock.release(lock)
             return
         self.__finalizing[job_id] = True
-        # Check there is an exit code file
-        exit_code_file = os.path.join(self.__admin_dir,
-                                      str(self.__job_number[job_id]),
-                                      "__exit_code")
-        assert(os.path.exists(exit_code_file))
-        try:
-            with io.open(exit_code_file,'rt') as fp:
-                exit_status = int(fp.read())
-        except Exception as ex:
-            # Set exit status to 127
-            logging.error("GEJobRunner: exception when "
-                          "reading exit_status for job "
-                          "%s: %s" % (job_id,ex))
-            exit_status = 127
+        # Exit code file fields after the exit status (i.e.
+        # start and end times, and number of slots)
+        fields = []
+        if self.__journal_file is not None:
+            # Get the exit status from the journal
+            try:
+                record = self.__journal_records[
+                    str(self.__job_number[job_id])]
+                exit_status = record[1]
+                fields = [record[3],record[4],record[2]]
+            except KeyError:
+                logging.error("GEJobRunner: no journal record for "
+                              "job %s" % job_id)
+                exit_status = 127
+        else:
+            # Check there is an exit code file
+            exit_code_file = self.__exit_code_file(
+                self.__job_number[job_id])
+            assert(os.path.exists(exit_code_file))
+            try:
+                with io.open(exit_code_file,'rt') as fp:
+                    fields = fp.read().split()
+                exit_status = int(fields[0])
+                fields = fields[1:]
+            except Exception as ex:
+                # Set exit status to 127
+                logging.error("GEJobRunner: exception when "
+                              "reading exit_status for job "
+                              "%s: %s" % (job_id,ex))
+                exit_status = 127
         # Update queue information
-        self.queue(job_id)
+        queue = self.queue(job_id)
+        # Store metrics
+        metrics = dict(submit_time=self.__submit_time.get(job_id),
+                       queue=queue)
+        for name,value in zip(('start_time','end_time','nslots'),fields):
+            try:
+                metrics[name] = int(value)
+            except ValueError:
+                # Missing (e.g. job was terminated)
+                pass
+        self.__job_metrics[job_id] = metrics
         # Store exit status and clean up
         self.__exit_status[job_id] = exit_status
         self.__clean_up_job(job_id)
@@ -963,7 +2955,10 @@ exit $exit_code
         """Internal: clean up internal job files
 
         Removes the internal directory associated with a job, along
-        with any files it contains (e.g. job script, exit code etc).
+        with any files it contains (e.g. job script etc), and the
+        exit code file for the job. For array job tasks the
+        directory is only removed once all the tasks have been
+        cleaned up.
 
         This method should only be invoked for jobs that have
         finished running. If the job is still running then returns
@@ -977,18 +2972,61 @@ exit $exit_code
             logging.error("GEJobRunner: job %d not found, can't do "
                           "clean up" % job_id)
             return
-        job_dir = os.path.join(self.__admin_dir,str(job_number))
-        try:
-            # Remove the directory and contents
-            shutil.rmtree(job_dir)
-        except Exception as ex:
-            logging.warning("GEJobRunner: exception cleaning up for "
-                            "job %s (ignored): %s" % (job_id,ex))
+        job_dir = self.__job_dir(job_number)
+        remove_job_dir = True
+        if '.' in str(job_number):
+            # Array job task: only remove the directory when
+            # there are no more tasks
+            array_number = int(str(job_number).split('.')[0])
+            try:
+                tasks = self.__array_tasks[array_number]
+                tasks.discard(job_number)
+                if tasks:
+                    remove_job_dir = False
+                else:
+                    del(self.__array_tasks[array_number])
+            except KeyError:
+                pass
+        if self.__journal_file is not None:
+            # Remove the job script (and task table) and the
+            # journal record
+            if remove_job_dir:
+                array_number = str(job_number).split('.')[0]
+                names = ["job_script.%s.sh" % array_number]
+                if '.' in str(job_number):
+                    names.append("tasks.%s" % array_number)
+                for name in names:
+                    try:
+                        os.remove(os.path.join(self.__admin_dir,name))
+                    except OSError:
+                        pass
+            try:
+                del(self.__journal_records[str(job_number)])
+            except KeyError:
+                pass
+        else:
+            try:
+                # Remove the directory and contents
+                if remove_job_dir:
+                    shutil.rmtree(job_dir)
+            except Exception as ex:
+                logging.warning("GEJobRunner: exception cleaning up for "
+                                "job %s (ignored): %s" % (job_id,ex))
+            try:
+                # Remove the exit code file
+                os.remove(self.__exit_code_file(job_number))
+            except OSError:
+                pass
         # Clear stored error state
         try:
             del(self.__error_state[job_id])
         except KeyError:
             pass
+        # Remove the id of the packed job
+        try:
+            del(self.__pack_ids[job_id])
+        except KeyError:
+            pass
         # Remove the internally stored job number
         del(self.__job_number[job_id])
 
@@ -1002,9 +3040,32 @@ exit $exit_code
 
         NB as 'qstat' calls can be expensive to make, a caching
         mechanism is used which stores the output from 'qstat'
-        for a specified period.
+        for a specified period. Only one thread refreshes the
+        cache at a time, so 'qstat' is run at most once per
+        cache lifetime.
         """
         # Should we return the cached data?
+        if (time.time() - self.__cached_qstat_output_timestamp) < \
+           self.__cached_qstat_output_lifetime:
+            logging.debug("GEJobRunner: returning cached qstat output")
+            return self.__cached_qstat_output
+        # Wait for lock on qstat
+        lock = None
+        while lock is None:
+            lock = self.__qstat_lock.acquire("qstat")
+        try:
+            return self.__refresh_qstat_output()
+        finally:
+            self.__qstat_lock.release(lock)
+
+    def __refresh_qstat_output(self):
+        """Internal: run qstat and update the cached output
+
+        Should only be invoked by '__run_qstat' when the lock
+        on qstat is held.
+        """
+        # Check if the cache was refreshed while waiting
+        # for the lock
         if (time.time() - self.__cached_qstat_output_timestamp) < \
            self.__cached_qstat_output_lifetime:
             logging.debug("GEJobRunner: returning cached qstat output")
@@ -1036,8 +3097,13 @@ exit $exit_code
                 # Skip this line
                 pass
         # Update the cache
-        self.__cached_qstat_output_timestamp = time.time()
+        job_states = {}
+        for job_data in qstat_output:
+            for job_id in self.__qstat_job_ids(job_data):
+                job_states[job_id] = job_data[4]
+        self.__cached_qstat_job_states = job_states
         self.__cached_qstat_output = qstat_output
+        self.__cached_qstat_output_timestamp = time.time()
         return qstat_output
 
     def __run_qacct(self,job_id):
@@ -1079,12 +3145,21 @@ exit $exit_code
         expensive to perform, and are best avoided unless absolutely
         necessary.
         """
-        cmd = ['qacct','-j',"%s" % job_id]
+        if '.' in job_id:
+            # Array job task
+            array_id,task_id = job_id.split('.')
+            cmd = ['qacct','-j',array_id,'-t',task_id]
+        else:
+            cmd = ['qacct','-j',"%s" % job_id]
         # Run the qacct command
-        p = subprocess.Popen(cmd,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE,
-                             universal_newlines=True)
+        try:
+            p = subprocess.Popen(cmd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        except OSError as ex:
+            logging.debug("Job %s: unable to run qacct: %s" % (job_id,ex))
+            return None
         stdoutdata,stderrdata = p.communicate()
         # Check stderr in case output is not available
         # e.g. "error: job id 18384 not found"
@@ -1113,7 +3188,7 @@ exit $exit_code
         # exit_status  0
         # ...
         # i.e. key-value pairs, one pair per line
-        for line in p.stdout:
+        for line in stdoutdata.split('\n'):
             try:
                 i = line.index(" ")
                 key = line[:i].strip()
@@ -1129,23 +3204,60 @@ exit $exit_code
         Internal: get the state code for a job id
 
         Will be one of the GE job state codes, or an empty
-        string if the job id isn't found.
+        string if the job id isn't found. Jobs in a pack have
+        the state of the packed job.
         """
         # Run qstat and process output to get job states
         logging.debug("GEJobRunner: acquiring state for job %s"
                       % job_id)
-        qstat = self.__run_qstat()
-        job_ids = []
-        job_states = {}
-        for job_data in qstat:
-            id_ = job_data[0]
-            state = job_data[4]
+        self.__run_qstat()
+        try:
+            state = self.__cached_qstat_job_states[
+                self.__pack_ids.get(job_id,job_id)]
             logging.debug("GEJobRunner: found job %s (state '%s')"
-                          % (id_,state))
-            if id_ == job_id:
-                return state
-        # Job not found
-        return ""
+                          % (job_id,state))
+            return state
+        except KeyError:
+            # Job not found
+            return ""
+
+    def __qstat_job_ids(self,job_data):
+        """
+        Internal: return the job ids for a line of qstat output
+
+        For array jobs the 'ja-task-ID' column holds either a
+        single task id, or a range (e.g. '1-4:1') or list
+        (e.g. '1,3') of task ids for pending tasks; the job ids
+        are returned as 'JOBID.TASKID' for each task in this
+        case.
+        """
+        # Columns are: job-ID, prior, name, user, state, submit
+        # date & time, queue (not present for pending jobs),
+        # slots and ja-task-ID (array jobs only)
+        try:
+            slots = 7
+            if not job_data[slots].isdigit():
+                slots += 1
+            task_ids = job_data[slots+1]
+        except IndexError:
+            return [job_data[0]]
+        job_ids = []
+        for task_range in task_ids.split(','):
+            try:
+                if ':' in task_range:
+                    task_range,step = task_range.split(':')
+                    step = int(step)
+                else:
+                    step = 1
+                if '-' in task_range:
+                    first,last = [int(t) for t in task_range.split('-')]
+                else:
+                    first = last = int(task_range)
+            except ValueError:
+                continue
+            for task_id in range(first,last+1,step):
+                job_ids.append("%s.%d" % (job_data[0],task_id))
+        return job_ids
 
     def __ge_name(self,name):
         """Internal: sanitize a name for use with GE
@@ -1320,17 +3432,179 @@ class ResourceLock(object):
 # Functions
 #######################################################################
 
-def fetch_runner(definition):
+def _import_callable(name):
+    """Internal: import and return a callable from its import path
+
+    Arguments:
+      name: import path of the callable, either of the form
+        'package.module.function' or 'package.module:function'
+
+    Returns:
+      The callable object.
+    """
+    if ':' in name:
+        module_name,attr = name.split(':',1)
+    else:
+        module_name,attr = name.rsplit('.',1)
+    obj = importlib.import_module(module_name)
+    for part in attr.split('.'):
+        obj = getattr(obj,part)
+    if not callable(obj):
+        raise TypeError("'%s' is not callable" % name)
+    return obj
+
+def _run_python_function(func,args,working_dir,log_file,err_file,nslots):
+    """Internal: run a Python callable for a PythonFunctionRunner
+
+    Executed in a worker process: redirects stdout and
+    stderr to the log files and runs the callable in the
+    working directory, restoring the state of the worker
+    afterwards.
+
+    Arguments:
+      func: callable (or import path of a callable) to run
+      args: arguments to supply to the callable
+      working_dir: directory to run the callable in
+      log_file: file to write stdout to
+      err_file: file to write stderr to (or None to write
+        to the same file as stdout)
+      nslots: value to set for 'BCFTBX_RUNNER_NSLOTS'
+
+    Returns:
+      Exit status for the job.
+    """
+    cwd = os.getcwd()
+    env_nslots = os.environ.get('BCFTBX_RUNNER_NSLOTS')
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_streams = (sys.stdout,sys.stderr)
+    saved_fds = (os.dup(1),os.dup(2))
+    log = io.open(log_file,'wb')
+    err = io.open(err_file,'wb') if err_file else log
+    os.dup2(log.fileno(),1)
+    os.dup2(err.fileno(),2)
+    # Python-level streams may not write to the standard file
+    # descriptors (e.g. if they were replaced in the parent
+    # process) so also replace these
+    sys.stdout = os.fdopen(os.dup(1),'w',1)
+    sys.stderr = os.fdopen(os.dup(2),'w',1)
+    try:
+        os.environ['BCFTBX_RUNNER_NSLOTS'] = "%s" % nslots
+        os.chdir(working_dir)
+        if not callable(func):
+            try:
+                func = _import_callable(func)
+            except Exception as ex:
+                sys.stderr.write("Unable to import '%s': %s\n" % (func,ex))
+                return 127
+        try:
+            status = func(*args)
+        except SystemExit as ex:
+            status = ex.code
+            if status is not None and not isinstance(status,int):
+                sys.stderr.write("%s\n" % status)
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        if not isinstance(status,int) or isinstance(status,bool):
+            status = 0
+        return status
+    finally:
+        sys.stdout.close()
+        sys.stderr.close()
+        sys.stdout,sys.stderr = saved_streams
+        os.dup2(saved_fds[0],1)
+        os.dup2(saved_fds[1],2)
+        for fd in saved_fds:
+            os.close(fd)
+        log.close()
+        if err is not log:
+            err.close()
+        os.chdir(cwd)
+        if env_nslots is None:
+            del(os.environ['BCFTBX_RUNNER_NSLOTS'])
+        else:
+            os.environ['BCFTBX_RUNNER_NSLOTS'] = env_nslots
+
+def _timed_python_function(*args):
+    """Internal: run a Python callable and time it
+
+    Wraps '_run_python_function' (which is called with the
+    supplied arguments) to measure the start and end times
+    and the CPU time used by the worker process.
+
+    Returns:
+      Tuple of the exit status for the job and a dictionary
+      with the metrics.
+    """
+    start_time = time.time()
+    cpu_time = sum(os.times()[:2])
+    status = _run_python_function(*args)
+    return (status,dict(start_time=start_time,
+                        end_time=time.time(),
+                        cpu_time=sum(os.times()[:2]) - cpu_time))
+
+def _wait_for_process(p):
+    """Internal: wait for a subprocess to exit
+
+    Uses 'os.wait4' so that the resource usage of the
+    process is also collected (falling back to 'wait' if
+    this isn't available). Note that the 'returncode' of
+    the Popen instance isn't set when 'os.wait4' is used.
+
+    Arguments:
+      p: subprocess.Popen instance
+
+    Returns:
+      Tuple of the exit status (negative if the process
+      was killed by a signal) and the resource usage (or
+      None if this isn't available).
+    """
+    try:
+        pid,status,rusage = os.wait4(p.pid,0)
+    except (AttributeError,OSError):
+        return (p.wait(),None)
+    if os.WIFSIGNALED(status):
+        return (-os.WTERMSIG(status),rusage)
+    return (os.WEXITSTATUS(status),rusage)
+
+def _rusage_metrics(rusage):
+    """Internal: return job metrics from a resource usage object
+
+    Arguments:
+      rusage: resource usage returned from 'os.wait4' (or
+        None)
+
+    Returns:
+      Dictionary with the peak memory ('max_rss', in kB)
+      and CPU time ('cpu_time', in seconds).
+    """
+    if rusage is None:
+        return {}
+    max_rss = rusage.ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes rather than kB
+        max_rss = max_rss//1024
+    return dict(max_rss=max_rss,
+                cpu_time=rusage.ru_utime + rusage.ru_stime)
+
+def fetch_runner(definition,settings=None):
     """Return job runner instance based on a definition string
 
     Given a definition string, returns an appropriate runner
     instance.
 
+    Additional keyword arguments for the runner (e.g. the
+    dictionary returned by the 'settings' method of another
+    runner) can be supplied via 'settings'.
+
     Definitions are of the form:
 
       RunnerName[(args)]
 
-    RunnerName can be 'SimpleJobRunner' or 'GEJobRunner'.
+    RunnerName can be 'SimpleJobRunner', 'GEJobRunner' or
+    'LocalSchedulerRunner' (or 'local' for short).
     If '(args)' are also supplied then:
 
     - for SimpleJobRunners, this can be a list of optional
@@ -1344,7 +3618,18 @@ def fetch_runner(definition):
     - for GEJobRunners, this is a set of arbitrary 'qsub'
       options that will be used on job submission.
 
+    - for LocalSchedulerRunners, this can be a list of optional
+      arguments separated by spaces or commas:
+      * 'cores=N' (where N is an integer; sets the total number
+        of cores available to jobs)
+      * 'nslots=N' (sets the default number of slots per job)
+      * 'join_logs=BOOLEAN' (as for SimpleJobRunner)
+      * 'pin_cpus=BOOLEAN' (sets whether jobs should be pinned to
+        the CPUs assigned to them)
+
     """
+    if settings is None:
+        settings = {}
     if definition.startswith('SimpleJobRunner'):
         if definition.startswith('SimpleJobRunner(') and \
            definition.endswith(')'):
@@ -1366,13 +3651,42 @@ def fetch_runner(definition):
                 else:
                     raise Exception("Unrecognised argument for "
                                     "SimpleJobRunner definition: %s" % arg)
-            return SimpleJobRunner(join_logs=join_logs,nslots=nslots)
+            return SimpleJobRunner(join_logs=join_logs,nslots=nslots,
+                                   **settings)
         else:
-            return SimpleJobRunner(join_logs=True)
+            return SimpleJobRunner(join_logs=True,**settings)
     elif definition.startswith('GEJobRunner'):
         if definition.startswith('GEJobRunner(') and definition.endswith(')'):
             ge_extra_args = definition[len('GEJobRunner('):len(definition)-1].split(' ')
-            return GEJobRunner(ge_extra_args=ge_extra_args)
+            return GEJobRunner(ge_extra_args=ge_extra_args,**settings)
         else:
-            return GEJobRunner()
+            return GEJobRunner(**settings)
+    elif definition.startswith('LocalSchedulerRunner') or \
+         definition == 'local' or definition.startswith('local('):
+        name = definition.split('(')[0]
+        kws = dict(join_logs=True)
+        if definition.startswith(name+'(') and definition.endswith(')'):
+            args = definition[len(name+'('):len(definition)-1]
+            for arg in args.replace(',',' ').split():
+                key,value = (arg.split('=',1)+[''])[:2]
+                if key in ('cores','nslots'):
+                    kws[key] = int(value)
+                elif key in ('join_logs','pin_cpus'):
+                    if value.lower() in ('true','yes','y'):
+                        kws[key] = True
+                    elif value.lower() in ('false','no','n'):
+                        kws[key] = False
+                    else:
+                        raise Exception("Invalid value for "
+                                        "LocalSchedulerRunner '%s': %s" %
+                                        (key,value))
+                else:
+                    raise Exception("Unrecognised argument for "
+                                    "LocalSchedulerRunner definition: %s"
+                                    % arg)
+        elif definition != name:
+            raise Exception("Unrecognised runner definition: %s" %
+                            definition)
+        kws.update(settings)
+        return LocalSchedulerRunner(**kws)
     raise Exception("Unrecognised runner definition: %s" % definition)
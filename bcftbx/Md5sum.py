@@ -37,6 +37,16 @@ There is also a high-level class 'Md5Checker' which implements various
 class methods for running MD5 checks across all files in a directory, and
 a wrapper class 'Md5Reporter' which
 
+The 'Md5Cache' class provides an optional persistent store of checksums
+(held in an SQLite database) which can be supplied to the 'Md5Checker'
+methods, so that files which haven't changed since they were last
+checksummed don't need to be read again.
+
+The 'Md5Manifest' class builds a hierarchical (Merkle tree) manifest of
+MD5 sums for a directory, which can be saved and used to incrementally
+check copies of the directory (or the directory itself at a later time)
+by only examining the parts which have changed.
+
 """
 
 #######################################################################
@@ -47,7 +57,15 @@ import sys
 import os
 import io
 import logging
+import stat
 import hashlib
+import json
+import gzip
+import sqlite3
+import random
+import threading
+from multiprocessing.pool import ThreadPool
+from . import utils
 
 #######################################################################
 # Modules constants
@@ -77,9 +95,40 @@ class Md5Checker(object):
     LINKS_SAME=5
     LINKS_DIFFER=6
     TYPES_DIFFER=7
+    SIZES_DIFFER=8
     # Class constants representing link handling
     FOLLOW_LINKS=0
     IGNORE_LINKS=1
+    # Class constants representing comparison levels
+    CMP_TYPE=0
+    CMP_SIZE=1
+    CMP_SAMPLE=2
+    CMP_MD5=3
+    # Names for comparison levels (indexed by level)
+    CMP_LEVEL_NAMES=('type','size','sample','md5')
+    # Class constants representing verification order
+    ORDER_MANIFEST=0
+    ORDER_INODE=1
+    ORDER_DIRECTORY=2
+    # Names for verification orders (indexed by order)
+    ORDER_NAMES=('manifest','inode','directory')
+
+    @classmethod
+    def md5sum(self,f,cache=None):
+        """Return the MD5 sum for a file, using a cache if supplied
+
+        Arguments:
+          f: name and path of the file
+          cache: (optional) Md5Cache instance to fetch and store
+            checksums from and to
+
+        Returns:
+          Md5sum digest for the file.
+
+        """
+        if cache is not None:
+            return cache.md5sum(f)
+        return md5sum(f)
 
     @classmethod
     def walk(self,dirn,links=FOLLOW_LINKS):
@@ -92,10 +141,13 @@ class Md5Checker(object):
         How symbolic links are handled depends on the setting of the
         'links' option:
 
-        FOLLOW_LINKS: symbolic links to files are treated as files; links
-                      to directories are followed.
+        FOLLOW_LINKS: symbolic links to files are treated as files
+                      (including broken links); links to directories
+                      are not traversed.
         IGNORE_LINKS: symbolic links to files are ignored; links to
-                      directories are not followed.
+                      directories are not traversed.
+
+        The traversal is performed by 'bcftbx.utils.scan_tree'.
 
         Arguments:
           dirn: name of the top-level directory
@@ -105,18 +157,18 @@ class Md5Checker(object):
           Yields the name and full path for each file under 'dirn'.
           
         """
-        for d in os.walk(dirn):
-            if os.path.islink(d[0]) and links != self.FOLLOW_LINKS:
-                continue
-            for f in d[2]:
-                path = os.path.join(d[0],f)
-                if os.path.islink(path) and links != self.FOLLOW_LINKS:
-                    continue
-                else:
-                    yield os.path.normpath(path)
+        if links == self.FOLLOW_LINKS:
+            link_handling = utils.NOFOLLOW_LINKS
+        else:
+            if os.path.islink(dirn):
+                return
+            link_handling = utils.IGNORE_LINKS
+        for entry in utils.scan_tree(dirn,links=link_handling):
+            if not entry.is_dir():
+                yield os.path.normpath(entry.path)
 
     @classmethod
-    def md5_walk(self,dirn,links=FOLLOW_LINKS):
+    def md5_walk(self,dirn,links=FOLLOW_LINKS,cache=None):
         """Calculate MD5 sums for all files in directory
 
         Given a directory, traverses the structure underneath (including
@@ -129,6 +181,7 @@ class Md5Checker(object):
         Arguments:
           dirn: name of the top-level directory
           links: (optional) specify how symbolic links are handled
+          cache: (optional) Md5Cache instance to use for checksums
 
         Returns:
           Yields a tuple (f,md5) where f is the path of a file relative to
@@ -136,10 +189,10 @@ class Md5Checker(object):
 
         """
         for f in self.walk(dirn,links=links):
-            yield (os.path.relpath(f,dirn),md5sum(f))
+            yield (os.path.relpath(f,dirn),self.md5sum(f,cache=cache))
 
     @classmethod
-    def md5cmp_files(self,f1,f2):
+    def md5cmp_files(self,f1,f2,cache=None):
         """Compares the MD5 sums of two files 
 
         Given two file names, attempts to compute and compare their
@@ -158,6 +211,7 @@ class Md5Checker(object):
         Arguments:
           f1: name and path for reference file
           f2: name and path for file to be checked
+          cache: (optional) Md5Cache instance to use for checksums
 
         Returns:
           Md5Checker constant representing the outcome of the
@@ -166,7 +220,7 @@ class Md5Checker(object):
         """
         # Compute and compare MD5 sums
         try:
-            if md5sum(f1) == md5sum(f2):
+            if self.md5sum(f1,cache=cache) == self.md5sum(f2,cache=cache):
                 status = self.MD5_OK
             else:
                 status = self.MD5_FAILED
@@ -177,7 +231,93 @@ class Md5Checker(object):
         return status
 
     @classmethod
-    def md5cmp_dirs(self,d1,d2,links=FOLLOW_LINKS):
+    def cmp_files(self,f1,f2,level=CMP_MD5,cache=None):
+        """Compares two files using increasingly expensive checks
+
+        Given two file names, compares them in tiers and stops
+        as soon as a difference is found, or once the requested
+        comparison level has been reached:
+
+        CMP_TYPE:   both paths must exist and be regular files (or
+                    links to regular files), otherwise returns
+                    MD5_ERROR;
+        CMP_SIZE:   if the file sizes differ then returns
+                    SIZES_DIFFER (or MD5_FAILED if the level is
+                    CMP_MD5, since the MD5 sums must also differ);
+        CMP_SAMPLE: if the MD5 sums of sampled blocks from the
+                    start, middle and end of each file differ then
+                    returns MD5_FAILED;
+        CMP_MD5:    if the MD5 sums of the full files differ then
+                    returns MD5_FAILED.
+
+        If all the checks up to and including the requested level
+        pass then returns MD5_OK.
+
+        Note that only CMP_MD5 (the default) is equivalent to
+        'md5cmp_files'; the lower levels are faster but can only
+        prove that files are different, not that they're the same.
+
+        Arguments:
+          f1: name and path for reference file
+          f2: name and path for file to be checked
+          level: (optional) Md5Checker constant specifying the
+            highest level of comparison to perform
+          cache: (optional) Md5Cache instance to use for checksums
+
+        Returns:
+          Md5Checker constant representing the outcome of the
+          comparison.
+
+        """
+        # Existence and type
+        try:
+            st1 = os.stat(f1)
+            st2 = os.stat(f2)
+        except OSError as ex:
+            logging.error("%s: error while comparing files: '%s'" % (f1,ex))
+            return self.MD5_ERROR
+        if not (stat.S_ISREG(st1.st_mode) and stat.S_ISREG(st2.st_mode)):
+            logging.error("%s: can't compare, not regular files" % f1)
+            return self.MD5_ERROR
+        if level <= self.CMP_TYPE:
+            return self.MD5_OK
+        # Sizes
+        if st1.st_size != st2.st_size:
+            if level >= self.CMP_MD5:
+                return self.MD5_FAILED
+            return self.SIZES_DIFFER
+        if level <= self.CMP_SIZE:
+            return self.MD5_OK
+        # Sampled blocks: for CMP_MD5 these are only used as a
+        # quick check before reading large files in full, so are
+        # skipped for small files (where the sample covers the
+        # whole file) and if either file has a valid cached MD5
+        # sum (to avoid reading files unnecessarily)
+        if level == self.CMP_SAMPLE:
+            sample = True
+        elif st1.st_size <= 3*BLOCKSIZE:
+            sample = False
+        elif cache is not None and (cache.lookup(f1,st1) or
+                                    cache.lookup(f2,st2)):
+            sample = False
+        else:
+            sample = True
+        if sample:
+            try:
+                if sampled_md5sum(f1) != sampled_md5sum(f2):
+                    return self.MD5_FAILED
+            except IOError as ex:
+                logging.error("%s: error while generating sampled MD5 "
+                              "sums: '%s'" % (f1,ex))
+                return self.MD5_ERROR
+        if level <= self.CMP_SAMPLE:
+            return self.MD5_OK
+        # Full MD5 sums
+        return self.md5cmp_files(f1,f2,cache=cache)
+
+    @classmethod
+    def md5cmp_dirs(self,d1,d2,links=FOLLOW_LINKS,cache=None,
+                    level=CMP_MD5):
         """Compares the contents of one directory with another using MD5 sums
 
         Given two directory names 'd1' and 'd2', compares the MD5 sum of
@@ -192,6 +332,12 @@ class Md5Checker(object):
 
         If one or both MD5 sums cannot be computed then yields MD5_ERROR.
 
+        The 'level' option allows cheaper checks to be used (see the
+        'cmp_files' method for details); in this case SIZES_DIFFER can
+        also be yielded, if the file sizes don't match. (At the default
+        CMP_MD5 level, files with different sizes are reported as
+        MD5_FAILED without being read.)
+
         How symbolic links are handled depends on the setting of the 'links'
         option:
 
@@ -206,6 +352,10 @@ class Md5Checker(object):
           d1: 'reference' directory
           d2: 'target' directory to be compared with the reference
           links: (optional) specify how symbolic links are handled.
+          cache: (optional) Md5Cache instance to use for checksums
+          level: (optional) Md5Checker constant specifying the
+            highest level of comparison to perform (defaults to
+            CMP_MD5 i.e. full MD5 sums)
 
         Returns:
           Yields a tuple (f,status) where f is the relative path of the
@@ -219,7 +369,7 @@ class Md5Checker(object):
                 result = self.MISSING_TARGET
             else:
                 try:
-                    result = self.md5cmp_files(f1,f2)
+                    result = self.cmp_files(f1,f2,level=level,cache=cache)
                 except Exception as ex:
                     logging.debug("Failed to compute one or both checksums:")
                     logging.debug("Reference file: %s" % f1)
@@ -229,7 +379,7 @@ class Md5Checker(object):
             yield (os.path.relpath(f1,d1),result)
 
     @classmethod
-    def compute_md5sums(self,d,links=FOLLOW_LINKS):
+    def compute_md5sums(self,d,links=FOLLOW_LINKS,cache=None):
         """Calculate MD5 sums for all files in directory
 
         Given a directory, traverses the structure underneath (including
@@ -242,6 +392,7 @@ class Md5Checker(object):
         Arguments:
           dirn: name of the top-level directory
           links: (optional) specify how symbolic links are handled
+          cache: (optional) Md5Cache instance to use for checksums
 
         Returns:
           Yields a tuple (f,md5) where f is the path of a file relative to
@@ -250,13 +401,14 @@ class Md5Checker(object):
         """
         for f in self.walk(d,links=links):
             try:
-                md5 = md5sum(f)
+                md5 = self.md5sum(f,cache=cache)
                 yield (os.path.relpath(f,d),md5)
             except IOError as ex:
                 logging.error("md5sum: %s: %s" % (f,ex))
 
     @classmethod
-    def verify_md5sums(self,filen=None,fp=None):
+    def verify_md5sums(self,filen=None,fp=None,cache=None,
+                       order=ORDER_MANIFEST,nthreads=1,ordered=True):
         """Verify md5sums from a file
 
         Given a file (or a file-like object opened for reading), reads
@@ -280,9 +432,34 @@ class Md5Checker(object):
         there is a problem computing the MD5 sum then it yields
         MD5_ERROR.
 
+        By default files are verified one at a time in the order
+        that they appear in the file. For large sets of files the
+        'order' option can be used to improve read locality:
+
+        ORDER_MANIFEST : (default) verify in the order listed
+        ORDER_INODE    : verify in order of device and inode number
+        ORDER_DIRECTORY: verify in order of parent directory and name
+
+        in which case all the files are read from the file and stat'ed
+        up front, before the MD5 sums are checked. The 'nthreads' option
+        specifies the number of threads used for the stat and MD5 sum
+        operations.
+
+        When 'order' or 'nthreads' are set then the results are still
+        yielded in the original order from the file (via a reorder
+        buffer), unless 'ordered' is set to False, in which case each
+        result is yielded as soon as it is available.
+
         Arguments:
           filen: name of the file containing md5sum output
           fp   : file-like object opened for reading, with md5sum output
+          cache: (optional) Md5Cache instance to use for checksums
+          order: (optional) Md5Checker constant specifying the
+            order that the files are verified in
+          nthreads: (optional) number of threads to use (default: 1)
+          ordered: (optional) if False then yield results in the
+            order that they complete, rather than the order from the
+            file (ignored unless 'order' or 'nthreads' are set)
 
         Returns:
           Yields a tuple (f,status) where f is the path of the file being
@@ -294,24 +471,86 @@ class Md5Checker(object):
             filen=None
         else:
             fp = io.open(filen,'rt')
+        try:
+            if order == self.ORDER_MANIFEST and nthreads == 1:
+                # Verify each line in turn
+                for f,chksum in self._read_md5sums(fp):
+                    if not os.path.exists(f):
+                        status = self.MISSING_TARGET
+                    else:
+                        status = self._verify_md5sum(f,chksum,cache=cache)
+                    yield (f,status)
+                return
+            # Read all the entries and stat the files up front
+            entries = list(self._read_md5sums(fp))
+            pool = ThreadPool(nthreads)
+            try:
+                stats = pool.map(_stat_or_none,[e[0] for e in entries])
+                # Determine the order to do the verification
+                indices = list(range(len(entries)))
+                if order == self.ORDER_INODE:
+                    indices.sort(key=lambda i:
+                                 (stats[i].st_dev,stats[i].st_ino)
+                                 if stats[i] is not None else (-1,-1))
+                elif order == self.ORDER_DIRECTORY:
+                    indices.sort(key=lambda i:
+                                 os.path.split(
+                                     os.path.abspath(entries[i][0])))
+                # Verify the MD5 sums
+                def verify(i):
+                    f,chksum = entries[i]
+                    if stats[i] is None:
+                        return (i,self.MISSING_TARGET)
+                    return (i,self._verify_md5sum(f,chksum,cache=cache))
+                reorder_buffer = {}
+                next_index = 0
+                for i,status in pool.imap_unordered(verify,indices):
+                    if not ordered:
+                        yield (entries[i][0],status)
+                        continue
+                    # Hold results until they can be yielded in
+                    # the original order
+                    reorder_buffer[i] = status
+                    while next_index in reorder_buffer:
+                        yield (entries[next_index][0],
+                               reorder_buffer.pop(next_index))
+                        next_index += 1
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            if filen is not None:
+                fp.close()
+
+    @classmethod
+    def _read_md5sums(self,fp):
+        """Internal: yield (f,chksum) tuples from md5sum output
+
+        Raises IndexError for lines which can't be interpreted.
+        """
         for line in fp:
             items = line.strip().split()
             if len(items) < 2:
                 raise IndexError("Bad MD5 sum line: %s" % line.rstrip('\n'))
             chksum = items[0]
             f = line[len(chksum):].strip()
-            try:
-                if not os.path.exists(f):
-                    status = self.MISSING_TARGET
-                elif md5sum(f) == chksum:
-                    status = self.MD5_OK
-                else:
-                    status = self.MD5_FAILED
-            except IOError as ex:
-                # Error accessing file
-                logging.error("%s: error while generating MD5 sum: '%s'" % (f,ex))
-                status = self.MD5_ERROR
-            yield (f,status)
+            yield (f,chksum)
+
+    @classmethod
+    def _verify_md5sum(self,f,chksum,cache=None):
+        """Internal: check the MD5 sum of an existing file
+
+        Returns MD5_OK, MD5_FAILED or MD5_ERROR.
+        """
+        try:
+            if self.md5sum(f,cache=cache) == chksum:
+                return self.MD5_OK
+            else:
+                return self.MD5_FAILED
+        except IOError as ex:
+            # Error accessing file
+            logging.error("%s: error while generating MD5 sum: '%s'" % (f,ex))
+            return self.MD5_ERROR
 
 class Md5CheckReporter(object):
     """Provides a generic reporting class for Md5Checker methods
@@ -337,6 +576,7 @@ class Md5CheckReporter(object):
     n_files  : total number of results examined
     n_ok     : number that passed MD5 checks (MD5_OK)
     n_failed : number that failed due to different MD5 sums (MD5_FAILED)
+               or different sizes (SIZES_DIFFER)
     n_missing: number that failed due to a missing target file
                (MISSING_TARGET)
     n_errors : number that had errors calculating their MD5 sums
@@ -416,6 +656,9 @@ class Md5CheckReporter(object):
             if status == Md5Checker.MD5_FAILED:
                 status_msg = "FAILED"
                 self._md5_failed.append(f)
+            elif status == Md5Checker.SIZES_DIFFER:
+                status_msg = "FAILED (sizes differ)"
+                self._md5_failed.append(f)
             elif status == Md5Checker.MISSING_TARGET:
                 status_msg = "MISSING"
                 self._missing_target.append(f)
@@ -455,6 +698,638 @@ class Md5CheckReporter(object):
         else:
             return 1
 
+class Md5Cache(object):
+    """Persistent cache of MD5 sums keyed on file metadata
+
+    Stores the MD5 sum for each file along with the size,
+    modification time (in nanoseconds) and inode number at the
+    time the checksum was computed, in an SQLite database.
+
+    When the checksum for a file is requested, the file is
+    stat'ed and if the metadata match the cached values then
+    the stored checksum is returned without reading the file;
+    otherwise the checksum is computed and the cache is updated.
+
+    Example usage:
+
+    >>> cache = Md5Cache("/data/.md5cache.sqlite")
+    >>> for f,md5 in Md5Checker.compute_md5sums(dirn,cache=cache):
+    ...    print("%s  %s" % (md5,f))
+    >>> cache.close()
+
+    Setting 'rehash' to True forces the checksums to be
+    recomputed regardless of the cached values (the cache is
+    still updated with the new values).
+
+    Setting 'verify_fraction' to a value between 0 and 1 causes
+    that fraction of cache hits to be recomputed anyway, as a
+    periodic check that the cache can still be trusted; cached
+    checksums which turn out not to match are reported as
+    warnings, counted by the 'n_stale' property, and replaced.
+
+    Md5Cache instances can be shared between threads.
+
+    The following properties report on cache usage:
+
+    n_hits    : number of checksums returned from the cache
+    n_misses  : number of checksums that had to be computed
+    n_verified: number of cache hits that were also recomputed
+    n_stale   : number of recomputed hits which didn't match
+    """
+    def __init__(self,db_file,rehash=False,verify_fraction=0.0,
+                 commit_interval=100):
+        """Create a new Md5Cache instance
+
+        Arguments:
+          db_file: path to the SQLite database file (will be
+            created if it doesn't already exist)
+          rehash: if True then ignore cached checksums and
+            always recompute (default is to trust the cache)
+          verify_fraction: fraction (between 0.0 and 1.0) of
+            cache hits to recompute as a check (default 0.0,
+            i.e. no checks)
+          commit_interval: number of updates to accumulate
+            before committing them to the database
+        """
+        if verify_fraction < 0.0 or verify_fraction > 1.0:
+            raise ValueError("verify_fraction must be between 0 and 1 "
+                             "(got %s)" % verify_fraction)
+        self._db_file = os.path.abspath(db_file)
+        self._rehash = bool(rehash)
+        self._verify_fraction = float(verify_fraction)
+        self._commit_interval = commit_interval
+        self._n_uncommitted = 0
+        self._n_hits = 0
+        self._n_misses = 0
+        self._n_verified = 0
+        self._n_stale = 0
+        self._lock = threading.Lock()
+        self._cx = sqlite3.connect(self._db_file,check_same_thread=False)
+        self._cx.execute("""
+        CREATE TABLE IF NOT EXISTS checksums (
+          path      VARCHAR PRIMARY KEY,
+          size      INTEGER,
+          mtime_ns  INTEGER,
+          inode     INTEGER,
+          md5       CHAR(32)
+        )
+        """)
+        self._cx.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    @property
+    def n_hits(self):
+        """Number of checksums returned from the cache
+        """
+        return self._n_hits
+
+    @property
+    def n_misses(self):
+        """Number of checksums which had to be computed
+        """
+        return self._n_misses
+
+    @property
+    def n_verified(self):
+        """Number of cache hits which were also recomputed
+        """
+        return self._n_verified
+
+    @property
+    def n_stale(self):
+        """Number of recomputed cache hits which didn't match
+        """
+        return self._n_stale
+
+    def lookup(self,f,st=None):
+        """Return the cached MD5 sum for a file
+
+        Returns the cached checksum if the current size,
+        modification time and inode for the file match the
+        stored values, otherwise returns None.
+
+        Arguments:
+          f: name and path of the file
+          st: (optional) 'os.stat' result for the file (will
+            be fetched if not supplied)
+        """
+        if st is None:
+            st = os.stat(f)
+        with self._lock:
+            cu = self._cx.cursor()
+            cu.execute("SELECT size,mtime_ns,inode,md5 FROM checksums "
+                       "WHERE path=?",(os.path.abspath(f),))
+            row = cu.fetchone()
+        if row is None:
+            return None
+        if tuple(row[:3]) != _stat_key(st):
+            return None
+        return row[3]
+
+    def store(self,f,chksum,st=None):
+        """Store the MD5 sum for a file in the cache
+
+        Arguments:
+          f: name and path of the file
+          chksum: MD5 sum for the file
+          st: (optional) 'os.stat' result for the file at the
+            time the checksum was computed (will be fetched if
+            not supplied)
+        """
+        if st is None:
+            st = os.stat(f)
+        size,mtime_ns,inode = _stat_key(st)
+        with self._lock:
+            self._cx.execute("INSERT OR REPLACE INTO checksums "
+                             "(path,size,mtime_ns,inode,md5) "
+                             "VALUES (?,?,?,?,?)",
+                             (os.path.abspath(f),size,mtime_ns,inode,chksum))
+            self._n_uncommitted += 1
+            if self._n_uncommitted >= self._commit_interval:
+                self._commit()
+
+    def md5sum(self,f):
+        """Return the MD5 sum for a file
+
+        Returns the cached checksum if the file appears to be
+        unchanged, otherwise computes the checksum and updates
+        the cache.
+
+        Raises IOError if the file can't be accessed.
+
+        Arguments:
+          f: name and path of the file
+        """
+        st = os.stat(f)
+        if not self._rehash:
+            chksum = self.lookup(f,st)
+            if chksum is not None:
+                with self._lock:
+                    self._n_hits += 1
+                    verify = (self._verify_fraction and
+                              random.random() < self._verify_fraction)
+                    if verify:
+                        self._n_verified += 1
+                if verify:
+                    actual = md5sum(f)
+                    if actual != chksum:
+                        logging.warning("%s: cached MD5 sum doesn't match "
+                                        "file contents (updating cache)"
+                                        % f)
+                        with self._lock:
+                            self._n_stale += 1
+                        self.store(f,actual,st)
+                        return actual
+                return chksum
+        with self._lock:
+            self._n_misses += 1
+        chksum = md5sum(f)
+        self.store(f,chksum,st)
+        return chksum
+
+    def commit(self):
+        """Commit pending updates to the database
+        """
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        """Commit pending updates and close the database
+        """
+        with self._lock:
+            if self._cx is not None:
+                self._commit()
+                self._cx.close()
+                self._cx = None
+
+    def _commit(self):
+        """Internal: commit updates (lock must already be held)
+        """
+        self._cx.commit()
+        self._n_uncommitted = 0
+
+class Md5Manifest(object):
+    """Hierarchical manifest of MD5 sums for a directory
+
+    An Md5Manifest holds a tree of nodes mirroring a directory
+    structure:
+
+    - each file node stores the size, modification time (in
+      nanoseconds) and MD5 sum of the file;
+    - each link node stores the target of the symbolic link;
+    - each directory node stores its children, plus a digest
+      computed from the names, types and MD5 sums, link
+      targets or digests of those children (so the digest of
+      a directory changes if anything underneath it changes).
+
+    Manifests are created using the 'build' method and can be
+    written to and read from file using the 'save' and 'load'
+    methods.
+
+    Two manifests can be compared using the 'compare' method,
+    which only descends into subdirectories whose digests
+    differ. A manifest can also be checked against a directory
+    on disk using the 'verify' method, in which case only files
+    whose size or modification time differ from those stored in
+    the manifest are read and checksummed.
+
+    Supplying an existing manifest when building a new one means
+    that only files which are new (or whose size or modification
+    time have changed) will be read, for example:
+
+    >>> manifest = Md5Manifest.build("/data/run")
+    >>> manifest.save("run.manifest")
+    ... # Top up the data in /data/run
+    >>> previous = Md5Manifest.load("run.manifest")
+    >>> verification = previous.verify("/data/run")
+    >>> for path,status in verification:
+    ...   print("%s: %s" % (path,status))
+    >>> print("Checksummed %d files" % verification.n_hashed)
+    >>> manifest = Md5Manifest.build("/data/run",previous=previous)
+
+    Symbolic links are recorded as links (i.e. their targets are
+    not checksummed), and links to directories are not
+    traversed. Files which are not regular files, directories or
+    links (e.g. FIFOs) are ignored.
+    """
+    # Node types
+    FILE = 'f'
+    DIRECTORY = 'd'
+    LINK = 'l'
+    # Version of the manifest file format
+    FORMAT_VERSION = 1
+
+    def __init__(self,root=None):
+        """Create a new Md5Manifest instance
+
+        Arguments:
+          root: (optional) the root directory node (if not
+            supplied then the manifest will be empty)
+        """
+        if root is None:
+            root = { 'type': self.DIRECTORY, 'children': {} }
+            self._set_digests(root)
+        self._root = root
+        self.n_hashed = 0
+
+    @property
+    def digest(self):
+        """Return the digest for the top-level directory
+        """
+        return self._root['digest']
+
+    @classmethod
+    def build(self,dirn,previous=None,cache=None,nthreads=1):
+        """Build a manifest for a directory
+
+        Arguments:
+          dirn: the directory to build the manifest for
+          previous: (optional) an existing Md5Manifest for the
+            directory; MD5 sums will be reused for files where
+            the size and modification time are unchanged
+          cache: (optional) Md5Cache instance used to look up and
+            store MD5 sums
+          nthreads: (optional) number of threads to use for
+            computing MD5 sums (default: 1)
+
+        Returns:
+          Md5Manifest instance; the 'n_hashed' property reports
+          the number of files which were checksummed.
+        """
+        dirn = os.path.abspath(dirn)
+        root = { 'type': self.DIRECTORY, 'children': {} }
+        if previous is not None:
+            previous = previous._root
+        dirs = { dirn: (root,previous) }
+        to_hash = []
+        for entry in utils.scan_tree(dirn):
+            parent,prev_parent = dirs[os.path.dirname(entry.path)]
+            prev = None
+            if prev_parent is not None:
+                prev = prev_parent['children'].get(entry.name)
+            if entry.is_symlink():
+                node = { 'type': self.LINK,
+                         'target': os.readlink(entry.path) }
+            elif entry.is_dir():
+                node = { 'type': self.DIRECTORY, 'children': {} }
+                if prev is not None and prev['type'] != self.DIRECTORY:
+                    prev = None
+                dirs[entry.path] = (node,prev)
+            elif entry.is_file():
+                size,mtime_ns,inode = _stat_key(
+                    entry.stat(follow_symlinks=False))
+                node = { 'type': self.FILE,
+                         'size': size,
+                         'mtime': mtime_ns }
+                if prev is not None and \
+                   prev['type'] == self.FILE and \
+                   prev['size'] == size and \
+                   prev['mtime'] == mtime_ns:
+                    node['md5'] = prev['md5']
+                else:
+                    to_hash.append((entry.path,node))
+            else:
+                logging.warning("%s: not a regular file, ignored" %
+                                entry.path)
+                continue
+            parent['children'][entry.name] = node
+        # Compute the outstanding checksums
+        def compute_md5sum(item):
+            f,node = item
+            node['md5'] = Md5Checker.md5sum(f,cache=cache)
+        if nthreads > 1 and to_hash:
+            pool = ThreadPool(nthreads)
+            try:
+                pool.map(compute_md5sum,to_hash)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for item in to_hash:
+                compute_md5sum(item)
+        self._set_digests(root)
+        manifest = self(root)
+        manifest.n_hashed = len(to_hash)
+        return manifest
+
+    @classmethod
+    def load(self,filen):
+        """Read a manifest from a file
+
+        Files with a '.gz' extension are assumed to be
+        gzip-compressed.
+
+        Arguments:
+          filen: name of the file to read the manifest from
+
+        Returns:
+          Md5Manifest instance.
+        """
+        if filen.endswith('.gz'):
+            fp = gzip.open(filen,'rb')
+        else:
+            fp = io.open(filen,'rb')
+        try:
+            data = json.loads(fp.read().decode('utf-8'))
+        finally:
+            fp.close()
+        if data.get('version') != self.FORMAT_VERSION:
+            raise ValueError("%s: unsupported manifest version '%s'" %
+                             (filen,data.get('version')))
+        return self(data['root'])
+
+    def save(self,filen):
+        """Write the manifest to a file
+
+        The manifest is written to a temporary file which
+        then replaces 'filen', so an existing manifest is not
+        lost if writing fails. Files with a '.gz' extension are
+        gzip-compressed.
+
+        Arguments:
+          filen: name of the file to write the manifest to
+        """
+        tmp_filen = "%s.tmp" % filen
+        data = json.dumps({ 'version': self.FORMAT_VERSION,
+                            'root': self._root },
+                          separators=(',',':'),
+                          sort_keys=True)
+        if filen.endswith('.gz'):
+            fp = gzip.open(tmp_filen,'wb')
+        else:
+            fp = io.open(tmp_filen,'wb')
+        try:
+            fp.write(data.encode('utf-8'))
+        finally:
+            fp.close()
+        os.rename(tmp_filen,filen)
+
+    def compare(self,other):
+        """Compare this manifest against another manifest
+
+        This manifest is treated as the reference, and
+        subdirectories are only examined where their digests
+        differ between the two manifests.
+
+        Arguments:
+          other: Md5Manifest instance to compare against
+
+        Returns:
+          Yields a tuple (path,status) for each file, link or
+          directory which differs, where 'path' is relative to
+          the top-level directory and 'status' is one of the
+          Md5Checker constants MD5_FAILED, SIZES_DIFFER,
+          LINKS_DIFFER, TYPES_DIFFER, MISSING_TARGET (missing
+          from 'other') or MISSING_SOURCE (only present in
+          'other').
+        """
+        for result in self._cmp_nodes(self._root,other._root,''):
+            yield result
+
+    def verify(self,dirn,cache=None,rehash=False,nthreads=1):
+        """Verify a directory on disk against the manifest
+
+        All directories are listed and all files have their
+        size and modification time checked against the
+        manifest; however only files where these differ are
+        read and checksummed (unless 'rehash' is specified).
+
+        Arguments:
+          dirn: the directory to verify
+          cache: (optional) Md5Cache instance used to look up and
+            store MD5 sums
+          rehash: (optional) if True then checksum all files,
+            regardless of whether their metadata has changed
+          nthreads: (optional) number of threads to use for
+            computing MD5 sums (default: 1)
+
+        Returns:
+          Md5ManifestVerification instance, which yields a
+          tuple (path,status) for each file, link or directory
+          which differs when iterated over (see the
+          'Md5ManifestVerification' class for details).
+        """
+        return Md5ManifestVerification(self,dirn,cache=cache,
+                                       rehash=rehash,nthreads=nthreads)
+
+    def _verify(self,dirn,cache,rehash,nthreads,verification):
+        """Internal: generator for verifying a directory
+
+        Yields (path,status) tuples for each difference, and
+        sets the 'n_hashed' property of 'verification' (an
+        Md5ManifestVerification instance) once the files which
+        need to be checksummed are known.
+        """
+        dirn = os.path.abspath(dirn)
+        to_hash = []
+        for result in self._verify_dir(dirn,self._root,'',to_hash,rehash):
+            yield result
+        def check_md5sum(item):
+            path,f,chksum = item
+            try:
+                if Md5Checker.md5sum(f,cache=cache) == chksum:
+                    return (path,Md5Checker.MD5_OK)
+                return (path,Md5Checker.MD5_FAILED)
+            except IOError:
+                return (path,Md5Checker.MD5_ERROR)
+        verification.n_hashed = len(to_hash)
+        if nthreads > 1 and to_hash:
+            pool = ThreadPool(nthreads)
+            try:
+                results = pool.imap(check_md5sum,to_hash)
+                for path,status in results:
+                    if status != Md5Checker.MD5_OK:
+                        yield (path,status)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for item in to_hash:
+                path,status = check_md5sum(item)
+                if status != Md5Checker.MD5_OK:
+                    yield (path,status)
+
+    def _verify_dir(self,dirn,node,path,to_hash,rehash):
+        """Internal: check a directory against a manifest node
+
+        Yields (path,status) tuples for differences found from
+        the directory listings and metadata, and appends tuples
+        (path,file,md5) to 'to_hash' for files which need to be
+        checksummed.
+        """
+        entries = dict([(entry.name,entry)
+                        for entry in utils.list_dir_entries(dirn)])
+        children = node['children']
+        for name in sorted(set(entries) | set(children)):
+            relpath = os.path.join(path,name) if path else name
+            entry = entries.get(name)
+            child = children.get(name)
+            if entry is not None:
+                if entry.is_symlink():
+                    entry_type = self.LINK
+                elif entry.is_dir():
+                    entry_type = self.DIRECTORY
+                elif entry.is_file():
+                    entry_type = self.FILE
+                else:
+                    # Ignore other types of file
+                    entry = None
+            if entry is None and child is None:
+                continue
+            elif entry is None:
+                yield (relpath,Md5Checker.MISSING_TARGET)
+            elif child is None:
+                yield (relpath,Md5Checker.MISSING_SOURCE)
+            elif entry_type != child['type']:
+                yield (relpath,Md5Checker.TYPES_DIFFER)
+            elif entry_type == self.LINK:
+                if os.readlink(entry.path) != child['target']:
+                    yield (relpath,Md5Checker.LINKS_DIFFER)
+            elif entry_type == self.DIRECTORY:
+                for result in self._verify_dir(entry.path,child,relpath,
+                                               to_hash,rehash):
+                    yield result
+            else:
+                size,mtime_ns,inode = _stat_key(
+                    entry.stat(follow_symlinks=False))
+                if size != child['size']:
+                    yield (relpath,Md5Checker.SIZES_DIFFER)
+                elif rehash or mtime_ns != child['mtime']:
+                    to_hash.append((relpath,entry.path,child['md5']))
+
+    @classmethod
+    def _cmp_nodes(self,node1,node2,path):
+        """Internal: compare two directory nodes
+
+        Yields (path,status) tuples for each difference.
+        """
+        if node1['digest'] == node2['digest']:
+            return
+        children1 = node1['children']
+        children2 = node2['children']
+        for name in sorted(set(children1) | set(children2)):
+            relpath = os.path.join(path,name) if path else name
+            child1 = children1.get(name)
+            child2 = children2.get(name)
+            if child2 is None:
+                yield (relpath,Md5Checker.MISSING_TARGET)
+            elif child1 is None:
+                yield (relpath,Md5Checker.MISSING_SOURCE)
+            elif child1['type'] != child2['type']:
+                yield (relpath,Md5Checker.TYPES_DIFFER)
+            elif child1['type'] == self.DIRECTORY:
+                for result in self._cmp_nodes(child1,child2,relpath):
+                    yield result
+            elif child1['type'] == self.LINK:
+                if child1['target'] != child2['target']:
+                    yield (relpath,Md5Checker.LINKS_DIFFER)
+            elif child1['size'] != child2['size']:
+                yield (relpath,Md5Checker.SIZES_DIFFER)
+            elif child1['md5'] != child2['md5']:
+                yield (relpath,Md5Checker.MD5_FAILED)
+
+    @classmethod
+    def _set_digests(self,node):
+        """Internal: compute and store digests for a directory node
+
+        Digests are computed for all subdirectories first;
+        returns the digest for 'node'.
+        """
+        chksum = hashlib.md5()
+        children = node['children']
+        for name in sorted(children):
+            child = children[name]
+            if child['type'] == self.DIRECTORY:
+                value = self._set_digests(child)
+            elif child['type'] == self.LINK:
+                value = child['target']
+            else:
+                value = child['md5']
+            chksum.update(_encode_path(u"%s\0%s\0%s\n" %
+                                       (name,child['type'],value)))
+        node['digest'] = chksum.hexdigest()
+        return node['digest']
+
+class Md5ManifestVerification(object):
+    """Results of verifying a directory against an Md5Manifest
+
+    Instances are returned by the 'Md5Manifest.verify' method.
+    Iterating over the instance verifies the directory and
+    yields a tuple (path,status) for each file, link or
+    directory which differs, where 'path' is relative to the
+    directory and 'status' is one of the Md5Checker constants
+    MD5_FAILED, MD5_ERROR, SIZES_DIFFER, LINKS_DIFFER,
+    TYPES_DIFFER, MISSING_TARGET (missing from disk) or
+    MISSING_SOURCE (only present on disk).
+
+    Once iteration has finished the 'n_hashed' property
+    reports the number of files which were checksummed (it
+    is None before then).
+    """
+    def __init__(self,manifest,dirn,cache=None,rehash=False,nthreads=1):
+        """Create a new Md5ManifestVerification instance
+
+        Arguments:
+          manifest: Md5Manifest instance to verify against
+          dirn: the directory to verify
+          cache: (optional) Md5Cache instance used to look up and
+            store MD5 sums
+          rehash: (optional) if True then checksum all files,
+            regardless of whether their metadata has changed
+          nthreads: (optional) number of threads to use for
+            computing MD5 sums (default: 1)
+        """
+        self.n_hashed = None
+        self._results = manifest._verify(dirn,cache,rehash,nthreads,self)
+
+    def __iter__(self):
+        return self._results
+
 #######################################################################
 # Functions
 #######################################################################
@@ -488,3 +1363,66 @@ def md5sum(f):
     if close_fp:
         fp.close()
     return chksum.hexdigest()
+
+def sampled_md5sum(f,blocksize=BLOCKSIZE):
+    """Return MD5 digest for blocks sampled from a file
+
+    Computes the MD5 digest of three blocks read from the
+    start, middle and end of the file (or the whole file,
+    if it is smaller than three blocks).
+
+    This is much cheaper than 'md5sum' for large files, but
+    can only be used to detect differences: files with
+    different sampled digests are different, but files with
+    the same sampled digests may still differ elsewhere.
+
+    Arguments:
+      f: name of the file to generate the checksum from
+      blocksize: (optional) size of each sampled block in
+        bytes (defaults to BLOCKSIZE)
+
+    Returns:
+      Md5sum digest for the sampled blocks.
+
+    """
+    chksum = hashlib.md5()
+    with io.open(f,"rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size <= 3*blocksize:
+            offsets = (0,)
+            blocksize = size
+        else:
+            offsets = (0,(size-blocksize)//2,size-blocksize)
+        for offset in offsets:
+            fp.seek(offset)
+            chksum.update(fp.read(blocksize))
+    return chksum.hexdigest()
+
+def _stat_or_none(f):
+    """Internal: return 'os.stat' result for a file, or None on error
+    """
+    try:
+        return os.stat(f)
+    except OSError:
+        return None
+
+def _stat_key(st):
+    """Internal: return (size,mtime_ns,inode) for 'os.stat' result
+    """
+    try:
+        mtime_ns = st.st_mtime_ns
+    except AttributeError:
+        # Python 2
+        mtime_ns = int(st.st_mtime*1e9)
+    return (st.st_size,mtime_ns,st.st_ino)
+
+def _encode_path(s):
+    """Internal: return path string encoded as bytes
+    """
+    if isinstance(s,bytes):
+        return s
+    try:
+        return s.encode('utf-8','surrogateescape')
+    except LookupError:
+        # Python 2
+        return s.encode('utf-8')
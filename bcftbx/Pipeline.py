@@ -21,6 +21,20 @@ The essential classes are:
 * SolidPipelineRunner: subclass of PipelineRunner specifically for
   running on SOLiD data (i.e. pairs of csfasta/qual files)
 
+The order that waiting jobs are started in is determined by the queue
+policy of the PipelineRunner:
+
+* JobQueue: start jobs in the order they were queued (the default)
+* LongestFirstJobQueue: start the jobs with the largest inputs first
+* GroupPriorityJobQueue: start jobs according to the priority of
+  their groups
+
+The maximum number of jobs that a PipelineRunner runs at once can be
+adjusted as the pipeline runs using a throttle:
+
+* AdaptiveThrottle: adjust the number of concurrent jobs according to
+  the load on the cluster
+
 There are also some useful methods:
 
 * GetSolidDataFiles: collect csfasta/qual file pairs from a specific
@@ -29,6 +43,7 @@ There are also some useful methods:
   end data
 * GetFastqFiles: collect fastq files from a specific directory
 * GetFastqGzFiles: collect gzipped fastq files
+* estimate_job_size: estimate the size of a job from its input files
 
 The PipelineRunners depend on the JobRunner instances (created from
 classes in the JobRunner module) to interface with the job management
@@ -41,6 +56,10 @@ system. So typical usage might look like:
 >>> pipeline.queueJob(...)
 >>> pipeline.run()
 
+Alternatively a pipeline can be run from an asyncio event loop using
+the 'run_async' method of PipelineRunner (which uses the
+AsyncJobRunner module, and requires Python 3.6 or later).
+
 """
 
 #######################################################################
@@ -49,8 +68,14 @@ system. So typical usage might look like:
 
 import sys
 import os
+import io
 import re
 import time
+import json
+import heapq
+import collections
+import csv
+import stat
 try:
     # Python 3
     import queue
@@ -58,6 +83,35 @@ except ImportError:
     # Python 2
     import Queue as queue
 import logging
+from . import Md5sum
+from .JobRunner import BaseJobRunner
+from .JobRunner import SimpleJobRunner
+from .JobRunner import GEJobRunner
+from .JobRunner import LocalSchedulerRunner
+from .JobRunner import fetch_runner
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Fields in the job metrics records written by PipelineRunner
+METRICS_FIELDS = ('pipeline',
+                  'name',
+                  'label',
+                  'group',
+                  'job_id',
+                  'working_dir',
+                  'status',
+                  'exit_status',
+                  'submit_time',
+                  'start_time',
+                  'end_time',
+                  'queue_wait',
+                  'run_time',
+                  'queue',
+                  'nslots',
+                  'max_rss',
+                  'cpu_time')
 
 #######################################################################
 # Class definitions
@@ -95,7 +149,8 @@ class Job(object):
     The Job class uses a JobRunner instance (which supplies the necessary methods for
     starting, stopping and monitoring) for low-level job interactions.
     """
-    def __init__(self,runner,name,dirn,script,args,label=None,group=None):
+    def __init__(self,runner,name,dirn,script,args,label=None,group=None,
+                 depends_on=None,inputs=None,outputs=None):
         """Create an instance of Job.
 
         Arguments:
@@ -110,6 +165,10 @@ class Job(object):
           group: (optional) arbitrary string to use as a 'group' identifier;
             assign the same 'group' label to multiple jobs to indicate they're
             related
+          depends_on: (optional) list of Job instances which must complete
+            successfully before this job can be started
+          inputs: (optional) list of files which are read by the job
+          outputs: (optional) list of files which are written by the job
         """
         self.name = name
         self.working_dir = dirn
@@ -117,11 +176,18 @@ class Job(object):
         self.args = args
         self.label = label
         self.group_label = group
+        if depends_on is None:
+            depends_on = []
+        self.depends_on = list(depends_on)
+        self.inputs = list(inputs) if inputs else []
+        self.outputs = list(outputs) if outputs else []
         self.job_id = None
         self.log = None
         self.submitted = False
         self.failed = False
         self.terminated = False
+        self.skipped = False
+        self.up_to_date = False
         self.start_time = None
         self.end_time = None
         self.exit_status = None
@@ -135,14 +201,22 @@ class Job(object):
         # (seconds)
         self.__timeout = 3600
 
-    def start(self):
+    def start(self,job_id=None):
         """Start the job running
 
+        Arguments:
+          job_id: (optional) if the job has already been submitted
+            via the runner (e.g. as a task in an array job) then
+            supply the id returned by the runner
+
         Returns:
           Id for job
         """
         if not self.submitted and not self.__finished:
-            self.job_id = self.__runner.run(self.name,self.working_dir,self.script,self.args)
+            if job_id is None:
+                job_id = self.__runner.run(self.name,self.working_dir,self.script,
+                                           self.args)
+            self.job_id = job_id
             self.submitted = True
             self.start_time = time.time()
             if self.job_id is None:
@@ -207,12 +281,57 @@ class Job(object):
         # Resubmit
         return self.start()
 
-    def isRunning(self):
+    def skip(self,up_to_date=False):
+        """Mark the job as finished without running it
+
+        Used when the job can't be run (for example because
+        one of the jobs it depends on has failed), in which
+        case the job is flagged as both skipped and failed;
+        or when the job doesn't need to be run because its
+        outputs are already up to date, in which case it is
+        flagged as skipped and up to date, with an exit status
+        of zero.
+
+        Arguments:
+          up_to_date: if True then the job is being skipped
+            because it is up to date
+        """
+        if not self.submitted and not self.__finished:
+            self.skipped = True
+            if up_to_date:
+                self.up_to_date = True
+                self.exit_status = 0
+            else:
+                self.failed = True
+            self.__finished = True
+            self.start_time = time.time()
+            self.end_time = self.start_time
+
+    @property
+    def succeeded(self):
+        """Check if the job finished successfully
+
+        Returns True if the job has finished with a zero
+        exit status (and wasn't terminated, or skipped for
+        any reason other than being up to date), False
+        otherwise.
+        """
+        return (self.__finished and
+                not self.failed and
+                not self.terminated and
+                self.exit_status == 0)
+
+    def isRunning(self,running_job_ids=None):
         """Check if job is still running
+
+        Arguments:
+          running_job_ids: (optional) set of the ids of the
+            jobs which the runner reports as running (see the
+            'update' method)
         """
         if not self.submitted:
             return False
-        self.update()
+        self.update(running_job_ids)
         return not self.__finished
 
     def errorState(self):
@@ -224,7 +343,11 @@ class Job(object):
         """Return descriptive string indicating job status
         """
         if self.__finished:
-            if self.terminated:
+            if self.up_to_date:
+                return "Up to date"
+            elif self.skipped:
+                return "Skipped"
+            elif self.terminated:
                 return "Terminated"
             else:
                 return "Finished"
@@ -236,15 +359,75 @@ class Job(object):
         else:
             return "Waiting"
 
-    def update(self):
+    def update(self,running_job_ids=None):
         """Update status of job
+
+        Arguments:
+          running_job_ids: (optional) set of the ids of the
+            jobs which the runner reports as running (e.g. from
+            a single call to the runner's 'list' method); if
+            supplied then this is used instead of querying the
+            runner for the status of this job
         """
         if not self.__finished:
-            if not self.__runner.isRunning(self.job_id):
+            if running_job_ids is not None:
+                running = (self.job_id in running_job_ids)
+            else:
+                running = self.__runner.isRunning(self.job_id)
+            if not running:
                 self.__finished = True
                 self.end_time = time.time()
                 self.exit_status = self.__runner.exit_status(self.job_id)
 
+    def metrics(self):
+        """Return timing and resource usage metrics for the job
+
+        Combines the job's own data with the metrics
+        reported by the runner (where the runner provides
+        these; see 'BaseJobRunner.metrics'). Returns a
+        dictionary with the items in 'METRICS_FIELDS' (apart
+        from 'pipeline'), where:
+
+          submit_time: time the job was submitted
+          start_time : time the job started running
+          end_time   : time the job finished
+          queue_wait : time between submission and starting
+          run_time   : time between starting and finishing
+
+        Times are in seconds (since the epoch for 'submit_time',
+        'start_time' and 'end_time'); items which aren't
+        available are set to None.
+        """
+        runner_metrics = {}
+        if self.job_id is not None:
+            try:
+                runner_metrics = self.__runner.metrics(self.job_id)
+            except AttributeError:
+                # Runner doesn't provide metrics
+                pass
+        metrics = dict([(field,runner_metrics.get(field))
+                        for field in METRICS_FIELDS[1:]])
+        metrics.update(name=self.name,
+                       label=self.label,
+                       group=self.group_label,
+                       job_id=self.job_id,
+                       working_dir=self.working_dir,
+                       status=self.status(),
+                       exit_status=self.exit_status,
+                       submit_time=self.start_time)
+        if metrics['end_time'] is None:
+            metrics['end_time'] = self.end_time
+        if metrics['start_time'] is not None:
+            if metrics['submit_time'] is not None:
+                # Times recorded by the job may be truncated to
+                # the nearest second
+                metrics['queue_wait'] = max(metrics['start_time'] -
+                                            metrics['submit_time'],0.0)
+            if metrics['end_time'] is not None:
+                metrics['run_time'] = metrics['end_time'] - \
+                                      metrics['start_time']
+        return metrics
+
     def wait(self):
         """Wait for job to complete
 
@@ -254,6 +437,55 @@ class Job(object):
             time.sleep(1)
         return
 
+    def checkpoint(self):
+        """Return the current state of the job
+
+        Returns a dictionary (which can be serialised as
+        JSON) with the job's status, which can be used to
+        restore the job via the 'restore' method. Python
+        callables are stored as their import paths.
+        """
+        script = self.script
+        if callable(script):
+            script = "%s:%s" % (script.__module__,script.__name__)
+        state = dict(name=self.name,
+                     working_dir=self.working_dir,
+                     script=script,
+                     args=list(self.args))
+        for attr in ('label','group_label','inputs','outputs','job_id',
+                     'log','submitted','failed','terminated','skipped',
+                     'up_to_date','start_time','end_time'):
+            value = getattr(self,attr)
+            if value:
+                state[attr] = value
+        if self.exit_status is not None:
+            state['exit_status'] = self.exit_status
+        if self.__finished:
+            state['finished'] = True
+        return state
+
+    def restore(self,state):
+        """Restore the status of the job from a checkpoint
+
+        Arguments:
+          state: dictionary returned by the 'checkpoint'
+            method
+        """
+        for attr in ('job_id','log','start_time','end_time','exit_status'):
+            setattr(self,attr,state.get(attr))
+        for attr in ('submitted','failed','terminated','skipped',
+                     'up_to_date'):
+            setattr(self,attr,bool(state.get(attr)))
+        self.__finished = bool(state.get('finished'))
+
+    def resolve_path(self,path):
+        """Return the full path for an input or output file
+
+        Relative paths are taken to be relative to the
+        job's working directory.
+        """
+        return os.path.join(os.path.abspath(self.working_dir),path)
+
     @property
     def runner(self):
         """Return the JobRunner instance associated with the Job
@@ -262,6 +494,244 @@ class Job(object):
         return self.__runner
 
 # PipelineRunner: class to set up and run multiple jobs
+class JobQueue(queue.Queue):
+    """Queue of jobs waiting to be started by a PipelineRunner
+
+    Jobs are returned in the order that they were added
+    (i.e. first in, first out). This is the base class for
+    the other queue policies, which can override the '_put'
+    and '_get' methods (as for the standard 'queue.Queue'
+    subclasses) along with 'waiting_jobs' and 'peek' to
+    change the order that jobs are started in.
+    """
+    # Name of the queue policy
+    policy = 'fifo'
+
+    def waiting_jobs(self):
+        """Return a list of the jobs in the order they will be started
+        """
+        with self.mutex:
+            return list(self.queue)
+
+    def peek(self):
+        """Return the job which will be started next
+
+        The job is left in the queue. Returns None if the
+        queue is empty.
+        """
+        with self.mutex:
+            try:
+                return self.queue[0]
+            except IndexError:
+                return None
+
+class LongestFirstJobQueue(JobQueue):
+    """Queue which returns the largest jobs first
+
+    Implements a 'longest processing time first' policy: the
+    jobs which are estimated to take longest are started
+    first, so that they don't end up holding up the end of
+    the pipeline. Jobs with the same estimate are returned
+    in the order they were added.
+
+    By default the estimate is the total size of the files
+    supplied as arguments to the job (see 'estimate_job_size').
+    """
+    policy = 'longest_first'
+
+    def __init__(self,estimate=None):
+        """Create a new LongestFirstJobQueue
+
+        Arguments:
+          estimate: (optional) function which takes a Job
+            instance and returns an estimate of how long it
+            will take (by default 'estimate_job_size' is used)
+        """
+        if estimate is None:
+            estimate = estimate_job_size
+        self.estimate = estimate
+        JobQueue.__init__(self)
+
+    def _init(self,maxsize):
+        self.queue = []
+        self.__count = 0
+
+    def _qsize(self,*args):
+        return len(self.queue)
+
+    def _put(self,job):
+        heapq.heappush(self.queue,(-self.estimate(job),self.__count,job))
+        self.__count += 1
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
+    def waiting_jobs(self):
+        with self.mutex:
+            return [item[-1] for item in sorted(self.queue)]
+
+    def peek(self):
+        with self.mutex:
+            try:
+                return self.queue[0][-1]
+            except IndexError:
+                return None
+
+class GroupPriorityJobQueue(JobQueue):
+    """Queue which returns jobs according to their group priority
+
+    Jobs in groups with higher priorities are started first.
+    Groups with the same priority are started in the order
+    that the first job from each group was added, so that
+    each group completes as early as possible; jobs within
+    a group are returned in the order they were added. Jobs
+    which aren't in a group are treated as a group of their
+    own.
+    """
+    policy = 'group'
+
+    def __init__(self,priorities=None):
+        """Create a new GroupPriorityJobQueue
+
+        Arguments:
+          priorities: (optional) dictionary mapping group
+            labels to priorities (integers, higher values
+            are started first); groups not in the dictionary
+            have priority zero
+        """
+        self.priorities = dict(priorities) if priorities else {}
+        JobQueue.__init__(self)
+
+    def _init(self,maxsize):
+        self.queue = []
+        self.__count = 0
+        self.__group_order = {}
+
+    def _qsize(self,*args):
+        return len(self.queue)
+
+    def _put(self,job):
+        group = job.group_label
+        if group not in self.__group_order:
+            self.__group_order[group] = len(self.__group_order)
+        heapq.heappush(self.queue,(-self.priorities.get(group,0),
+                                   self.__group_order[group],
+                                   self.__count,
+                                   job))
+        self.__count += 1
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
+    def waiting_jobs(self):
+        with self.mutex:
+            return [item[-1] for item in sorted(self.queue)]
+
+    def peek(self):
+        with self.mutex:
+            try:
+                return self.queue[0][-1]
+            except IndexError:
+                return None
+
+class AdaptiveThrottle(object):
+    """Adjust the maximum number of concurrent jobs to the cluster load
+
+    The throttle periodically samples the load on the cluster
+    (using the supplied 'sample' function) and adjusts the
+    target number of concurrent jobs for the pipeline, keeping it
+    between 'floor' and 'ceiling':
+
+    - if the number of jobs waiting in the cluster queue exceeds
+      'max_pending' then the cluster is busy, and the target is
+      halved;
+    - otherwise if none of our own jobs are waiting, the pipeline
+      is already running as many jobs as the target and has more
+      jobs waiting to start, the target is increased by 'step'.
+
+    The 'sample' function should take no arguments and return a
+    dictionary with the items 'pending' (the total number of
+    jobs waiting in the cluster queue) and 'own_pending' (the
+    number of those jobs which belong to the pipeline's user),
+    for example the 'cluster_usage' function from the
+    'cluster_load.py' utility.
+
+    The throttle is used by supplying it to a PipelineRunner
+    via the 'throttle' argument; the initial target is the
+    pipeline's 'max_concurrent_jobs' (limited to between the
+    floor and the ceiling).
+    """
+    def __init__(self,floor,ceiling,sample,interval=60.0,max_pending=0,
+                 step=1):
+        """Create a new AdaptiveThrottle
+
+        Arguments:
+          floor: minimum number of concurrent jobs
+          ceiling: maximum number of concurrent jobs
+          sample: function returning the current load on the
+            cluster (see above)
+          interval: minimum time (in seconds) between samples
+            of the cluster load (default 60s)
+          max_pending: number of jobs which can be waiting in
+            the cluster queue before the cluster is considered
+            to be busy (default 0)
+          step: number of jobs to increase the target by each
+            time (default 1)
+        """
+        if floor < 1 or ceiling < floor:
+            raise Exception("AdaptiveThrottle: bad limits (floor %s, "
+                            "ceiling %s)" % (floor,ceiling))
+        self.floor = floor
+        self.ceiling = ceiling
+        self.sample = sample
+        self.interval = interval
+        self.max_pending = max_pending
+        self.step = step
+        self.target = None
+        self.load = None
+        self.__last_sample = None
+
+    def update(self,pipeline):
+        """Return the target number of concurrent jobs for a pipeline
+
+        Samples the cluster load (unless it was sampled less
+        than 'interval' seconds ago) and adjusts the target.
+
+        Arguments:
+          pipeline: the PipelineRunner instance being throttled
+
+        Returns:
+          Target number of concurrent jobs.
+        """
+        if self.target is None:
+            self.target = min(max(pipeline.max_concurrent_jobs,self.floor),
+                              self.ceiling)
+        now = time.time()
+        if self.__last_sample is not None and \
+           (now - self.__last_sample) < self.interval:
+            return self.target
+        self.__last_sample = now
+        try:
+            self.load = self.sample()
+        except Exception as ex:
+            logging.warning("AdaptiveThrottle: failed to sample cluster "
+                            "load: %s" % ex)
+            return self.target
+        if self.load['pending'] > self.max_pending:
+            # Cluster is busy
+            self.target = max(self.target//2,self.floor)
+        elif not self.load['own_pending'] and \
+             pipeline.nRunning() >= self.target and \
+             pipeline.nWaiting() > 0:
+            # Cluster is keeping up with our jobs
+            self.target = min(self.target + self.step,self.ceiling)
+        return self.target
+
+# Queue policies which can be specified by name
+QUEUE_POLICIES = dict([(q.policy,q) for q in (JobQueue,
+                                              LongestFirstJobQueue,
+                                              GroupPriorityJobQueue)])
+
 class PipelineRunner(object):
     """Class to run and manage multiple concurrent jobs.
 
@@ -285,9 +755,91 @@ class PipelineRunner(object):
     completes ('jobCompletionHandler'), and when a group completes
     ('groupCompletionHandler'). These can perform any specific actions that are required
     such as sending notification email, setting file ownerships and permissions etc.
+
+    Jobs can depend on other jobs in the pipeline, by supplying the jobs returned by
+    earlier calls to 'queueJob' via the 'depends_on' argument. A job is held until all
+    the jobs it depends on have completed, and is then released to be started
+    (subject to 'max_concurrent_jobs') - so for example a later stage can start for
+    one sample while an earlier stage is still running for others:
+
+    >>> qc = p.queueJob('/home/foo','qc.sh',('sample1.fq',))
+    >>> align = p.queueJob('/home/foo','align.sh',('sample1.fq',),depends_on=[qc])
+
+    If a job fails (i.e. finishes with a non-zero exit status, fails to be submitted or
+    is terminated) then the jobs which depend on it (directly or indirectly) are
+    skipped: they are marked as completed with 'skipped' and 'failed' set, without
+    being run. Skipped jobs are passed to the job completion handler and count towards
+    the completion of their groups.
+
+    Jobs can also declare the files that they read ('inputs') and write ('outputs')
+    when they are queued. When a job with declared outputs is due to start, it is
+    skipped (and treated as having completed successfully) if all its outputs exist
+    and either none of them are older than its inputs, or the MD5 checksums of its
+    inputs match those recorded in the 'signature_file' (if one was supplied) when the
+    job last completed successfully. Running the pipeline with 'dry_run=True' reports
+    which jobs would be run without running anything.
+
+    If a 'state_file' is supplied then the state of the pipeline (the queued jobs and
+    their dependencies, the ids of submitted jobs, the runner and the status of the
+    completed jobs) is saved to this file as the pipeline runs; the file is replaced
+    atomically on each update. If the program running the pipeline exits before the
+    pipeline has finished, a new PipelineRunner can be created from the state file
+    using the 'resume' class method, and then run to continue the pipeline: jobs which
+    are still running are reattached to where the runner supports this (e.g. for
+    GEJobRunner), so work isn't resubmitted. Jobs which can't be reattached are
+    resubmitted. When a state file is used the running jobs aren't terminated if the
+    pipeline is deleted before it finishes.
+
+    By default waiting jobs are started in the order they were queued. Alternatively a
+    'queue_policy' can be specified, either as the name of a policy ('fifo',
+    'longest_first' or 'group') or as a JobQueue instance: for example using
+    'longest_first' starts the jobs with the largest input files first, which can reduce
+    the total time taken when job sizes vary (as the largest jobs don't end up running
+    on their own at the end of the pipeline).
+
+    If a 'metrics_file' is supplied then a record with the timing and resource usage
+    metrics for each job (see 'Job.metrics') is appended to this file as the job
+    completes, along with the 'pipeline_id' of the pipeline (so that the records from
+    several runs can be collected in the same file). The records are written as CSV if the file name
+    ends with '.csv', otherwise as JSON lines (i.e. one JSON object per line); the
+    'job_metrics_summary.py' utility can be used to summarise the records.
+
+    When several waiting jobs which run the same script in the same directory are
+    started together, and the runner provides its own 'run_array' method, they are
+    submitted using that method (so for GEJobRunners they are submitted as a single
+    Grid Engine array job, with each job still writing its own log files). Any other jobs
+    which are started together are submitted using the runner's 'run_many' method (so
+    for GEJobRunners the submissions are made concurrently).
+
+    Large numbers of short jobs can instead be packed together, so that each submitted
+    job runs several of the pipeline's jobs in turn (using the runner's 'run_pack'
+    method; for GEJobRunners each pack is submitted as a single Grid Engine job, while
+    other runners start the jobs separately). Consecutive waiting jobs are added to a
+    pack while it holds fewer than 'pack_size' jobs and, if 'pack_walltime' is set, while
+    the estimated run time of the pack doesn't exceed 'pack_walltime' seconds (the
+    estimate for each job is the mean run time of the jobs running the same script
+    which have already completed; until an estimate is available, jobs are packed by
+    'pack_size' alone or otherwise started on their own). Up to 'pack_parallel' of the
+    jobs in each pack are run at the same time. When packing is used,
+    'max_concurrent_jobs' limits the number of packs (rather than jobs) which are
+    running, and packing takes precedence over array jobs. Each of the packed jobs
+    still has its own job id, log files and exit status, and is passed to the job
+    completion handler individually.
+
+    The maximum number of jobs can be adjusted as the pipeline runs by supplying a
+    'throttle' (e.g. an AdaptiveThrottle instance, which adjusts the number of jobs
+    between a floor and a ceiling according to the load on the cluster). The
+    throttle's 'update' method is called with the pipeline on each update, and
+    returns the new value for 'max_concurrent_jobs'.
+
+    The pipeline can also be run from within an asyncio event loop by awaiting the
+    coroutine returned by the 'run_async' method (Python 3.6 or later only).
     """
     def __init__(self,runner,max_concurrent_jobs=4,poll_interval=30,jobCompletionHandler=None,
-                 groupCompletionHandler=None):
+                 groupCompletionHandler=None,use_array_jobs=True,signature_file=None,
+                 state_file=None,queue_policy=None,metrics_file=None,
+                 pack_size=None,pack_walltime=None,pack_parallel=1,
+                 throttle=None):
         """Create new PipelineRunner instance.
 
         Arguments:
@@ -296,40 +848,133 @@ class PipelineRunner(object):
             at one time (default = 4)
           poll_interval: time interval (in seconds) between checks on the queue status
             (only used when pipeline is run in 'blocking' mode)
+          use_array_jobs: if True (the default) then jobs which share the same
+            script and working directory are submitted together via the runner's
+            'run_array' method (if the runner provides its own implementation)
+          signature_file: (optional) JSON file used to store the checksums of the
+            inputs of jobs which complete successfully, which are used to check
+            whether jobs are up to date (created if it doesn't already exist)
+          state_file: (optional) file to save the state of the pipeline to (so
+            that it can be resumed using the 'resume' method; if the runner
+            can't be recreated from its definition, e.g. a PythonFunctionRunner,
+            then the runner must be supplied when resuming)
+          queue_policy: (optional) determines the order that waiting jobs are
+            started in: either the name of a policy ('fifo' (the default),
+            'longest_first' or 'group'), or a JobQueue instance
+          metrics_file: (optional) file to append the metrics for each job
+            to as it completes (CSV if the name ends with '.csv', otherwise
+            JSON lines)
+          pack_size: (optional) maximum number of jobs to pack together into
+            a single submitted job
+          pack_walltime: (optional) target run time (in seconds) for each
+            pack of jobs, used to determine how many jobs are packed together
+          pack_parallel: number of jobs in each pack to run at the same time
+            (default = 1, i.e. run the jobs in a pack one after the other)
+          throttle: (optional) throttle (e.g. AdaptiveThrottle instance)
+            used to adjust 'max_concurrent_jobs' as the pipeline runs
         """
         # Parameters
         self.__runner = runner
         self.max_concurrent_jobs = max_concurrent_jobs
         self.poll_interval = poll_interval
+        self.use_array_jobs = use_array_jobs
+        self.pack_size = pack_size
+        self.pack_walltime = pack_walltime
+        self.pack_parallel = pack_parallel
+        self.throttle = throttle
         # Groups
         self.groups = []
         self.njobs_in_group = {}
-        # Queue of jobs to run
-        self.jobs = queue.Queue()
-        # Subset that are currently running
-        self.running = []
+        self.__completed_in_group = {}
+        # Jobs waiting for their dependencies to complete
+        self.__blocked = collections.OrderedDict()
+        self.__dependents = {}
+        self.__npending = {}
+        self.__newly_completed = collections.deque()
+        # All jobs which have been queued (in order)
+        self.__job_list = []
+        self.__queued_jobs = set()
+        # Subset that are currently running (and index of the
+        # running jobs by job id)
+        self.__running = collections.OrderedDict()
+        self.__running_ids = {}
+        self.__running_id_set = set()
+        self.__nstarted = 0
+        # Packs that running jobs belong to (and the running
+        # jobs in each pack)
+        self.__packs = {}
+        self.__pack_jobs = {}
+        self.__npacks = 0
+        # Run times of completed jobs for each script (for
+        # estimating the run times of packs)
+        self.__run_times = {}
         # Subset that have completed
         self.completed = []
+        self.__completed_jobs = set()
         # Callback functions
         self.handle_job_completion = jobCompletionHandler
         self.handle_group_completion = groupCompletionHandler
+        # File to save pipeline state to
+        self.__state_file = state_file
+        if state_file and _runner_definition(runner) is None:
+            logging.warning("PipelineRunner: runner %r can't be recreated "
+                            "from the state file; it must be supplied to "
+                            "'resume'" % runner)
+        # File to append job metrics to
+        self.__metrics_file = metrics_file
+        self.pipeline_id = "%s.%d" % (time.strftime("%Y%m%d%H%M%S"),
+                                      os.getpid())
+        # Input signatures for up to date checks
+        self.__signature_file = signature_file
+        self.__signatures = {}
+        if signature_file and os.path.exists(signature_file):
+            with io.open(signature_file,'rt') as fp:
+                self.__signatures = json.load(fp)
+        # Queue of jobs to run
+        if queue_policy is None:
+            queue_policy = 'fifo'
+        if isinstance(queue_policy,JobQueue):
+            self.jobs = queue_policy
+        else:
+            try:
+                self.jobs = QUEUE_POLICIES[queue_policy]()
+            except KeyError:
+                raise Exception("PipelineRunner: unknown queue policy '%s'" %
+                                queue_policy)
 
-    def queueJob(self,working_dir,script,script_args,label=None,group=None):
+    def queueJob(self,working_dir,script,script_args,label=None,group=None,
+                 depends_on=None,inputs=None,outputs=None):
         """Add a job to the pipeline.
 
         The job will be queued and executed once the pipeline's 'run' method has been
-        executed.
+        executed (and once the jobs it depends on have completed).
 
         Arguments:
           working_dir: directory to run the job in
-          script: script file to run
+          script: script file to run (or a Python callable, if the runner
+            is a PythonFunctionRunner)
           script_args: arguments to be supplied to the script at run time
           label: (optional) arbitrary string to use as an identifier in the job name
           group: (optional) arbitrary string to use as a 'group' identifier;
             assign the same 'group' label to multiple jobs to indicate they're
             related
+          depends_on: (optional) list of jobs (returned from previous calls to
+            'queueJob') which must complete successfully before the job can start
+          inputs: (optional) list of files read by the job (relative paths are
+            taken to be relative to the working directory)
+          outputs: (optional) list of files written by the job; the job will be
+            skipped if these are up to date with respect to the inputs
+
+        Returns:
+          The Job instance for the queued job.
         """
-        job_name = os.path.splitext(os.path.basename(script))[0]+'.'+str(label)
+        if depends_on is None:
+            depends_on = []
+        for dependency in depends_on:
+            if dependency not in self.__queued_jobs:
+                raise Exception("PipelineRunner: dependency '%s' is not a job "
+                                "in this pipeline" % dependency.name)
+        job_name = _script_name(script)+'.'+str(label)
         if group:
             if group not in self.groups:
                 # New group label
@@ -337,19 +982,47 @@ class PipelineRunner(object):
                 self.njobs_in_group[group] = 1
             else:
                 self.njobs_in_group[group] += 1
-        self.jobs.put(Job(self.__runner,job_name,working_dir,script,script_args,
-                          label,group))
-        logging.debug("Added job: now %d jobs in pipeline" % self.jobs.qsize())
+        job = Job(self.__runner,job_name,working_dir,script,script_args,
+                  label,group,depends_on,inputs,outputs)
+        self.__job_list.append(job)
+        self.__queued_jobs.add(job)
+        if self.__block_job(job):
+            self.__blocked[job] = True
+        else:
+            self.jobs.put(job)
+        logging.debug("Added job: now %d jobs in pipeline" % self.nWaiting())
+        return job
 
     def nWaiting(self):
         """Return the number of jobs still waiting to be started
+
+        This includes jobs which are waiting for their
+        dependencies to complete.
         """
-        return self.jobs.qsize()
+        return self.jobs.qsize() + len(self.__blocked)
 
     def nRunning(self):
         """Return the number of jobs currently running
         """
-        return len(self.running)
+        return len(self.__running)
+
+    @property
+    def running(self):
+        """List of the jobs which are currently running
+        """
+        return list(self.__running)
+
+    @property
+    def blocked(self):
+        """List of the jobs waiting for their dependencies to complete
+        """
+        return list(self.__blocked)
+
+    @property
+    def runner(self):
+        """Return the JobRunner instance used by the pipeline
+        """
+        return self.__runner
 
     def nCompleted(self):
         """Return the number of jobs that have completed
@@ -367,14 +1040,18 @@ class PipelineRunner(object):
         # Return the status
         return (self.nWaiting() > 0 or self.nRunning() > 0)
 
-    def run(self,blocking=True):
+    def run(self,blocking=True,dry_run=False):
         """Execute the jobs in the pipeline
 
         Each job previously added to the pipeline by 'queueJob' will be
         started and checked periodically for termination.
 
         By default 'run' operates in 'blocking' mode, so it doesn't return
-        until all jobs have been submitted and have finished executing.
+        until all jobs have been submitted and have finished executing. In
+        this mode the pipeline waits for up to 'poll_interval' seconds
+        between updates, but is updated as soon as the runner indicates
+        that a job has completed (see the 'wait_for_completion' method of
+        the job runners).
 
         To run in non-blocking mode, set the 'blocking' argument to False.
         In this mode the pipeline starts and returns immediately; it is
@@ -386,7 +1063,14 @@ class PipelineRunner(object):
         >>> p.run()
         >>> while p.isRunning():
         >>>     time.sleep(30)
+
+        If 'dry_run' is True then no jobs are run; instead the jobs which
+        would be run (i.e. which aren't up to date, or which depend on jobs
+        that would be run) are reported, and a list of these jobs is
+        returned.
         """
+        if dry_run:
+            return self.__dry_run()
         logging.debug("PipelineRunner: started")
         logging.debug("Blocking mode : %s" % blocking)
         # Report set up
@@ -394,13 +1078,33 @@ class PipelineRunner(object):
               (self.nWaiting(),self.nRunning(),self.nCompleted()))
         # Initial update sets the jobs running
         self.update()
+        self.__save_state()
         if blocking:
             while self.isRunning():
                 # Pipeline is still executing so wait
-                time.sleep(self.poll_interval)
+                self.__wait()
             # Pipeline has finished
             print("Pipeline completed")
 
+    def run_async(self):
+        """Execute the jobs in the pipeline from an asyncio event loop
+
+        Returns a coroutine which runs the pipeline until all
+        the jobs have finished, e.g.
+
+        >>> await p.run_async()
+
+        The pipeline is updated as its jobs complete, using the
+        shared 'AsyncJobRunner' for the pipeline's runner (so that
+        other coroutines can wait for jobs from the same runner
+        without additional polling); see 'run_pipeline' in the
+        'AsyncJobRunner' module for details.
+
+        Requires Python 3.6 or later.
+        """
+        from .AsyncJobRunner import run_pipeline
+        return run_pipeline(self)
+
     def update(self):
         """Update the pipeline
 
@@ -409,44 +1113,89 @@ class PipelineRunner(object):
         """
         # Flag to report updated status
         updated_status = False
-        # Look for running jobs that have completed
-        for job in self.running[::-1]:
-            if not job.isRunning():
+        # Adjust the number of concurrent jobs (before checking
+        # for completed jobs, so the throttle sees whether all the
+        # available slots were in use)
+        if self.throttle is not None:
+            max_concurrent_jobs = self.throttle.update(self)
+            if max_concurrent_jobs != self.max_concurrent_jobs:
+                print("Maximum concurrent jobs changed from %d to %d" %
+                      (self.max_concurrent_jobs,max_concurrent_jobs))
+                self.max_concurrent_jobs = max_concurrent_jobs
+        # Look for running jobs that have completed (fetching
+        # the ids of all the running jobs from the runner at once,
+        # so only the jobs which are no longer listed need to be
+        # checked)
+        running_job_ids = self.__list_running_job_ids()
+        if running_job_ids is None:
+            check_jobs = list(self.__running)
+        else:
+            check_jobs = [self.__running_ids[job_id] for job_id in
+                          self.__running_id_set.difference(running_job_ids)]
+            if len(self.__running_ids) < len(self.__running):
+                # Include jobs which failed to be submitted
+                check_jobs.extend([job for job in self.__running
+                                   if job.job_id not in self.__running_ids])
+            check_jobs.sort(key=lambda job: self.__running[job])
+        for job in check_jobs:
+            if not job.isRunning(running_job_ids):
                 # Job has completed
-                self.running.remove(job)
-                self.completed.append(job)
-                updated_status = True
+                del(self.__running[job])
+                self.__remove_from_pack(job)
+                if self.__running_ids.get(job.job_id) is job:
+                    del(self.__running_ids[job.job_id])
+                    self.__running_id_set.discard(job.job_id)
                 print("Job has completed: %s: %s %s (%s)" % (
                     job.job_id,
                     job.name,
                     os.path.basename(job.working_dir),
                     time.asctime(time.localtime(job.end_time))))
-                # Invoke callback on job completion
-                if self.handle_job_completion:
-                    self.handle_job_completion(job)
-                # Check for completed group
-                if job.group_label is not None:
-                    jobs_in_group = []
-                    for check_job in self.completed:
-                        if check_job.group_label == job.group_label:
-                            jobs_in_group.append(check_job)
-                    if self.njobs_in_group[job.group_label] == len(jobs_in_group):
-                        # All jobs in group have completed
-                        print("Group '%s' has completed" % job.group_label)
-                        # Invoke callback on group completion
-                        if self.handle_group_completion:
-                            self.handle_group_completion(job.group_label,jobs_in_group)
-            else:
-                # Job is running, check it's not in an error state
-                if job.errorState():
-                    # Terminate jobs in error state
-                    logging.warning("Terminating job %s in error state" % job.job_id)
-                    job.terminate()
+                self.__complete_job(job)
+                updated_status = True
+        # Check that running jobs aren't in an error state
+        for job in self.__error_state_jobs():
+            # Terminate jobs in error state
+            logging.warning("Terminating job %s in error state" % job.job_id)
+            job.terminate()
+        # Collect new jobs to submit (skipping jobs which are up to
+        # date, which may in turn release jobs that depend on them);
+        # jobs are collected into packs, where a pack which holds
+        # a single job is started as a normal job
+        packs = [[]]
+        while True:
+            # Release jobs whose dependencies have completed
+            if self.__release_jobs():
+                updated_status = True
+            n_up_to_date = 0
+            while not self.jobs.empty():
+                if not self.__fits_pack(packs[-1],self.jobs.peek()):
+                    if (self.__nrunning_packs() + len(packs)) >= \
+                       self.max_concurrent_jobs:
+                        break
+                    packs.append([])
+                elif not packs[-1] and \
+                     (self.__nrunning_packs() + len(packs)) > \
+                     self.max_concurrent_jobs:
+                    break
+                next_job = self.jobs.get()
+                if self.__is_up_to_date(next_job):
+                    next_job.skip(up_to_date=True)
+                    print("Job is up to date: %s %s" % (
+                        next_job.name,
+                        os.path.basename(next_job.working_dir)))
+                    self.__complete_job(next_job)
+                    n_up_to_date += 1
+                    updated_status = True
+                else:
+                    packs[-1].append(next_job)
+            if not n_up_to_date:
+                break
         # Submit new jobs to GE queue
-        while not self.jobs.empty() and self.nRunning() < self.max_concurrent_jobs:
-            next_job = self.jobs.get()
-            next_job.start()
-            self.running.append(next_job)
+        packs = [pack for pack in packs if pack]
+        self.__start_jobs(packs)
+        new_jobs = [job for pack in packs for job in pack]
+        for next_job in new_jobs:
+            self.__add_running_job(next_job)
             updated_status = True
             print("Job has started: %s: %s %s (%s)" % (
                 next_job.job_id,
@@ -459,6 +1208,621 @@ class PipelineRunner(object):
         if updated_status:
             print("Currently %d jobs waiting, %d running, %d finished" %
                   (self.nWaiting(),self.nRunning(),self.nCompleted()))
+            self.__save_state()
+
+    def __complete_job(self,job):
+        """Internal: handle a job which has completed (or been skipped)
+
+        Adds the job to the list of completed jobs, and invokes
+        the job completion handler (and the group completion
+        handler, if this was the last job in its group).
+        """
+        self.completed.append(job)
+        self.__completed_jobs.add(job)
+        if job in self.__dependents:
+            self.__newly_completed.append(job)
+        # Record the input signature
+        if job.succeeded and not job.skipped:
+            self.__record_signature(job)
+        # Record the run time (for estimating pack run times)
+        if self.pack_walltime and not job.skipped:
+            self.__record_run_time(job)
+        # Record the job metrics
+        if self.__metrics_file:
+            self.__write_metrics(job)
+        # Invoke callback on job completion
+        if self.handle_job_completion:
+            self.handle_job_completion(job)
+        # Check for completed group
+        if job.group_label is not None:
+            jobs_in_group = self.__completed_in_group.setdefault(
+                job.group_label,[])
+            jobs_in_group.append(job)
+            if self.njobs_in_group[job.group_label] == len(jobs_in_group):
+                # All jobs in group have completed
+                print("Group '%s' has completed" % job.group_label)
+                # Invoke callback on group completion
+                if self.handle_group_completion:
+                    self.handle_group_completion(job.group_label,
+                                                 list(jobs_in_group))
+
+    def __write_metrics(self,job):
+        """Internal: append the metrics for a job to the metrics file
+
+        CSV files are written using the csv module (so follow
+        the same quoting rules as readers such as
+        'job_metrics_summary.py'), with a header line written
+        first if the file doesn't exist yet (or is empty).
+        """
+        record = job.metrics()
+        record['pipeline'] = self.pipeline_id
+        try:
+            if self.__metrics_file.endswith('.csv'):
+                write_header = (not os.path.exists(self.__metrics_file) or
+                                os.path.getsize(self.__metrics_file) == 0)
+                with _open_csv_for_append(self.__metrics_file) as fp:
+                    writer = csv.DictWriter(fp,METRICS_FIELDS,
+                                            extrasaction='ignore',
+                                            lineterminator='\n')
+                    if write_header:
+                        writer.writeheader()
+                    writer.writerow(record)
+            else:
+                with io.open(self.__metrics_file,'at') as fp:
+                    fp.write(u"%s\n" % json.dumps(collections.OrderedDict(
+                        [(field,record[field]) for field in METRICS_FIELDS]),
+                                                   separators=(',',':')))
+        except IOError as ex:
+            logging.error("PipelineRunner: unable to write metrics for "
+                          "job %s to '%s': %s" % (job.name,
+                                                  self.__metrics_file,ex))
+
+    def __block_job(self,job):
+        """Internal: register a job with the jobs it depends on
+
+        Records the job as a dependent of each of the jobs it
+        depends on which haven't completed yet (or which failed),
+        along with the number of dependencies that it is still
+        waiting for.
+
+        Returns True if the job has to wait (i.e. it has
+        dependencies which haven't completed, or which failed),
+        False if it can be started straight away.
+        """
+        npending = 0
+        blocked = False
+        for dependency in job.depends_on:
+            if dependency in self.__completed_jobs:
+                if dependency.succeeded:
+                    continue
+                # Dependency already failed, so job will be
+                # skipped on the next update
+                self.__newly_completed.append(dependency)
+            else:
+                npending += 1
+            self.__dependents.setdefault(dependency,[]).append(job)
+            blocked = True
+        self.__npending[job] = npending
+        return blocked
+
+    def __release_jobs(self):
+        """Internal: release jobs whose dependencies have completed
+
+        Checks the dependents of the jobs which have completed
+        since the last check: jobs whose dependencies have all
+        completed successfully are moved to the queue of jobs
+        waiting to start; jobs with a dependency which failed are
+        skipped (which may in turn cause other jobs to be
+        skipped).
+
+        Returns True if any jobs were released or skipped, False
+        otherwise.
+        """
+        unblocked = set()
+        while self.__newly_completed:
+            job = self.__newly_completed.popleft()
+            for dependent in self.__dependents.pop(job,[]):
+                if dependent in unblocked or \
+                   dependent in self.__completed_jobs:
+                    continue
+                if not job.succeeded:
+                    # Dependency failed
+                    unblocked.add(dependent)
+                    dependent.skip()
+                    print("Job has been skipped (dependency failed): %s %s" %
+                          (dependent.name,
+                           os.path.basename(dependent.working_dir)))
+                    self.__complete_job(dependent)
+                else:
+                    self.__npending[dependent] -= 1
+                    if self.__npending[dependent] == 0:
+                        # All dependencies completed successfully
+                        unblocked.add(dependent)
+                        self.jobs.put(dependent)
+        for job in unblocked:
+            del(self.__blocked[job])
+        return bool(unblocked)
+
+    def __add_running_job(self,job):
+        """Internal: add a job to the running jobs
+        """
+        self.__running[job] = self.__nstarted
+        self.__nstarted += 1
+        if job.job_id is not None:
+            self.__running_ids[job.job_id] = job
+            self.__running_id_set.add(job.job_id)
+
+    def __nrunning_packs(self):
+        """Internal: return the number of running packs
+
+        Jobs which aren't part of a pack count as a pack
+        of their own.
+        """
+        return len(self.__running) - len(self.__packs) + \
+            len(self.__pack_jobs)
+
+    def __add_pack(self,jobs):
+        """Internal: record that a set of jobs were started as a pack
+        """
+        if not jobs:
+            return
+        self.__npacks += 1
+        self.__pack_jobs[self.__npacks] = set(jobs)
+        for job in jobs:
+            self.__packs[job] = self.__npacks
+
+    def __remove_from_pack(self,job):
+        """Internal: remove a job which has finished from its pack
+        """
+        try:
+            pack = self.__packs.pop(job)
+        except KeyError:
+            return
+        jobs = self.__pack_jobs[pack]
+        jobs.discard(job)
+        if not jobs:
+            del(self.__pack_jobs[pack])
+
+    def __fits_pack(self,pack,job):
+        """Internal: check if a job can be added to a pack
+
+        Returns True if the pack is empty, or if packing is
+        enabled and adding the job wouldn't exceed either
+        the maximum number of jobs or the target run time for
+        a pack.
+        """
+        if not pack:
+            return True
+        if not (self.pack_size or self.pack_walltime):
+            return False
+        if self.pack_size and len(pack) >= self.pack_size:
+            return False
+        if self.pack_walltime:
+            estimates = [self.__estimate_run_time(j) for j in pack + [job]]
+            if None in estimates:
+                # Can only pack by size until there are
+                # estimates for all the jobs
+                return bool(self.pack_size)
+            return (sum(estimates)/float(max(self.pack_parallel,1)) <=
+                    self.pack_walltime)
+        return True
+
+    def __record_run_time(self,job):
+        """Internal: record the run time of a completed job
+        """
+        run_time = job.metrics()['run_time']
+        if run_time is None:
+            return
+        run_times = self.__run_times.setdefault(job.script,[0.0,0])
+        run_times[0] += run_time
+        run_times[1] += 1
+
+    def __estimate_run_time(self,job):
+        """Internal: estimate the run time of a job
+
+        Returns the mean run time of the completed jobs
+        which ran the same script, or None if no jobs
+        running the script have completed.
+        """
+        try:
+            total,n = self.__run_times[job.script]
+            return total/n
+        except KeyError:
+            return None
+
+    def __list_running_job_ids(self):
+        """Internal: return the set of ids of running jobs
+
+        Fetches the ids of all the queued and running jobs from
+        the runner in a single call. Returns None if the runner
+        can't list its jobs (in which case each job is checked
+        individually).
+        """
+        try:
+            return set(self.__runner.list())
+        except NotImplementedError:
+            return None
+
+    def __error_state_jobs(self):
+        """Internal: return the running jobs which are in an error state
+
+        Fetches the ids of the jobs in an error state from the
+        runner in a single call where possible, otherwise checks
+        each running job individually.
+        """
+        try:
+            job_ids = self.__runner.list_error_state()
+        except AttributeError:
+            return [job for job in self.__running if job.errorState()]
+        return [self.__running_ids[job_id] for job_id in job_ids
+                if job_id in self.__running_ids]
+
+    def __is_up_to_date(self,job):
+        """Internal: check if the outputs of a job are up to date
+
+        A job is up to date if it has declared outputs which
+        all exist, and either none of the outputs are older
+        than the inputs, or the current checksums of the inputs
+        match the stored signature for the job.
+        """
+        if not job.outputs:
+            return False
+        outputs = [job.resolve_path(f) for f in job.outputs]
+        inputs = [job.resolve_path(f) for f in job.inputs]
+        for f in outputs + inputs:
+            if not os.path.exists(f):
+                return False
+        if not inputs:
+            return True
+        if min([os.path.getmtime(f) for f in outputs]) >= \
+           max([os.path.getmtime(f) for f in inputs]):
+            return True
+        signature = self.__signatures.get(self.__signature_key(job))
+        if signature is not None:
+            try:
+                return signature == self.__input_signature(job)
+            except (IOError,OSError) as ex:
+                logging.warning("PipelineRunner: unable to generate "
+                                "signature for %s: %s" % (job.name,ex))
+        return False
+
+    def __signature_key(self,job):
+        """Internal: return the key for the stored signature of a job
+        """
+        if callable(job.script):
+            script = "%s.%s" % (job.script.__module__,job.script.__name__)
+        else:
+            script = job.script
+        return json.dumps([os.path.abspath(job.working_dir),
+                           script,
+                           [str(arg) for arg in job.args]])
+
+    def __input_signature(self,job):
+        """Internal: return the MD5 checksums of the inputs of a job
+        """
+        return dict([(f,Md5sum.md5sum(job.resolve_path(f)))
+                     for f in job.inputs])
+
+    def __record_signature(self,job):
+        """Internal: store the input signature for a job
+
+        Only jobs which declare inputs and outputs are recorded,
+        and only if a signature file was specified.
+        """
+        if not self.__signature_file or not job.inputs or not job.outputs:
+            return
+        try:
+            self.__signatures[self.__signature_key(job)] = \
+                self.__input_signature(job)
+        except (IOError,OSError) as ex:
+            logging.warning("PipelineRunner: unable to generate signature "
+                            "for %s: %s" % (job.name,ex))
+            return
+        tmp_file = "%s.tmp" % self.__signature_file
+        with io.open(tmp_file,'wt') as fp:
+            fp.write(u"%s" % json.dumps(self.__signatures,indent=1,
+                                        sort_keys=True))
+        os.rename(tmp_file,self.__signature_file)
+
+    def __dry_run(self):
+        """Internal: report which jobs would be run
+
+        Jobs are considered in the order they were queued: a
+        job would be run if it isn't up to date, or if any of
+        the jobs it depends on would be run.
+
+        Returns:
+          List of the jobs that would be run.
+        """
+        would_run = set()
+        jobs = []
+        for job in self.__job_list:
+            if job.submitted or job in self.__completed_jobs:
+                continue
+            if [dependency for dependency in job.depends_on
+                if dependency in would_run] or \
+               not self.__is_up_to_date(job):
+                print("Would run: %s %s" % (job.name,
+                                            os.path.basename(job.working_dir)))
+                would_run.add(job)
+                jobs.append(job)
+            else:
+                print("Up to date: %s %s" % (job.name,
+                                             os.path.basename(job.working_dir)))
+        print("%d jobs would be run, %d are up to date" %
+              (len(jobs),self.nWaiting()-len(jobs)))
+        return jobs
+
+    def __save_state(self):
+        """Internal: save the state of the pipeline to the state file
+
+        The state is written to a temporary file which then
+        replaces the existing state file, so that the state file
+        is always complete.
+        """
+        if not self.__state_file:
+            return
+        index = dict([(job,i) for i,job in enumerate(self.__job_list)])
+        jobs = []
+        for job in self.__job_list:
+            job_state = job.checkpoint()
+            if job.depends_on:
+                job_state['depends_on'] = [index[dependency]
+                                           for dependency in job.depends_on]
+            jobs.append(job_state)
+        state = dict(version=1,
+                     runner=_runner_definition(self.__runner),
+                     runner_settings=self.__runner.settings(),
+                     log_dir=self.__runner.log_dir,
+                     runner_state=self.__runner.checkpoint(),
+                     max_concurrent_jobs=self.max_concurrent_jobs,
+                     poll_interval=self.poll_interval,
+                     use_array_jobs=self.use_array_jobs,
+                     pack_size=self.pack_size,
+                     pack_walltime=self.pack_walltime,
+                     pack_parallel=self.pack_parallel,
+                     signature_file=self.__signature_file,
+                     queue_policy=self.jobs.policy,
+                     metrics_file=self.__metrics_file,
+                     pipeline_id=self.pipeline_id,
+                     jobs=jobs,
+                     waiting=[index[job] for job in self.jobs.waiting_jobs()],
+                     blocked=[index[job] for job in self.__blocked],
+                     running=[index[job] for job in self.__running],
+                     packs=[sorted([index[job] for job in jobs])
+                            for jobs in self.__pack_jobs.values()],
+                     completed=[index[job] for job in self.completed])
+        tmp_file = "%s.tmp" % self.__state_file
+        with io.open(tmp_file,'wt') as fp:
+            fp.write(u"%s" % json.dumps(state,separators=(',',':')))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.rename(tmp_file,self.__state_file)
+
+    @classmethod
+    def resume(cls,state_file,runner=None,jobCompletionHandler=None,
+               groupCompletionHandler=None,queue_policy=None,throttle=None):
+        """Create a new PipelineRunner from a saved state file
+
+        Restores the jobs from a pipeline which was run with a
+        'state_file'. Completed jobs keep their status (the
+        completion handlers aren't invoked for them again);
+        jobs which were running are reattached to via the
+        runner where possible, otherwise they are put back at
+        the start of the queue to be resubmitted.
+
+        The new pipeline continues to save its state to the
+        same file; call its 'run' method to continue running
+        the pipeline.
+
+        Arguments:
+          state_file: state file saved by a PipelineRunner
+          runner: (optional) a JobRunner instance to use (by
+            default a runner is created from the definition
+            and settings stored in the state file; a runner
+            must be supplied if the original runner couldn't
+            be recreated, e.g. for PythonFunctionRunners)
+          jobCompletionHandler: (optional) job completion
+            callback function
+          groupCompletionHandler: (optional) group completion
+            callback function
+          queue_policy: (optional) queue policy to use (by
+            default the named policy stored in the state file
+            is used)
+          throttle: (optional) throttle to use to adjust the
+            maximum number of concurrent jobs
+
+        Returns:
+          A PipelineRunner instance.
+        """
+        with io.open(state_file,'rt') as fp:
+            state = json.load(fp)
+        # Set up the runner
+        if runner is None:
+            if state['runner'] is None:
+                raise Exception("PipelineRunner: runner can't be recreated "
+                                "from state file '%s': a runner must be "
+                                "supplied" % state_file)
+            runner = fetch_runner(state['runner'],
+                                  settings=state.get('runner_settings'))
+            runner.set_log_dir(state['log_dir'])
+        reattached = []
+        if state['runner_state'] is not None:
+            reattached = runner.reattach(state['runner_state'])
+        # Create the pipeline
+        pipeline = cls(runner,
+                       max_concurrent_jobs=state['max_concurrent_jobs'],
+                       poll_interval=state['poll_interval'],
+                       jobCompletionHandler=jobCompletionHandler,
+                       groupCompletionHandler=groupCompletionHandler,
+                       use_array_jobs=state['use_array_jobs'],
+                       signature_file=state['signature_file'],
+                       state_file=state_file,
+                       queue_policy=(queue_policy or
+                                     state.get('queue_policy')),
+                       metrics_file=state.get('metrics_file'),
+                       pack_size=state.get('pack_size'),
+                       pack_walltime=state.get('pack_walltime'),
+                       pack_parallel=state.get('pack_parallel',1),
+                       throttle=throttle)
+        if 'pipeline_id' in state:
+            pipeline.pipeline_id = state['pipeline_id']
+        # Restore the jobs
+        jobs = []
+        for job_state in state['jobs']:
+            depends_on = [jobs[i] for i in job_state.get('depends_on',[])]
+            job = Job(runner,
+                      job_state['name'],
+                      job_state['working_dir'],
+                      job_state['script'],
+                      job_state['args'],
+                      label=job_state.get('label'),
+                      group=job_state.get('group_label'),
+                      depends_on=depends_on,
+                      inputs=job_state.get('inputs'),
+                      outputs=job_state.get('outputs'))
+            job.restore(job_state)
+            jobs.append(job)
+            pipeline.__job_list.append(job)
+            pipeline.__queued_jobs.add(job)
+            group = job.group_label
+            if group:
+                if group not in pipeline.groups:
+                    pipeline.groups.append(group)
+                    pipeline.njobs_in_group[group] = 1
+                else:
+                    pipeline.njobs_in_group[group] += 1
+        for i in state['completed']:
+            job = jobs[i]
+            pipeline.completed.append(job)
+            pipeline.__completed_jobs.add(job)
+            if job.group_label is not None:
+                pipeline.__completed_in_group.setdefault(job.group_label,
+                                                         []).append(job)
+        resubmit = []
+        for i in state['running']:
+            job = jobs[i]
+            if job.job_id in reattached:
+                pipeline.__add_running_job(job)
+            else:
+                logging.warning("PipelineRunner: unable to reattach to "
+                                "job %s (%s), it will be resubmitted" %
+                                (job.job_id,job.name))
+                job.restore(dict())
+                resubmit.append(job)
+        for pack in state.get('packs',[]):
+            pack = [jobs[i] for i in pack if jobs[i] in pipeline.__running]
+            if pack:
+                pipeline.__add_pack(pack)
+        for job in resubmit + [jobs[i] for i in state['waiting']]:
+            pipeline.jobs.put(job)
+        for i in state['blocked']:
+            pipeline.__block_job(jobs[i])
+            pipeline.__blocked[jobs[i]] = True
+        print("Resumed pipeline from %s: %d jobs waiting, %d running, "
+              "%d finished" % (state_file,pipeline.nWaiting(),
+                               pipeline.nRunning(),pipeline.nCompleted()))
+        return pipeline
+
+    def __wait(self):
+        """Internal: wait before the next update of the pipeline
+
+        Waits until the runner indicates that a job may have
+        completed, or for 'poll_interval' seconds (if the
+        runner doesn't support waiting for completion).
+        """
+        try:
+            self.__runner.wait_for_completion(self.poll_interval)
+        except AttributeError:
+            time.sleep(self.poll_interval)
+
+    def __start_jobs(self,packs):
+        """Internal: start a set of jobs running
+
+        The jobs are supplied as a list of packs (i.e. lists
+        of jobs): packs with more than one job are started
+        via the runner's 'run_pack' method (if submission of
+        a pack fails then its jobs are started individually).
+
+        Of the remaining jobs, jobs which run the same script
+        in the same working
+        directory are started together as an array job (unless
+        array jobs are disabled); if submission of an array
+        job fails then the jobs are started individually.
+
+        Remaining jobs are submitted together via the runner's
+        'run_many' method (any which fail are then retried
+        individually).
+        """
+        # Start the packs
+        jobs = []
+        for pack in packs:
+            if len(pack) == 1:
+                jobs.append(pack[0])
+                continue
+            name = "%s.pack" % _script_name(pack[0].script)
+            job_ids = self.__runner.run_pack(name,
+                                             [(job.name,
+                                               job.working_dir,
+                                               job.script,
+                                               job.args)
+                                              for job in pack],
+                                             nparallel=self.pack_parallel)
+            for job,job_id in zip(pack,job_ids):
+                if job_id is None:
+                    logging.warning("PipelineRunner: pack submission "
+                                    "failed for %s, submitting "
+                                    "individually" % job.name)
+                job.start(job_id=job_id)
+            self.__add_pack([job for job,job_id in zip(pack,job_ids)
+                             if job_id is not None])
+        # Group jobs by script and working directory
+        use_array_jobs = (self.use_array_jobs and
+                          _has_run_array(self.__runner))
+        batches = []
+        batch_index = {}
+        for job in jobs:
+            key = (job.script,job.working_dir)
+            if not use_array_jobs or key not in batch_index:
+                batch_index[key] = len(batches)
+                batches.append([job])
+            else:
+                batches[batch_index[key]].append(job)
+        # Start the jobs
+        singles = []
+        for batch in batches:
+            if len(batch) > 1:
+                script = batch[0].script
+                name = _script_name(script)
+                job_ids = self.__runner.run_array(name,
+                                                  batch[0].working_dir,
+                                                  script,
+                                                  [job.args for job in batch],
+                                                  names=[job.name
+                                                         for job in batch])
+                for job,job_id in zip(batch,job_ids):
+                    if job_id is None:
+                        logging.warning("PipelineRunner: array job "
+                                        "submission failed for %s, submitting "
+                                        "individually" % job.name)
+                    job.start(job_id=job_id)
+            else:
+                singles.append(batch[0])
+        # Start the remaining jobs
+        if len(singles) > 1:
+            job_ids = self.__runner.run_many([(job.name,
+                                               job.working_dir,
+                                               job.script,
+                                               job.args)
+                                              for job in singles])
+            for job,job_id in zip(singles,job_ids):
+                if job_id is None:
+                    logging.warning("PipelineRunner: submission failed for "
+                                    "%s, submitting individually" % job.name)
+                job.start(job_id=job_id)
+        else:
+            for job in singles:
+                job.start()
 
     def report(self):
         """Return a report of the pipeline status
@@ -470,43 +1834,60 @@ class PipelineRunner(object):
             status = "WAITING"
         else:
             status = "COMPLETED"
-        report = "Pipeline status at %s: %s\n\n" % (time.asctime(),status)
+        report = ["Pipeline status at %s: %s\n\n" % (time.asctime(),status)]
         # Report directories
         dirs = []
+        seen = set()
         for job in self.completed:
-            if job.working_dir not in dirs:
+            if job.working_dir not in seen:
+                seen.add(job.working_dir)
                 dirs.append(job.working_dir)
         for dirn in dirs:
-            report += "\t%s\n" % dirn
+            report.append("\t%s\n" % dirn)
         # Report jobs waiting
         if self.nWaiting() > 0:
-            report += "\n%d jobs waiting to run\n" % self.nWaiting()
+            report.append("\n%d jobs waiting to run\n" % self.nWaiting())
         # Report jobs running
         if self.nRunning() > 0:
-            report += "\n%d jobs running:\n" % self.nRunning()
+            report.append("\n%d jobs running:\n" % self.nRunning())
             for job in self.running:
-                report += "\t%s\t%s\t%s\n" % (job.label,job.log,job.working_dir)
+                report.append("\t%s\t%s\t%s\n" % (job.label,job.log,
+                                                   job.working_dir))
         # Report completed jobs
         if self.nCompleted() > 0:
-            report += "\n%d jobs completed:\n" % self.nCompleted()
+            report.append("\n%d jobs completed:\n" % self.nCompleted())
             for job in self.completed:
-                report += "\t%s\t%s\t%s\t%.1fs\t[%s]\n" % (job.label,
-                                                           job.log,
-                                                           job.working_dir,
-                                                           (job.end_time - job.start_time),
-                                                           job.status())
-        return report
+                report.append("\t%s\t%s\t%s\t%.1fs\t[%s]\n" %
+                              (job.label,
+                               job.log,
+                               job.working_dir,
+                               (job.end_time - job.start_time),
+                               job.status()))
+        return ''.join(report)
 
     def __del__(self):
         """Deal with deletion of the pipeline
 
         If the pipeline object is deleted while still running
-        then terminate all running jobs.
+        then terminate all running jobs (unless the pipeline has
+        a state file, in which case the state is saved and the
+        running jobs are left so that the pipeline can be
+        resumed).
 
         """
+        if not hasattr(self,'jobs'):
+            # Pipeline wasn't fully initialised
+            return
+        if self.__state_file and self.__running:
+            try:
+                self.__save_state()
+            except Exception as ex:
+                logging.error("Failed to save pipeline state: %s" % ex)
+            return
         # Empty the queue
         while not self.jobs.empty():
             self.jobs.get()
+        self.__blocked.clear()
         # Terminate the running jobs
         for job in self.running:
             logging.debug("Terminating job %s" % job.job_id)
@@ -547,6 +1928,82 @@ class SolidPipelineRunner(PipelineRunner):
 # Module Functions
 #######################################################################
 
+def _script_name(script):
+    """Internal: return base name to use for jobs running a script
+
+    Returns the name of the script file without the leading
+    directories and trailing extension, or the name of the
+    function if the 'script' is a Python callable.
+    """
+    if callable(script):
+        return script.__name__
+    return os.path.splitext(os.path.basename(script))[0]
+
+def _runner_definition(runner):
+    """Internal: return the definition used to recreate a runner
+
+    Returns the runner's definition (i.e. its 'repr', which
+    can be passed to 'fetch_runner' along with its settings)
+    or None if 'fetch_runner' can't recreate the runner (e.g.
+    PythonFunctionRunners, and subclasses of the standard
+    runners).
+    """
+    if type(runner) in (SimpleJobRunner,GEJobRunner,LocalSchedulerRunner):
+        return repr(runner)
+    return None
+
+def _has_run_array(runner):
+    """Internal: check if a runner provides its own 'run_array' method
+
+    Returns False if the runner only has the default
+    implementation from BaseJobRunner (which starts each
+    job separately).
+    """
+    run_array = getattr(type(runner),'run_array',None)
+    return (getattr(run_array,'__func__',run_array) is not
+            getattr(BaseJobRunner.run_array,'__func__',
+                    BaseJobRunner.run_array))
+
+def _open_csv_for_append(filename):
+    """Internal: open a CSV file to append rows using the csv module
+
+    The csv module expects a binary file under Python 2, and
+    a text file opened with newline='' under Python 3.
+    """
+    if sys.version_info[0] < 3:
+        return open(filename,'ab')
+    return io.open(filename,'at',newline='')
+
+def estimate_job_size(job):
+    """Estimate the size of a job from its input files
+
+    The estimate is the total size (in bytes) of the files
+    which are supplied as arguments to the job's script, plus
+    any files declared as inputs for the job. Arguments which
+    aren't existing files are ignored (relative paths are
+    taken to be relative to the job's working directory).
+
+    Arguments:
+      job: Job instance
+
+    Returns:
+      Estimated size of the job (integer).
+    """
+    size = 0
+    seen = set()
+    for f in list(job.args) + list(job.inputs):
+        path = job.resolve_path(str(f))
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            size += st.st_size
+    return size
+
 def GetSolidDataFiles(dirn,pattern=None,file_list=None):
     """Return list of csfasta/qual file pairs in target directory
 
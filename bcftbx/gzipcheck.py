@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+#
+#     gzipcheck.py: check integrity of gzip-compressed files
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# gzipcheck.py
+#
+#########################################################################
+
+"""
+gzipcheck
+
+Classes and functions for checking the integrity of gzip-compressed
+files (for example the ``fastq.gz`` files produced from an Illumina
+sequencing run), before primary data are deleted.
+
+Checking files:
+
+- check_gzip: test-decompress a gzipped file, verifying the CRC and
+  uncompressed size (ISIZE) of every gzip member
+- check_gzip_files: check multiple files in parallel
+- GzipCheckResult: holds the outcome of checking a file
+
+Locating files and recording results:
+
+- list_fastqs: list the fastq files in an IlluminaData object
+- GzipCheckRecord: persistent record of validated files, so that
+  files which haven't changed can be skipped on subsequent checks
+
+Example usage:
+
+>>> illumina_data = IlluminaData('/data/run')
+>>> record = GzipCheckRecord('validated.txt')
+>>> for result in check_gzip_files(list_fastqs(illumina_data),
+...                                nprocs=8,check_lines=True,
+...                                record=record):
+...    print(result)
+
+"""
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import io
+import zlib
+import struct
+import logging
+import functools
+from multiprocessing import Pool
+from .Md5sum import _stat_key
+
+#######################################################################
+# Constants
+#######################################################################
+
+BLOCKSIZE = 1024*1024
+
+# gzip header flags (see RFC 1952)
+FTEXT = 0x01
+FHCRC = 0x02
+FEXTRA = 0x04
+FNAME = 0x08
+FCOMMENT = 0x10
+
+#######################################################################
+# Classes
+#######################################################################
+
+class GzipCheckError(Exception):
+    """Base class for errors detected in gzipped files
+    """
+
+class GzipCheckResult(object):
+    """Class to hold the outcome of checking a gzipped file
+
+    Provides the following attributes:
+
+    filen:   path of the file that was checked
+    status:  one of OK, FAILED or SKIPPED
+    error:   description of the error (if the check failed,
+             otherwise None)
+    members: number of gzip members in the file
+    size:    total uncompressed size of the data in bytes
+    nlines:  number of lines in the uncompressed data (or
+             None if lines were not counted)
+    """
+    # Check outcomes
+    OK = 'OK'
+    FAILED = 'FAILED'
+    SKIPPED = 'SKIPPED'
+
+    def __init__(self,filen,status,error=None,members=0,size=0,
+                 nlines=None):
+        """Create a new GzipCheckResult instance
+
+        Arguments:
+          filen: path of the file that was checked
+          status: outcome of the check (OK, FAILED or SKIPPED)
+          error: (optional) description of the error
+          members: (optional) number of gzip members
+          size: (optional) total uncompressed size in bytes
+          nlines: (optional) number of uncompressed lines
+        """
+        self.filen = filen
+        self.status = status
+        self.error = error
+        self.members = members
+        self.size = size
+        self.nlines = nlines
+
+    @property
+    def ok(self):
+        """Return True if the file passed the check (or was skipped)
+        """
+        return self.status != self.FAILED
+
+    def __repr__(self):
+        """Implement __repr__ built-in
+
+        Returns a tab-delimited line with the file name,
+        status, number of members, uncompressed size, number
+        of lines and error message.
+        """
+        return "%s\t%s\t%s\t%s\t%s\t%s" % \
+            (self.filen,
+             self.status,
+             self.members,
+             self.size,
+             '' if self.nlines is None else self.nlines,
+             '' if self.error is None else self.error)
+
+class GzipCheckRecord(object):
+    """Persistent record of files which have been validated
+
+    Records are stored in a tab-delimited file with one line
+    for each validated file, consisting of the full path plus
+    the size, modification time (in nanoseconds) and inode
+    number of the file when it was checked.
+
+    A file is considered to be already validated if there is
+    a record where the path and all these attributes match
+    those of the file on disk; otherwise it must be checked
+    again.
+
+    Records are appended to the file (and flushed) as they are
+    added, so that progress is not lost if checking is
+    interrupted.
+
+    Example usage:
+
+    >>> record = GzipCheckRecord('validated.txt')
+    >>> if not record.is_validated(filen):
+    ...   if check_gzip(filen).ok:
+    ...     record.add(filen)
+    >>> record.close()
+    """
+    def __init__(self,record_file):
+        """Create a new GzipCheckRecord instance
+
+        Arguments:
+          record_file: path to the file used to store the
+            records (will be created if it doesn't exist)
+        """
+        self._record_file = record_file
+        self._records = {}
+        if os.path.exists(record_file):
+            with io.open(record_file,'rt') as fp:
+                for line in fp:
+                    try:
+                        filen,size,mtime_ns,inode = \
+                            line.rstrip('\n').split('\t')
+                        self._records[filen] = (int(size),
+                                                int(mtime_ns),
+                                                int(inode))
+                    except ValueError:
+                        logging.warning("%s: bad record ignored: %s" %
+                                        (record_file,line.rstrip('\n')))
+        self._fp = io.open(record_file,'at')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    def is_validated(self,filen,st=None):
+        """Check if a file has already been validated
+
+        Arguments:
+          filen: path to the file
+          st: (optional) result of 'os.stat' for the file (will
+            be obtained if not supplied)
+
+        Returns:
+          True if there is a matching record for the file,
+          False if not.
+        """
+        filen = os.path.abspath(filen)
+        try:
+            if st is None:
+                st = os.stat(filen)
+        except OSError:
+            return False
+        return self._records.get(filen) == _stat_key(st)
+
+    def add(self,filen,st=None):
+        """Record that a file has been validated
+
+        Arguments:
+          filen: path to the file
+          st: (optional) result of 'os.stat' for the file (will
+            be obtained if not supplied)
+        """
+        filen = os.path.abspath(filen)
+        if st is None:
+            st = os.stat(filen)
+        key = _stat_key(st)
+        self._records[filen] = key
+        self._fp.write(u"%s\t%d\t%d\t%d\n" % ((filen,) + key))
+        self._fp.flush()
+
+    def close(self):
+        """Close the record file
+        """
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+class _Reader(object):
+    """Internal: buffered reader supporting lookahead and push-back
+    """
+    def __init__(self,fp,blocksize=BLOCKSIZE):
+        self._fp = fp
+        self._blocksize = blocksize
+        self._buf = b''
+
+    def read(self,n):
+        """Return up to 'n' bytes (fewer only at end of file)
+        """
+        while len(self._buf) < n:
+            data = self._fp.read(self._blocksize)
+            if not data:
+                break
+            self._buf += data
+        data = self._buf[:n]
+        self._buf = self._buf[n:]
+        return data
+
+    def read_chunk(self):
+        """Return the next chunk of data (empty at end of file)
+        """
+        if self._buf:
+            data = self._buf
+            self._buf = b''
+            return data
+        return self._fp.read(self._blocksize)
+
+    def read_cstring(self):
+        """Read and discard a zero-terminated string
+        """
+        while True:
+            c = self.read(1)
+            if not c:
+                raise GzipCheckError("truncated gzip header")
+            if c == b'\0':
+                return
+
+    def unread(self,data):
+        """Push data back so that it is returned by the next read
+        """
+        self._buf = data + self._buf
+
+#######################################################################
+# Functions
+#######################################################################
+
+def check_gzip(filen,check_lines=False,blocksize=BLOCKSIZE):
+    """Test-decompress a gzipped file
+
+    Decompresses each member of the file in turn and checks
+    that the CRC32 and uncompressed size (ISIZE) stored in the
+    member's trailer match the decompressed data. The
+    decompressed data are discarded, so the memory used doesn't
+    depend on the size of the file.
+
+    Optionally also checks that the total number of lines in
+    the decompressed data is a multiple of four (as required
+    for Fastq files).
+
+    Arguments:
+      filen: path to the gzipped file to check
+      check_lines: (optional) if True then also check the
+        number of lines is a multiple of four
+      blocksize: (optional) size of blocks to read from the
+        file and decompress at a time
+
+    Returns:
+      GzipCheckResult instance.
+    """
+    members = 0
+    size = 0
+    nlines = 0
+    last_byte = b'\n'
+    try:
+        with io.open(filen,'rb') as fp:
+            r = _Reader(fp,blocksize=blocksize)
+            while True:
+                # Read member header
+                header = r.read(10)
+                if not header:
+                    if not members:
+                        raise GzipCheckError("empty file")
+                    break
+                if header[:2] != b'\x1f\x8b':
+                    if members and not header.strip(b'\0'):
+                        # Allow trailing zero padding
+                        chunk = r.read_chunk()
+                        while chunk and not chunk.strip(b'\0'):
+                            chunk = r.read_chunk()
+                        if not chunk:
+                            break
+                    if members:
+                        raise GzipCheckError("trailing garbage after "
+                                             "member %d" % members)
+                    raise GzipCheckError("not a gzipped file")
+                if len(header) < 10:
+                    raise GzipCheckError("truncated gzip header")
+                method,flags = struct.unpack('<BB',header[2:4])
+                if method != 8:
+                    raise GzipCheckError("unknown compression method %d" %
+                                         method)
+                if flags & FEXTRA:
+                    extra = r.read(2)
+                    if len(extra) < 2:
+                        raise GzipCheckError("truncated gzip header")
+                    xlen = struct.unpack('<H',extra)[0]
+                    if len(r.read(xlen)) < xlen:
+                        raise GzipCheckError("truncated gzip header")
+                if flags & FNAME:
+                    r.read_cstring()
+                if flags & FCOMMENT:
+                    r.read_cstring()
+                if flags & FHCRC:
+                    if len(r.read(2)) < 2:
+                        raise GzipCheckError("truncated gzip header")
+                # Decompress the raw deflate stream
+                members += 1
+                d = zlib.decompressobj(-zlib.MAX_WBITS)
+                crc = 0
+                isize = 0
+                while not d.unused_data:
+                    chunk = r.read_chunk()
+                    if not chunk:
+                        raise GzipCheckError("unexpected end of file "
+                                             "in member %d" % members)
+                    while chunk and not d.unused_data:
+                        data = d.decompress(chunk,blocksize)
+                        chunk = d.unconsumed_tail
+                        if not data:
+                            continue
+                        crc = zlib.crc32(data,crc)
+                        isize += len(data)
+                        if check_lines:
+                            nlines += data.count(b'\n')
+                            last_byte = data[-1:]
+                r.unread(d.unused_data)
+                # Check the trailer
+                trailer = r.read(8)
+                if len(trailer) < 8:
+                    raise GzipCheckError("unexpected end of file in "
+                                         "member %d" % members)
+                expected_crc,expected_isize = struct.unpack('<II',trailer)
+                if (crc & 0xffffffff) != expected_crc:
+                    raise GzipCheckError("CRC check failed for member %d" %
+                                         members)
+                if (isize & 0xffffffff) != expected_isize:
+                    raise GzipCheckError("ISIZE check failed for member %d" %
+                                         members)
+                size += isize
+    except (GzipCheckError,zlib.error,IOError,OSError) as ex:
+        return GzipCheckResult(filen,GzipCheckResult.FAILED,error=str(ex),
+                               members=members,size=size)
+    if check_lines:
+        if last_byte != b'\n':
+            # Final line has no newline
+            nlines += 1
+        if nlines % 4 != 0:
+            return GzipCheckResult(filen,GzipCheckResult.FAILED,
+                                   error="number of lines (%d) is not a "
+                                   "multiple of 4" % nlines,
+                                   members=members,size=size,
+                                   nlines=nlines)
+    else:
+        nlines = None
+    return GzipCheckResult(filen,GzipCheckResult.OK,members=members,
+                           size=size,nlines=nlines)
+
+def check_gzip_files(files,nprocs=1,check_lines=False,record=None):
+    """Check multiple gzipped files in parallel
+
+    Files are checked using 'check_gzip' in a pool of 'nprocs'
+    processes, and results are yielded as each check completes
+    (so not necessarily in the same order as 'files').
+
+    If a GzipCheckRecord is supplied then files which have
+    already been validated (and are unchanged) are skipped, and
+    files which pass the checks are added to the record. Each
+    file is stat'ed before it is checked, and is only added to
+    the record if the stat still matches once the check has
+    completed (so a file which is modified while it is being
+    checked is not recorded as validated).
+
+    Arguments:
+      files: list of paths to gzipped files to check
+      nprocs: (optional) number of processes to use
+        (default: 1)
+      check_lines: (optional) if True then also check the
+        number of lines is a multiple of four
+      record: (optional) GzipCheckRecord instance
+
+    Returns:
+      Yields a GzipCheckResult instance for each file.
+    """
+    to_check = []
+    for filen in files:
+        try:
+            st = os.stat(filen)
+        except OSError:
+            # Check will report the error
+            st = None
+        if record is not None and st is not None and \
+           record.is_validated(filen,st=st):
+            yield GzipCheckResult(filen,GzipCheckResult.SKIPPED)
+        else:
+            to_check.append((filen,st))
+    check = functools.partial(_check_gzip_item,check_lines=check_lines)
+    if nprocs > 1 and len(to_check) > 1:
+        pool = Pool(nprocs)
+        try:
+            results = pool.imap_unordered(check,to_check)
+            for result,st in results:
+                if record is not None:
+                    _record_result(record,result,st)
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for item in to_check:
+            result,st = check(item)
+            if record is not None:
+                _record_result(record,result,st)
+            yield result
+
+def _check_gzip_item(item,check_lines=False):
+    """Internal: check a file for 'check_gzip_files'
+
+    'item' is a tuple (filen,st) where 'st' is the
+    result of 'os.stat' for the file before the check;
+    returns a tuple (result,st).
+    """
+    filen,st = item
+    return (check_gzip(filen,check_lines=check_lines),st)
+
+def _record_result(record,result,st):
+    """Internal: add a successfully checked file to a record
+
+    The file is only added if 'st' (the result of 'os.stat'
+    before the check) still matches the file on disk.
+    """
+    if not result.ok or st is None:
+        return
+    try:
+        unchanged = (_stat_key(os.stat(result.filen)) == _stat_key(st))
+    except OSError:
+        unchanged = False
+    if unchanged:
+        record.add(result.filen,st=st)
+    else:
+        logging.warning("%s: changed while being checked, not recorded "
+                        "as validated" % result.filen)
+
+def list_fastqs(illumina_data):
+    """Return list of fastq files in an IlluminaData object
+
+    Includes the fastqs for all projects, plus the
+    undetermined fastqs (if present).
+
+    Arguments:
+      illumina_data: populated IlluminaData instance
+
+    Returns:
+      List of full paths to the fastq files.
+    """
+    projects = list(illumina_data.projects)
+    if illumina_data.undetermined is not None:
+        projects.append(illumina_data.undetermined)
+    fastqs = []
+    for project in projects:
+        for sample in project.samples:
+            for fq in sample.fastq:
+                fastqs.append(os.path.join(sample.dirn,fq))
+    return fastqs
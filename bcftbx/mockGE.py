@@ -11,6 +11,14 @@ simulating the functionality provided by the Grid Engine command
 line utilities, and a function `setup_mock_GE`, which creates
 mock versions of those utilities ('qsub', 'qstat', 'qacct' and
 'qdel').
+
+By default jobs are run as real processes and all times are taken
+from the system clock. Alternatively `MockGE` can be created with
+a simulated clock (`virtual_clock=True`), which is only moved on
+by calling its `advance` method: in this mode the length of time
+that each job runs for is taken from a model (`job_duration`)
+rather than from the job itself, so large numbers of jobs can be
+simulated quickly (see the `MockGE` documentation for details).
 """
 
 #######################################################################
@@ -45,7 +53,8 @@ class MockGE(object):
     The following methods can be invoked which provide functions
     similar to their SGE namesakes:
 
-    - qsub: submits a job to be run
+    - qsub: submits a job to be run (including array jobs via
+      the '-t' option)
     - qstat: outputs information on active jobs
     - qacct: outputs accounting information for completed jobs
     - qdel: terminates an active job
@@ -54,12 +63,38 @@ class MockGE(object):
     called to check the status of any active jobs and update the
     database accordingly; this method can also be invoked directly.
 
+    Updates to the database made by each invocation are committed
+    together, and the database uses SQLite's write-ahead logging
+    ('WAL') mode so that reading job data (e.g. for 'qstat') isn't
+    blocked by updates from other processes.
+
+    If 'virtual_clock' is True then the instance uses a simulated
+    clock (stored in the database, so that it is shared with the
+    mock utilities and any other 'MockGE' instances using the
+    same database), which starts at the current time and is only
+    moved on by the 'advance' method. In this mode:
+
+    - jobs don't run while they are in the 'r' state: instead
+      each job is scheduled to finish after the number of seconds
+      given by the 'job_duration' model. The command for each job
+      is then run when the clock reaches its scheduled end time
+      (so that any outputs are still produced), with the commands
+      for all the jobs finishing at the same update being run in
+      turn by a single shell process. Job commands should
+      therefore complete quickly;
+    - only instances which were created with 'virtual_clock'
+      set start and finish jobs (so for example the mock
+      utilities just report the state of the jobs, rather than
+      updating it).
+
     NB the 'stop' method should be invoked on the 'MockGE' instance
     when it is not longer needed, to ensure that any running
     processes are properly terminated.
     """
     def __init__(self,max_jobs=4,qsub_delay=0.0,qacct_delay=15.0,
-                 shell='/bin/bash',database_dir=None,debug=False):
+                 shell='/bin/bash',database_dir=None,debug=False,
+                 cleanup_at_exit=True,virtual_clock=False,
+                 job_duration=None):
         """
         Create a new MockGE instance
 
@@ -76,6 +111,16 @@ class MockGE(object):
             managing the mockGE functionality (defaults to
             '$HOME/.mockGE')
           debug (bool): if True then turn on debugging output
+          cleanup_at_exit (bool): if True (the default) then
+            register the 'stop' method to be invoked at exit
+          virtual_clock (bool): if True then use a simulated
+            clock, and start and finish jobs according to the
+            'job_duration' model
+          job_duration (float): number of seconds that each
+            job runs for when using the simulated clock; can
+            also be a function which takes the name and command
+            line of a job and returns the number of seconds
+            (defaults to zero)
         """
         if debug:
             logging.getLogger().setLevel(logging.DEBUG)
@@ -95,17 +140,30 @@ class MockGE(object):
             logging.debug("Connecting to DB")
             self._cx = sqlite3.connect(self._db_file)
             self._cx.row_factory = sqlite3.Row
+            self._cx.execute("PRAGMA journal_mode=WAL")
+            self._cx.execute("PRAGMA synchronous=NORMAL")
         except Exception as ex:
             print("Exception connecting to DB: %s" % ex)
             raise ex
         if init_db:
             logging.debug("Setting up DB")
             self._init_db()
+        else:
+            self._update_db()
         self._shell = shell
         self._max_jobs = max_jobs
         self._qsub_delay = qsub_delay
         self._qacct_delay = qacct_delay
-        atexit.register(self.stop)
+        # Simulated clock
+        if virtual_clock:
+            self._init_clock()
+        self._simulated = self._has_clock()
+        self._job_duration = job_duration
+        # Only instances which own the simulated clock
+        # start and finish jobs
+        self._updates_jobs = (virtual_clock or not self._simulated)
+        if cleanup_at_exit:
+            atexit.register(self.stop)
 
     def stop(self):
         """
@@ -133,21 +191,145 @@ class MockGE(object):
           qsub_time   FLOAT,
           start_time  FLOAT,
           end_time    FLOAT,
-          exit_code   INTEGER
+          exit_code   INTEGER,
+          array_id    INTEGER,
+          task_id     INTEGER
         )
         """
         try:
             cu = self._cx.cursor()
             cu.execute(sql)
+            self._init_tables(cu)
             self._cx.commit()
         except sqlite3.Error as ex:
             print("Failed to set up database: %s" % ex)
             raise ex
 
+    def _init_tables(self,cu):
+        """
+        Set up the index and tables added by later versions
+        """
+        cu.execute("CREATE INDEX IF NOT EXISTS jobs_state "
+                   "ON jobs (state)")
+        cu.execute("CREATE TABLE IF NOT EXISTS clock (time FLOAT)")
+
+    def _update_db(self):
+        """
+        Add columns missing from databases created by older versions
+        """
+        cu = self._cx.cursor()
+        cu.execute("PRAGMA table_info(jobs)")
+        columns = [c['name'] for c in cu.fetchall()]
+        for column in ('array_id','task_id'):
+            if column not in columns:
+                logging.debug("Adding '%s' column to DB" % column)
+                cu.execute("ALTER TABLE jobs ADD COLUMN %s INTEGER" %
+                           column)
+        self._init_tables(cu)
+        self._cx.commit()
+
+    def _init_clock(self):
+        """
+        Start the simulated clock (if not already started)
+        """
+        cu = self._cx.cursor()
+        cu.execute("""
+        INSERT INTO clock (time)
+        SELECT ? WHERE NOT EXISTS (SELECT time FROM clock)
+        """,(time.time(),))
+        self._cx.commit()
+
+    def _has_clock(self):
+        """
+        Check if the database has a simulated clock
+        """
+        cu = self._cx.cursor()
+        cu.execute("SELECT time FROM clock")
+        return (cu.fetchone() is not None)
+
+    def _time(self):
+        """
+        Return the current time
+
+        This is the time from the simulated clock, if
+        one is being used, otherwise the system time.
+        """
+        if not self._simulated:
+            return time.time()
+        cu = self._cx.cursor()
+        cu.execute("SELECT time FROM clock")
+        return cu.fetchone()['time']
+
+    def _next_event_time(self):
+        """
+        Return the time of the next scheduled job event
+
+        The events are jobs finishing (when using the
+        simulated clock) and submitted jobs becoming ready to
+        be queued. Returns None if there are no events.
+        """
+        cu = self._cx.cursor()
+        cu.execute("""
+        SELECT MIN(t) AS t FROM (
+          SELECT end_time AS t FROM jobs WHERE state=='r'
+          UNION ALL
+          SELECT qsub_time+? AS t FROM jobs WHERE state=='t'
+        )
+        """,(self._qsub_delay,))
+        return cu.fetchone()['t']
+
+    def advance(self,seconds=None):
+        """
+        Move the simulated clock on and update the jobs
+
+        Arguments:
+          seconds (float): number of seconds to move the
+            clock on by; if None then the clock is moved on to
+            the time of the next scheduled event (i.e. a job
+            finishing or being queued), if there is one
+
+        Returns:
+          Float: the new time on the simulated clock.
+        """
+        if not self._simulated:
+            raise Exception("MockGE: not using a simulated clock")
+        now = self._time()
+        if seconds is None:
+            next_event = self._next_event_time()
+            if next_event is not None:
+                now = max(now,next_event)
+        else:
+            now += seconds
+        cu = self._cx.cursor()
+        cu.execute("UPDATE clock SET time=?",(now,))
+        self._cx.commit()
+        self.update_jobs()
+        return now
+
+    def _duration(self,name,command):
+        """
+        Return the modelled duration of a job in seconds
+        """
+        if self._job_duration is None:
+            return 0.0
+        if callable(self._job_duration):
+            return float(self._job_duration(name,command))
+        return float(self._job_duration)
+
     def _init_job(self,name,command,working_dir,nslots,queue,
-                  output_name,join_output):
+                  output_name,join_output,array_id=None,task_id=None,
+                  commit=True):
         """
         Create a new job id
+
+        For array jobs, 'task_id' should be set for each
+        task, and 'array_id' should be set to the id of the
+        first task (this is set automatically for the first
+        task if 'array_id' is None).
+
+        If 'commit' is False then the new job isn't committed
+        to the database (so that multiple jobs can be committed
+        together).
         """
         cmd = []
         for arg in command:
@@ -161,79 +343,127 @@ class MockGE(object):
         logging.debug("_init_job: cmd: %s" % cmd)
         try:
             sql = """
-            INSERT INTO jobs (user,state,qsub_time,name,command,working_dir,nslots,queue,output_name,join_output)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO jobs (user,state,qsub_time,name,command,working_dir,nslots,queue,output_name,join_output,array_id,task_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
             cu = self._cx.cursor()
             cu.execute(sql,(self._user(),
                             't',
-                            time.time(),
+                            self._time(),
                             name,
                             command,
                             working_dir,
                             nslots,
                             queue,
                             output_name,
-                            join_output))
-            self._cx.commit()
-            return cu.lastrowid
+                            join_output,
+                            array_id,
+                            task_id))
+            job_id = cu.lastrowid
+            if task_id is not None and array_id is None:
+                cu.execute("UPDATE jobs SET array_id=? WHERE id=?",
+                           (job_id,job_id))
+            if commit:
+                self._cx.commit()
+            return job_id
         except Exception as ex:
             logging.error("qsub failed with exception: %s" % ex)
 
+    def _job_command(self,job):
+        """
+        Return the command line for running a job
+
+        The command line sets up the job environment and
+        redirects the stdout and stderr from the command to
+        the job's output files.
+
+        Arguments:
+          job (Row): job data from the database (must include
+            the name, command, nslots, queue, working_dir,
+            output_name, join_output, array_id and task_id)
+        """
+        name = job['name']
+        working_dir = job['working_dir']
+        output_name = job['output_name']
+        task_id = job['task_id']
+        # Job number and environment (including task id for
+        # array tasks)
+        if task_id is not None:
+            job_number = "%s.%s" % (job['array_id'],task_id)
+            env = "JOB_ID=%s SGE_TASK_ID=%s " % (job['array_id'],task_id)
+        else:
+            job_number = job['id']
+            env = "JOB_ID=%s " % job['id']
+        # Output file basename
+        if output_name:
+            out = os.path.abspath(output_name)
+            if os.path.isdir(out):
+                out = os.path.join(out,name)
+            elif not os.path.isabs(out):
+                out = os.path.join(working_dir,out)
+        else:
+            out = os.path.join(working_dir,name)
+        logging.debug("Output basename: %s" % out)
+        # Set up stdout and stderr targets
+        stdout_file = "%s.o%s" % (out,job_number)
+        redirect = "1>%s" % stdout_file
+        logging.debug("Stdout: %s" % stdout_file)
+        if job['join_output'] == 'y':
+            redirect = "%s 2>&1" % redirect
+        else:
+            stderr_file = "%s.e%s" % (out,job_number)
+            redirect = "%s 2>%s" % (redirect,stderr_file)
+            logging.debug("Stderr: %s" % stderr_file)
+        return "%sNSLOTS=%s QUEUE=%s %s %s" % (env,
+                                               job['nslots'],
+                                               job['queue'],
+                                               job['command'],
+                                               redirect)
+
     def _start_job(self,job_id):
         """
         Start a job running
+
+        When using the simulated clock the job isn't
+        actually run; instead it is scheduled to finish
+        after its modelled duration.
+
+        NB the changes to the database are not committed.
         """
         # Get job info
         sql = """
-        SELECT name,command,nslots,queue,working_dir,output_name,join_output
+        SELECT id,name,command,nslots,queue,working_dir,output_name,join_output,array_id,task_id
         FROM jobs WHERE id==?
         """
         cu = self._cx.cursor()
         cu.execute(sql,(job_id,))
         job = cu.fetchone()
-        name = job['name']
-        command = job['command']
-        nslots = job['nslots']
-        queue = job['queue']
-        working_dir = job['working_dir']
-        output_name = job['output_name']
-        join_output = job['join_output']
         # Try to run the job
         try:
-            # Output file basename
-            if output_name:
-                out = os.path.abspath(output_name)
-                if os.path.isdir(out):
-                    out = os.path.join(out,name)
-                elif not os.path.isabs(out):
-                    out = os.path.join(working_dir,out)
-            else:
-                out = os.path.join(working_dir,name)
-            logging.debug("Output basename: %s" % out)
-            # Set up stdout and stderr targets
-            stdout_file = "%s.o%s" % (out,job_id)
-            redirect = "1>%s" % stdout_file
-            logging.debug("Stdout: %s" % stdout_file)
-            if join_output == 'y':
-                redirect = "%s 2>&1" % redirect
-            else:
-                stderr_file = "%s.e%s" % (out,job_id)
-                redirect = "%s 2>%s" % (redirect,stderr_file)
-                logging.debug("Stderr: %s" % stderr_file)
+            if self._simulated:
+                # Schedule the end of the job
+                start_time = self._time()
+                end_time = start_time + self._duration(job['name'],
+                                                       job['command'])
+                sql = """
+                UPDATE jobs SET state='r',start_time=?,end_time=?
+                WHERE id=?
+                """
+                cu.execute(sql,(start_time,end_time,job_id))
+                return
             # Build a script to run the command
             script_file = os.path.join(self._database_dir,
                                        "__job%d.sh" % job_id)
             with io.open(script_file,'wt') as fp:
                 fp.write(u"""#!%s
-NSLOTS=%s QUEUE=%s %s %s
+%s
 exit_code=$?
 echo "$exit_code" 1>%s/__exit_code.%d
-""" % (self._shell,nslots,queue,command,redirect,self._database_dir,job_id))
+""" % (self._shell,self._job_command(job),self._database_dir,job_id))
             os.chmod(script_file,0o775)
             # Run the command and capture process id
             process = subprocess.Popen(script_file,
-                                       cwd=working_dir,
+                                       cwd=job['working_dir'],
                                        close_fds=True,
                                        stdout=subprocess.PIPE,
                                        stderr=subprocess.STDOUT,
@@ -246,9 +476,7 @@ echo "$exit_code" 1>%s/__exit_code.%d
             UPDATE jobs SET pid=?,state='r',start_time=?
             WHERE id=?
             """
-            cu = self._cx.cursor()
-            cu.execute(sql,(pid,time.time(),job_id))
-            self._cx.commit()
+            cu.execute(sql,(pid,self._time(),job_id))
         except Exception as ex:
             # Put job into error state
             logging.debug("Exception trying to start job '%s'"
@@ -258,38 +486,29 @@ echo "$exit_code" 1>%s/__exit_code.%d
             UPDATE jobs SET state='Eqw',start_time=?
             WHERE id=?
             """
-            cu = self._cx.cursor()
-            cu.execute(sql,(time.time(),job_id))
-            self._cx.commit()
+            cu.execute(sql,(self._time(),job_id))
 
-    def update_jobs(self):
+    def _finished_jobs(self):
         """
-        Update all job info
-        """
-        # Get jobs that are waiting with state 't' and
-        # set them to 'qw'
-        cu = self._cx.cursor()
-        sql = """
-        SELECT id,qsub_time FROM jobs WHERE state=='t'
+        Return the exit codes for running jobs which have finished
+
+        Checks the process for each running job, and collects
+        the exit codes for the jobs which have finished (also
+        removing their scripts and exit code files).
+
+        Returns:
+          List of tuples of the form (EXIT_CODE,END_TIME,JOB_ID)
+          for each finished job.
         """
-        cu.execute(sql)
-        jobs = cu.fetchall()
-        for job in jobs:
-            if (time.time() - job['qsub_time']) < self._qsub_delay:
-                logging.debug("Job %d not ready to go to 'qw'",
-                              job['id'])
-                continue
-            logging.debug("Setting state to 'qw' for job %d" %
-                          job['id'])
-            sql = """
-            UPDATE jobs SET state='qw' WHERE id=?
-            """
-            cu.execute(sql,(job['id'],))
-            self._cx.commit()
+        # Reap any jobs started by this instance which have
+        # finished (so they don't linger as zombies)
+        for process in self._processes:
+            process.poll()
         # Get jobs that have finished running
         sql = """
         SELECT id,pid FROM jobs WHERE state=='r'
         """
+        cu = self._cx.cursor()
         cu.execute(sql)
         jobs = cu.fetchall()
         finished_jobs = []
@@ -304,6 +523,7 @@ echo "$exit_code" 1>%s/__exit_code.%d
                 logging.debug("Exception: %s" % ex)
                 finished_jobs.append(job_id)
         logging.debug("Finished jobs: %s" % finished_jobs)
+        results = []
         for job_id in finished_jobs:
             # Clean up
             script_file = os.path.join(self._database_dir,
@@ -321,44 +541,117 @@ echo "$exit_code" 1>%s/__exit_code.%d
             else:
                 logging.error("Missing __exit_code file for job %s"
                               % job_id)
-                end_time = time.time()
+                end_time = self._time()
                 exit_code = 1
-            # Update database
-            sql = """
-            UPDATE jobs SET state='c',exit_code=?,end_time=?
-            WHERE id==?
-            """
-            logging.debug("SQL: %s" % sql)
-            cu.execute(sql,(exit_code,end_time,job_id))
-        if finished_jobs:
-            self._cx.commit()
+            results.append((exit_code,end_time,job_id))
+        return results
+
+    def _finished_simulated_jobs(self):
+        """
+        Run the commands for simulated jobs which have finished
+
+        The commands for all the running jobs whose scheduled
+        end times have been reached are run in turn (in order
+        of their end times) by a single shell process.
+
+        Returns:
+          List of tuples of the form (EXIT_CODE,END_TIME,JOB_ID)
+          for each finished job.
+        """
+        # Get jobs that have reached their end times
+        sql = """
+        SELECT id,name,command,nslots,queue,working_dir,output_name,join_output,array_id,task_id,end_time
+        FROM jobs WHERE state=='r' AND end_time<=?
+        ORDER BY end_time,id
+        """
+        cu = self._cx.cursor()
+        cu.execute(sql,(self._time(),))
+        jobs = cu.fetchall()
+        if not jobs:
+            return []
+        logging.debug("Finished jobs: %s" % [job['id'] for job in jobs])
+        # Build a script to run the commands and report
+        # the exit codes
+        script_file = os.path.join(self._database_dir,"__finished.sh")
+        with io.open(script_file,'wt') as fp:
+            fp.write(u"#!%s\n" % self._shell)
+            for job in jobs:
+                fp.write(u"""(cd "%s" && %s)
+echo "__exit_code.%d $?"
+""" % (job['working_dir'],self._job_command(job),job['id']))
+        # Run the commands
+        exit_codes = {}
+        try:
+            process = subprocess.Popen([self._shell,script_file],
+                                       close_fds=True,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       universal_newlines=True)
+            for line in process.communicate()[0].split('\n'):
+                if line.startswith("__exit_code."):
+                    job_id,exit_code = line[len("__exit_code."):].split()
+                    exit_codes[int(job_id)] = int(exit_code)
+        except Exception as ex:
+            logging.error("Failed to run commands for finished "
+                          "jobs: %s" % ex)
+        os.remove(script_file)
+        results = []
+        for job in jobs:
+            try:
+                exit_code = exit_codes[job['id']]
+            except KeyError:
+                logging.error("Missing exit code for job %s"
+                              % job['id'])
+                exit_code = 1
+            results.append((exit_code,job['end_time'],job['id']))
+        return results
+
+    def update_jobs(self):
+        """
+        Update all job info
+
+        All the changes are committed to the database
+        together at the end of the update.
+
+        When using the simulated clock this does nothing
+        unless the instance was created with 'virtual_clock'
+        set.
+        """
+        if not self._updates_jobs:
+            return
+        cu = self._cx.cursor()
+        now = self._time()
+        # Set jobs that are waiting with state 't' to 'qw'
+        # once the qsub delay has elapsed
+        sql = """
+        UPDATE jobs SET state='qw'
+        WHERE state=='t' AND qsub_time<=?
+        """
+        cu.execute(sql,(now-self._qsub_delay,))
+        # Deal with jobs that have finished running
+        if self._simulated:
+            finished_jobs = self._finished_simulated_jobs()
+        else:
+            finished_jobs = self._finished_jobs()
+        sql = """
+        UPDATE jobs SET state='c',exit_code=?,end_time=?
+        WHERE id==?
+        """
+        cu.executemany(sql,finished_jobs)
         # Deal with jobs that are marked for deletion
         sql = """
-        SELECT id FROM jobs WHERE state == 'd'
+        SELECT id,pid FROM jobs WHERE state == 'd'
         """
         cu.execute(sql)
-        jobs = cu.fetchall()
-        deleted_jobs = [job['id'] for job in jobs]
-        for job_id in deleted_jobs:
-            sql = """
-            SELECT pid FROM jobs WHERE id==?
-            """
-            cu.execute(sql,(job_id,))
-            job = cu.fetchone()
-            if job is None:
-                continue
-            # Try to stop the job
+        deleted_jobs = cu.fetchall()
+        for job in deleted_jobs:
+            job_id = job['id']
+            # Try to stop the job (and any processes that
+            # it started)
             try:
-                pid = int(job['pid'])
-                os.kill(pid,9)
+                os.killpg(int(job['pid']),9)
             except Exception:
                 pass
-            # Update the database
-            sql = """
-            UPDATE jobs SET state='c' WHERE id=?
-            """
-            cu.execute(sql,(job_id,))
-            self._cx.commit()
             # Remove any files
             for name in ("__job%d.sh" % job_id,
                          "__exit_code.%d" % job_id):
@@ -367,33 +660,32 @@ echo "$exit_code" 1>%s/__exit_code.%d
                                            name))
                 except OSError:
                     pass
-            # Exit code
-            exit_code_file = os.path.join(self._database_dir,
-                                          "__exit_code.%d" % job_id)
-        # Deal with jobs that are waiting
         sql = """
-        SELECT id FROM jobs WHERE state == 'qw'
+        UPDATE jobs SET state='c',end_time=? WHERE id=?
+        """
+        cu.executemany(sql,[(now,job['id']) for job in deleted_jobs])
+        # Start waiting jobs while there are free slots
+        sql = """
+        SELECT COUNT(*) AS nrunning FROM jobs WHERE state=='r'
         """
         cu.execute(sql)
-        jobs = cu.fetchall()
-        waiting_jobs = [job['id'] for job in jobs]
-        for job_id in waiting_jobs:
+        nfree = self._max_jobs - cu.fetchone()['nrunning']
+        if nfree > 0:
             sql = """
-            SELECT id,pid FROM jobs WHERE state=='r'
+            SELECT id FROM jobs WHERE state == 'qw'
+            ORDER BY id LIMIT ?
             """
-            cu.execute(sql)
-            nrunning = len(cu.fetchall())
-            if nrunning < self._max_jobs:
-                self._start_job(job_id)
-            else:
-                break
-        
+            cu.execute(sql,(nfree,))
+            for job in cu.fetchall():
+                self._start_job(job['id'])
+        self._cx.commit()
+
     def _list_jobs(self,user,state=None):
         """
         Get list of the jobs
         """
         sql = """
-        SELECT id,name,user,state,qsub_time,start_time,queue FROM jobs WHERE state != 'c'
+        SELECT id,name,user,state,qsub_time,start_time,queue,array_id,task_id FROM jobs WHERE state != 'c'
         """
         args = []
         if user != "\\*" and user != "*":
@@ -415,28 +707,33 @@ echo "$exit_code" 1>%s/__exit_code.%d
         cu.execute(sql,(job_id,))
         return cu.fetchone()
 
-    def _mark_for_deletion(self,job_id):
+    def _mark_for_deletion(self,job_id,task_ids=None):
         """
         Mark a job for termination/deletion
+
+        For array jobs all the tasks are marked, unless a
+        subset of task ids are specified via 'task_ids'.
         """
-        # Look up the job and check it can be deleted
+        # Look up the job (or array tasks)
         sql = """
-        SELECT state FROM jobs WHERE id=?
+        SELECT id,state,task_id FROM jobs
+        WHERE (id=? AND array_id IS NULL) OR array_id=?
         """
         cu = self._cx.cursor()
-        cu.execute(sql,(job_id,))
-        job = cu.fetchone()
-        if job is None:
-            return
-        state = job['state']
-        if state not in ('t','qw','r','Eqw'):
-            return
-        new_state = 'd'
-        sql = """
-        UPDATE jobs SET state=? WHERE id=?
-        """
-        cu = self._cx.cursor()
-        cu.execute(sql,(new_state,job_id,))
+        cu.execute(sql,(job_id,job_id))
+        jobs = cu.fetchall()
+        for job in jobs:
+            # Check the job can be deleted
+            if task_ids is not None and job['task_id'] not in task_ids:
+                continue
+            state = job['state']
+            if state not in ('t','qw','r','Eqw'):
+                continue
+            new_state = 'd'
+            sql = """
+            UPDATE jobs SET state=? WHERE id=?
+            """
+            cu.execute(sql,(new_state,job['id'],))
         self._cx.commit()
 
     def _cleanup_processes(self):
@@ -447,7 +744,7 @@ echo "$exit_code" 1>%s/__exit_code.%d
         # Stop jobs that are still running
         cu = self._cx.cursor()
         sql = """
-        SELECT id,pid FROM jobs WHERE state=='r'
+        SELECT id,pid FROM jobs WHERE state=='r' AND pid IS NOT NULL
         """
         cu.execute(sql)
         jobs = cu.fetchall()
@@ -456,7 +753,7 @@ echo "$exit_code" 1>%s/__exit_code.%d
             pid = job['pid']
             try:
                 logging.debug("Checking job=%d pid=%d" % (job_id,pid))
-                os.kill(pid,9)
+                os.killpg(pid,9)
             except Exception as ex:
                 pass
         for process in self._processes:
@@ -489,6 +786,7 @@ echo "$exit_code" 1>%s/__exit_code.%d
         p.add_argument("-j",action="store")
         p.add_argument("-o",action="store")
         p.add_argument("-e",action="store")
+        p.add_argument("-t",action="store")
         args,cmd = p.parse_known_args(argv)
         # Command
         logging.debug("qsub: cmd: %s" % cmd)
@@ -522,6 +820,24 @@ echo "$exit_code" 1>%s/__exit_code.%d
             join_output = 'y'
         else:
             join_output = 'n'
+        # Array job tasks
+        if args.t:
+            first,last,step = _parse_task_range(args.t)
+            job_id = None
+            for task_id in range(first,last+1,step):
+                id_ = self._init_job(name,cmd,working_dir,nslots,queue,
+                                     output_name,join_output,
+                                     array_id=job_id,task_id=task_id,
+                                     commit=False)
+                if job_id is None:
+                    job_id = id_
+            self._cx.commit()
+            logging.debug("Created array job %s" % job_id)
+            # Report the job id
+            print("Your job-array %s.%s-%s:%s (\"%s\") has been "
+                  "submitted" % (job_id,first,last,step,name))
+            self.update_jobs()
+            return
         # Create an initial entry in job table
         job_id = self._init_job(name,cmd,working_dir,nslots,queue,
                                 output_name,join_output)
@@ -559,7 +875,10 @@ echo "$exit_code" 1>%s/__exit_code.%d
         print("""job-ID  prior   name       user         state submit/start at     queue                          slots ja-task-ID
 -----------------------------------------------------------------------------------------------------------------""")
         for job in jobs:
-            job_id = str(job["id"])
+            if job["task_id"] is not None:
+                job_id = str(job["array_id"])
+            else:
+                job_id = str(job["id"])
             name = str(job["name"])
             user = str(job["user"])
             state = str(job["state"])
@@ -577,6 +896,8 @@ echo "$exit_code" 1>%s/__exit_code.%d
             line.append("%s" % start_time)
             line.append("%s%s" % (queue[:30],' '*(30-len(queue))))
             line.append("1")
+            if job["task_id"] is not None:
+                line.append("%s" % job["task_id"])
             print(' '.join(line))
 
     def qacct(self,argv):
@@ -622,7 +943,7 @@ echo "$exit_code" 1>%s/__exit_code.%d
             sys.stderr.write("error: job id %s not found\n" % job_id)
             return
         # Check delay time
-        elapsed_since_job_end = time.time() - job_info[6]
+        elapsed_since_job_end = self._time() - job_info[6]
         logging.debug("qacct: elapsed time: %s" % elapsed_since_job_end)
         if elapsed_since_job_end < self._qacct_delay:
             return
@@ -666,19 +987,44 @@ exit_status  %s""" % (queue,user,name,job_id,
         self.update_jobs()
         # Process supplied arguments
         p = argparse.ArgumentParser()
+        p.add_argument("-t",action="store")
         p.add_argument("job_id",action="store",nargs="+")
         args = p.parse_args(argv)
+        # Array tasks
+        if args.t:
+            first,last,step = _parse_task_range(args.t)
+            task_ids = list(range(first,last+1,step))
+        else:
+            task_ids = None
         # Loop over job ids
         for job_id in args.job_id:
             job_id = int(job_id)
             # Mark the job for deletion
-            self._mark_for_deletion(job_id)
+            self._mark_for_deletion(job_id,task_ids=task_ids)
             print("Job %s has been marked for deletion" % job_id)
 
 #######################################################################
 # Functions
 #######################################################################
 
+def _parse_task_range(t):
+    """
+    Internal helper function to parse an array job task range
+
+    Task ranges are of the form 'N', 'N-M' or 'N-M:STEP';
+    returns a tuple (N,M,STEP).
+    """
+    if ':' in t:
+        t,step = t.split(':')
+        step = int(step)
+    else:
+        step = 1
+    if '-' in t:
+        first,last = [int(x) for x in t.split('-')]
+    else:
+        first = last = int(t)
+    return (first,last,step)
+
 def _make_mock_GE_exe(path,f,database_dir=None,debug=None,
                       qsub_delay=None,qacct_delay=None):
     """
@@ -693,6 +1039,8 @@ def _make_mock_GE_exe(path,f,database_dir=None,debug=None,
         args.append("qacct_delay=%s" % qacct_delay)
     if debug is not None:
         args.append("debug=%s" % debug)
+    # Jobs must outlive the utility that started them
+    args.append("cleanup_at_exit=False")
     with io.open(path,'w') as fp:
         fp.write(u"""#!/usr/bin/env python
 import sys
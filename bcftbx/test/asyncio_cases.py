@@ -0,0 +1,208 @@
+#######################################################################
+# Test cases for AsyncJobRunner.py module
+#######################################################################
+# These use 'async'/'await' syntax (Python 3.6 or later) so are kept
+# out of test_AsyncJobRunner.py, which only imports them on versions
+# of Python which can compile them
+from bcftbx.JobRunner import BaseJobRunner
+from bcftbx.JobRunner import SimpleJobRunner
+from bcftbx.JobRunner import GEJobRunner
+from bcftbx.AsyncJobRunner import AsyncJobRunner
+from bcftbx.AsyncJobRunner import async_runner
+from bcftbx.Pipeline import PipelineRunner
+from bcftbx.mockGE import setup_mock_GE
+from bcftbx.mockGE import MockGE
+import unittest
+import asyncio
+import os
+import tempfile
+import shutil
+import atexit
+
+class CountingJobRunner(SimpleJobRunner):
+    """SimpleJobRunner which counts calls to 'list'
+
+    Also waits for the whole timeout in 'wait_for_completion'.
+    """
+    def __init__(self):
+        SimpleJobRunner.__init__(self)
+        self.nlist = 0
+
+    def list(self):
+        self.nlist += 1
+        return SimpleJobRunner.list(self)
+
+    def wait_for_completion(self,timeout):
+        return BaseJobRunner.wait_for_completion(self,timeout)
+
+class TestAsyncJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        # Create a temporary directory to work in
+        self.working_dir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.working_dir)
+
+    def run_coroutine(self,coro,timeout=10.0):
+        return self.loop.run_until_complete(asyncio.wait_for(coro,timeout))
+
+    def test_async_job_runner_submit_and_wait(self):
+        """AsyncJobRunner: submit jobs and wait for them to complete
+        """
+        runner = AsyncJobRunner(SimpleJobRunner(),poll_interval=0.1)
+        async def run_jobs():
+            job_ok = await runner.submit('test_ok',self.working_dir,
+                                         '/bin/bash',('-c','exit 0',))
+            job_error = await runner.submit('test_error',self.working_dir,
+                                            '/bin/bash',('-c','exit 1',))
+            return await asyncio.gather(runner.wait(job_ok),
+                                        runner.wait(job_error),
+                                        runner.wait(job_ok))
+        self.assertEqual(self.run_coroutine(run_jobs()),[0,1,0])
+
+    def test_async_job_runner_as_completed(self):
+        """AsyncJobRunner: iterate over jobs in order of completion
+        """
+        runner = AsyncJobRunner(SimpleJobRunner(),poll_interval=0.1)
+        async def run_jobs():
+            job_ids = await runner.submit_many(
+                [('test%d' % i,self.working_dir,'sleep',(str(t),))
+                 for i,t in enumerate((0.6,0.1,0.3))])
+            completed = []
+            async for job_id in runner.as_completed(job_ids):
+                completed.append(job_ids.index(job_id))
+            return completed
+        self.assertEqual(self.run_coroutine(run_jobs()),[1,2,0])
+
+    def test_async_job_runner_wait_any(self):
+        """AsyncJobRunner: wait for first of several jobs to complete
+        """
+        runner = AsyncJobRunner(SimpleJobRunner(),poll_interval=0.1)
+        async def run_jobs():
+            job_ids = await runner.submit_array('test',self.working_dir,
+                                                'sleep',[('0.1',),('60',)])
+            completed = await runner.wait_any(job_ids)
+            await runner.terminate(job_ids[1])
+            return (job_ids,completed,await runner.wait(job_ids[1]))
+        job_ids,completed,exit_status = self.run_coroutine(run_jobs())
+        self.assertEqual(completed,[job_ids[0]])
+        self.assertNotEqual(exit_status,0)
+
+    def test_async_job_runner_shares_polling(self):
+        """AsyncJobRunner: waiting coroutines share a single poll
+        """
+        njobs = 10
+        runner = CountingJobRunner()
+        arunner = AsyncJobRunner(runner,poll_interval=0.2)
+        async def run_jobs():
+            job_ids = [await arunner.submit('test%d' % i,self.working_dir,
+                                            'sleep',('0.5',))
+                       for i in range(njobs)]
+            return await asyncio.gather(*[arunner.wait(job_id)
+                                          for job_id in job_ids])
+        self.assertEqual(self.run_coroutine(run_jobs()),[0]*njobs)
+        self.assertTrue(runner.nlist < njobs)
+        self.assertEqual(runner.nlist,arunner.npolls)
+
+    def test_async_runner_is_shared(self):
+        """async_runner: returns same AsyncJobRunner for a runner
+        """
+        runner = SimpleJobRunner()
+        self.assertTrue(async_runner(runner) is async_runner(runner))
+        self.assertFalse(async_runner(runner) is
+                         async_runner(SimpleJobRunner()))
+
+    def test_pipelinerunner_run_async(self):
+        """PipelineRunner: run pipeline from an event loop
+        """
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=2,
+                            poll_interval=0.5)
+        job1 = pr.queueJob(self.working_dir,'sleep',('0.2',),label='1')
+        pr.queueJob(self.working_dir,'true',(),label='2',depends_on=[job1])
+        pr.queueJob(self.working_dir,'false',(),label='3')
+        self.run_coroutine(pr.run_async())
+        self.assertEqual(pr.nWaiting(),0)
+        self.assertEqual(pr.nRunning(),0)
+        self.assertEqual(sorted([(job.label,job.exit_status)
+                                 for job in pr.completed]),
+                         [('1',0),('2',0),('3',1)])
+        # Dependent job completes last
+        self.assertEqual(pr.completed[-1].label,'2')
+
+class TestAsyncJobRunnerWithMockGE(unittest.TestCase):
+
+    def setUp(self):
+        # Work in a temporary directory (so that the runners'
+        # admin directories are created there)
+        self.cwd = os.getcwd()
+        self.top_dir = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree,self.top_dir,True)
+        os.chdir(self.top_dir)
+        # Set up mockGE utilities
+        self.database_dir = tempfile.mkdtemp(dir=self.top_dir)
+        self.bin_dir = tempfile.mkdtemp(dir=self.top_dir)
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.old_path
+        setup_mock_GE(bindir=self.bin_dir,
+                      database_dir=self.database_dir,
+                      debug=False)
+        self.mock_ge = MockGE(database_dir=self.database_dir)
+        self.working_dir = tempfile.mkdtemp(dir=self.top_dir)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.mock_ge.stop()
+        os.environ['PATH'] = self.old_path
+        os.chdir(self.cwd)
+
+    def run_coroutine(self,coro,timeout=30.0):
+        # Update the mock GE in the background while the
+        # coroutine runs
+        async def update_mock_ge():
+            while True:
+                self.mock_ge.update_jobs()
+                await asyncio.sleep(0.1)
+        async def main():
+            updater = asyncio.ensure_future(update_mock_ge())
+            try:
+                return await asyncio.wait_for(coro,timeout)
+            finally:
+                updater.cancel()
+        return self.loop.run_until_complete(main())
+
+    def test_async_job_runner_with_ge_job_runner(self):
+        """AsyncJobRunner: wait for GEJobRunner jobs
+        """
+        runner = AsyncJobRunner(GEJobRunner(poll_interval=0.5))
+        async def run_jobs():
+            job_ids = await runner.submit_array(
+                'test',self.working_dir,'/bin/bash',
+                [('-c','exit %d' % i) for i in range(3)])
+            job_ids.append(await runner.submit('test',self.working_dir,
+                                               '/bin/bash',('-c','exit 3',)))
+            completed = []
+            async for job_id in runner.as_completed(job_ids):
+                completed.append(job_id)
+            return (sorted(job_ids),sorted(completed),
+                    await asyncio.gather(*[runner.wait(job_id)
+                                           for job_id in job_ids]))
+        job_ids,completed,exit_status = self.run_coroutine(run_jobs())
+        self.assertEqual(completed,job_ids)
+        self.assertEqual(exit_status,[0,1,2,3])
+
+    def test_pipelinerunner_run_async_with_ge_job_runner(self):
+        """PipelineRunner: run pipeline using GEJobRunner from an event loop
+        """
+        pr = PipelineRunner(GEJobRunner(poll_interval=0.5),
+                            max_concurrent_jobs=4,poll_interval=1)
+        for i in range(4):
+            pr.queueJob(self.working_dir,'/bin/bash',('-c','exit %d' % i),
+                        label=str(i))
+        self.run_coroutine(pr.run_async())
+        self.assertEqual(sorted([(job.label,job.exit_status)
+                                 for job in pr.completed]),
+                         [('0',0),('1',1),('2',2),('3',3)])
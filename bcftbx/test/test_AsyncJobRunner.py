@@ -0,0 +1,16 @@
+#######################################################################
+# Tests for AsyncJobRunner.py module
+#######################################################################
+import sys
+import unittest
+
+if sys.version_info >= (3,6):
+    from bcftbx.test.asyncio_cases import TestAsyncJobRunner
+    from bcftbx.test.asyncio_cases import TestAsyncJobRunnerWithMockGE
+else:
+    @unittest.skip("AsyncJobRunner requires Python 3.6 or later")
+    class TestAsyncJobRunner(unittest.TestCase):
+        def test_async_job_runner(self):
+            """AsyncJobRunner: skipped (requires Python 3.6 or later)
+            """
+            pass
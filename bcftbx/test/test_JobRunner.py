@@ -6,9 +6,12 @@ from bcftbx.mockGE import setup_mock_GE
 from bcftbx.mockGE import MockGE
 import bcftbx.utils
 import unittest
+import io
 import tempfile
 import time
 import shutil
+import atexit
+import multiprocessing
 
 class TestSimpleJobRunner(unittest.TestCase):
 
@@ -79,6 +82,24 @@ class TestSimpleJobRunner(unittest.TestCase):
         self.assertEqual(runner.exit_status(jobid_ok),0)
         self.assertEqual(runner.exit_status(jobid_error),1)
 
+    def test_simple_job_runner_metrics(self):
+        """Test SimpleJobRunner returns metrics for a job
+        """
+        runner = SimpleJobRunner(nslots=2)
+        jobid = self.run_job(runner,'test',self.working_dir,'/bin/bash',
+                             ('-c','sleep 0.2; exit 1',))
+        metrics = runner.metrics(jobid)
+        self.assertEqual(metrics['nslots'],2)
+        self.assertTrue(metrics['submit_time'] <= metrics['start_time'])
+        self.assertFalse('end_time' in metrics)
+        self.wait_for_jobs(runner,jobid)
+        self.assertEqual(runner.exit_status(jobid),1)
+        metrics = runner.metrics(jobid)
+        self.assertTrue((metrics['end_time'] - metrics['start_time']) >= 0.2)
+        self.assertTrue(metrics['max_rss'] > 0)
+        self.assertTrue(metrics['cpu_time'] >= 0.0)
+        self.assertEqual(runner.metrics('missing'),{})
+
     def test_simple_job_runner_termination(self):
         """Test SimpleJobRunner can terminate a running job
 
@@ -98,6 +119,64 @@ class TestSimpleJobRunner(unittest.TestCase):
         self.assertFalse(runner.isRunning(jobid))
         self.assertNotEqual(runner.exit_status(jobid),0)
 
+    def test_simple_job_runner_run_array(self):
+        """Test SimpleJobRunner runs multiple jobs via 'run_array'
+        """
+        # Create a runner and execute commands with known exit codes
+        runner = SimpleJobRunner()
+        jobids = runner.run_array('test',self.working_dir,'/bin/bash',
+                                  [('-c','exit 0',),('-c','exit 1',)])
+        self.assertEqual(len(jobids),2)
+        self.wait_for_jobs(runner,*jobids)
+        # Check exit codes
+        self.assertEqual(runner.exit_status(jobids[0]),0)
+        self.assertEqual(runner.exit_status(jobids[1]),1)
+
+    def test_simple_job_runner_run_many(self):
+        """Test SimpleJobRunner runs multiple jobs via 'run_many'
+        """
+        # Create a runner and execute commands with known exit codes
+        runner = SimpleJobRunner()
+        jobids = runner.run_many([('test_ok',self.working_dir,
+                                   '/bin/bash',('-c','exit 0',)),
+                                  ('test_error',self.working_dir,
+                                   '/bin/bash',('-c','exit 1',))])
+        self.assertEqual(len(jobids),2)
+        self.wait_for_jobs(runner,*jobids)
+        # Check names and exit codes
+        self.assertEqual(runner.name(jobids[0]),'test_ok')
+        self.assertEqual(runner.name(jobids[1]),'test_error')
+        self.assertEqual(runner.exit_status(jobids[0]),0)
+        self.assertEqual(runner.exit_status(jobids[1]),1)
+
+    def test_simple_job_runner_run_pack(self):
+        """Test SimpleJobRunner runs packed jobs separately
+        """
+        runner = SimpleJobRunner()
+        jobids = runner.run_pack('pack',
+                                 [('test%d' % i,self.working_dir,
+                                   '/bin/bash',('-c','exit %d' % i,))
+                                  for i in range(3)],
+                                 nparallel=2)
+        self.assertEqual(len(set(jobids)),3)
+        self.wait_for_jobs(runner,*jobids)
+        for i,jobid in enumerate(jobids):
+            self.assertEqual(runner.name(jobid),'test%d' % i)
+            self.assertEqual(runner.exit_status(jobid),i)
+
+    def test_simple_job_runner_wait_for_completion(self):
+        """Test SimpleJobRunner 'wait_for_completion' returns when job exits
+        """
+        runner = SimpleJobRunner()
+        jobid = self.run_job(runner,'test',self.working_dir,'sleep',('1',))
+        start = time.time()
+        self.assertTrue(runner.wait_for_completion(30))
+        self.assertTrue(time.time() - start < 10)
+        self.wait_for_jobs(runner,jobid)
+        self.assertEqual(runner.exit_status(jobid),0)
+        # No more jobs so should time out
+        self.assertFalse(runner.wait_for_completion(0.1))
+
     def test_simple_job_runner_join_logs(self):
         """Test SimpleJobRunner joining stderr to stdout
 
@@ -209,9 +288,297 @@ class TestSimpleJobRunner(unittest.TestCase):
         self.assertEqual(str(SimpleJobRunner(nslots=8,join_logs=True)),
                          'SimpleJobRunner(nslots=8 join_logs=True)')
 
+class TestLocalSchedulerRunner(unittest.TestCase):
+
+    def setUp(self):
+        # Create a temporary directory to work in
+        self.working_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def wait_for_jobs(self,runner,*args):
+        timeout = 10.0
+        start = time.time()
+        while (time.time() - start) < timeout:
+            if not [jobid for jobid in args if runner.isRunning(jobid)]:
+                return
+            runner.wait_for_completion(0.1)
+        self.fail("Timed out waiting for test job")
+
+    def test_local_scheduler_runner(self):
+        """Test LocalSchedulerRunner with basic shell command
+        """
+        runner = LocalSchedulerRunner(cores=2)
+        jobid = runner.run('test',self.working_dir,'echo',('this is a test',))
+        self.wait_for_jobs(runner,jobid)
+        # Check outputs
+        self.assertEqual(runner.name(jobid),'test')
+        self.assertEqual(runner.exit_status(jobid),0)
+        with io.open(runner.logFile(jobid),'rt') as fp:
+            self.assertEqual(fp.read(),"this is a test\n")
+        self.assertTrue(os.path.isfile(runner.errFile(jobid)))
+        self.assertEqual(os.path.dirname(runner.logFile(jobid)),
+                         self.working_dir)
+
+    def test_local_scheduler_runner_exit_status(self):
+        """Test LocalSchedulerRunner returns correct exit status
+        """
+        runner = LocalSchedulerRunner(cores=2)
+        jobid_ok = runner.run('test_ok',self.working_dir,
+                              '/bin/bash',('-c','exit 0',))
+        jobid_error = runner.run('test_error',self.working_dir,
+                                 '/bin/bash',('-c','exit 1',))
+        self.wait_for_jobs(runner,jobid_ok,jobid_error)
+        self.assertEqual(runner.exit_status(jobid_ok),0)
+        self.assertEqual(runner.exit_status(jobid_error),1)
+
+    def test_local_scheduler_runner_metrics(self):
+        """Test LocalSchedulerRunner returns metrics including queue wait
+        """
+        runner = LocalSchedulerRunner(cores=2,nslots=2)
+        jobid1 = runner.run('test1',self.working_dir,'sleep',('0.2',))
+        jobid2 = runner.run('test2',self.working_dir,'sleep',('0.2',))
+        # Second job is waiting for slots
+        metrics = runner.metrics(jobid2)
+        self.assertEqual(metrics['nslots'],2)
+        self.assertFalse('start_time' in metrics)
+        self.wait_for_jobs(runner,jobid1,jobid2)
+        metrics1 = runner.metrics(jobid1)
+        metrics2 = runner.metrics(jobid2)
+        self.assertTrue(metrics2['start_time'] >= metrics1['end_time'])
+        self.assertTrue((metrics2['start_time'] -
+                         metrics2['submit_time']) >= 0.2)
+        for metrics in (metrics1,metrics2):
+            self.assertTrue(metrics['max_rss'] > 0)
+            self.assertTrue(metrics['cpu_time'] >= 0.0)
+
+    def test_local_scheduler_runner_queues_jobs(self):
+        """Test LocalSchedulerRunner queues jobs until slots are free
+        """
+        runner = LocalSchedulerRunner(cores=4,nslots=2)
+        jobids = [runner.run('test%d' % i,self.working_dir,'sleep',('0.5',))
+                  for i in range(3)]
+        jobids.append(runner.run('test3',self.working_dir,'sleep',('0.5',),
+                                 nslots=1))
+        # Only two jobs can run at once
+        self.assertEqual(sorted(runner.list()),sorted(jobids))
+        self.assertEqual(runner.slots_in_use,4)
+        for jobid in jobids:
+            self.assertTrue(runner.isRunning(jobid))
+            self.assertEqual(runner.exit_status(jobid),None)
+        self.wait_for_jobs(runner,jobids[0],jobids[1])
+        # Remaining two jobs should now be running
+        self.assertEqual(sorted(runner.list()),sorted(jobids[2:]))
+        self.assertEqual(runner.slots_in_use,3)
+        self.wait_for_jobs(runner,*jobids)
+        self.assertEqual(runner.list(),[])
+        self.assertEqual(runner.slots_in_use,0)
+        for jobid in jobids:
+            self.assertEqual(runner.exit_status(jobid),0)
+
+    def test_local_scheduler_runner_nslots(self):
+        """Test LocalSchedulerRunner sets BCFTBX_RUNNER_NSLOTS
+        """
+        runner = LocalSchedulerRunner(cores=8,nslots=2,join_logs=True)
+        jobid1 = runner.run('test1',self.working_dir,'/bin/bash',
+                            ('-c','echo $BCFTBX_RUNNER_NSLOTS',))
+        jobid2 = runner.run('test2',self.working_dir,'/bin/bash',
+                            ('-c','echo $BCFTBX_RUNNER_NSLOTS',),nslots=6)
+        # Requests larger than the number of cores are reduced
+        jobid3 = runner.run('test3',self.working_dir,'/bin/bash',
+                            ('-c','echo $BCFTBX_RUNNER_NSLOTS',),nslots=16)
+        self.wait_for_jobs(runner,jobid1,jobid2,jobid3)
+        for jobid,nslots in ((jobid1,"2"),(jobid2,"6"),(jobid3,"8")):
+            self.assertEqual(runner.errFile(jobid),None)
+            with io.open(runner.logFile(jobid),'rt') as fp:
+                self.assertEqual(fp.read().strip(),nslots)
+
+    def test_local_scheduler_runner_termination(self):
+        """Test LocalSchedulerRunner can terminate running and queued jobs
+        """
+        runner = LocalSchedulerRunner(cores=1)
+        jobid1 = runner.run('test1',self.working_dir,'sleep',('60s',))
+        jobid2 = runner.run('test2',self.working_dir,'sleep',('60s',))
+        self.assertTrue(runner.isRunning(jobid1))
+        self.assertTrue(runner.isRunning(jobid2))
+        # Terminate queued job
+        self.assertTrue(runner.terminate(jobid2))
+        self.assertFalse(runner.isRunning(jobid2))
+        self.assertEqual(runner.exit_status(jobid2),-1)
+        # Terminate running job
+        self.assertTrue(runner.terminate(jobid1))
+        self.assertFalse(runner.isRunning(jobid1))
+        self.assertNotEqual(runner.exit_status(jobid1),0)
+        self.assertEqual(runner.slots_in_use,0)
+
+    def test_local_scheduler_runner_pin_cpus(self):
+        """Test LocalSchedulerRunner pins jobs to CPUs
+        """
+        if not hasattr(os,'sched_getaffinity'):
+            raise unittest.SkipTest("CPU affinity not supported")
+        cpus = sorted(os.sched_getaffinity(0))
+        runner = LocalSchedulerRunner(cores=1,join_logs=True,pin_cpus=True)
+        jobid = runner.run('test',self.working_dir,'/bin/bash',
+                           ('-c','cat /proc/self/status',))
+        self.assertEqual(runner.cpus(jobid),cpus[:1])
+        self.wait_for_jobs(runner,jobid)
+        self.assertEqual(runner.cpus(jobid),None)
+        with io.open(runner.logFile(jobid),'rt') as fp:
+            allowed = [line.split()[-1] for line in fp
+                       if line.startswith('Cpus_allowed_list:')]
+        self.assertEqual(allowed,[str(cpus[0])])
+
+    def test_local_scheduler_runner_repr(self):
+        """Test LocalSchedulerRunner '__repr__' method
+        """
+        self.assertEqual(str(LocalSchedulerRunner(cores=4)),
+                         'LocalSchedulerRunner(cores=4 join_logs=False)')
+        self.assertEqual(str(LocalSchedulerRunner(cores=4,nslots=2,
+                                                  join_logs=True)),
+                         'LocalSchedulerRunner(cores=4 nslots=2 '
+                         'join_logs=True)')
+
+class TestPythonFunctionRunner(unittest.TestCase):
+
+    def setUp(self):
+        # Create a temporary directory to work in
+        self.working_dir = tempfile.mkdtemp()
+        self.runner = None
+
+    def tearDown(self):
+        if self.runner is not None:
+            self.runner.shutdown()
+        shutil.rmtree(self.working_dir)
+
+    def wait_for_jobs(self,runner,*args):
+        timeout = 10.0
+        start = time.time()
+        while (time.time() - start) < timeout:
+            if not [jobid for jobid in args if runner.isRunning(jobid)]:
+                return
+            runner.wait_for_completion(0.1)
+        self.fail("Timed out waiting for test job")
+
+    def read_log(self,log_file):
+        with io.open(log_file,'rt') as fp:
+            return fp.read()
+
+    def test_python_function_runner(self):
+        """Test PythonFunctionRunner runs a callable
+        """
+        self.runner = PythonFunctionRunner(max_workers=2)
+        jobid = self.runner.run('test',self.working_dir,print,
+                                ('this is a test',))
+        self.wait_for_jobs(self.runner,jobid)
+        self.assertEqual(self.runner.name(jobid),'test')
+        self.assertEqual(self.runner.exit_status(jobid),0)
+        self.assertEqual(self.read_log(self.runner.logFile(jobid)),
+                         "this is a test\n")
+        self.assertEqual(self.read_log(self.runner.errFile(jobid)),"")
+        self.assertEqual(os.path.dirname(self.runner.logFile(jobid)),
+                         self.working_dir)
+        self.assertEqual(self.runner.list(),[])
+
+    def test_python_function_runner_import_path(self):
+        """Test PythonFunctionRunner runs callables from import paths
+        """
+        self.runner = PythonFunctionRunner(max_workers=2)
+        jobid1 = self.runner.run('test1',self.working_dir,'os.mkdir',
+                                 ('test1',))
+        jobid2 = self.runner.run('test2',self.working_dir,'os:mkdir',
+                                 ('test2',))
+        jobid3 = self.runner.run('test3',self.working_dir,
+                                 'bcftbx.no_such_module.function',())
+        self.wait_for_jobs(self.runner,jobid1,jobid2,jobid3)
+        # Directories are created relative to the working dir
+        self.assertEqual(self.runner.exit_status(jobid1),0)
+        self.assertTrue(os.path.isdir(os.path.join(self.working_dir,
+                                                   'test1')))
+        self.assertEqual(self.runner.exit_status(jobid2),0)
+        self.assertTrue(os.path.isdir(os.path.join(self.working_dir,
+                                                   'test2')))
+        # Callables which can't be imported
+        self.assertEqual(self.runner.exit_status(jobid3),127)
+        self.assertTrue(self.read_log(self.runner.errFile(jobid3)).\
+                        startswith("Unable to import"))
+
+    def test_python_function_runner_exit_status(self):
+        """Test PythonFunctionRunner returns correct exit status
+        """
+        self.runner = PythonFunctionRunner(max_workers=2)
+        jobid_ok = self.runner.run('test_ok',self.working_dir,
+                                   'sys.exit',(0,))
+        jobid_error = self.runner.run('test_error',self.working_dir,
+                                      'sys.exit',(3,))
+        jobid_return = self.runner.run('test_return',self.working_dir,
+                                       os.system,('exit 2',))
+        jobid_exception = self.runner.run('test_exception',self.working_dir,
+                                          os.remove,('missing',))
+        self.wait_for_jobs(self.runner,jobid_ok,jobid_error,jobid_return,
+                           jobid_exception)
+        self.assertEqual(self.runner.exit_status(jobid_ok),0)
+        self.assertEqual(self.runner.exit_status(jobid_error),3)
+        self.assertEqual(self.runner.exit_status(jobid_return),512)
+        self.assertEqual(self.runner.exit_status(jobid_exception),1)
+        self.assertTrue("Traceback" in
+                        self.read_log(self.runner.errFile(jobid_exception)))
+
+    def test_python_function_runner_metrics(self):
+        """Test PythonFunctionRunner returns metrics for a job
+        """
+        self.runner = PythonFunctionRunner(max_workers=1,nslots=2)
+        jobid = self.runner.run('test',self.working_dir,'time.sleep',(0.2,))
+        self.wait_for_jobs(self.runner,jobid)
+        metrics = self.runner.metrics(jobid)
+        self.assertEqual(metrics['nslots'],2)
+        self.assertTrue(metrics['submit_time'] <= metrics['start_time'])
+        self.assertTrue((metrics['end_time'] - metrics['start_time']) >= 0.2)
+        self.assertTrue(metrics['cpu_time'] >= 0.0)
+        self.assertEqual(self.runner.metrics('missing'),{})
+
+    def test_python_function_runner_captures_subprocess_output(self):
+        """Test PythonFunctionRunner captures output from subprocesses
+        """
+        self.runner = PythonFunctionRunner(max_workers=1,nslots=4,
+                                           join_logs=True)
+        jobid = self.runner.run('test',self.working_dir,os.system,
+                                ('echo $BCFTBX_RUNNER_NSLOTS; '
+                                 'echo error >&2',))
+        self.wait_for_jobs(self.runner,jobid)
+        self.assertEqual(self.runner.exit_status(jobid),0)
+        self.assertEqual(self.runner.errFile(jobid),None)
+        self.assertEqual(self.read_log(self.runner.logFile(jobid)),
+                         "4\nerror\n")
+
+    def test_python_function_runner_termination(self):
+        """Test PythonFunctionRunner can terminate jobs which haven't started
+        """
+        self.runner = PythonFunctionRunner(max_workers=1)
+        jobids = [self.runner.run('test%d' % i,self.working_dir,
+                                  'time.sleep',(0.5,))
+                  for i in range(4)]
+        self.assertEqual(sorted(self.runner.list()),sorted(jobids))
+        # Job which has been queued can be terminated
+        self.assertTrue(self.runner.terminate(jobids[-1]))
+        self.assertFalse(self.runner.isRunning(jobids[-1]))
+        self.assertEqual(self.runner.exit_status(jobids[-1]),-1)
+        # Job which is running can't be terminated
+        self.assertFalse(self.runner.terminate(jobids[0]))
+        self.wait_for_jobs(self.runner,*jobids)
+        for jobid in jobids[:-1]:
+            self.assertEqual(self.runner.exit_status(jobid),0)
+
 class TestGEJobRunner(unittest.TestCase):
 
     def setUp(self):
+        # Work in a temporary directory (so that the runners'
+        # admin directories are created there); this is
+        # removed at exit, after the runners have cleaned up
+        self.cwd = os.getcwd()
+        self.top_dir = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree,self.top_dir,True)
+        os.chdir(self.top_dir)
         # Set up mockGE utilities
         self.database_dir = self.make_tmp_dir()
         self.bin_dir = self.make_tmp_dir()
@@ -232,6 +599,7 @@ class TestGEJobRunner(unittest.TestCase):
     def tearDown(self):
         self.mock_ge.stop()
         os.environ['PATH'] = self.old_path
+        os.chdir(self.cwd)
         shutil.rmtree(self.database_dir)
         shutil.rmtree(self.bin_dir)
         shutil.rmtree(self.working_dir)
@@ -362,6 +730,284 @@ class TestGEJobRunner(unittest.TestCase):
         self.assertEqual(runner.exit_status(jobid_ok),0)
         self.assertEqual(runner.exit_status(jobid_error),1)
 
+    def test_ge_job_runner_metrics(self):
+        """Test GEJobRunner returns metrics for jobs
+        """
+        for journal in (False,True):
+            runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                                 journal=journal)
+            jobid = self.run_job(runner,'test',self.working_dir,
+                                 '/bin/bash',('-c','exit 1',))
+            jobids = runner.run_array('test',self.working_dir,'/bin/bash',
+                                      [('-c','exit 0',) for i in range(2)])
+            metrics = runner.metrics(jobid)
+            self.assertTrue(metrics['submit_time'] <= time.time())
+            self.assertFalse('end_time' in metrics)
+            self.wait_for_jobs(runner,jobid,*jobids)
+            self.assertEqual(runner.exit_status(jobid),1)
+            for jobid in [jobid] + jobids:
+                metrics = runner.metrics(jobid)
+                self.assertEqual(metrics['queue'],'mock.q')
+                self.assertEqual(metrics['nslots'],1)
+                self.assertTrue(metrics['start_time'] <= metrics['end_time'])
+                self.assertTrue(int(metrics['submit_time']) <=
+                                metrics['start_time'])
+
+    def test_ge_job_runner_list_multiple_jobs(self):
+        """Test GEJobRunner lists and finalizes multiple jobs
+        """
+        # Create a runner and execute commands with known exit codes
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        jobids = [self.run_job(runner,'test%d' % i,self.working_dir,
+                               '/bin/bash',('-c','exit %d' % (i%2),))
+                  for i in range(4)]
+        self.assertEqual(sorted(runner.list()),sorted(jobids))
+        self.wait_for_jobs(runner,*jobids)
+        # Check jobs are no longer listed and exit codes
+        self.assertEqual(runner.list(),[])
+        for i,jobid in enumerate(jobids):
+            self.assertEqual(runner.exit_status(jobid),i%2)
+
+    def test_ge_job_runner_run_array(self):
+        """Test GEJobRunner runs array job with task ids
+        """
+        # Create a runner and submit an array job
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        jobids = runner.run_array('test',self.working_dir,'/bin/bash',
+                                  [('-c','echo task %d; exit %d' % (i,i))
+                                   for i in range(3)])
+        self.assertEqual(len(jobids),3)
+        array_id = jobids[0].split('.')[0]
+        self.assertEqual(jobids,["%s.%d" % (array_id,i)
+                                 for i in (1,2,3)])
+        self.assertEqual(sorted(runner.list()),sorted(jobids))
+        self.wait_for_jobs(runner,*jobids)
+        # Check exit codes and outputs
+        self.assertEqual(runner.list(),[])
+        for i,jobid in enumerate(jobids):
+            self.assertEqual(runner.exit_status(jobid),i)
+            self.assertEqual(runner.name(jobid),'test')
+            self.assertEqual(runner.queue(jobid),'mock.q')
+            self.assertEqual(runner.logFile(jobid),
+                             os.path.join(self.working_dir,
+                                          "test.o%s" % jobid))
+            with open(runner.logFile(jobid),'rt') as fp:
+                self.assertEqual(fp.read(),"task %d\n" % i)
+
+    def test_ge_job_runner_run_array_with_names(self):
+        """Test GEJobRunner array job tasks write log files named for each task
+        """
+        # Create a runner and submit an array job
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        names = ['test.a','test.b']
+        jobids = runner.run_array('test',self.working_dir,'/bin/bash',
+                                  [('-c','echo task %d; echo error %d >&2'
+                                    % (i,i)) for i in range(2)],
+                                  names=names)
+        self.wait_for_jobs(runner,*jobids)
+        # Check outputs
+        for i,jobid in enumerate(jobids):
+            self.assertEqual(runner.exit_status(jobid),0)
+            self.assertEqual(runner.name(jobid),names[i])
+            self.assertEqual(runner.logFile(jobid),
+                             os.path.join(self.working_dir,
+                                          "%s.o%s" % (names[i],jobid)))
+            with open(runner.logFile(jobid),'rt') as fp:
+                self.assertEqual(fp.read(),"task %d\n" % i)
+            with open(runner.errFile(jobid),'rt') as fp:
+                self.assertEqual(fp.read(),"error %d\n" % i)
+
+    def test_ge_job_runner_run_many(self):
+        """Test GEJobRunner submits multiple jobs concurrently
+        """
+        # Create a runner and submit jobs with known exit codes
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                             submit_threads=3)
+        jobids = runner.run_many([('test%d' % i,self.working_dir,
+                                   '/bin/bash',('-c','exit %d' % i,))
+                                  for i in range(5)])
+        self.assertEqual(len(jobids),5)
+        self.assertEqual(len(set(jobids)),5)
+        self.assertFalse(None in jobids)
+        self.assertEqual(sorted(runner.list()),sorted(jobids))
+        self.wait_for_jobs(runner,*jobids)
+        # Check the ids are returned in the same order as
+        # the jobs were supplied
+        for i,jobid in enumerate(jobids):
+            self.assertEqual(runner.name(jobid),'test%d' % i)
+            self.assertEqual(runner.exit_status(jobid),i)
+
+    def test_ge_job_runner_run_pack(self):
+        """Test GEJobRunner runs packed jobs in a single job
+        """
+        for journal in (False,True):
+            for nparallel in (1,2):
+                runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                                     journal=journal)
+                jobids = runner.run_pack(
+                    'pack',
+                    [('test%d' % i,self.working_dir,'/bin/bash',
+                      ('-c','echo task %d; exit %d' % (i,i)))
+                     for i in range(3)],
+                    nparallel=nparallel)
+                pack_id = jobids[0].split('-')[0]
+                self.assertEqual(jobids,["%s-%d" % (pack_id,i)
+                                         for i in (1,2,3)])
+                self.assertEqual(sorted(runner.list()),sorted(jobids))
+                self.wait_for_jobs(runner,*jobids)
+                # Check exit codes, metrics and outputs
+                self.assertEqual(runner.list(),[])
+                for i,jobid in enumerate(jobids):
+                    self.assertEqual(runner.exit_status(jobid),i)
+                    self.assertEqual(runner.name(jobid),'test%d' % i)
+                    self.assertEqual(runner.queue(jobid),'mock.q')
+                    metrics = runner.metrics(jobid)
+                    self.assertEqual(metrics['nslots'],1)
+                    self.assertTrue(metrics['start_time'] <=
+                                    metrics['end_time'])
+                    self.assertEqual(runner.logFile(jobid),
+                                     os.path.join(self.working_dir,
+                                                  "test%d.o%s" % (i,jobid)))
+                    with open(runner.logFile(jobid),'rt') as fp:
+                        self.assertEqual(fp.read(),"task %d\n" % i)
+
+    def test_ge_job_runner_terminate_packed_job(self):
+        """Test GEJobRunner skips packed jobs which are terminated
+        """
+        for journal in (False,True):
+            runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                                 journal=journal)
+            jobids = runner.run_pack('pack',
+                                     [('test%d' % i,self.working_dir,
+                                       '/bin/bash',('-c','exit 0',))
+                                      for i in range(2)])
+            # Terminate the second job before the pack runs
+            runner.terminate(jobids[1])
+            self.wait_for_jobs(runner,*jobids)
+            self.assertEqual(runner.exit_status(jobids[0]),0)
+            self.assertEqual(runner.exit_status(jobids[1]),-1)
+            self.assertTrue(os.path.exists(runner.logFile(jobids[0])))
+            self.assertFalse(os.path.exists(runner.logFile(jobids[1])))
+
+    def test_ge_job_runner_wait_for_completion(self):
+        """Test GEJobRunner 'wait_for_completion' returns when job exits
+        """
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                             poll_interval=1)
+        jobid = self.run_job(runner,'test',self.working_dir,'/bin/true',())
+        # Job hasn't run yet so should time out
+        self.assertFalse(runner.wait_for_completion(0.5))
+        self.update_jobs()
+        start = time.time()
+        self.assertTrue(runner.wait_for_completion(30))
+        self.assertTrue(time.time() - start < 10)
+        self.wait_for_jobs(runner,jobid)
+        self.assertEqual(runner.exit_status(jobid),0)
+        # No more jobs so should time out
+        self.assertFalse(runner.wait_for_completion(0.1))
+
+    def test_ge_job_runner_reattach(self):
+        """Test GEJobRunner can reattach to jobs from a checkpoint
+        """
+        # Submit jobs using one runner
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        jobid = self.run_job(runner,'test',self.working_dir,'/bin/bash',
+                             ('-c','exit 2',))
+        array_jobids = runner.run_array('test_array',self.working_dir,
+                                        '/bin/bash',[('-c','exit 0',),
+                                                     ('-c','exit 1',)])
+        state = runner.checkpoint()
+        self.assertEqual(sorted(state['jobs'].keys()),
+                         sorted([jobid]+array_jobids))
+        # Reattach using a new runner
+        new_runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        self.assertEqual(sorted(new_runner.reattach(state)),
+                         sorted([jobid]+array_jobids))
+        self.assertEqual(new_runner.name(jobid),'test')
+        self.assertEqual(new_runner.logFile(jobid),runner.logFile(jobid))
+        # Runner can't reattach once it has jobs
+        self.assertRaises(Exception,new_runner.reattach,state)
+        self.wait_for_jobs(new_runner,jobid,*array_jobids)
+        self.assertEqual(new_runner.exit_status(jobid),2)
+        self.assertEqual(new_runner.exit_status(array_jobids[0]),0)
+        self.assertEqual(new_runner.exit_status(array_jobids[1]),1)
+
+    def test_ge_job_runner_retries_submission(self):
+        """Test GEJobRunner retries if qsub can't contact qmaster
+        """
+        # Make a 'qsub' which fails on the first attempt
+        fail_dir = self.make_tmp_dir()
+        marker = os.path.join(fail_dir,"failed")
+        qsub = os.path.join(fail_dir,"qsub")
+        with io.open(qsub,'wt') as fp:
+            fp.write(u"""#!/bin/bash
+if [ ! -f {marker} ] ; then
+  touch {marker}
+  echo "error: unable to contact qmaster using port 6444 on host \\"sge\\"" >&2
+  exit 1
+fi
+exec {qsub} "$@"
+""".format(marker=marker,qsub=os.path.join(self.bin_dir,"qsub")))
+        os.chmod(qsub,0o755)
+        path = os.environ['PATH']
+        os.environ['PATH'] = fail_dir + os.pathsep + path
+        try:
+            # Create a runner and submit a job
+            runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                                 submit_retry_interval=0.1)
+            jobid = self.run_job(runner,'test',self.working_dir,'true',())
+        finally:
+            os.environ['PATH'] = path
+            shutil.rmtree(fail_dir)
+        self.assertNotEqual(jobid,None)
+        self.wait_for_jobs(runner,jobid)
+        self.assertEqual(runner.exit_status(jobid),0)
+
+    def test_ge_job_runner_no_retry_for_other_errors(self):
+        """Test GEJobRunner doesn't retry for other qsub errors
+        """
+        # Make a 'qsub' which always fails
+        fail_dir = self.make_tmp_dir()
+        counter = os.path.join(fail_dir,"count")
+        qsub = os.path.join(fail_dir,"qsub")
+        with io.open(qsub,'wt') as fp:
+            fp.write(u"""#!/bin/bash
+echo "x" >> {counter}
+echo "Unable to run job: unknown queue" >&2
+exit 1
+""".format(counter=counter))
+        os.chmod(qsub,0o755)
+        path = os.environ['PATH']
+        os.environ['PATH'] = fail_dir + os.pathsep + path
+        try:
+            # Create a runner and submit a job
+            runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                                 submit_retry_interval=0.1)
+            jobid = self.run_job(runner,'test',self.working_dir,'true',())
+            with io.open(counter,'rt') as fp:
+                nattempts = len(fp.read().split())
+        finally:
+            os.environ['PATH'] = path
+            shutil.rmtree(fail_dir)
+        self.assertEqual(jobid,None)
+        self.assertEqual(nattempts,1)
+
+    def test_ge_job_runner_terminate_array_task(self):
+        """Test GEJobRunner can terminate a task in an array job
+        """
+        # Create a runner and submit an array job
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        jobids = runner.run_array('test',self.working_dir,'sleep',
+                                  [('60s',),('1s',)])
+        self.assertTrue(runner.isRunning(jobids[0]))
+        # Terminate the first task
+        runner.terminate(jobids[0])
+        self.assertFalse(runner.isRunning(jobids[0]))
+        self.assertNotEqual(runner.exit_status(jobids[0]),0)
+        # Other task should complete normally
+        self.wait_for_jobs(runner,jobids[1])
+        self.assertEqual(runner.exit_status(jobids[1]),0)
+
     def test_ge_job_runner_termination(self):
         """Test GEJobRunner can terminate a running job
 
@@ -382,6 +1028,57 @@ class TestGEJobRunner(unittest.TestCase):
         self.assertFalse(runner.isRunning(jobid))
         self.assertNotEqual(runner.exit_status(jobid),0)
 
+    def test_ge_job_runner_journal(self):
+        """Test GEJobRunner runs jobs using the journal
+        """
+        # Create a runner and execute commands with known exit codes
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                             journal=True)
+        jobids = [self.run_job(runner,'test%d' % i,self.working_dir,
+                               '/bin/bash',('-c','echo job %d; exit %d' %
+                                            (i,i),))
+                  for i in range(3)]
+        self.assertEqual(sorted(runner.list()),sorted(jobids))
+        self.wait_for_jobs(runner,*jobids)
+        # Check exit codes, queues and outputs
+        self.assertEqual(runner.list(),[])
+        for i,jobid in enumerate(jobids):
+            self.assertEqual(runner.exit_status(jobid),i)
+            self.assertEqual(runner.queue(jobid),'mock.q')
+            with open(runner.logFile(jobid),'rt') as fp:
+                self.assertEqual(fp.read(),"job %d\n" % i)
+
+    def test_ge_job_runner_journal_run_array(self):
+        """Test GEJobRunner runs array job using the journal
+        """
+        # Create a runner and submit an array job
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                             journal=True)
+        jobids = runner.run_array('test',self.working_dir,'/bin/bash',
+                                  [('-c','exit %d' % i) for i in range(3)])
+        self.assertEqual(len(jobids),3)
+        self.assertEqual(sorted(runner.list()),sorted(jobids))
+        self.wait_for_jobs(runner,*jobids)
+        # Check exit codes
+        self.assertEqual(runner.list(),[])
+        for i,jobid in enumerate(jobids):
+            self.assertEqual(runner.exit_status(jobid),i)
+            self.assertEqual(runner.queue(jobid),'mock.q')
+
+    def test_ge_job_runner_journal_termination(self):
+        """Test GEJobRunner can terminate a job using the journal
+        """
+        # Create a runner and execute the sleep command
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args,
+                             journal=True)
+        jobid = self.run_job(runner,'test',self.working_dir,'sleep',('60s',))
+        self.assertTrue(runner.isRunning(jobid))
+        # Terminate job
+        runner.terminate(jobid)
+        self.update_jobs()
+        self.assertFalse(runner.isRunning(jobid))
+        self.assertEqual(runner.exit_status(jobid),-1)
+
     def test_ge_job_runner_join_logs(self):
         """Test GEJobRunner with '-j y' option (i.e. join stderr and stdout)
 
@@ -474,6 +1171,32 @@ class TestGEJobRunner(unittest.TestCase):
             ntries += 1
         self.fail("Job failed to go into error state")
 
+    def test_ge_job_runner_list_error_state(self):
+        """Test GEJobRunner lists jobs in error state
+        """
+        # Create a runner and execute one command in a non-existent
+        # working directory and one which will run
+        runner = GEJobRunner(ge_extra_args=self.ge_extra_args)
+        jobid1 = self.run_job(runner,'test_eqw',
+                              '/non/existent/dir',
+                              'echo',('this should fail',))
+        jobid2 = self.run_job(runner,'test_ok',
+                              self.working_dir,
+                              'sleep',('10s',))
+        # Wait for job to go into error state
+        ntries = 0
+        while ntries < 100:
+            job_ids = runner.list_error_state()
+            if job_ids:
+                # Success - job errored
+                self.assertEqual(job_ids,[jobid1])
+                self.assertTrue(runner.errorState(jobid1))
+                self.assertFalse(runner.errorState(jobid2))
+                return
+            time.sleep(0.1)
+            ntries += 1
+        self.fail("Job failed to go into error state")
+
     def test_ge_job_runner_queue(self):
         """Test GEJobRunner fetches the queue of running job
         """
@@ -603,6 +1326,34 @@ class TestFetchRunnerFunction(unittest.TestCase):
         self.assertTrue(isinstance(runner,GEJobRunner))
         self.assertEqual(runner.ge_extra_args,['-j','y'])
 
+    def test_fetch_local_scheduler_runner(self):
+        """fetch_runner returns a LocalSchedulerRunner
+        """
+        runner = fetch_runner("local(cores=64)")
+        self.assertTrue(isinstance(runner,LocalSchedulerRunner))
+        self.assertEqual(runner.cores,64)
+        self.assertEqual(runner.nslots,1)
+        runner = fetch_runner("local")
+        self.assertTrue(isinstance(runner,LocalSchedulerRunner))
+        self.assertEqual(runner.cores,multiprocessing.cpu_count())
+
+    def test_fetch_local_scheduler_runner_with_args(self):
+        """fetch_runner returns a LocalSchedulerRunner with arguments
+        """
+        runner = fetch_runner("LocalSchedulerRunner(cores=8 nslots=2 "
+                              "join_logs=False)")
+        self.assertTrue(isinstance(runner,LocalSchedulerRunner))
+        self.assertEqual(runner.cores,8)
+        self.assertEqual(runner.nslots,2)
+        self.assertEqual(str(runner),
+                         "LocalSchedulerRunner(cores=8 nslots=2 "
+                         "join_logs=False)")
+        runner = fetch_runner("local(cores=8,nslots=4)")
+        self.assertEqual(runner.cores,8)
+        self.assertEqual(runner.nslots,4)
+        self.assertRaises(Exception,fetch_runner,"local(slots=8)")
+        self.assertRaises(Exception,fetch_runner,"local(join_logs=maybe)")
+
     def test_fetch_bad_runner_raises_exception(self):
         """fetch_runner raises exception for unknown runner
         """
@@ -7,6 +7,7 @@ from bcftbx.test.mock_data import ExampleDirSpiders,ExampleDirLanguages
 import unittest
 import os
 import tempfile
+import shutil
 import io
 
 TEST_TEXT = u"""Md5sum is a Python module with functions for generating
@@ -147,6 +148,159 @@ class TestMd5CheckerMd5cmpFiles(unittest.TestCase):
                          Md5Checker.md5cmp_files(self.example_dir.dirn,
                                                  self.example_dir.path('spider.txt')))
 
+class TestSampledMd5sum(unittest.TestCase):
+    """Tests for the 'sampled_md5sum' function
+
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def _make_file(self,name,data):
+        filen = os.path.join(self.wd,name)
+        with io.open(filen,'wb') as fp:
+            fp.write(data)
+        return filen
+
+    def test_sampled_md5sum_small_file(self):
+        """sampled_md5sum is same as md5sum for small file
+        """
+        f = self._make_file("small",TEST_TEXT.encode())
+        self.assertEqual(sampled_md5sum(f),md5sum(f))
+
+    def test_sampled_md5sum_detects_differences_in_samples(self):
+        """sampled_md5sum detects differences in sampled blocks
+        """
+        data = b"0123456789"*100
+        f1 = self._make_file("file1",data)
+        f2 = self._make_file("file2",data[:-1]+b"X")
+        self.assertNotEqual(sampled_md5sum(f1,blocksize=10),
+                            sampled_md5sum(f2,blocksize=10))
+
+    def test_sampled_md5sum_ignores_unsampled_blocks(self):
+        """sampled_md5sum ignores differences outside sampled blocks
+        """
+        data = b"0123456789"*100
+        f1 = self._make_file("file1",data)
+        f2 = self._make_file("file2",data[:100]+b"X"+data[101:])
+        self.assertEqual(sampled_md5sum(f1,blocksize=10),
+                         sampled_md5sum(f2,blocksize=10))
+        self.assertNotEqual(md5sum(f1),md5sum(f2))
+
+class TestMd5CheckerCmpFiles(unittest.TestCase):
+    """Tests for the 'cmp_files' method of the Md5Checker class
+
+    """
+    def setUp(self):
+        self.example_dir = ExampleDirSpiders()
+        self.wd = self.example_dir.create_directory()
+
+    def tearDown(self):
+        self.example_dir.delete_directory()
+
+    def test_cmp_files_identical_files(self):
+        """Md5Checker.cmp_files compare identical files at all levels
+        """
+        for level in (Md5Checker.CMP_TYPE,
+                      Md5Checker.CMP_SIZE,
+                      Md5Checker.CMP_SAMPLE,
+                      Md5Checker.CMP_MD5):
+            self.assertEqual(Md5Checker.MD5_OK,
+                             Md5Checker.cmp_files(
+                                 self.example_dir.path('spider.txt'),
+                                 self.example_dir.path('spider2.txt'),
+                                 level=level))
+
+    def test_cmp_files_large_files_with_cache(self):
+        """Md5Checker.cmp_files doesn't sample large files with cached MD5 sums
+        """
+        import bcftbx.Md5sum
+        data = u"A"*(3*BLOCKSIZE+1)
+        self.example_dir.add_file("large.txt",data)
+        self.example_dir.add_file("large2.txt",data)
+        f1 = self.example_dir.path('large.txt')
+        f2 = self.example_dir.path('large2.txt')
+        db_file = os.path.join(self.example_dir.dirn,"cache.db")
+        with Md5Cache(db_file) as cache:
+            # Populate the cache
+            self.assertEqual(Md5Checker.MD5_OK,
+                             Md5Checker.cmp_files(f1,f2,cache=cache))
+            # Sampled MD5 sums shouldn't be generated when the
+            # cached values are valid
+            sampled_md5sum = bcftbx.Md5sum.sampled_md5sum
+            def fail_sampled_md5sum(*args,**kws):
+                raise Exception("sampled_md5sum called")
+            bcftbx.Md5sum.sampled_md5sum = fail_sampled_md5sum
+            try:
+                self.assertEqual(Md5Checker.MD5_OK,
+                                 Md5Checker.cmp_files(f1,f2,cache=cache))
+            finally:
+                bcftbx.Md5sum.sampled_md5sum = sampled_md5sum
+
+    def test_cmp_files_different_sizes(self):
+        """Md5Checker.cmp_files detects files with different sizes
+        """
+        self.example_dir.add_file("small.txt","Small")
+        self.assertEqual(Md5Checker.MD5_OK,
+                         Md5Checker.cmp_files(
+                             self.example_dir.path('spider.txt'),
+                             self.example_dir.path('small.txt'),
+                             level=Md5Checker.CMP_TYPE))
+        self.assertEqual(Md5Checker.MD5_FAILED,
+                         Md5Checker.cmp_files(
+                             self.example_dir.path('spider.txt'),
+                             self.example_dir.path('small.txt'),
+                             level=Md5Checker.CMP_MD5))
+        for level in (Md5Checker.CMP_SIZE,
+                      Md5Checker.CMP_SAMPLE):
+            self.assertEqual(Md5Checker.SIZES_DIFFER,
+                             Md5Checker.cmp_files(
+                                 self.example_dir.path('spider.txt'),
+                                 self.example_dir.path('small.txt'),
+                                 level=level))
+
+    def test_cmp_files_same_size_different_content(self):
+        """Md5Checker.cmp_files detects same-sized files with different content
+        """
+        self.example_dir.add_file("file1.txt","Spider")
+        self.example_dir.add_file("file2.txt","Spyder")
+        f1 = self.example_dir.path('file1.txt')
+        f2 = self.example_dir.path('file2.txt')
+        self.assertEqual(Md5Checker.MD5_OK,
+                         Md5Checker.cmp_files(f1,f2,
+                                              level=Md5Checker.CMP_SIZE))
+        self.assertEqual(Md5Checker.MD5_FAILED,
+                         Md5Checker.cmp_files(f1,f2,
+                                              level=Md5Checker.CMP_SAMPLE))
+        self.assertEqual(Md5Checker.MD5_FAILED,
+                         Md5Checker.cmp_files(f1,f2))
+
+    def test_cmp_files_missing_and_broken(self):
+        """Md5Checker.cmp_files with missing file and broken link
+        """
+        for level in (Md5Checker.CMP_TYPE,Md5Checker.CMP_MD5):
+            self.assertEqual(Md5Checker.MD5_ERROR,
+                             Md5Checker.cmp_files(
+                                 self.example_dir.path('spider.txt'),
+                                 self.example_dir.path('missing.txt'),
+                                 level=level))
+            self.assertEqual(Md5Checker.MD5_ERROR,
+                             Md5Checker.cmp_files(
+                                 self.example_dir.path('broken.txt'),
+                                 self.example_dir.path('spider.txt'),
+                                 level=level))
+
+    def test_cmp_files_file_and_directory(self):
+        """Md5Checker.cmp_files when one 'file' is a directory
+        """
+        self.assertEqual(Md5Checker.MD5_ERROR,
+                         Md5Checker.cmp_files(
+                             self.example_dir.path('spider.txt'),
+                             self.example_dir.dirn,
+                             level=Md5Checker.CMP_TYPE))
+
 class TestMd5CheckerWalk(unittest.TestCase):
     """Tests for the 'walk' method of the Md5Checker class
 
@@ -294,6 +448,20 @@ class TestMd5CheckerMd5cmpDirs(unittest.TestCase):
             else:
                 self.assertEqual(Md5Checker.MD5_OK,status)
 
+    def test_cmp_different_dirs_different_size_level(self):
+        """Md5Checker.md5cmp_dirs with different directories ('size' level)
+        """
+        # Replace file in target with different content
+        self.dir2.add_file("goodbye","Goooooodbyeeee!")
+        for f,status in Md5Checker.md5cmp_dirs(self.dir1.dirn,
+                                               self.dir2.dirn,
+                                               links=Md5Checker.IGNORE_LINKS,
+                                               level=Md5Checker.CMP_SIZE):
+            if os.path.basename(f) == "goodbye":
+                self.assertEqual(Md5Checker.SIZES_DIFFER,status)
+            else:
+                self.assertEqual(Md5Checker.MD5_OK,status)
+
 class TestMd5CheckerComputeMd5sms(unittest.TestCase):
     """Tests for the 'compute_md5sums' method of the Md5Checker class
 
@@ -369,6 +537,288 @@ class TestMd5CheckerVerifyMd5sms(unittest.TestCase):
         # Check no files were missed
         self.assertEqual(len(files),0)
 
+    def _check_verify_md5sums_ordering(self,order,nthreads):
+        # Create MD5sum 'file' with a missing and a bad entry
+        md5sums = []
+        expected = []
+        for f in self.example_dir.filelist(full_path=True):
+            md5sums.append(u"%s  %s" % (md5sum(f),f))
+            expected.append((f,Md5Checker.MD5_OK))
+        missing = os.path.join(self.example_dir.dirn,"missing.txt")
+        md5sums.append(u"%s  %s" % ("d41d8cd98f00b204e9800998ecf8427e",
+                                    missing))
+        expected.append((missing,Md5Checker.MISSING_TARGET))
+        f = self.example_dir.path("hello")
+        md5sums.insert(0,u"%s  %s" % ("d41d8cd98f00b204e9800998ecf8427e",f))
+        expected.insert(0,(f,Md5Checker.MD5_FAILED))
+        fp = io.StringIO(u'\n'.join(md5sums))
+        # Run verification and check results are in original order
+        results = list(Md5Checker.verify_md5sums(fp=fp,order=order,
+                                                 nthreads=nthreads))
+        self.assertEqual(results,expected)
+
+    def test_verify_md5sums_inode_order(self):
+        """Md5Checker.verify_md5sums reports in input order using inode order
+        """
+        self._check_verify_md5sums_ordering(Md5Checker.ORDER_INODE,1)
+        self._check_verify_md5sums_ordering(Md5Checker.ORDER_INODE,4)
+
+    def test_verify_md5sums_directory_order(self):
+        """Md5Checker.verify_md5sums reports in input order using directory order
+        """
+        self._check_verify_md5sums_ordering(Md5Checker.ORDER_DIRECTORY,4)
+
+    def test_verify_md5sums_manifest_order_multiple_threads(self):
+        """Md5Checker.verify_md5sums reports in input order using threads
+        """
+        self._check_verify_md5sums_ordering(Md5Checker.ORDER_MANIFEST,4)
+
+    def test_verify_md5sums_unordered_results(self):
+        """Md5Checker.verify_md5sums returns all results when unordered
+        """
+        md5sums = []
+        files = self.example_dir.filelist(full_path=True)
+        for f in files:
+            md5sums.append(u"%s  %s" % (md5sum(f),f))
+        fp = io.StringIO(u'\n'.join(md5sums))
+        results = list(Md5Checker.verify_md5sums(fp=fp,
+                                                 order=Md5Checker.ORDER_INODE,
+                                                 nthreads=4,
+                                                 ordered=False))
+        self.assertEqual(sorted([r[0] for r in results]),sorted(files))
+        for f,status in results:
+            self.assertEqual(status,Md5Checker.MD5_OK)
+
+    def test_verify_md5sums_shared_cache_multiple_threads(self):
+        """Md5Checker.verify_md5sums shares checksum cache between threads
+        """
+        md5sums = []
+        files = self.example_dir.filelist(full_path=True)
+        for f in files:
+            md5sums.append(u"%s  %s" % (md5sum(f),f))
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(cache_dir,"md5cache.sqlite")
+            for i in range(2):
+                with Md5Cache(cache_file) as cache:
+                    fp = io.StringIO(u'\n'.join(md5sums))
+                    for f,status in Md5Checker.verify_md5sums(
+                            fp=fp,
+                            order=Md5Checker.ORDER_INODE,
+                            nthreads=4,
+                            cache=cache):
+                        self.assertEqual(status,Md5Checker.MD5_OK)
+            self.assertEqual(cache.n_hits,len(files))
+        finally:
+            shutil.rmtree(cache_dir)
+
+class TestMd5Cache(unittest.TestCase):
+    """Tests for the Md5Cache class
+
+    """
+    def setUp(self):
+        self.example_dir = ExampleDirLanguages()
+        self.example_dir.create_directory()
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.cache_dir,"md5cache.sqlite")
+
+    def tearDown(self):
+        self.example_dir.delete_directory()
+        shutil.rmtree(self.cache_dir)
+
+    def test_md5cache_computes_and_reuses_checksums(self):
+        """Md5Cache computes checksums then reuses them on next run
+        """
+        files = self.example_dir.filelist(include_links=False,
+                                          full_path=False)
+        with Md5Cache(self.cache_file) as cache:
+            for f,md5 in Md5Checker.compute_md5sums(self.example_dir.dirn,
+                                                    links=Md5Checker.IGNORE_LINKS,
+                                                    cache=cache):
+                self.assertEqual(md5,self.example_dir.checksum_for_file(f))
+            self.assertEqual(cache.n_hits,0)
+            self.assertEqual(cache.n_misses,len(files))
+        with Md5Cache(self.cache_file) as cache:
+            for f,md5 in Md5Checker.compute_md5sums(self.example_dir.dirn,
+                                                    links=Md5Checker.IGNORE_LINKS,
+                                                    cache=cache):
+                self.assertEqual(md5,self.example_dir.checksum_for_file(f))
+            self.assertEqual(cache.n_hits,len(files))
+            self.assertEqual(cache.n_misses,0)
+
+    def test_md5cache_detects_modified_file(self):
+        """Md5Cache recomputes checksum when file changes
+        """
+        f = self.example_dir.path("hello")
+        with Md5Cache(self.cache_file) as cache:
+            md5 = cache.md5sum(f)
+        self.example_dir.add_file("hello","Hello, again!")
+        with Md5Cache(self.cache_file) as cache:
+            self.assertNotEqual(cache.md5sum(f),md5)
+            self.assertEqual(cache.md5sum(f),md5sum(f))
+            self.assertEqual(cache.n_misses,1)
+            self.assertEqual(cache.n_hits,1)
+
+    def test_md5cache_rehash(self):
+        """Md5Cache recomputes all checksums when 'rehash' is set
+        """
+        f = self.example_dir.path("hello")
+        with Md5Cache(self.cache_file) as cache:
+            cache.md5sum(f)
+        with Md5Cache(self.cache_file,rehash=True) as cache:
+            self.assertEqual(cache.md5sum(f),md5sum(f))
+            self.assertEqual(cache.n_hits,0)
+            self.assertEqual(cache.n_misses,1)
+
+    def test_md5cache_verify_fraction_detects_stale_entry(self):
+        """Md5Cache with 'verify_fraction' detects stale cached checksum
+        """
+        f = self.example_dir.path("hello")
+        with Md5Cache(self.cache_file) as cache:
+            cache.store(f,"00000000000000000000000000000000")
+        with Md5Cache(self.cache_file,verify_fraction=1.0) as cache:
+            self.assertEqual(cache.md5sum(f),md5sum(f))
+            self.assertEqual(cache.n_hits,1)
+            self.assertEqual(cache.n_verified,1)
+            self.assertEqual(cache.n_stale,1)
+        with Md5Cache(self.cache_file) as cache:
+            self.assertEqual(cache.lookup(f),md5sum(f))
+
+    def test_md5cache_bad_verify_fraction(self):
+        """Md5Cache raises ValueError for out-of-range 'verify_fraction'
+        """
+        self.assertRaises(ValueError,Md5Cache,self.cache_file,
+                          verify_fraction=1.5)
+
+    def test_md5cache_missing_file(self):
+        """Md5Cache raises IOError for missing file
+        """
+        with Md5Cache(self.cache_file) as cache:
+            self.assertRaises(IOError,cache.md5sum,
+                              self.example_dir.path("missing.txt"))
+
+class TestMd5Manifest(unittest.TestCase):
+    """Tests for the Md5Manifest class
+
+    """
+    def setUp(self):
+        self.example_dir = ExampleDirLanguages()
+        self.example_dir.create_directory()
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.example_dir.delete_directory()
+        shutil.rmtree(self.wd)
+
+    def test_md5manifest_build(self):
+        """Md5Manifest builds identical manifests for identical directories
+        """
+        manifest = Md5Manifest.build(self.example_dir.dirn)
+        self.assertEqual(manifest.n_hashed,7)
+        copy_dir = ExampleDirLanguages()
+        copy_dir.create_directory()
+        try:
+            manifest2 = Md5Manifest.build(copy_dir.dirn,nthreads=4)
+        finally:
+            copy_dir.delete_directory()
+        self.assertEqual(manifest.digest,manifest2.digest)
+        self.assertEqual(list(manifest.compare(manifest2)),[])
+
+    def test_md5manifest_save_and_load(self):
+        """Md5Manifest can be saved to and loaded from file
+        """
+        manifest = Md5Manifest.build(self.example_dir.dirn)
+        for name in ("manifest.json","manifest.json.gz"):
+            manifest_file = os.path.join(self.wd,name)
+            manifest.save(manifest_file)
+            manifest2 = Md5Manifest.load(manifest_file)
+            self.assertEqual(manifest.digest,manifest2.digest)
+            self.assertEqual(list(manifest.compare(manifest2)),[])
+
+    def test_md5manifest_compare(self):
+        """Md5Manifest.compare reports differences between manifests
+        """
+        manifest = Md5Manifest.build(self.example_dir.dirn)
+        self.example_dir.add_file("spanish/gracias","Thank you!")
+        self.example_dir.add_file("welsh/north_wales/maen_ddrwg_gen_i",
+                                  "Apologies!")
+        self.example_dir.add_file("goodbye","Goodbye?")
+        os.remove(self.example_dir.path("icelandic/takk_fyrir"))
+        os.remove(self.example_dir.path("hi"))
+        os.symlink("goodbye",self.example_dir.path("hi"))
+        manifest2 = Md5Manifest.build(self.example_dir.dirn)
+        self.assertNotEqual(manifest.digest,manifest2.digest)
+        self.assertEqual(list(manifest.compare(manifest2)),
+                         [("goodbye",Md5Checker.MD5_FAILED),
+                          ("hi",Md5Checker.LINKS_DIFFER),
+                          ("icelandic/takk_fyrir",Md5Checker.MISSING_TARGET),
+                          ("spanish/gracias",Md5Checker.MISSING_SOURCE),
+                          ("welsh/north_wales/maen_ddrwg_gen_i",
+                           Md5Checker.SIZES_DIFFER)])
+
+    def test_md5manifest_verify_unchanged(self):
+        """Md5Manifest.verify doesn't read files for unchanged directory
+        """
+        manifest = Md5Manifest.build(self.example_dir.dirn)
+        verification = manifest.verify(self.example_dir.dirn)
+        self.assertEqual(list(verification),[])
+        self.assertEqual(verification.n_hashed,0)
+        # Force all files to be checksummed
+        verification = manifest.verify(self.example_dir.dirn,
+                                       rehash=True,
+                                       nthreads=2)
+        self.assertEqual(list(verification),[])
+        self.assertEqual(verification.n_hashed,7)
+        # Verifying doesn't change the manifest
+        self.assertEqual(manifest.n_hashed,7)
+
+    def test_md5manifest_verify_and_update_after_additions(self):
+        """Md5Manifest only checksums new files after additions
+        """
+        manifest = Md5Manifest.build(self.example_dir.dirn)
+        self.example_dir.add_file("french/merci","Thank you!")
+        verification = manifest.verify(self.example_dir.dirn)
+        self.assertEqual(list(verification),
+                         [("french",Md5Checker.MISSING_SOURCE)])
+        self.assertEqual(verification.n_hashed,0)
+        manifest2 = Md5Manifest.build(self.example_dir.dirn,
+                                      previous=manifest)
+        self.assertEqual(manifest2.n_hashed,1)
+        self.assertEqual(list(manifest2.verify(self.example_dir.dirn)),[])
+        self.assertEqual(list(manifest.compare(manifest2)),
+                         [("french",Md5Checker.MISSING_SOURCE)])
+
+    def test_md5manifest_verify_detects_changes(self):
+        """Md5Manifest.verify detects changed, missing and modified files
+        """
+        # Set a whole-second timestamp (so it can be restored
+        # exactly later)
+        hello = self.example_dir.path("hello")
+        os.utime(hello,(1500000000,1500000000))
+        manifest = Md5Manifest.build(self.example_dir.dirn)
+        # Change contents without changing size
+        self.example_dir.add_file("hello","Jello!")
+        os.utime(hello,(1500000010,1500000010))
+        # Change contents and size
+        self.example_dir.add_file("spanish/hola","Buenos dias!")
+        # Remove a file
+        os.remove(self.example_dir.path("goodbye"))
+        self.assertEqual(list(manifest.verify(self.example_dir.dirn)),
+                         [("goodbye",Md5Checker.MISSING_TARGET),
+                          ("spanish/hola",Md5Checker.SIZES_DIFFER),
+                          ("hello",Md5Checker.MD5_FAILED)])
+        # Restore the original timestamp so the change is
+        # only detected by rehashing
+        os.utime(hello,(1500000000,1500000000))
+        self.assertEqual(list(manifest.verify(self.example_dir.dirn)),
+                         [("goodbye",Md5Checker.MISSING_TARGET),
+                          ("spanish/hola",Md5Checker.SIZES_DIFFER)])
+        self.assertEqual(list(manifest.verify(self.example_dir.dirn,
+                                              rehash=True)),
+                         [("goodbye",Md5Checker.MISSING_TARGET),
+                          ("spanish/hola",Md5Checker.SIZES_DIFFER),
+                          ("hello",Md5Checker.MD5_FAILED)])
+
 class TestMd5CheckReporter(unittest.TestCase):
     """Test the Md5CheckReporter class
 
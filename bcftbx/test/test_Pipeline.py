@@ -2,19 +2,30 @@
 # Tests for Pipeline.py module
 #######################################################################
 import os
+import io
+import json
+import csv
 import unittest
 import tempfile
 import shutil
+import atexit
 import time
 import bcftbx.utils
 from bcftbx.JobRunner import SimpleJobRunner
 from bcftbx.JobRunner import GEJobRunner
+from bcftbx.JobRunner import PythonFunctionRunner
 from bcftbx.Pipeline import Job
 from bcftbx.Pipeline import GetSolidDataFiles
 from bcftbx.Pipeline import GetSolidPairedEndFiles
 from bcftbx.Pipeline import GetFastqFiles
 from bcftbx.Pipeline import GetFastqGzFiles
 from bcftbx.Pipeline import PipelineRunner
+from bcftbx.Pipeline import GroupPriorityJobQueue
+from bcftbx.Pipeline import AdaptiveThrottle
+from bcftbx.Pipeline import estimate_job_size
+from bcftbx.Pipeline import METRICS_FIELDS
+from bcftbx.mockGE import setup_mock_GE
+from bcftbx.mockGE import MockGE
 
 class TestJobWithSimpleJobRunner(unittest.TestCase):
     """Unit tests for the the Job class using SimpleJobRunner
@@ -514,6 +525,772 @@ class TestPipelineRunner(unittest.TestCase):
         pr.queueJob(self.working_dir,'ls','-l')
         pr.run(blocking=True)
 
+    def test_pipelinerunner_doesnt_wait_for_poll_interval(self):
+        """PipelineRunner: updates as soon as jobs complete
+        """
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=2,
+                            poll_interval=30)
+        for i in range(4):
+            pr.queueJob(self.working_dir,'sleep',('0.1',),label=str(i))
+        start = time.time()
+        pr.run(blocking=True)
+        self.assertTrue(time.time() - start < 30)
+        self.assertEqual(pr.nCompleted(),4)
+
+    def test_pipelinerunner_log_files_include_labels(self):
+        """PipelineRunner: log file names include job labels
+        """
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=3,
+                            poll_interval=1)
+        for label in ('sampleA','sampleB','sampleC'):
+            pr.queueJob(self.working_dir,'echo',(label,),label=label)
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),3)
+        for job in pr.completed:
+            self.assertTrue(os.path.basename(job.log).startswith(
+                "echo.%s." % job.label))
+
+    def test_pipelinerunner_batches_status_checks(self):
+        """PipelineRunner: fetches status of all running jobs in one call
+        """
+        class CountingRunner(SimpleJobRunner):
+            def __init__(self):
+                SimpleJobRunner.__init__(self)
+                self.nlist = 0
+                self.nerror_state = 0
+            def list(self):
+                self.nlist += 1
+                return SimpleJobRunner.list(self)
+            def errorState(self,job_id):
+                self.nerror_state += 1
+                return SimpleJobRunner.errorState(self,job_id)
+        runner = CountingRunner()
+        pr = PipelineRunner(runner,max_concurrent_jobs=4,poll_interval=1)
+        for i in range(4):
+            pr.queueJob(self.working_dir,'sleep',('1',),label=str(i))
+        pr.run(blocking=False)
+        self.assertEqual(pr.nRunning(),4)
+        runner.nlist = 0
+        pr.update()
+        self.assertEqual(runner.nlist,1)
+        self.assertEqual(runner.nerror_state,0)
+        self.assertEqual(pr.nRunning(),4)
+        while pr.isRunning():
+            time.sleep(0.1)
+        self.assertEqual(pr.nCompleted(),4)
+        self.assertEqual(pr.running,[])
+        self.assertEqual(sorted([job.label for job in pr.completed]),
+                         ['0','1','2','3'])
+
+    def test_pipelinerunner_group_completion(self):
+        """PipelineRunner: group completion handler gets all jobs in group
+        """
+        completed_groups = []
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=2,
+                            poll_interval=1,
+                            groupCompletionHandler=lambda group,jobs:
+                            completed_groups.append(
+                                (group,sorted([j.label for j in jobs]))))
+        for label,group in (('a1','a'),('b1','b'),('a2','a'),('c1',None)):
+            pr.queueJob(self.working_dir,'true',(),label=label,group=group)
+        pr.run(blocking=True)
+        self.assertEqual(sorted(completed_groups),
+                         [('a',['a1','a2']),('b',['b1'])])
+        report = pr.report()
+        self.assertTrue("4 jobs completed:" in report)
+        self.assertEqual(report.count("\t%s\n" % self.working_dir),1)
+
+    def test_pipelinerunner_metrics_file(self):
+        """PipelineRunner: writes job metrics as JSON lines
+        """
+        metrics_file = os.path.join(self.working_dir,"metrics.json")
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=1,
+                            poll_interval=1,metrics_file=metrics_file)
+        job1 = pr.queueJob(self.working_dir,'sleep',('0.2',),label='1',
+                           group='a')
+        pr.queueJob(self.working_dir,'false',(),label='2')
+        pr.queueJob(self.working_dir,'true',(),label='3',depends_on=[job1])
+        pr.run(blocking=True)
+        with io.open(metrics_file,'rt') as fp:
+            records = [json.loads(line) for line in fp]
+        self.assertEqual([r['name'] for r in records],
+                         ['sleep.1','false.2','true.3'])
+        for record in records:
+            self.assertEqual(list(record.keys()),list(METRICS_FIELDS))
+            self.assertEqual(record['pipeline'],pr.pipeline_id)
+            self.assertEqual(record['status'],'Finished')
+            self.assertEqual(record['nslots'],1)
+            self.assertTrue(record['queue_wait'] >= 0.0)
+            self.assertTrue(record['max_rss'] > 0)
+        self.assertEqual(records[0]['group'],'a')
+        self.assertTrue(records[0]['run_time'] >= 0.2)
+        self.assertEqual([r['exit_status'] for r in records],[0,1,0])
+
+    def test_pipelinerunner_metrics_file_csv(self):
+        """PipelineRunner: appends job metrics to CSV file
+        """
+        metrics_file = os.path.join(self.working_dir,"metrics.csv")
+        for i in range(2):
+            pr = PipelineRunner(SimpleJobRunner(),poll_interval=1,
+                                metrics_file=metrics_file)
+            pr.queueJob(self.working_dir,'true',(),label=str(i),
+                        group='a,"b"')
+            pr.run(blocking=True)
+        with io.open(metrics_file,'rt') as fp:
+            lines = fp.read().split('\n')
+        # Header is only written once
+        self.assertEqual(lines[0],','.join(METRICS_FIELDS))
+        self.assertEqual(len(lines),4)
+        for i in range(2):
+            fields = lines[i+1].split(',')
+            self.assertEqual(fields[1],'true.%d' % i)
+            self.assertEqual(fields[3:5],['"a','""b"""'])
+        self.assertEqual(lines[3],'')
+        # Can be read back using the csv module
+        with open(metrics_file) as fp:
+            records = list(csv.DictReader(fp))
+        self.assertEqual([r['label'] for r in records],['0','1'])
+        self.assertEqual([r['group'] for r in records],['a,"b"']*2)
+
+    def test_pipelinerunner_with_python_functions(self):
+        """PipelineRunner: runs Python callables via PythonFunctionRunner
+        """
+        runner = PythonFunctionRunner(max_workers=2)
+        pr = PipelineRunner(runner,max_concurrent_jobs=4,poll_interval=1)
+        for i in range(4):
+            pr.queueJob(self.working_dir,os.mkdir,('dir%d' % i,),
+                        label=str(i))
+        pr.queueJob(self.working_dir,os.mkdir,('.',),label='fail')
+        pr.run(blocking=True)
+        runner.shutdown()
+        self.assertEqual(pr.nCompleted(),5)
+        jobs = dict([(job.label,job) for job in pr.completed])
+        for i in range(4):
+            self.assertEqual(jobs[str(i)].name,'mkdir.%d' % i)
+            self.assertEqual(jobs[str(i)].exit_status,0)
+            self.assertTrue(os.path.isdir(os.path.join(self.working_dir,
+                                                       'dir%d' % i)))
+        self.assertEqual(jobs['fail'].exit_status,1)
+
+    def test_pipelinerunner_dependencies(self):
+        """PipelineRunner: jobs start once their dependencies complete
+        """
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=4,
+                            poll_interval=1)
+        # Sample A finishes the first stage quickly, sample B doesn't
+        qc_a = pr.queueJob(self.working_dir,'sleep',('0.1',),label='qc_a')
+        qc_b = pr.queueJob(self.working_dir,'sleep',('2',),label='qc_b')
+        align_a = pr.queueJob(self.working_dir,'true',(),label='align_a',
+                              depends_on=[qc_a])
+        align_b = pr.queueJob(self.working_dir,'true',(),label='align_b',
+                              depends_on=[qc_b])
+        report = pr.queueJob(self.working_dir,'true',(),label='report',
+                             depends_on=[align_a,align_b])
+        self.assertEqual(pr.nWaiting(),5)
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),5)
+        for job in (qc_a,qc_b,align_a,align_b,report):
+            self.assertTrue(job.succeeded)
+        # Second stage for sample A started before first stage
+        # for sample B finished
+        self.assertTrue(align_a.start_time >= qc_a.end_time)
+        self.assertTrue(align_a.start_time < qc_b.end_time)
+        self.assertTrue(align_b.start_time >= qc_b.end_time)
+        self.assertTrue(report.start_time >= align_a.end_time)
+        self.assertTrue(report.start_time >= align_b.end_time)
+
+    def test_pipelinerunner_dependencies_respect_max_concurrent_jobs(self):
+        """PipelineRunner: released jobs respect 'max_concurrent_jobs'
+        """
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=2,
+                            poll_interval=1)
+        first = pr.queueJob(self.working_dir,'true',(),label='first')
+        jobs = [pr.queueJob(self.working_dir,'sleep',('0.2',),label=str(i),
+                            depends_on=[first]) for i in range(4)]
+        max_running = []
+        def record_running(job):
+            max_running.append(pr.nRunning())
+        pr.handle_job_completion = record_running
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),5)
+        self.assertTrue(max(max_running) <= 2)
+        for job in jobs:
+            self.assertTrue(job.succeeded)
+
+    def test_pipelinerunner_dependency_failure_skips_dependants(self):
+        """PipelineRunner: jobs which depend on failed jobs are skipped
+        """
+        completed_jobs = []
+        completed_groups = {}
+        def job_completed(job):
+            completed_jobs.append(job.label)
+        def group_completed(group,jobs):
+            completed_groups[group] = sorted([job.label for job in jobs])
+        pr = PipelineRunner(SimpleJobRunner(),poll_interval=1,
+                            jobCompletionHandler=job_completed,
+                            groupCompletionHandler=group_completed)
+        qc = pr.queueJob(self.working_dir,'false',(),label='qc',group='a')
+        align = pr.queueJob(self.working_dir,'true',(),label='align',
+                            group='a',depends_on=[qc])
+        report = pr.queueJob(self.working_dir,'true',(),label='report',
+                             group='a',depends_on=[align])
+        other = pr.queueJob(self.working_dir,'true',(),label='other',
+                            group='b')
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),4)
+        self.assertNotEqual(qc.exit_status,0)
+        self.assertFalse(qc.succeeded)
+        for job in (align,report):
+            self.assertTrue(job.skipped)
+            self.assertTrue(job.failed)
+            self.assertFalse(job.submitted)
+            self.assertEqual(job.exit_status,None)
+            self.assertEqual(job.status(),"Skipped")
+        self.assertTrue(other.succeeded)
+        self.assertEqual(sorted(completed_jobs),
+                         ['align','other','qc','report'])
+        self.assertEqual(completed_groups,{ 'a': ['align','qc','report'],
+                                            'b': ['other'] })
+
+    def test_pipelinerunner_dependency_must_be_in_pipeline(self):
+        """PipelineRunner: dependencies must be jobs in the pipeline
+        """
+        pr1 = PipelineRunner(SimpleJobRunner())
+        pr2 = PipelineRunner(SimpleJobRunner())
+        job = pr1.queueJob(self.working_dir,'true',())
+        self.assertRaises(Exception,
+                          pr2.queueJob,
+                          self.working_dir,'true',(),depends_on=[job])
+
+    def make_file(self,name,content,age=0):
+        # Make a file in the working dir, optionally backdating
+        # its modification time by 'age' seconds
+        path = os.path.join(self.working_dir,name)
+        with open(path,'wt') as fp:
+            fp.write(content)
+        mtime = time.time() - age
+        os.utime(path,(mtime,mtime))
+        return path
+
+    def test_pipelinerunner_skips_up_to_date_jobs(self):
+        """PipelineRunner: jobs with up to date outputs are skipped
+        """
+        self.make_file('in1.txt','input 1',age=100)
+        self.make_file('out1.txt','output 1',age=50)
+        self.make_file('in2.txt','input 2',age=50)
+        self.make_file('out2.txt','output 2',age=100)
+        pr = PipelineRunner(SimpleJobRunner(),poll_interval=1)
+        # Outputs newer than inputs
+        job1 = pr.queueJob(self.working_dir,'cp',('in1.txt','out1.txt'),
+                           label='1',inputs=('in1.txt',),
+                           outputs=('out1.txt',))
+        # Outputs older than inputs
+        job2 = pr.queueJob(self.working_dir,'cp',('in2.txt','out2.txt'),
+                           label='2',inputs=('in2.txt',),
+                           outputs=('out2.txt',))
+        # Outputs don't exist
+        job3 = pr.queueJob(self.working_dir,'cp',('out1.txt','out3.txt'),
+                           label='3',inputs=('out1.txt',),
+                           outputs=('out3.txt',),depends_on=[job1])
+        # Outputs not declared
+        job4 = pr.queueJob(self.working_dir,'true',(),label='4',
+                           depends_on=[job3])
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),4)
+        self.assertTrue(job1.up_to_date)
+        self.assertTrue(job1.skipped)
+        self.assertFalse(job1.submitted)
+        self.assertTrue(job1.succeeded)
+        self.assertEqual(job1.status(),"Up to date")
+        for job in (job2,job3,job4):
+            self.assertFalse(job.up_to_date)
+            self.assertTrue(job.submitted)
+            self.assertTrue(job.succeeded)
+        with open(os.path.join(self.working_dir,'out2.txt'),'rt') as fp:
+            self.assertEqual(fp.read(),'input 2')
+
+    def test_pipelinerunner_uses_input_signatures(self):
+        """PipelineRunner: jobs are skipped if input checksums are unchanged
+        """
+        signature_file = os.path.join(self.working_dir,'signatures.json')
+        infile = self.make_file('in.txt','input',age=100)
+        def run_pipeline():
+            pr = PipelineRunner(SimpleJobRunner(),poll_interval=1,
+                                signature_file=signature_file)
+            job = pr.queueJob(self.working_dir,'cp',('in.txt','out.txt'),
+                              inputs=('in.txt',),outputs=('out.txt',))
+            pr.run(blocking=True)
+            return job
+        # First run: job runs and signature is recorded
+        job = run_pipeline()
+        self.assertTrue(job.submitted)
+        self.assertTrue(os.path.exists(signature_file))
+        # Input is newer than the output but the contents
+        # are unchanged
+        self.make_file('in.txt','input')
+        os.utime(os.path.join(self.working_dir,'out.txt'),
+                 (time.time()-50,time.time()-50))
+        job = run_pipeline()
+        self.assertTrue(job.up_to_date)
+        self.assertFalse(job.submitted)
+        # Input is changed
+        self.make_file('in.txt','new input')
+        os.utime(os.path.join(self.working_dir,'out.txt'),
+                 (time.time()-50,time.time()-50))
+        job = run_pipeline()
+        self.assertTrue(job.submitted)
+        self.assertTrue(job.succeeded)
+        with open(os.path.join(self.working_dir,'out.txt'),'rt') as fp:
+            self.assertEqual(fp.read(),'new input')
+
+    def test_pipelinerunner_dry_run(self):
+        """PipelineRunner: dry run reports jobs without running them
+        """
+        self.make_file('in1.txt','input 1',age=100)
+        self.make_file('out1.txt','output 1',age=50)
+        self.make_file('in2.txt','input 2',age=100)
+        pr = PipelineRunner(SimpleJobRunner(),poll_interval=1)
+        job1 = pr.queueJob(self.working_dir,'cp',('in1.txt','out1.txt'),
+                           label='1',inputs=('in1.txt',),
+                           outputs=('out1.txt',))
+        job2 = pr.queueJob(self.working_dir,'cp',('in2.txt','out2.txt'),
+                           label='2',inputs=('in2.txt',),
+                           outputs=('out2.txt',))
+        job3 = pr.queueJob(self.working_dir,'cp',('out2.txt','out3.txt'),
+                           label='3',inputs=('out2.txt',),
+                           outputs=('out3.txt',),depends_on=[job2])
+        self.assertEqual(pr.run(dry_run=True),[job2,job3])
+        # Nothing was run
+        self.assertEqual(pr.nWaiting(),3)
+        self.assertEqual(pr.nCompleted(),0)
+        for job in (job1,job2,job3):
+            self.assertFalse(job.submitted)
+        self.assertFalse(os.path.exists(os.path.join(self.working_dir,
+                                                     'out2.txt')))
+
+    def test_pipelinerunner_longest_first_queue_policy(self):
+        """PipelineRunner: 'longest_first' policy starts largest jobs first
+        """
+        self.make_file('small.fq','x'*10)
+        self.make_file('large.fq','x'*1000)
+        self.make_file('medium.fq','x'*100)
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=1,
+                            poll_interval=1,queue_policy='longest_first')
+        for name in ('small','large','medium','missing'):
+            pr.queueJob(self.working_dir,'cat',('%s.fq' % name,),
+                        label=name)
+        pr.run(blocking=True)
+        self.assertEqual([job.label for job in pr.completed],
+                         ['large','medium','small','missing'])
+
+    def test_pipelinerunner_group_priority_queue_policy(self):
+        """PipelineRunner: 'group' policy starts jobs grouped by priority
+        """
+        queue_policy = GroupPriorityJobQueue(priorities={ 'c': 1 })
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=1,
+                            poll_interval=1,queue_policy=queue_policy)
+        for label,group in (('a1','a'),('b1','b'),('c1','c'),
+                            ('a2','a'),('b2','b'),('c2','c')):
+            pr.queueJob(self.working_dir,'true',(),label=label,group=group)
+        pr.run(blocking=True)
+        self.assertEqual([job.label for job in pr.completed],
+                         ['c1','c2','a1','a2','b1','b2'])
+
+    def test_pipelinerunner_unknown_queue_policy(self):
+        """PipelineRunner: raise exception for unknown queue policy
+        """
+        self.assertRaises(Exception,
+                          PipelineRunner,SimpleJobRunner(),
+                          queue_policy='shortest_first')
+
+    def test_pipelinerunner_pack_walltime(self):
+        """PipelineRunner: packs jobs using estimated run times
+        """
+        class PackingRunner(SimpleJobRunner):
+            # Records packs and reports a run time of 1s for
+            # every job
+            def __init__(self):
+                SimpleJobRunner.__init__(self)
+                self.packs = []
+            def run_pack(self,name,jobs,nparallel=1):
+                self.packs.append((len(jobs),nparallel))
+                return SimpleJobRunner.run_pack(self,name,jobs,nparallel)
+            def metrics(self,job_id):
+                return dict(start_time=0.0,end_time=1.0)
+        for pack_parallel,packs in ((1,[(3,1),(3,1)]),
+                                    (2,[(6,2)])):
+            runner = PackingRunner()
+            pr = PipelineRunner(runner,max_concurrent_jobs=1,poll_interval=1,
+                                pack_walltime=3.0,pack_parallel=pack_parallel)
+            for i in range(7):
+                pr.queueJob(self.working_dir,'true',(),label=str(i))
+            pr.run(blocking=True)
+            self.assertEqual(pr.nCompleted(),7)
+            # First job runs on its own to get an estimate
+            self.assertEqual(runner.packs,packs)
+            for job in pr.completed:
+                self.assertTrue(job.succeeded)
+
+    def test_estimate_job_size(self):
+        """estimate_job_size: sums sizes of files in arguments and inputs
+        """
+        self.make_file('a.fq','x'*10)
+        self.make_file('b.fq','x'*100)
+        os.mkdir(os.path.join(self.working_dir,'subdir'))
+        job = Job(SimpleJobRunner(),'test',self.working_dir,'cat',
+                  ('-n','a.fq','a.fq','subdir',
+                   os.path.join(self.working_dir,'b.fq')),
+                  inputs=('b.fq','missing.fq'))
+        self.assertEqual(estimate_job_size(job),110)
+
+    def test_pipelinerunner_resume(self):
+        """PipelineRunner: resume pipeline from a state file
+        """
+        state_file = os.path.join(self.working_dir,'pipeline.state')
+        runs = os.path.join(self.working_dir,'runs.txt')
+        completed_jobs = []
+        pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=1,
+                            poll_interval=1,state_file=state_file,
+                            jobCompletionHandler=lambda job:
+                            completed_jobs.append(job.label))
+        cmd = 'echo %s >>%s; sleep %s'
+        job1 = pr.queueJob(self.working_dir,'/bin/bash',
+                           ('-c',cmd % ('1',runs,'0')),label='1',group='a')
+        job2 = pr.queueJob(self.working_dir,'/bin/bash',
+                           ('-c',cmd % ('2',runs,'1')),label='2',group='a',
+                           depends_on=[job1])
+        job3 = pr.queueJob(self.working_dir,'/bin/bash',
+                           ('-c',cmd % ('3',runs,'0')),label='3',group='b',
+                           depends_on=[job2])
+        # Run until the second job is running
+        pr.run(blocking=False)
+        while not job2.submitted:
+            pr.update()
+            time.sleep(0.1)
+        self.assertTrue(os.path.exists(state_file))
+        # Delete the pipeline (leaves the second job running)
+        del(pr)
+        self.assertEqual(completed_jobs,['1'])
+        # Resume the pipeline
+        completed_groups = []
+        pr = PipelineRunner.resume(state_file,
+                                   jobCompletionHandler=lambda job:
+                                   completed_jobs.append(job.label),
+                                   groupCompletionHandler=lambda group,jobs:
+                                   completed_groups.append(group))
+        self.assertEqual(pr.nCompleted(),1)
+        self.assertEqual(pr.completed[0].label,'1')
+        self.assertTrue(pr.completed[0].succeeded)
+        # SimpleJobRunner can't reattach so the second job
+        # is waiting to be resubmitted
+        self.assertEqual(pr.nRunning(),0)
+        self.assertEqual(pr.nWaiting(),2)
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),3)
+        self.assertEqual(completed_jobs,['1','2','3'])
+        self.assertEqual(sorted(completed_groups),['a','b'])
+        # First job wasn't rerun
+        with open(runs,'rt') as fp:
+            self.assertEqual(fp.read().split(),['1','2','2','3'])
+
+    def test_pipelinerunner_resume_needs_runner_if_not_recreatable(self):
+        """PipelineRunner: resume requires runner if it can't be recreated
+        """
+        state_file = os.path.join(self.working_dir,'pipeline.state')
+        pr = PipelineRunner(PythonFunctionRunner(),state_file=state_file)
+        pr.run(blocking=False)
+        self.assertRaises(Exception,PipelineRunner.resume,state_file)
+        runner = PythonFunctionRunner()
+        pr = PipelineRunner.resume(state_file,runner=runner)
+        self.assertTrue(pr.runner is runner)
+
+class TestAdaptiveThrottle(unittest.TestCase):
+
+    class MockPipeline(object):
+        # Provides the pipeline methods used by the throttle
+        def __init__(self,max_concurrent_jobs,nrunning,nwaiting):
+            self.max_concurrent_jobs = max_concurrent_jobs
+            self.nrunning = nrunning
+            self.nwaiting = nwaiting
+        def nRunning(self):
+            return self.nrunning
+        def nWaiting(self):
+            return self.nwaiting
+
+    def make_sample(self,loads):
+        # Returns a function which returns each of the loads
+        # in turn
+        loads = list(loads)
+        def sample():
+            pending,own_pending = loads.pop(0)
+            return dict(pending=pending,own_pending=own_pending)
+        return sample
+
+    def test_adaptive_throttle_increases_when_quiet(self):
+        """AdaptiveThrottle: increases target when cluster is quiet
+        """
+        throttle = AdaptiveThrottle(2,5,self.make_sample([(0,0)]*4),
+                                    interval=0)
+        pipeline = self.MockPipeline(3,3,10)
+        targets = []
+        for i in range(4):
+            targets.append(throttle.update(pipeline))
+            pipeline.nrunning = targets[-1]
+        self.assertEqual(targets,[4,5,5,5])
+
+    def test_adaptive_throttle_holds_when_not_saturated(self):
+        """AdaptiveThrottle: holds target if not all jobs are running
+        """
+        throttle = AdaptiveThrottle(1,10,self.make_sample([(0,2),(0,0),
+                                                           (0,0)]),
+                                    interval=0)
+        # Own jobs are waiting
+        self.assertEqual(throttle.update(self.MockPipeline(4,4,10)),4)
+        # Pipeline isn't using all its slots
+        self.assertEqual(throttle.update(self.MockPipeline(4,2,10)),4)
+        # Pipeline has no more jobs to start
+        self.assertEqual(throttle.update(self.MockPipeline(4,4,0)),4)
+
+    def test_adaptive_throttle_decreases_when_busy(self):
+        """AdaptiveThrottle: halves target (down to floor) when cluster is busy
+        """
+        throttle = AdaptiveThrottle(3,16,self.make_sample([(5,0)]*3),
+                                    interval=0,max_pending=4)
+        pipeline = self.MockPipeline(16,16,10)
+        self.assertEqual([throttle.update(pipeline) for i in range(3)],
+                         [8,4,3])
+
+    def test_adaptive_throttle_initial_target(self):
+        """AdaptiveThrottle: initial target is limited to floor and ceiling
+        """
+        for max_concurrent_jobs,target in ((1,2),(3,3),(10,5)):
+            throttle = AdaptiveThrottle(2,5,self.make_sample([(1,1)]),
+                                        interval=0,max_pending=1)
+            self.assertEqual(throttle.update(
+                self.MockPipeline(max_concurrent_jobs,0,0)),target)
+
+    def test_adaptive_throttle_sample_interval(self):
+        """AdaptiveThrottle: only samples load once per interval
+        """
+        throttle = AdaptiveThrottle(1,10,self.make_sample([(0,0)]),
+                                    interval=60)
+        pipeline = self.MockPipeline(4,4,10)
+        self.assertEqual(throttle.update(pipeline),5)
+        pipeline.nrunning = 5
+        self.assertEqual(throttle.update(pipeline),5)
+
+    def test_adaptive_throttle_sample_failure(self):
+        """AdaptiveThrottle: keeps target if load can't be sampled
+        """
+        def sample():
+            raise OSError("qstat: not found")
+        throttle = AdaptiveThrottle(1,10,sample,interval=0)
+        self.assertEqual(throttle.update(self.MockPipeline(4,4,10)),4)
+
+    def test_adaptive_throttle_bad_limits(self):
+        """AdaptiveThrottle: raises exception for bad floor or ceiling
+        """
+        sample = self.make_sample([])
+        self.assertRaises(Exception,AdaptiveThrottle,0,4,sample)
+        self.assertRaises(Exception,AdaptiveThrottle,4,2,sample)
+
+    def test_pipelinerunner_with_adaptive_throttle(self):
+        """PipelineRunner: adjusts 'max_concurrent_jobs' using throttle
+        """
+        working_dir = tempfile.mkdtemp()
+        try:
+            throttle = AdaptiveThrottle(1,3,self.make_sample([(0,0)]*100),
+                                        interval=0)
+            pr = PipelineRunner(SimpleJobRunner(),max_concurrent_jobs=1,
+                                poll_interval=1,throttle=throttle)
+            max_running = []
+            def record_running(job):
+                max_running.append(pr.nRunning())
+            pr.handle_job_completion = record_running
+            for i in range(8):
+                pr.queueJob(working_dir,'sleep',('0.2',),label=str(i))
+            pr.run(blocking=True)
+            self.assertEqual(pr.nCompleted(),8)
+            self.assertEqual(pr.max_concurrent_jobs,3)
+            self.assertTrue(max(max_running) > 1)
+        finally:
+            shutil.rmtree(working_dir)
+
+class TestPipelineRunnerWithMockGE(unittest.TestCase):
+
+    def setUp(self):
+        # Work in a temporary directory (so that the runners'
+        # admin directories are created there); this is
+        # removed at exit, after the runners have cleaned up
+        self.cwd = os.getcwd()
+        self.top_dir = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree,self.top_dir,True)
+        os.chdir(self.top_dir)
+        # Set up mockGE utilities
+        self.database_dir = tempfile.mkdtemp(dir=os.getcwd())
+        self.bin_dir = tempfile.mkdtemp(dir=os.getcwd())
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.old_path
+        setup_mock_GE(bindir=self.bin_dir,
+                      database_dir=self.database_dir)
+        self.mock_ge = MockGE(database_dir=self.database_dir)
+        # Set up working dir
+        self.working_dir = tempfile.mkdtemp(dir=os.getcwd())
+
+    def tearDown(self):
+        self.mock_ge.stop()
+        os.environ['PATH'] = self.old_path
+        os.chdir(self.cwd)
+        shutil.rmtree(self.database_dir)
+        shutil.rmtree(self.bin_dir)
+        shutil.rmtree(self.working_dir)
+
+    def test_pipelinerunner_uses_array_jobs(self):
+        """PipelineRunner: submits jobs sharing a script as array job
+        """
+        pr = PipelineRunner(GEJobRunner(),poll_interval=1)
+        for i in range(3):
+            pr.queueJob(self.working_dir,'/bin/bash',('-c','exit %d' % i),
+                        label=str(i))
+        pr.queueJob(self.working_dir,'/bin/true',(),label='3')
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),4)
+        jobs = dict([(job.label,job) for job in pr.completed])
+        array_id = jobs['0'].job_id.split('.')[0]
+        for i in range(3):
+            job = jobs[str(i)]
+            self.assertEqual(job.job_id,"%s.%d" % (array_id,i+1))
+            self.assertEqual(job.exit_status,i)
+            # Each task has its own log file
+            self.assertEqual(job.log,
+                             os.path.join(self.working_dir,
+                                          "bash.%d.o%s" % (i,job.job_id)))
+            self.assertTrue(os.path.exists(job.log))
+        self.assertFalse('.' in jobs['3'].job_id)
+        self.assertEqual(jobs['3'].exit_status,0)
+
+    def test_pipelinerunner_no_array_jobs(self):
+        """PipelineRunner: submits individual jobs if array jobs disabled
+        """
+        pr = PipelineRunner(GEJobRunner(),poll_interval=1,
+                            use_array_jobs=False)
+        for i in range(2):
+            pr.queueJob(self.working_dir,'/bin/true',(),label=str(i))
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),2)
+        for job in pr.completed:
+            self.assertFalse('.' in job.job_id)
+            self.assertEqual(job.exit_status,0)
+
+    def test_pipelinerunner_resume_reattaches_to_ge_jobs(self):
+        """PipelineRunner: resumed pipeline reattaches to running GE jobs
+        """
+        state_file = os.path.join(self.working_dir,'pipeline.state')
+        runs = os.path.join(self.working_dir,'runs.txt')
+        pr = PipelineRunner(GEJobRunner(),poll_interval=1,
+                            state_file=state_file)
+        cmd = 'echo %s >>%s'
+        job1 = pr.queueJob(self.working_dir,'/bin/bash',('-c',cmd % ('1',runs)),
+                           label='1')
+        job2 = pr.queueJob(self.working_dir,'/bin/bash',('-c',cmd % ('2',runs)),
+                           label='2',depends_on=[job1])
+        # Submit the first job and then delete the pipeline
+        # before the job has run
+        pr.run(blocking=False)
+        self.assertTrue(job1.submitted)
+        job_id = job1.job_id
+        del(pr)
+        # Resume the pipeline
+        pr = PipelineRunner.resume(state_file)
+        self.assertEqual(pr.nRunning(),1)
+        self.assertEqual(pr.running[0].job_id,job_id)
+        self.assertEqual(pr.nWaiting(),1)
+        pr.run(blocking=True)
+        self.assertEqual(pr.nCompleted(),2)
+        for job in pr.completed:
+            self.assertTrue(job.succeeded)
+        self.assertEqual(pr.completed[0].job_id,job_id)
+        # Each job only ran once
+        with open(runs,'rt') as fp:
+            self.assertEqual(fp.read().split(),['1','2'])
+
+    def test_pipelinerunner_uses_run_many(self):
+        """PipelineRunner: submits other jobs together via 'run_many'
+        """
+        runner = GEJobRunner()
+        # Record calls to the runner's 'run_many' method
+        run_many_calls = []
+        run_many = runner.run_many
+        def record_run_many(jobs):
+            run_many_calls.append(len(jobs))
+            return run_many(jobs)
+        runner.run_many = record_run_many
+        pr = PipelineRunner(runner,max_concurrent_jobs=5,poll_interval=1)
+        for i in range(3):
+            pr.queueJob(self.working_dir,'/bin/bash',('-c','exit %d' % i),
+                        label=str(i))
+        pr.queueJob(self.working_dir,'/bin/true',(),label='3')
+        pr.queueJob(self.working_dir,'/bin/false',(),label='4')
+        pr.run(blocking=True)
+        self.assertEqual(run_many_calls,[2])
+        self.assertEqual(pr.nCompleted(),5)
+        jobs = dict([(job.label,job) for job in pr.completed])
+        for i in range(3):
+            self.assertEqual(jobs[str(i)].exit_status,i)
+        self.assertEqual(jobs['3'].exit_status,0)
+        self.assertNotEqual(jobs['4'].exit_status,0)
+
+    def test_pipelinerunner_packs_jobs(self):
+        """PipelineRunner: packs jobs together via 'run_pack'
+        """
+        runner = GEJobRunner()
+        # Record calls to the runner's 'run_pack' method
+        run_pack_calls = []
+        run_pack = runner.run_pack
+        def record_run_pack(name,jobs,nparallel=1):
+            run_pack_calls.append((len(jobs),nparallel))
+            return run_pack(name,jobs,nparallel=nparallel)
+        runner.run_pack = record_run_pack
+        pr = PipelineRunner(runner,max_concurrent_jobs=2,poll_interval=1,
+                            pack_size=3,pack_parallel=2)
+        max_running = []
+        def record_running(job):
+            max_running.append(pr.nRunning())
+        pr.handle_job_completion = record_running
+        for i in range(7):
+            pr.queueJob(self.working_dir,'/bin/bash',
+                        ('-c','echo %d; exit %d' % (i,i%2)),label=str(i))
+        pr.run(blocking=True)
+        self.assertEqual(run_pack_calls,[(3,2),(3,2)])
+        # Packs count as single jobs (so more than two jobs
+        # were running at once)
+        self.assertTrue(max(max_running) > 2)
+        self.assertEqual(pr.nCompleted(),7)
+        jobs = dict([(job.label,job) for job in pr.completed])
+        pack_id = jobs['0'].job_id.split('-')[0]
+        for i in range(7):
+            job = jobs[str(i)]
+            if i < 3:
+                self.assertEqual(job.job_id,"%s-%d" % (pack_id,i+1))
+            self.assertEqual(job.exit_status,i%2)
+            with open(job.log,'rt') as fp:
+                self.assertEqual(fp.read(),"%d\n" % i)
+        self.assertFalse('-' in jobs['6'].job_id)
+
+    def test_pipelinerunner_resume_restores_runner_settings(self):
+        """PipelineRunner: resumed pipeline recreates runner with same settings
+        """
+        state_file = os.path.join(self.working_dir,'pipeline.state')
+        runner = GEJobRunner(queue='long.q',qacct=True,poll_interval=2.0,
+                             ge_extra_args=['-l','h_rt=1:00:00'])
+        pr = PipelineRunner(runner,state_file=state_file)
+        pr.run(blocking=False)
+        pr = PipelineRunner.resume(state_file)
+        self.assertTrue(isinstance(pr.runner,GEJobRunner))
+        self.assertEqual(pr.runner.settings(),runner.settings())
+        self.assertEqual(pr.runner.settings()['queue'],'long.q')
+        self.assertEqual(pr.runner.ge_extra_args,['-l','h_rt=1:00:00'])
+
 #######################################################################
 # Main program
 #######################################################################
@@ -0,0 +1,231 @@
+#######################################################################
+# Tests for gzipcheck.py module
+#######################################################################
+import unittest
+import os
+import io
+import gzip
+import tempfile
+import shutil
+import bcftbx.gzipcheck
+from bcftbx.gzipcheck import *
+from bcftbx.IlluminaData import IlluminaData
+from bcftbx.mock import MockIlluminaData
+
+fastq_data = b"""@K00311:43:HL3LWBBXX:8:1101:21440:1121 1:N:0:CNATGT
+GCCNGACAGCAGAAAT
++
+AAF#FJJJJJJJJJJJ
+@K00311:43:HL3LWBBXX:8:1101:21460:1121 1:N:0:CNATGT
+GGGNGTCATTGATCAT
++
+AAF#FJJJJJJJJJJJ
+"""
+
+class TestCheckGzip(unittest.TestCase):
+    """Tests for the 'check_gzip' function
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def _make_gzip(self,name,members):
+        # Create gzip file with one member for each item in 'members'
+        filen = os.path.join(self.wd,name)
+        with io.open(filen,'wb') as fp:
+            for data in members:
+                with gzip.GzipFile(fileobj=fp,mode='wb') as gz:
+                    gz.write(data)
+        return filen
+    def test_check_gzip_ok(self):
+        """check_gzip: valid gzip file passes
+        """
+        filen = self._make_gzip("test.fastq.gz",(fastq_data,))
+        result = check_gzip(filen)
+        self.assertEqual(result.status,GzipCheckResult.OK)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.members,1)
+        self.assertEqual(result.size,len(fastq_data))
+        self.assertEqual(result.nlines,None)
+        self.assertEqual(result.error,None)
+    def test_check_gzip_multiple_members(self):
+        """check_gzip: valid multi-member gzip file passes
+        """
+        filen = self._make_gzip("test.fastq.gz",(fastq_data,fastq_data))
+        result = check_gzip(filen,check_lines=True,blocksize=16)
+        self.assertEqual(result.status,GzipCheckResult.OK)
+        self.assertEqual(result.members,2)
+        self.assertEqual(result.size,2*len(fastq_data))
+        self.assertEqual(result.nlines,16)
+    def test_check_gzip_bad_line_count(self):
+        """check_gzip: fails when line count is not a multiple of 4
+        """
+        filen = self._make_gzip("test.fastq.gz",
+                                (fastq_data.rstrip(b'\n').rsplit(b'\n',1)[0],))
+        self.assertEqual(check_gzip(filen).status,GzipCheckResult.OK)
+        result = check_gzip(filen,check_lines=True)
+        self.assertEqual(result.status,GzipCheckResult.FAILED)
+        self.assertEqual(result.nlines,7)
+    def test_check_gzip_bad_crc(self):
+        """check_gzip: fails when CRC doesn't match
+        """
+        filen = self._make_gzip("test.fastq.gz",(fastq_data,))
+        with io.open(filen,'r+b') as fp:
+            fp.seek(-8,os.SEEK_END)
+            crc = fp.read(1)
+            fp.seek(-8,os.SEEK_END)
+            fp.write(bytes(bytearray([ord(crc) ^ 0xff])))
+        result = check_gzip(filen)
+        self.assertEqual(result.status,GzipCheckResult.FAILED)
+        self.assertTrue(result.error.startswith("CRC check failed"))
+    def test_check_gzip_bad_isize(self):
+        """check_gzip: fails when ISIZE doesn't match
+        """
+        filen = self._make_gzip("test.fastq.gz",(fastq_data,))
+        with io.open(filen,'r+b') as fp:
+            fp.seek(-4,os.SEEK_END)
+            fp.write(b'\0\0\0\0')
+        result = check_gzip(filen)
+        self.assertEqual(result.status,GzipCheckResult.FAILED)
+        self.assertTrue(result.error.startswith("ISIZE check failed"))
+    def test_check_gzip_truncated(self):
+        """check_gzip: fails for truncated file
+        """
+        filen = self._make_gzip("test.fastq.gz",(fastq_data,))
+        with io.open(filen,'r+b') as fp:
+            fp.truncate(os.path.getsize(filen)-12)
+        result = check_gzip(filen)
+        self.assertEqual(result.status,GzipCheckResult.FAILED)
+        self.assertTrue(result.error.startswith("unexpected end of file"))
+    def test_check_gzip_trailing_garbage(self):
+        """check_gzip: fails for trailing garbage but allows zero padding
+        """
+        filen = self._make_gzip("test.fastq.gz",(fastq_data,))
+        with io.open(filen,'ab') as fp:
+            fp.write(b'\0'*100)
+        self.assertEqual(check_gzip(filen).status,GzipCheckResult.OK)
+        with io.open(filen,'ab') as fp:
+            fp.write(b'garbage')
+        self.assertEqual(check_gzip(filen).status,GzipCheckResult.FAILED)
+    def test_check_gzip_not_gzipped(self):
+        """check_gzip: fails for file which is not gzipped
+        """
+        filen = os.path.join(self.wd,"test.fastq")
+        with io.open(filen,'wb') as fp:
+            fp.write(fastq_data)
+        result = check_gzip(filen)
+        self.assertEqual(result.status,GzipCheckResult.FAILED)
+        self.assertEqual(result.error,"not a gzipped file")
+    def test_check_gzip_missing_file(self):
+        """check_gzip: fails for missing file
+        """
+        result = check_gzip(os.path.join(self.wd,"missing.fastq.gz"))
+        self.assertEqual(result.status,GzipCheckResult.FAILED)
+
+class TestCheckGzipFiles(unittest.TestCase):
+    """Tests for the 'check_gzip_files' function and GzipCheckRecord
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.files = []
+        for i in range(4):
+            filen = os.path.join(self.wd,"test%d.fastq.gz" % i)
+            with gzip.open(filen,'wb') as fp:
+                fp.write(fastq_data)
+            self.files.append(filen)
+        self.bad_file = os.path.join(self.wd,"bad.fastq.gz")
+        with io.open(self.bad_file,'wb') as fp:
+            fp.write(b"Not gzipped")
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_check_gzip_files(self):
+        """check_gzip_files: checks all files using multiple processes
+        """
+        results = dict([(r.filen,r.status)
+                        for r in check_gzip_files(self.files+[self.bad_file],
+                                                  nprocs=2)])
+        self.assertEqual(len(results),5)
+        for filen in self.files:
+            self.assertEqual(results[filen],GzipCheckResult.OK)
+        self.assertEqual(results[self.bad_file],GzipCheckResult.FAILED)
+    def test_check_gzip_files_skips_validated_files(self):
+        """check_gzip_files: skips files which were previously validated
+        """
+        record_file = os.path.join(self.wd,"record.txt")
+        with GzipCheckRecord(record_file) as record:
+            results = [r.status for r in
+                       check_gzip_files(self.files+[self.bad_file],
+                                        record=record)]
+        self.assertEqual(results.count(GzipCheckResult.OK),4)
+        self.assertEqual(results.count(GzipCheckResult.FAILED),1)
+        # Modify one of the files
+        with gzip.open(self.files[0],'wb') as fp:
+            fp.write(fastq_data+fastq_data)
+        os.utime(self.files[0],(1500000000,1500000000))
+        # Rerun using the saved record
+        with GzipCheckRecord(record_file) as record:
+            results = dict([(r.filen,r.status)
+                            for r in check_gzip_files(
+                                    self.files+[self.bad_file],
+                                    record=record)])
+        self.assertEqual(results[self.files[0]],GzipCheckResult.OK)
+        for filen in self.files[1:]:
+            self.assertEqual(results[filen],GzipCheckResult.SKIPPED)
+        self.assertEqual(results[self.bad_file],GzipCheckResult.FAILED)
+    def test_check_gzip_files_doesnt_record_files_modified_during_check(self):
+        """check_gzip_files: doesn't record files modified during the check
+        """
+        record_file = os.path.join(self.wd,"record.txt")
+        # Modify one of the files while it is being checked
+        check_gzip = bcftbx.gzipcheck.check_gzip
+        def modifying_check_gzip(filen,**kws):
+            result = check_gzip(filen,**kws)
+            if filen == self.files[0]:
+                with gzip.open(filen,'wb') as fp:
+                    fp.write(fastq_data+fastq_data)
+                os.utime(filen,(1500000000,1500000000))
+            return result
+        bcftbx.gzipcheck.check_gzip = modifying_check_gzip
+        try:
+            with GzipCheckRecord(record_file) as record:
+                results = [r.status for r in
+                           check_gzip_files(self.files,record=record)]
+        finally:
+            bcftbx.gzipcheck.check_gzip = check_gzip
+        self.assertEqual(results.count(GzipCheckResult.OK),4)
+        # Rerun: only the modified file should be checked again
+        with GzipCheckRecord(record_file) as record:
+            results = dict([(r.filen,r.status)
+                            for r in check_gzip_files(self.files,
+                                                      record=record)])
+        self.assertEqual(results[self.files[0]],GzipCheckResult.OK)
+        for filen in self.files[1:]:
+            self.assertEqual(results[filen],GzipCheckResult.SKIPPED)
+
+class TestListFastqs(unittest.TestCase):
+    """Tests for the 'list_fastqs' function
+    """
+    def setUp(self):
+        self.top_dir = tempfile.mkdtemp()
+        self.mock_illumina_data = MockIlluminaData('test.MockIlluminaData',
+                                                   'casava',
+                                                   paired_end=True,
+                                                   top_dir=self.top_dir)
+        self.mock_illumina_data.add_fastq_batch('AB','AB1','AB1_GCCAAT',
+                                                lanes=(1,))
+        self.mock_illumina_data.add_fastq_batch('AB','AB2','AB2_AGTCAA',
+                                                lanes=(1,))
+        self.mock_illumina_data.add_undetermined()
+        self.mock_illumina_data.create()
+    def tearDown(self):
+        shutil.rmtree(self.top_dir)
+    def test_list_fastqs(self):
+        """list_fastqs: returns all fastqs including undetermined
+        """
+        illumina_data = IlluminaData(self.mock_illumina_data.dirn)
+        fastqs = list_fastqs(illumina_data)
+        self.assertEqual(len(fastqs),6)
+        for fq in fastqs:
+            self.assertTrue(os.path.isfile(fq))
+        for result in check_gzip_files(fastqs,check_lines=True):
+            self.assertEqual(result.status,GzipCheckResult.OK)
@@ -0,0 +1,164 @@
+#######################################################################
+# Tests for mockGE.py module
+#######################################################################
+from bcftbx.mockGE import MockGE
+from bcftbx.mockGE import setup_mock_GE
+from bcftbx.JobRunner import GEJobRunner
+import unittest
+import io
+import os
+import time
+import tempfile
+import shutil
+import atexit
+
+class TestMockGE(unittest.TestCase):
+
+    def setUp(self):
+        # Create a temporary directory to work in
+        self.working_dir = tempfile.mkdtemp()
+        self.database_dir = os.path.join(self.working_dir,"mockGE")
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def states(self,mock_ge):
+        # Return the states of all the jobs
+        cu = mock_ge._cx.cursor()
+        cu.execute("SELECT id,state FROM jobs ORDER BY id")
+        return [job['state'] for job in cu.fetchall()]
+
+    def test_mockge_uses_wal_mode(self):
+        """MockGE: database uses write-ahead logging
+        """
+        mock_ge = MockGE(database_dir=self.database_dir)
+        cu = mock_ge._cx.cursor()
+        cu.execute("PRAGMA journal_mode")
+        self.assertEqual(cu.fetchone()[0],"wal")
+        mock_ge.stop()
+
+    def test_mockge_run_array_job(self):
+        """MockGE: run array job tasks up to the maximum number of jobs
+        """
+        mock_ge = MockGE(database_dir=self.database_dir,max_jobs=2)
+        mock_ge.qsub(['-b','y','-N','test','-wd',self.working_dir,
+                      '-t','1-3','sleep','0.1'])
+        self.assertEqual(self.states(mock_ge),['r','r','qw'])
+        timeout = time.time() + 10.0
+        while self.states(mock_ge) != ['c','c','c']:
+            self.assertTrue(time.time() < timeout)
+            time.sleep(0.1)
+            mock_ge.update_jobs()
+        self.assertEqual(mock_ge._job_info(3)['exit_code'],0)
+        mock_ge.stop()
+
+    def test_mockge_advance_needs_virtual_clock(self):
+        """MockGE: 'advance' raises exception without simulated clock
+        """
+        mock_ge = MockGE(database_dir=self.database_dir)
+        self.assertRaises(Exception,mock_ge.advance)
+        mock_ge.stop()
+
+    def test_mockge_virtual_clock(self):
+        """MockGE: run jobs using a simulated clock
+        """
+        durations = dict(short=10.0,long=100.0)
+        mock_ge = MockGE(database_dir=self.database_dir,max_jobs=1,
+                         qacct_delay=5.0,virtual_clock=True,
+                         job_duration=lambda name,cmd: durations[name])
+        start = mock_ge._time()
+        mock_ge.qsub(['-b','y','-N','long','-wd',self.working_dir,
+                      'echo','hello'])
+        mock_ge.qsub(['-b','y','-N','short','-wd',self.working_dir,
+                      'exit','1'])
+        self.assertEqual(self.states(mock_ge),['r','qw'])
+        # Clock doesn't move unless advanced
+        mock_ge.update_jobs()
+        self.assertEqual(mock_ge._time(),start)
+        self.assertEqual(self.states(mock_ge),['r','qw'])
+        # Move to end of first job
+        self.assertEqual(mock_ge.advance(),start+100.0)
+        self.assertEqual(self.states(mock_ge),['c','r'])
+        with io.open(os.path.join(self.working_dir,"long.o1"),'rt') as fp:
+            self.assertEqual(fp.read(),"hello\n")
+        # Move part way through second job
+        self.assertEqual(mock_ge.advance(5.0),start+105.0)
+        self.assertEqual(self.states(mock_ge),['c','r'])
+        # Move to end of second job
+        self.assertEqual(mock_ge.advance(),start+110.0)
+        self.assertEqual(self.states(mock_ge),['c','c'])
+        job_info = mock_ge._job_info(2)
+        self.assertEqual(job_info['exit_code'],1)
+        self.assertEqual(job_info['start_time'],start+100.0)
+        self.assertEqual(job_info['end_time'],start+110.0)
+        # No more events
+        self.assertEqual(mock_ge.advance(),start+110.0)
+        mock_ge.stop()
+
+    def test_mockge_virtual_clock_is_shared(self):
+        """MockGE: simulated clock is shared with other instances
+        """
+        mock_ge = MockGE(database_dir=self.database_dir,
+                         virtual_clock=True,job_duration=60.0)
+        mock_ge.advance(3600.0)
+        mock_ge2 = MockGE(database_dir=self.database_dir)
+        self.assertEqual(mock_ge2._time(),mock_ge._time())
+        # Other instance doesn't start jobs
+        mock_ge2.qsub(['-b','y','-N','test','-wd',self.working_dir,
+                       'true'])
+        self.assertEqual(self.states(mock_ge),['t'])
+        mock_ge.update_jobs()
+        self.assertEqual(self.states(mock_ge),['r'])
+        # Deleting the job
+        mock_ge2.qdel(['1'])
+        mock_ge.advance(1.0)
+        self.assertEqual(self.states(mock_ge),['c'])
+        self.assertEqual(mock_ge._job_info(1)['end_time'],
+                         mock_ge._time())
+        mock_ge2.stop()
+        mock_ge.stop()
+
+class TestMockGEWithGEJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        # Work in a temporary directory (so that the runner's
+        # admin directory is created there)
+        self.cwd = os.getcwd()
+        self.top_dir = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree,self.top_dir,True)
+        os.chdir(self.top_dir)
+        # Set up mockGE utilities
+        self.database_dir = tempfile.mkdtemp(dir=self.top_dir)
+        self.bin_dir = tempfile.mkdtemp(dir=self.top_dir)
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.old_path
+        setup_mock_GE(bindir=self.bin_dir,
+                      database_dir=self.database_dir)
+        self.working_dir = tempfile.mkdtemp(dir=self.top_dir)
+
+    def tearDown(self):
+        os.environ['PATH'] = self.old_path
+        os.chdir(self.cwd)
+
+    def test_ge_job_runner_with_virtual_clock(self):
+        """MockGE: run GEJobRunner jobs using a simulated clock
+        """
+        mock_ge = MockGE(database_dir=self.database_dir,max_jobs=2,
+                         virtual_clock=True,job_duration=3600.0)
+        runner = GEJobRunner(poll_interval=0.1)
+        job_ids = [runner.run('test',self.working_dir,'/bin/bash',
+                              ('-c','exit %d' % i))
+                   for i in range(4)]
+        # Nothing finishes until the clock is moved on
+        mock_ge.update_jobs()
+        self.assertFalse(runner.wait_for_completion(0.5))
+        start = mock_ge._time()
+        self.assertEqual(mock_ge.advance(),start+3600.0)
+        self.assertEqual(mock_ge.advance(),start+7200.0)
+        timeout = time.time() + 10.0
+        while runner.list():
+            self.assertTrue(time.time() < timeout)
+            runner.wait_for_completion(0.5)
+        self.assertEqual([runner.exit_status(job_id)
+                          for job_id in job_ids],[0,1,2,3])
+        mock_ge.stop()
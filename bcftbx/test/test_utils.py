@@ -477,6 +477,100 @@ class TestUserAndGroupNameFunctions(unittest.TestCase):
         self.assertEqual(get_group_from_gid('root'),None)
         self.assertEqual(get_gid_from_group('0'),None)
 
+class TestScanTreeFunction(unittest.TestCase):
+    """Unit tests for the 'scan_tree' function
+
+    """
+    def setUp(self):
+        # Make a test data directory structure
+        self.example_dir = mock_data.ExampleDirLanguages()
+        self.wd = self.example_dir.create_directory()
+
+    def tearDown(self):
+        # Remove the test data directory
+        self.example_dir.delete_directory()
+
+    def test_scan_tree(self):
+        """'scan_tree' yields all files, directories and links
+        """
+        filelist = self.example_dir.filelist(include_dirs=True)
+        self.assertEqual(sorted([e.path for e in scan_tree(self.wd)]),
+                         filelist)
+
+    def test_scan_tree_multiple_threads(self):
+        """'scan_tree' yields all items when using multiple threads
+        """
+        filelist = self.example_dir.filelist(include_dirs=True)
+        self.assertEqual(sorted([e.path for e in scan_tree(self.wd,
+                                                           nthreads=4)]),
+                         filelist)
+
+    def test_scan_tree_ignore_links(self):
+        """'scan_tree' ignores links with IGNORE_LINKS
+        """
+        filelist = self.example_dir.filelist(include_links=False,
+                                             include_dirs=True)
+        self.assertEqual(sorted([e.path for e in
+                                 scan_tree(self.wd,links=IGNORE_LINKS)]),
+                         filelist)
+
+    def test_scan_tree_follow_links(self):
+        """'scan_tree' traverses linked directories with FOLLOW_LINKS
+        """
+        # Link to a directory outside the example directory
+        extra_dir = tempfile.mkdtemp()
+        try:
+            mock_data.TestUtils.make_file("extra","Extra!",basedir=extra_dir)
+            self.example_dir.add_link("elsewhere",extra_dir)
+            # Loop back to the top level
+            self.example_dir.add_link("spanish/loop","..")
+            filelist = self.example_dir.filelist(include_dirs=True)
+            self.assertEqual(sorted([e.path for e in scan_tree(self.wd)]),
+                             filelist)
+            filelist.append(os.path.join(self.wd,"elsewhere","extra"))
+            filelist.sort()
+            self.assertEqual(sorted([e.path for e in
+                                     scan_tree(self.wd,
+                                               links=FOLLOW_LINKS)]),
+                             filelist)
+        finally:
+            shutil.rmtree(extra_dir)
+
+    def test_scan_tree_pattern(self):
+        """'scan_tree' only yields items matching pattern
+        """
+        self.assertEqual(sorted([e.path for e in
+                                 scan_tree(self.wd,pattern=".*/spanish/")]),
+                         [os.path.join(self.wd,"spanish","adios"),
+                          os.path.join(self.wd,"spanish","hola")])
+
+class TestListDirEntriesFunction(unittest.TestCase):
+    """Unit tests for the 'list_dir_entries' function
+
+    """
+    def setUp(self):
+        # Make a test data directory structure
+        self.example_dir = mock_data.ExampleDirLanguages()
+        self.wd = self.example_dir.create_directory()
+
+    def tearDown(self):
+        # Remove the test data directory
+        self.example_dir.delete_directory()
+
+    def test_list_dir_entries(self):
+        """'list_dir_entries' returns entries for a single directory
+        """
+        entries = list_dir_entries(os.path.join(self.wd,"spanish"))
+        self.assertEqual(sorted([e.name for e in entries]),
+                         ["adios","hola"])
+        self.assertTrue(all([e.is_file() for e in entries]))
+
+    def test_list_dir_entries_missing_directory(self):
+        """'list_dir_entries' returns empty list for missing directory
+        """
+        self.assertEqual(list_dir_entries(os.path.join(self.wd,"missing")),
+                         [])
+
 class TestWalkFunction(unittest.TestCase):
     """Unit tests for the 'walk' function
 
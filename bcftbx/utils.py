@@ -41,6 +41,8 @@ File system wrappers and utilities:
   get_group_from_gid
   get_gid_from_group
   get_hostname
+  scan_tree
+  list_dir_entries
   walk
   list_dirs
   strip_ext
@@ -92,11 +94,22 @@ import datetime
 import re
 import socket
 from builtins import range
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    # Python 2: use backport
+    from scandir import scandir
 
 #######################################################################
 # Module constants
 #######################################################################
 
+# Symlink handling options for directory traversal
+FOLLOW_LINKS = 0
+IGNORE_LINKS = 1
+NOFOLLOW_LINKS = 2
+
 # Default size of data to read from file
 CHUNKSIZE = 102400
 
@@ -863,11 +876,134 @@ def get_hostname():
     """
     return socket.getfqdn()
 
+def scan_tree(dirn,links=NOFOLLOW_LINKS,pattern=None,nthreads=1):
+    """Traverse a directory and yield 'DirEntry' objects
+
+    Recursively traverses the directory structure under
+    'dirn' using 'os.scandir', and yields a 'DirEntry'
+    object for each file, directory and symbolic link that
+    is found (the top-level directory itself is not
+    included).
+
+    The 'DirEntry' objects cache the file type information
+    returned when the directory is listed, so callers can
+    use the 'is_dir', 'is_file' and 'is_symlink' methods
+    without additional system calls (which can be expensive
+    on network file systems).
+
+    How symbolic links are handled depends on the setting
+    of the 'links' option:
+
+    NOFOLLOW_LINKS: (default) links are yielded but links
+                    to directories are not traversed (same
+                    as 'os.walk')
+    FOLLOW_LINKS:   links are yielded and links to
+                    directories are also traversed (loops
+                    are detected and not traversed again)
+    IGNORE_LINKS:   links are neither yielded nor traversed
+
+    If 'nthreads' is greater than one then subdirectories
+    are listed in parallel using a pool of threads; in this
+    case the directory structure is traversed breadth-first,
+    rather than depth-first.
+
+    Arguments:
+      dirn: top-level directory to start traversal from
+      links: specify how symbolic links are handled
+      pattern: if not None then specifies a regular expression
+        pattern; only entries where the full path matches the
+        pattern are yielded (all subdirectories are still
+        traversed)
+      nthreads: number of threads to use for listing
+        directories (default: 1)
+
+    Returns:
+      Yields a 'DirEntry' instance for each item found under
+      'dirn'.
+    """
+    matcher = None
+    if pattern is not None:
+        matcher = re.compile(pattern)
+    visited = set()
+    if links == FOLLOW_LINKS:
+        st = os.stat(dirn)
+        visited.add((st.st_dev,st.st_ino))
+    def process(entries):
+        # Yields entries to be returned and updates
+        # the list of subdirectories to be traversed
+        for entry in entries:
+            if entry.is_symlink():
+                if links == IGNORE_LINKS:
+                    continue
+                if links == FOLLOW_LINKS and entry.is_dir():
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        pass
+                    else:
+                        if (st.st_dev,st.st_ino) not in visited:
+                            visited.add((st.st_dev,st.st_ino))
+                            subdirs.append(entry.path)
+            elif entry.is_dir():
+                if links == FOLLOW_LINKS:
+                    st = entry.stat()
+                    visited.add((st.st_dev,st.st_ino))
+                subdirs.append(entry.path)
+            if matcher is None or matcher.match(entry.path):
+                yield entry
+    if nthreads > 1:
+        # Breadth-first traversal, listing directories
+        # at each level in parallel
+        pool = ThreadPool(nthreads)
+        try:
+            level = [dirn]
+            while level:
+                subdirs = []
+                for entries in pool.imap(list_dir_entries,level):
+                    for entry in process(entries):
+                        yield entry
+                level = subdirs
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        # Depth-first traversal
+        stack = [dirn]
+        while stack:
+            subdirs = []
+            for entry in process(list_dir_entries(stack.pop())):
+                yield entry
+            stack.extend(subdirs[::-1])
+
+def list_dir_entries(dirn):
+    """Return list of 'DirEntry' objects for a directory
+
+    Lists the contents of a single directory using 'scandir'
+    (so file types are available from the 'DirEntry' objects
+    without additional calls to 'stat').
+
+    Errors listing the directory are logged and an empty
+    list is returned (consistent with 'os.walk').
+
+    Arguments:
+      dirn: directory to list
+
+    Returns:
+      List of 'DirEntry' instances for the entries in 'dirn'
+      (in arbitrary order).
+    """
+    try:
+        return list(scandir(dirn))
+    except OSError as ex:
+        logging.debug("%s: unable to list directory: %s" % (dirn,ex))
+        return []
+
 def walk(dirn,include_dirs=True,pattern=None):
     """Traverse the directory, subdirectories and files
 
     Essentially this 'walk' function is a convenience wrapper
-    for the 'os.walk' function.
+    for the 'scan_tree' function. Symbolic links are yielded but
+    links to directories are not traversed.
 
     Arguments:
       dirn: top-level directory to start traversal from
@@ -879,21 +1015,12 @@ def walk(dirn,include_dirs=True,pattern=None):
         pattern
         
     """
-    if pattern is not None:
-        matcher = re.compile(pattern)
     if include_dirs:
-        if pattern is None or matcher.match(dirn):
+        if pattern is None or re.match(pattern,dirn):
             yield dirn
-    for dirpath,dirnames,filenames in os.walk(dirn):
-        if include_dirs:
-            for d in dirnames:
-                d1 = os.path.join(dirpath,d)
-                if pattern is None or matcher.match(d1):
-                    yield d1
-        for f in filenames:
-            f1 = os.path.join(dirpath,f)
-            if pattern is None or matcher.match(f1):
-                yield f1
+    for entry in scan_tree(dirn,pattern=pattern):
+        if include_dirs or not entry.is_dir():
+            yield entry.path
 
 def list_dirs(parent,matches=None,startswith=None):
     """Return list of subdirectories relative to 'parent'
@@ -1072,17 +1199,11 @@ def links(dirn):
       Yields the name and full path for each symbolic link under 'dirn'.
 
     """
-    for d in os.walk(dirn):
-        if os.path.islink(d[0]):
-            yield d[0]
-        for sd in d[1]:
-            path = os.path.join(d[0],sd)
-            if os.path.islink(path):
-                yield path
-        for f in d[2]:
-            path = os.path.join(d[0],f)
-            if os.path.islink(path):
-                yield path
+    if os.path.islink(dirn):
+        yield dirn
+    for entry in scan_tree(dirn):
+        if entry.is_symlink():
+            yield entry.path
 
 #######################################################################
 # Sample/library name utilities
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+#
+#     ge_journal_benchmark.py: compare GEJobRunner admin layouts
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# ge_journal_benchmark.py
+#
+#########################################################################
+
+"""ge_journal_benchmark.py
+
+Compares the job throughput and filesystem operation counts for
+'GEJobRunner' when using the default per-job admin directories
+against using the append-only job journal, with the mock Grid
+Engine from 'bcftbx.mockGE'.
+
+For each layout the requested number of jobs (each running
+'true') are submitted via the runner, then the mock Grid Engine
+is updated and the runner's job list refreshed until all the
+jobs have been finalized. The time taken and the number of
+filesystem operations made by the runner are reported for the
+submission and completion phases separately.
+
+Operations performed by the jobs themselves are not counted: for
+the per-job directories each job writes three files and renames
+one of them, whereas using the journal each job makes a single
+append to the journal file.
+
+As for 'ge_poll_benchmark.py', 'qsub' is handled by an in-process
+'MockGE' instance so that process start up doesn't dominate the
+submission times.
+"""
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import sys
+import io
+import time
+import tempfile
+import shutil
+import subprocess
+import argparse
+import atexit
+import logging
+logging.basicConfig(format="%(levelname)s %(message)s")
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+import bcftbx.JobRunner
+from bcftbx.JobRunner import GEJobRunner
+from bcftbx.mockGE import MockGE
+from bcftbx.mockGE import setup_mock_GE
+from ge_poll_benchmark import OpCounter
+from ge_poll_benchmark import InProcessQsub
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Layouts to compare
+LAYOUTS = ('dirs','journal')
+
+#######################################################################
+# Functions
+#######################################################################
+
+def count_fs_ops(counter):
+    """Wrap filesystem operations used by GEJobRunner
+
+    Arguments:
+      counter (OpCounter): counter to wrap the operations
+        with
+    """
+    for name in ('mkdir','open','chmod','rename','remove'):
+        counter.wrap(os,name)
+    counter.wrap(os.path,'exists')
+    counter.wrap(io,'open',label='io.open')
+    counter.wrap(shutil,'rmtree')
+    counter.wrap(bcftbx.JobRunner,'scandir')
+
+def benchmark(njobs,working_dir,journal=False,timeout=600.0):
+    """Submit jobs and time how long it takes for them to finish
+
+    Arguments:
+      njobs (int): number of jobs to submit
+      working_dir (str): directory to run in
+      journal (bool): if True then use the job journal
+      timeout (float): maximum time in seconds to wait for
+        the jobs to finish
+
+    Returns:
+      Dictionary with the submission and completion times
+      and filesystem operation counts.
+    """
+    database_dir = os.path.join(working_dir,"mockGE")
+    bin_dir = os.path.join(working_dir,"bin")
+    os.mkdir(bin_dir)
+    setup_mock_GE(bindir=bin_dir,database_dir=database_dir)
+    path = os.environ['PATH']
+    os.environ['PATH'] = bin_dir + os.pathsep + path
+    # Use an in-process MockGE for submission and for
+    # running the jobs
+    mock_ge = MockGE(database_dir=database_dir,max_jobs=njobs)
+    mock_ge._cx.execute("PRAGMA synchronous=OFF")
+    update_jobs = mock_ge.update_jobs
+    mock_ge.update_jobs = lambda: None
+    runner = GEJobRunner(journal=journal)
+    counter = OpCounter()
+    results = dict(njobs=njobs)
+    try:
+        # Submit the jobs
+        popen = subprocess.Popen
+        bcftbx.JobRunner.subprocess.Popen = InProcessQsub(mock_ge)
+        count_fs_ops(counter)
+        try:
+            start = time.time()
+            job_ids = [runner.run("job%d" % i,working_dir,"true",())
+                       for i in range(njobs)]
+            results['submit_time'] = time.time() - start
+            results['submit_ops'] = sum(counter.counts.values())
+        finally:
+            counter.restore()
+            bcftbx.JobRunner.subprocess.Popen = popen
+        # Run the jobs and wait for them to be finalized
+        start = time.time()
+        ops = 0
+        while True:
+            update_jobs()
+            count_fs_ops(counter)
+            try:
+                running = runner.list()
+            finally:
+                ops += sum(counter.counts.values())
+                counter.restore()
+            if not running:
+                break
+            if (time.time() - start) > timeout:
+                logging.error("Timed out waiting for jobs to finish")
+                break
+            time.sleep(0.1)
+        results['complete_time'] = time.time() - start
+        results['complete_ops'] = ops
+        results['failed'] = len([j for j in job_ids
+                                 if runner.exit_status(j) != 0])
+    finally:
+        mock_ge.stop()
+        os.environ['PATH'] = path
+    return results
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        description="Compare job throughput and filesystem "
+        "operations for GEJobRunner using per-job admin directories "
+        "and the job journal, for each number of jobs N")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('njobs',metavar="N",type=int,nargs='*',
+                   default=[100,500],
+                   help="numbers of jobs to benchmark (default: "
+                   "100 500)")
+    args = p.parse_args()
+    # Top level working directory (registered before any
+    # runners are created, so it is removed after their
+    # admin directories)
+    top_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree,top_dir)
+    # Run the benchmarks
+    cwd = os.getcwd()
+    print("#jobs\tlayout\tsubmit(s)\tsubmit_ops\tcomplete(s)\t"
+          "complete_ops\tjobs/s\tfailed")
+    for njobs in args.njobs:
+        for layout in LAYOUTS:
+            working_dir = os.path.join(top_dir,"%s.%s" % (njobs,layout))
+            os.mkdir(working_dir)
+            os.chdir(working_dir)
+            try:
+                results = benchmark(njobs,working_dir,
+                                    journal=(layout == 'journal'))
+            finally:
+                os.chdir(cwd)
+            total_time = results['submit_time'] + results['complete_time']
+            print("%d\t%s\t%.2f\t%d\t%.2f\t%d\t%.1f\t%d" %
+                  (results['njobs'],
+                   layout,
+                   results['submit_time'],
+                   results['submit_ops'],
+                   results['complete_time'],
+                   results['complete_ops'],
+                   results['njobs']/total_time,
+                   results['failed']))
+            sys.stdout.flush()
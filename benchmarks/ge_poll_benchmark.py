@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+#
+#     ge_poll_benchmark.py: measure GEJobRunner polling costs
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# ge_poll_benchmark.py
+#
+#########################################################################
+
+"""ge_poll_benchmark.py
+
+Measures the cost of polling the status of large numbers of jobs
+with 'GEJobRunner', using the mock Grid Engine from 'bcftbx.mockGE'.
+
+For each requested number of jobs, the jobs are submitted via the
+runner and then a poll cycle similar to that performed by
+'PipelineRunner.update' is timed: the job list is refreshed, then
+'isRunning' and 'errorState' are checked for each job. The number
+of filesystem metadata operations and 'qstat' invocations made
+during the cycle are also reported.
+
+Submitting tens of thousands of jobs via the mock 'qsub' executable
+would be dominated by process start up, so 'qsub' is handled by an
+in-process 'MockGE' instance instead; 'qstat' is run as the normal
+mock executable so its cost is included in the measurements.
+"""
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import sys
+import io
+import time
+import tempfile
+import shutil
+import subprocess
+import argparse
+import atexit
+import logging
+logging.basicConfig(format="%(levelname)s %(message)s")
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+import bcftbx.JobRunner
+from bcftbx.JobRunner import GEJobRunner
+from bcftbx.mockGE import MockGE
+from bcftbx.mockGE import setup_mock_GE
+
+#######################################################################
+# Classes
+#######################################################################
+
+class OpCounter(object):
+    """Count calls to selected functions
+
+    Wraps functions in modules so that the number of calls
+    made to each is recorded in the 'counts' dictionary;
+    'restore' puts back the original functions.
+    """
+    def __init__(self):
+        self.counts = {}
+        self._wrapped = []
+
+    def wrap(self,module,name,label=None,match=None):
+        """Wrap the function 'name' in 'module'
+
+        Arguments:
+          module: module (or object) holding the function
+          name (str): name of the function
+          label (str): label to count calls under
+            (defaults to 'name')
+          match (function): if supplied then only count
+            calls where 'match(*args)' returns True
+        """
+        if not hasattr(module,name):
+            return
+        f = getattr(module,name)
+        if label is None:
+            label = name
+        self.counts[label] = 0
+        def wrapper(*args,**kws):
+            if match is None or match(*args):
+                self.counts[label] += 1
+            return f(*args,**kws)
+        setattr(module,name,wrapper)
+        self._wrapped.append((module,name,f))
+
+    def reset(self):
+        """Reset all the counts to zero
+        """
+        for label in self.counts:
+            self.counts[label] = 0
+
+    def restore(self):
+        """Restore the original functions
+        """
+        for module,name,f in self._wrapped[::-1]:
+            setattr(module,name,f)
+        self._wrapped = []
+
+class InProcessQsub(object):
+    """Replacement for 'subprocess.Popen' handling 'qsub' in-process
+
+    Commands other than 'qsub' are passed to the real
+    'subprocess.Popen'.
+    """
+    def __init__(self,mock_ge):
+        self._mock_ge = mock_ge
+        self._popen = subprocess.Popen
+
+    def __call__(self,cmd,*args,**kws):
+        if cmd[0] != 'qsub':
+            return self._popen(cmd,*args,**kws)
+        return _QsubResult(self._mock_ge,cmd[1:])
+
+class _QsubResult(object):
+    """Internal: mimic a completed 'qsub' subprocess
+    """
+    def __init__(self,mock_ge,argv):
+        stdout = sys.stdout
+        sys.stdout = io.StringIO() if sys.version_info[0] > 2 \
+                     else io.BytesIO()
+        try:
+            mock_ge.qsub(argv)
+            self._stdout = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.returncode = 0
+
+    def communicate(self):
+        return (self._stdout,"")
+
+#######################################################################
+# Functions
+#######################################################################
+
+def benchmark(njobs,working_dir,ncycles=3):
+    """Submit jobs and time polling cycles
+
+    Arguments:
+      njobs (int): number of jobs to submit
+      working_dir (str): directory to run in
+      ncycles (int): number of poll cycles to time
+
+    Returns:
+      Dictionary with the submission time, and the
+      time, filesystem operation and 'qstat' counts
+      for the slowest poll cycle.
+
+    NB the mock 'qstat' starts a small number of the
+    jobs each time it is run, so a few of the jobs will
+    complete during the poll cycles.
+    """
+    database_dir = os.path.join(working_dir,"mockGE")
+    bin_dir = os.path.join(working_dir,"bin")
+    os.mkdir(bin_dir)
+    setup_mock_GE(bindir=bin_dir,database_dir=database_dir)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    # Use an in-process MockGE for submission and don't
+    # schedule jobs at this point
+    mock_ge = MockGE(database_dir=database_dir,max_jobs=0)
+    mock_ge._cx.execute("PRAGMA synchronous=OFF")
+    mock_ge.update_jobs = lambda: None
+    # Submit the jobs
+    runner = GEJobRunner()
+    popen = subprocess.Popen
+    bcftbx.JobRunner.subprocess.Popen = InProcessQsub(mock_ge)
+    try:
+        start = time.time()
+        for i in range(njobs):
+            runner.run("job%d" % i,working_dir,"true",())
+        submission_time = time.time() - start
+    finally:
+        bcftbx.JobRunner.subprocess.Popen = popen
+    # Put all the jobs into the 'qw' state
+    mock_ge._cx.execute("UPDATE jobs SET state='qw' WHERE state=='t'")
+    mock_ge._cx.commit()
+    # Wait for the grace period to expire
+    time.sleep(2.5)
+    # Count operations in the poll cycles
+    counter = OpCounter()
+    counter.wrap(os.path,'exists')
+    counter.wrap(os,'stat')
+    counter.wrap(os,'listdir')
+    counter.wrap(bcftbx.JobRunner,'scandir')
+    counter.wrap(subprocess,'Popen',label='qstat',
+                 match=lambda cmd,*args: cmd[0] == 'qstat')
+    results = dict(njobs=njobs,submission_time=submission_time,
+                   poll_time=0.0)
+    try:
+        for i in range(ncycles):
+            counter.reset()
+            start = time.time()
+            for job_id in runner.list():
+                if runner.isRunning(job_id):
+                    runner.errorState(job_id)
+            poll_time = time.time() - start
+            if poll_time > results['poll_time']:
+                results['poll_time'] = poll_time
+                results['fs_ops'] = sum([counter.counts[x]
+                                         for x in counter.counts
+                                         if x != 'qstat'])
+                results['qstat'] = counter.counts['qstat']
+            # Force the cached data to expire before the
+            # next cycle
+            time.sleep(2.5)
+    finally:
+        counter.restore()
+    mock_ge.stop()
+    return results
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        description="Measure the cost of polling GEJobRunner jobs "
+        "against the mock Grid Engine, for each number of jobs N")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-c','--cycles',action='store',dest='ncycles',
+                   type=int,default=3,
+                   help="number of poll cycles to time for each "
+                   "number of jobs; the slowest is reported "
+                   "(default: 3)")
+    p.add_argument('njobs',metavar="N",type=int,nargs='*',
+                   default=[1000,10000,50000],
+                   help="numbers of jobs to benchmark (default: "
+                   "1000 10000 50000)")
+    args = p.parse_args()
+    # Top level working directory (registered before any
+    # runners are created, so it is removed after their
+    # admin directories)
+    top_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree,top_dir)
+    # Run the benchmarks
+    cwd = os.getcwd()
+    print("#jobs\tsubmit(s)\tpoll(s)\tfs_ops\tqstat")
+    for njobs in args.njobs:
+        working_dir = os.path.join(top_dir,str(njobs))
+        os.mkdir(working_dir)
+        os.chdir(working_dir)
+        try:
+            results = benchmark(njobs,working_dir,ncycles=args.ncycles)
+        finally:
+            os.chdir(cwd)
+        print("%d\t%.2f\t%.3f\t%d\t%d" % (results['njobs'],
+                                           results['submission_time'],
+                                           results['poll_time'],
+                                           results['fs_ops'],
+                                           results['qstat']))
+        sys.stdout.flush()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+#
+#     mockge_scale_benchmark.py: measure scheduler overhead at scale
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# mockge_scale_benchmark.py
+#
+#########################################################################
+
+"""mockge_scale_benchmark.py
+
+Measures the polling latency and scheduling overhead of a
+'PipelineRunner' using 'GEJobRunner' for large numbers of jobs,
+using the mock Grid Engine from 'bcftbx.mockGE' with a simulated
+clock.
+
+The mock Grid Engine runs up to a fixed number of jobs at once,
+with the length of each job drawn from an exponential
+distribution (so jobs finish in a realistic staggered order).
+Before each poll cycle the simulated clock is moved on by the
+pipeline's poll interval, so the benchmark runs in a fraction of
+the simulated time; each poll cycle then checks the runner for
+completed jobs and updates the pipeline (which submits new jobs
+as slots become free).
+
+For each number of jobs the mean and maximum time for a poll
+cycle are reported, along with the total time spent in the
+pipeline and runner per job ('overhead', which excludes the time
+spent in the mock Grid Engine itself) and the time taken by the
+mock Grid Engine.
+
+As for 'ge_poll_benchmark.py', 'qsub' is handled by the in-process
+'MockGE' instance; 'qstat' is run as the normal mock executable.
+"""
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import sys
+import time
+import random
+import tempfile
+import shutil
+import subprocess
+import argparse
+import atexit
+import logging
+logging.basicConfig(format="%(levelname)s %(message)s")
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+import bcftbx.JobRunner
+from bcftbx.JobRunner import GEJobRunner
+from bcftbx.Pipeline import PipelineRunner
+from bcftbx.mockGE import MockGE
+from bcftbx.mockGE import setup_mock_GE
+from ge_poll_benchmark import InProcessQsub
+
+#######################################################################
+# Functions
+#######################################################################
+
+def benchmark(njobs,working_dir,slots,max_concurrent_jobs,duration,
+              poll_interval,journal=False,seed=1,timeout=3600.0):
+    """Run a pipeline against a simulated cluster and time the polls
+
+    Arguments:
+      njobs (int): number of jobs to run
+      working_dir (str): directory to run in
+      slots (int): number of jobs the mock Grid Engine will
+        run at once
+      max_concurrent_jobs (int): maximum number of jobs that
+        the pipeline can run at once
+      duration (float): mean simulated length of a job in
+        seconds
+      poll_interval (float): simulated time in seconds
+        between poll cycles
+      journal (bool): if True then the runner uses the job
+        journal
+      seed (int): seed for the job length distribution
+      timeout (float): maximum time in seconds to wait for
+        the pipeline to finish
+
+    Returns:
+      Dictionary with the number of polls, the simulated and
+      real times taken, the mean and maximum poll times, the
+      time spent in the pipeline and runner, and the time
+      spent in the mock Grid Engine.
+    """
+    database_dir = os.path.join(working_dir,"mockGE")
+    bin_dir = os.path.join(working_dir,"bin")
+    os.mkdir(bin_dir)
+    setup_mock_GE(bindir=bin_dir,database_dir=database_dir)
+    # Model for job lengths
+    rng = random.Random(seed)
+    job_duration = lambda name,command: rng.expovariate(1.0/duration)
+    mock_ge = MockGE(database_dir=database_dir,max_jobs=slots,
+                     virtual_clock=True,job_duration=job_duration)
+    # Time spent in the mock Grid Engine
+    mock_time = [0.0]
+    qsub = mock_ge.qsub
+    def timed_qsub(argv):
+        start = time.time()
+        try:
+            return qsub(argv)
+        finally:
+            mock_time[0] += time.time() - start
+    mock_ge.qsub = timed_qsub
+    # Set up the pipeline
+    runner = GEJobRunner(journal=journal)
+    # The runner's grace period for new jobs is in real time,
+    # so would hold up completions for many simulated polls
+    runner._GEJobRunner__new_job_grace_period = 0.0
+    pr = PipelineRunner(runner,max_concurrent_jobs=max_concurrent_jobs,
+                        poll_interval=0)
+    for i in range(njobs):
+        pr.queueJob(working_dir,'true',(),label=str(i))
+    # Run the pipeline
+    popen = subprocess.Popen
+    bcftbx.JobRunner.subprocess.Popen = InProcessQsub(mock_ge)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull,'w')
+    poll_times = []
+    try:
+        start_time = mock_ge._time()
+        start = time.time()
+        pr.run(blocking=False)
+        while pr.nRunning() > 0 or pr.nWaiting() > 0:
+            if (time.time() - start) > timeout:
+                raise Exception("Timed out waiting for pipeline")
+            # Move on to the next poll
+            t = time.time()
+            mock_ge.advance(poll_interval)
+            mock_time[0] += time.time() - t
+            # Poll the runner and update the pipeline
+            t = time.time()
+            runner.wait_for_completion(0)
+            pr.update()
+            poll_times.append(time.time() - t)
+        wall_time = time.time() - start
+        makespan = mock_ge._time() - start_time
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        bcftbx.JobRunner.subprocess.Popen = popen
+    mock_ge.stop()
+    return dict(njobs=pr.nCompleted(),
+                npolls=len(poll_times),
+                makespan=makespan,
+                wall_time=wall_time,
+                mean_poll=sum(poll_times)/max(len(poll_times),1),
+                max_poll=max(poll_times or [0.0]),
+                overhead=wall_time-mock_time[0],
+                mock_time=mock_time[0])
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        description="Measure the poll latency and scheduling "
+        "overhead of a PipelineRunner using GEJobRunner to run N "
+        "jobs on a simulated Grid Engine cluster")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('njobs',metavar="N",type=int,nargs='*',
+                   default=[1000,10000,50000],
+                   help="numbers of jobs to benchmark (default: "
+                   "1000 10000 50000)")
+    p.add_argument('-s','--slots',type=int,default=500,
+                   help="number of jobs the simulated cluster runs "
+                   "at once (default: 500)")
+    p.add_argument('-m','--max-concurrent',type=int,default=1000,
+                   help="maximum number of concurrent jobs for the "
+                   "pipeline (default: 1000)")
+    p.add_argument('-d','--duration',type=float,default=600.0,
+                   help="mean simulated job length in seconds "
+                   "(default: 600)")
+    p.add_argument('-p','--poll-interval',type=float,default=30.0,
+                   help="simulated time in seconds between polls "
+                   "(default: 30)")
+    p.add_argument('-j','--journal',action='store_true',
+                   help="use the GEJobRunner job journal")
+    p.add_argument('--seed',type=int,default=1,
+                   help="seed for the job length distribution "
+                   "(default: 1)")
+    args = p.parse_args()
+    # Top level working directory (registered before any
+    # runners are created, so it is removed after their
+    # admin directories)
+    top_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree,top_dir,True)
+    # Make sure the mock utilities can find bcftbx
+    path = os.environ['PATH']
+    pythonpath = os.environ.get('PYTHONPATH')
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        [p for p in (SHARE_DIR,pythonpath) if p])
+    # Run the benchmarks
+    cwd = os.getcwd()
+    print("#jobs\tslots\tpolls\tmakespan(h)\twall(s)\tmean_poll(ms)\t"
+          "max_poll(ms)\toverhead(ms/job)\tmockGE(s)")
+    for njobs in args.njobs:
+        working_dir = os.path.join(top_dir,str(njobs))
+        os.mkdir(working_dir)
+        os.chdir(working_dir)
+        os.environ['PATH'] = os.path.join(working_dir,"bin") + \
+                             os.pathsep + path
+        try:
+            results = benchmark(njobs,working_dir,
+                                args.slots,
+                                args.max_concurrent,
+                                args.duration,
+                                args.poll_interval,
+                                journal=args.journal,
+                                seed=args.seed)
+        finally:
+            os.environ['PATH'] = path
+            os.chdir(cwd)
+        print("%d\t%d\t%d\t%.1f\t%.1f\t%.1f\t%.1f\t%.3f\t%.1f" %
+              (results['njobs'],
+               args.slots,
+               results['npolls'],
+               results['makespan']/3600.0,
+               results['wall_time'],
+               results['mean_poll']*1000.0,
+               results['max_poll']*1000.0,
+               results['overhead']/results['njobs']*1000.0,
+               results['mock_time']))
+        sys.stdout.flush()
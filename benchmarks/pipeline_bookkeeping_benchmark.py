@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+#     pipeline_bookkeeping_benchmark.py: time PipelineRunner bookkeeping
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# pipeline_bookkeeping_benchmark.py
+#
+#########################################################################
+
+"""pipeline_bookkeeping_benchmark.py
+
+Measures the time spent by 'PipelineRunner' in its own bookkeeping
+(i.e. in the 'update' method) for pipelines with different numbers
+of jobs, using a runner which doesn't run anything (so that only
+the overhead of the pipeline is measured).
+
+Each pipeline has two stages for each sample, with the second stage
+depending on the first, and the samples are assigned to groups of
+100. Up to a maximum number of jobs are allowed to run at once; a
+batch of the running jobs is then marked as completed before each
+update of the pipeline, until all the jobs have completed.
+
+The average time per completed job should stay roughly constant as
+the total number of jobs increases. (The status of all the running
+jobs is fetched from the runner once per update, so the time per
+update does depend on the number of jobs which are running at once.)
+"""
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import sys
+import time
+import argparse
+import logging
+logging.basicConfig(format="%(levelname)s %(message)s")
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+from bcftbx.JobRunner import BaseJobRunner
+from bcftbx.Pipeline import PipelineRunner
+
+#######################################################################
+# Classes
+#######################################################################
+
+class InstantJobRunner(BaseJobRunner):
+    """Job runner which doesn't run anything
+
+    Jobs are 'running' from when they are submitted until
+    they are marked as completed using the 'complete' method.
+    """
+    def __init__(self):
+        BaseJobRunner.__init__(self)
+        self._next_job_id = 0
+        self._running = []
+        self._running_set = set()
+        self._exit_status = {}
+
+    def run(self,name,working_dir,script,args):
+        self._next_job_id += 1
+        job_id = str(self._next_job_id)
+        self._running.append(job_id)
+        self._running_set.add(job_id)
+        return job_id
+
+    def complete(self,njobs):
+        """Mark the oldest running jobs as completed
+
+        Arguments:
+          njobs (int): number of jobs to complete
+        """
+        for job_id in self._running[:njobs]:
+            self._running_set.discard(job_id)
+            self._exit_status[job_id] = 0
+        self._running = self._running[njobs:]
+
+    def terminate(self,job_id):
+        self.complete(0)
+        return True
+
+    def list(self):
+        return list(self._running)
+
+    def isRunning(self,job_id):
+        return job_id in self._running_set
+
+    def list_error_state(self):
+        return []
+
+    def logFile(self,job_id):
+        return os.devnull
+
+    def errFile(self,job_id):
+        return os.devnull
+
+    def exit_status(self,job_id):
+        return self._exit_status.get(job_id)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def benchmark(nsamples,batch_size,max_concurrent_jobs):
+    """Run a pipeline and time the updates
+
+    Arguments:
+      nsamples (int): number of samples (there are two jobs
+        for each sample)
+      batch_size (int): number of jobs to complete before
+        each update
+      max_concurrent_jobs (int): maximum number of jobs that
+        the pipeline can run at once
+
+    Returns:
+      Tuple of the number of jobs, the number of updates and
+      the total time spent in the updates (in seconds).
+    """
+    runner = InstantJobRunner()
+    pr = PipelineRunner(runner,max_concurrent_jobs=max_concurrent_jobs,
+                        poll_interval=0)
+    for i in range(nsamples):
+        group = "group%d" % (i//100)
+        qc = pr.queueJob('.','qc.sh',('sample%d' % i,),
+                         label='qc%d' % i,group=group)
+        pr.queueJob('.','align.sh',('sample%d' % i,),
+                    label='align%d' % i,group=group,
+                    depends_on=[qc])
+    # Suppress reporting from the pipeline
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull,'w')
+    try:
+        pr.run(blocking=False)
+        nupdates = 0
+        update_time = 0.0
+        while pr.nRunning() > 0 or pr.nWaiting() > 0:
+            runner.complete(batch_size)
+            start = time.time()
+            pr.update()
+            update_time += time.time() - start
+            nupdates += 1
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return (pr.nCompleted(),nupdates,update_time)
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        description="Time the PipelineRunner updates for pipelines "
+        "with N samples (two jobs per sample)")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('nsamples',metavar="N",type=int,nargs='*',
+                   default=[500,5000,50000],
+                   help="numbers of samples to benchmark (default: "
+                   "500 5000 50000)")
+    p.add_argument('-b','--batch',type=int,default=100,
+                   help="number of jobs completing between updates "
+                   "(default: 100)")
+    p.add_argument('-m','--max-concurrent',type=int,default=1000,
+                   help="maximum number of concurrent jobs "
+                   "(default: 1000)")
+    args = p.parse_args()
+    # Run the benchmarks
+    print("#jobs\tmax_jobs\tbatch\tupdates\tupdate_time(s)\tper_job(us)")
+    for nsamples in args.nsamples:
+        njobs,nupdates,update_time = benchmark(nsamples,
+                                               args.batch,
+                                               args.max_concurrent)
+        print("%d\t%d\t%d\t%d\t%.2f\t%.1f" % (njobs,
+                                               args.max_concurrent,
+                                               args.batch,
+                                               nupdates,
+                                               update_time,
+                                               update_time/njobs*1.0e6))
+        sys.stdout.flush()
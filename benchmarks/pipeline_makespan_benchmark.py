@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+#
+#     pipeline_makespan_benchmark.py: time PipelineRunner makespans
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# pipeline_makespan_benchmark.py
+#
+#########################################################################
+
+"""pipeline_makespan_benchmark.py
+
+Measures the total time taken ('makespan') for a 'PipelineRunner'
+to run a set of identical jobs (each of which runs 'sleep'), when
+waiting for a fixed 'poll_interval' between updates (the previous
+behaviour) and when using the runner's 'wait_for_completion'
+method to update as soon as jobs complete.
+
+Jobs can be run either using 'SimpleJobRunner', or 'GEJobRunner'
+with the mock Grid Engine from 'bcftbx.mockGE' (in which case a
+background thread updates the mock Grid Engine every 0.1s so that
+jobs start and finish independently of the runner).
+"""
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import sys
+import time
+import tempfile
+import shutil
+import threading
+import argparse
+import atexit
+import logging
+logging.basicConfig(format="%(levelname)s %(message)s")
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+from bcftbx.JobRunner import BaseJobRunner
+from bcftbx.JobRunner import SimpleJobRunner
+from bcftbx.JobRunner import GEJobRunner
+from bcftbx.Pipeline import PipelineRunner
+from bcftbx.mockGE import MockGE
+from bcftbx.mockGE import setup_mock_GE
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Wait strategies to compare
+STRATEGIES = ('fixed','event')
+
+#######################################################################
+# Classes
+#######################################################################
+
+class MockGEUpdater(threading.Thread):
+    """Update a mock Grid Engine periodically in the background
+
+    The 'MockGE' instance is created within the thread (as
+    its database connection can only be used by the thread
+    which created it).
+    """
+    def __init__(self,database_dir,max_jobs,interval=0.1):
+        """Create a new MockGEUpdater
+
+        Arguments:
+          database_dir (str): mock Grid Engine database
+            directory
+          max_jobs (int): maximum number of jobs that the
+            mock Grid Engine will run at once
+          interval (float): time in seconds between updates
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._database_dir = database_dir
+        self._max_jobs = max_jobs
+        self._interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        mock_ge = MockGE(database_dir=self._database_dir,
+                         max_jobs=self._max_jobs,
+                         cleanup_at_exit=False)
+        try:
+            while not self._stop_event.wait(self._interval):
+                mock_ge.update_jobs()
+        finally:
+            mock_ge.stop()
+
+    def stop(self):
+        """Stop updating and wait for the thread to finish
+        """
+        self._stop_event.set()
+        self.join()
+
+#######################################################################
+# Functions
+#######################################################################
+
+def benchmark(runner,njobs,duration,working_dir,max_concurrent_jobs,
+              poll_interval,strategy):
+    """Run a pipeline of jobs and time how long it takes
+
+    Arguments:
+      runner (JobRunner): runner to execute the jobs with
+      njobs (int): number of jobs to run
+      duration (float): time in seconds for each job to
+        sleep for
+      working_dir (str): directory to run the jobs in
+      max_concurrent_jobs (int): maximum number of jobs that
+        the pipeline can run at once
+      poll_interval (float): pipeline poll interval
+      strategy (str): either 'fixed' (wait for the whole
+        poll interval between updates) or 'event' (use the
+        runner's 'wait_for_completion' method)
+
+    Returns:
+      Tuple of the time taken (in seconds) and the number
+      of failed jobs.
+    """
+    if strategy == 'fixed':
+        runner.wait_for_completion = \
+            lambda timeout: BaseJobRunner.wait_for_completion(runner,
+                                                              timeout)
+    pr = PipelineRunner(runner,
+                        max_concurrent_jobs=max_concurrent_jobs,
+                        poll_interval=poll_interval)
+    for i in range(njobs):
+        pr.queueJob(working_dir,'sleep',(str(duration),),label=str(i))
+    start = time.time()
+    pr.run(blocking=True)
+    makespan = time.time() - start
+    failed = len([job for job in pr.completed if job.exit_status != 0])
+    return (makespan,failed)
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        description="Compare the makespan for a PipelineRunner "
+        "running N jobs with a fixed poll interval against waiting "
+        "for job completion")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-n','--jobs',type=int,default=200,
+                   help="number of jobs to run (default: 200)")
+    p.add_argument('-d','--duration',type=float,default=2.0,
+                   help="time in seconds that each job runs for "
+                   "(default: 2)")
+    p.add_argument('-m','--max-concurrent',type=int,default=50,
+                   help="maximum number of concurrent jobs "
+                   "(default: 50)")
+    p.add_argument('-p','--poll-interval',type=float,default=30.0,
+                   help="pipeline poll interval in seconds "
+                   "(default: 30)")
+    p.add_argument('-r','--runner',choices=('simple','ge'),
+                   default='simple',
+                   help="job runner to use: 'simple' (default) or "
+                   "'ge' (GEJobRunner with mock Grid Engine)")
+    args = p.parse_args()
+    # Top level working directory (registered before any
+    # runners are created, so it is removed after their
+    # admin directories)
+    top_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree,top_dir,True)
+    # Run the benchmarks
+    cwd = os.getcwd()
+    print("#jobs\tduration(s)\tmax_jobs\tpoll(s)\trunner\tstrategy\t"
+          "makespan(s)\tfailed")
+    for strategy in STRATEGIES:
+        working_dir = os.path.join(top_dir,strategy)
+        os.mkdir(working_dir)
+        os.chdir(working_dir)
+        updater = None
+        path = os.environ['PATH']
+        pythonpath = os.environ.get('PYTHONPATH')
+        try:
+            if args.runner == 'ge':
+                database_dir = os.path.join(working_dir,"mockGE")
+                bin_dir = os.path.join(working_dir,"bin")
+                os.mkdir(bin_dir)
+                setup_mock_GE(bindir=bin_dir,database_dir=database_dir)
+                os.environ['PATH'] = bin_dir + os.pathsep + path
+                # Make sure the mock utilities can import bcftbx
+                os.environ['PYTHONPATH'] = os.pathsep.join(
+                    [p for p in (SHARE_DIR,pythonpath) if p])
+                updater = MockGEUpdater(database_dir,args.max_concurrent)
+                updater.start()
+                runner = GEJobRunner(poll_interval=args.poll_interval)
+            else:
+                runner = SimpleJobRunner()
+            makespan,failed = benchmark(runner,
+                                        args.jobs,
+                                        args.duration,
+                                        working_dir,
+                                        args.max_concurrent,
+                                        args.poll_interval,
+                                        strategy)
+        finally:
+            if updater is not None:
+                updater.stop()
+            os.environ['PATH'] = path
+            if pythonpath is None:
+                os.environ.pop('PYTHONPATH',None)
+            else:
+                os.environ['PYTHONPATH'] = pythonpath
+            os.chdir(cwd)
+        print("%d\t%.1f\t%d\t%.1f\t%s\t%s\t%.1f\t%d" %
+              (args.jobs,
+               args.duration,
+               args.max_concurrent,
+               args.poll_interval,
+               args.runner,
+               strategy,
+               makespan,
+               failed))
+        sys.stdout.flush()
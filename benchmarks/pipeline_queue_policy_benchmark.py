@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+#
+#     pipeline_queue_policy_benchmark.py: compare PipelineRunner queue policies
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# pipeline_queue_policy_benchmark.py
+#
+#########################################################################
+
+"""pipeline_queue_policy_benchmark.py
+
+Simulates running a QC script over a set of samples with
+different sizes using 'PipelineRunner' with 'SimpleJobRunner', and
+reports the total time taken ('makespan') and the mean time taken
+for each group of samples to complete under each of the queue
+policies.
+
+Each sample is represented by a (sparse) FASTQ file; the job for
+the sample runs a script which sleeps for a time proportional to
+the size of the file. The sizes are drawn from a log-normal
+distribution (so there are a few large samples) and the jobs are
+queued in directory listing order, as for 'run_qc_pipeline.py'.
+Samples are assigned to groups in turn.
+
+The lower bound on the makespan (the larger of the longest job
+and the total job time divided by the number of concurrent jobs)
+is also reported for comparison.
+"""
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import sys
+import io
+import time
+import random
+import tempfile
+import shutil
+import argparse
+import atexit
+import logging
+logging.basicConfig(format="%(levelname)s %(message)s")
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+from bcftbx.JobRunner import SimpleJobRunner
+from bcftbx.Pipeline import PipelineRunner
+from bcftbx.Pipeline import GetFastqFiles
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Queue policies to compare
+POLICIES = ('fifo','longest_first','group')
+
+# Script which sleeps for a time proportional to the input
+# file size
+QC_SCRIPT = """#!/bin/sh
+sleep $(awk -v size=$(wc -c <"$1") 'BEGIN { print size/%d }')
+"""
+
+#######################################################################
+# Functions
+#######################################################################
+
+def make_samples(data_dir,nsamples,mean_duration,rate,seed=None):
+    """Create sparse FASTQ files representing samples
+
+    Arguments:
+      data_dir (str): directory to create the files in
+      nsamples (int): number of samples to create
+      mean_duration (float): median time in seconds for
+        the job for each sample
+      rate (int): number of bytes processed per second
+      seed (int): (optional) seed for the random number
+        generator
+
+    Returns:
+      List of the job durations (in seconds).
+    """
+    rng = random.Random(seed)
+    durations = []
+    for i in range(nsamples):
+        duration = mean_duration*rng.lognormvariate(0.0,0.75)
+        with io.open(os.path.join(data_dir,"sample%03d.fastq" % i),
+                     'wb') as fp:
+            fp.truncate(int(duration*rate))
+        durations.append(duration)
+    return durations
+
+def benchmark(script,data_dir,policy,max_concurrent_jobs,ngroups):
+    """Run the pipeline and time how long it takes
+
+    Arguments:
+      script (str): path to the QC script
+      data_dir (str): directory with the sample files
+      policy (str): name of the queue policy to use
+      max_concurrent_jobs (int): maximum number of jobs that
+        the pipeline can run at once
+      ngroups (int): number of groups to assign the samples
+        to
+
+    Returns:
+      Tuple of the makespan, the mean time for groups to
+      complete (both in seconds) and the number of failed
+      jobs.
+    """
+    group_completion_times = []
+    pr = PipelineRunner(SimpleJobRunner(),
+                        max_concurrent_jobs=max_concurrent_jobs,
+                        poll_interval=1,
+                        queue_policy=policy,
+                        groupCompletionHandler=lambda group,jobs:
+                        group_completion_times.append(time.time()))
+    for i,fastq in enumerate(GetFastqFiles(data_dir)):
+        pr.queueJob(data_dir,script,fastq,label=fastq[0],
+                    group="group%d" % (i % ngroups))
+    start = time.time()
+    pr.run(blocking=True)
+    makespan = time.time() - start
+    mean_group_time = sum([t - start for t in group_completion_times])/\
+                      max(len(group_completion_times),1)
+    failed = len([job for job in pr.completed if job.exit_status != 0])
+    return (makespan,mean_group_time,failed)
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        description="Compare the makespan for a PipelineRunner "
+        "running jobs of varying sizes under each queue policy")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-n','--samples',type=int,default=24,
+                   help="number of samples (default: 24)")
+    p.add_argument('-d','--duration',type=float,default=2.0,
+                   help="median time in seconds for each job "
+                   "(default: 2)")
+    p.add_argument('-m','--max-concurrent',type=int,default=4,
+                   help="maximum number of concurrent jobs "
+                   "(default: 4)")
+    p.add_argument('-g','--groups',type=int,default=3,
+                   help="number of groups to assign samples to "
+                   "(default: 3)")
+    p.add_argument('-s','--seed',type=int,default=1,
+                   help="seed for random sample sizes (default: 1)")
+    args = p.parse_args()
+    # Bytes processed per second by the QC script
+    rate = 1000000
+    # Top level working directory
+    top_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree,top_dir,True)
+    # Set up the samples and the script
+    data_dir = os.path.join(top_dir,"data")
+    os.mkdir(data_dir)
+    durations = make_samples(data_dir,args.samples,args.duration,rate,
+                             seed=args.seed)
+    script = os.path.join(top_dir,"qc.sh")
+    with io.open(script,'wt') as fp:
+        fp.write(u"%s" % (QC_SCRIPT % rate))
+    os.chmod(script,0o755)
+    lower_bound = max(max(durations),sum(durations)/args.max_concurrent)
+    # Run the benchmarks
+    cwd = os.getcwd()
+    print("#jobs\tmax_jobs\tgroups\tpolicy\tmakespan(s)\t"
+          "lower_bound(s)\tmean_group(s)\tfailed")
+    for policy in POLICIES:
+        log_dir = os.path.join(top_dir,policy)
+        os.mkdir(log_dir)
+        os.chdir(log_dir)
+        try:
+            makespan,mean_group_time,failed = benchmark(script,
+                                                        data_dir,
+                                                        policy,
+                                                        args.max_concurrent,
+                                                        args.groups)
+        finally:
+            os.chdir(cwd)
+        print("%d\t%d\t%d\t%s\t%.1f\t%.1f\t%.1f\t%d" %
+              (args.samples,
+               args.max_concurrent,
+               args.groups,
+               policy,
+               makespan,
+               lower_bound,
+               mean_group_time,
+               failed))
+        sys.stdout.flush()
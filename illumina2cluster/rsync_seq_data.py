@@ -19,7 +19,7 @@ Wrapper for rsync for moving sequencing into the data storage area.
 # Modules metadata
 #######################################################################
 
-__version__ = "0.1.3"
+__version__ = "0.2.0"
 
 #######################################################################
 # Import modules that this module depends on
@@ -33,6 +33,11 @@ import time
 import logging
 import argparse
 import subprocess
+import heapq
+import fnmatch
+import tempfile
+import shutil
+from multiprocessing.pool import ThreadPool
 
 # Put .. onto Python search path for modules
 SHARE_DIR = os.path.abspath(
@@ -40,13 +45,65 @@ SHARE_DIR = os.path.abspath(
         os.path.join(os.path.dirname(sys.argv[0]),'..')))
 sys.path.append(SHARE_DIR)
 import bcftbx.platforms as platforms
+import bcftbx.utils as utils
+from bcftbx.Md5sum import Md5Checker
 
 #######################################################################
 # Functions
 #######################################################################
 
+def is_remote(target):
+    """Check whether an rsync target is on a remote system
+
+    Arguments:
+      target: rsync target (e.g. 'user@hostname:target')
+
+    Returns:
+      True if the target is remote, False if it is local.
+
+    """
+    return bool(re.compile(r'^([^@]*@)?[^:]*:').match(target))
+
+def build_rsync_cmd(source,target,dry_run=False,mirror=False,chmod=None,
+                    excludes=None,extra_args=None):
+    """Construct an rsync command line
+
+    Arguments:
+      source: the directory being copied/sync'ed
+      target: the directory the source will be copied into
+      dry_run: add the --dry-run option
+      mirror: add the --delete-after option
+      chmod: optional, mode specification to be applied to the copied
+        files e.g. chmod='u+rwX,g+rwX,o-w
+      excludes: optional, a list of rsync filter patterns specifying
+        files and directories to be excluded from the rsync
+      extra_args: optional, list of additional options to add to
+        the command line before the source and target
+
+    Returns:
+      List with the rsync command line.
+
+    """
+    rsync_cmd = ['rsync','-av']
+    if dry_run:
+        rsync_cmd.append('--dry-run')
+    if mirror:
+        rsync_cmd.append('--delete-after')
+    if is_remote(target):
+        # Remote destination, requires ssh
+        rsync_cmd.extend(['-e','ssh'])
+    if chmod is not None:
+        rsync_cmd.append('--chmod=%s' % chmod)
+    if excludes is not None:
+        for exclude in excludes:
+            rsync_cmd.append('--exclude=%s' % exclude)
+    if extra_args is not None:
+        rsync_cmd.extend(extra_args)
+    rsync_cmd.extend([source,target])
+    return rsync_cmd
+
 def run_rsync(source,target,dry_run=False,mirror=False,chmod=None,
-              log=None,err=None,excludes=None):
+              log=None,err=None,excludes=None,extra_args=None):
     """Wrapper for running the rsync command
 
     Create and execute an rsync command line to recursive copy/sync
@@ -72,26 +129,18 @@ def run_rsync(source,target,dry_run=False,mirror=False,chmod=None,
         if None then write to stderr.
       excludes: optional, a list of rsync filter patterns specifying
         files and directories to be excluded from the rsync
+      extra_args: optional, list of additional options to add to
+        the rsync command line
 
     Returns:
       The exit code from rsync (should be 0 if there were no errors).
 
     """
     # Build rsync command line
-    rsync_cmd = ['rsync','-av']
-    if dry_run:
-        rsync_cmd.append('--dry-run')
-    if mirror:
-        rsync_cmd.append('--delete-after')
-    if re.compile(r'^([^@]*@)?[^:]*:').match(target):
-        # Remote destination, requires ssh
-        rsync_cmd.extend(['-e','ssh'])
-    if chmod is not None:
-        rsync_cmd.append('--chmod=%s' % chmod)
-    if excludes is not None:
-        for exclude in excludes:
-            rsync_cmd.append('--exclude=%s' % exclude)
-    rsync_cmd.extend([source,target])
+    rsync_cmd = build_rsync_cmd(source,target,dry_run=dry_run,
+                                mirror=mirror,chmod=chmod,
+                                excludes=excludes,
+                                extra_args=extra_args)
     print("Rsync command: %s" % ' '.join(rsync_cmd))
     if log is None:
         fpout = sys.stdout
@@ -117,13 +166,379 @@ def run_rsync(source,target,dry_run=False,mirror=False,chmod=None,
         returncode = -1
     return returncode
 
+def is_excluded(path,excludes):
+    """Check whether a path matches any rsync exclude pattern
+
+    This approximates the way rsync applies '--exclude'
+    patterns: patterns without a '/' are matched against
+    each component of the path, patterns containing a '/'
+    are matched against the trailing components (or against
+    the start of the path, if the pattern starts with '/'),
+    and excluding a directory also excludes everything under
+    it.
+
+    Arguments:
+      path: path relative to the top of the transfer
+      excludes: list of rsync exclude patterns
+
+    Returns:
+      True if the path is excluded, False otherwise.
+
+    """
+    components = path.split(os.sep)
+    for pattern in excludes:
+        pattern = pattern.rstrip('/')
+        if '/' not in pattern:
+            for name in components:
+                if fnmatch.fnmatch(name,pattern):
+                    return True
+            continue
+        anchored = pattern.startswith('/')
+        pattern = pattern.lstrip('/')
+        n = pattern.count('/') + 1
+        for i in range(n,len(components)+1):
+            if anchored:
+                candidate = components[:n]
+            else:
+                candidate = components[i-n:i]
+            if fnmatch.fnmatch('/'.join(candidate),pattern):
+                return True
+            if anchored:
+                break
+    return False
+
+def partition_source(source,nshards,nthreads=1,excludes=None):
+    """Partition the contents of a directory into balanced shards
+
+    Scans the directory structure under 'source' and divides
+    the files (and symbolic links) between 'nshards' shards,
+    so that the total size of the files in each shard is as
+    similar as possible (by assigning the largest remaining
+    file to the shard with the smallest total each time).
+
+    Paths are relative to the parent of 'source' (i.e. they
+    start with the basename of 'source'), as required for use
+    with the --files-from option of rsync.
+
+    Arguments:
+      source: directory to partition
+      nshards: number of shards to divide the files into
+      nthreads: optional, number of threads to use when
+        scanning the directory structure (default: 1)
+      excludes: optional, a list of rsync filter patterns
+        specifying files and directories to be omitted (see
+        'is_excluded')
+
+    Returns:
+      Tuple (dirs,shards) where 'dirs' is a list of all the
+      directories (including 'source' itself) and 'shards' is
+      a list of 'nshards' tuples of the form (size,files).
+
+    """
+    source = os.path.abspath(source.rstrip(os.sep))
+    top_dir = os.path.dirname(source)
+    dirs = [os.path.relpath(source,top_dir)]
+    files = []
+    for entry in utils.scan_tree(source,nthreads=nthreads):
+        path = os.path.relpath(entry.path,top_dir)
+        if excludes and is_excluded(path,excludes):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            dirs.append(path)
+        else:
+            files.append((entry.stat(follow_symlinks=False).st_size,path))
+    # Assign largest files first, each to the currently
+    # smallest shard
+    files.sort(reverse=True)
+    heap = [(0,i) for i in range(nshards)]
+    shards = [[] for i in range(nshards)]
+    sizes = [0]*nshards
+    for size,path in files:
+        total,i = heapq.heappop(heap)
+        shards[i].append(path)
+        sizes[i] = total + size
+        heapq.heappush(heap,(sizes[i],i))
+    return (dirs,[(sizes[i],shards[i]) for i in range(nshards)])
+
+def write_files_from(paths,filen):
+    """Write a list of paths for use with the rsync --files-from option
+
+    Paths are separated by NUL characters (so the list
+    must be used with the --from0 option).
+
+    Arguments:
+      paths: list of paths to write
+      filen: name of the file to write the paths to
+
+    """
+    with io.open(filen,'wb') as fp:
+        for path in paths:
+            if not isinstance(path,bytes):
+                path = path.encode('utf-8')
+            fp.write(path)
+            fp.write(b'\0')
+
+def shard_log_file(log,name):
+    """Return the log file name for a stage of a parallel rsync
+
+    Inserts the name of the stage before the extension of
+    the log file name, e.g. for 'shard01' the log file
+    'rsync.RUN.log' becomes 'rsync.RUN.shard01.log'.
+
+    Arguments:
+      log: the base log file name (or None)
+      name: the name of the stage (e.g. 'shard01')
+
+    Returns:
+      The log file name for the shard (or None if 'log'
+      was None).
+
+    """
+    if log is None:
+        return None
+    base,ext = os.path.splitext(log)
+    return "%s.%s%s" % (base,name,ext)
+
+def run_parallel_rsync(source,target,nshards,dry_run=False,mirror=False,
+                       chmod=None,log=None,excludes=None,nthreads=1,
+                       verify=False):
+    """Run multiple concurrent rsyncs on partitions of a directory
+
+    The contents of 'source' are partitioned into 'nshards'
+    shards of approximately equal size (see 'partition_source'),
+    and then copied into 'target' as follows:
+
+    1. The directory structure is created using a single
+       (non-recursive) rsync;
+    2. The files in each shard are copied by running an
+       rsync for each shard concurrently, each with its own
+       log file;
+    3. The directories are rsync'ed again to set their
+       attributes (as the modification times will have been
+       changed by copying the files), and if 'mirror' is
+       specified then files which have been removed from the
+       source are deleted from the target.
+
+    As for 'run_rsync', 'source' is copied as a subdirectory
+    of 'target'.
+
+    Optionally the copies can be verified once the transfer has
+    completed (see 'verify_transfer').
+
+    Arguments:
+      source: the directory being copied/sync'ed
+      target: the directory the source will be copied into
+      nshards: the number of concurrent rsync processes to run
+      dry_run: run rsync using --dry-run option
+      mirror: if True then also delete files from the target
+        that have been removed from the source
+      chmod: optional, mode specification to be applied to the copied
+        files e.g. chmod='u+rwX,g+rwX,o-w
+      log: optional, name of a log file to record stdout from rsync;
+        each shard will write to its own log file based on this
+        name (see 'shard_log_file'). If None then write to stdout.
+      excludes: optional, a list of rsync filter patterns specifying
+        files and directories to be excluded from the rsync
+      nthreads: optional, number of threads to use when scanning
+        the source directory and verifying the copies
+      verify: if True then verify the copied files using checksums
+        after the transfer
+
+    Returns:
+      Zero if all the rsyncs completed without errors (and the
+      verification passed, if requested), otherwise the first
+      non-zero exit code.
+
+    """
+    source = os.path.abspath(source.rstrip(os.sep))
+    top_dir = os.path.dirname(source)
+    print("Scanning %s" % source)
+    dirs,shards = partition_source(source,nshards,nthreads=nthreads,
+                                   excludes=excludes)
+    for i,shard in enumerate(shards):
+        print("Shard %02d: %d files (%d bytes)" % (i+1,len(shard[1]),shard[0]))
+    tmp_dir = tempfile.mkdtemp(prefix="rsync_seq_data.")
+    try:
+        # Write the lists of directories and files
+        dirs_list = os.path.join(tmp_dir,"dirs")
+        write_files_from(dirs,dirs_list)
+        shard_lists = []
+        for i,shard in enumerate(shards):
+            shard_list = os.path.join(tmp_dir,"shard%02d" % (i+1))
+            write_files_from(shard[1],shard_list)
+            shard_lists.append(shard_list)
+        files_from_args = lambda filen: ['--from0',
+                                         '--files-from=%s' % filen]
+        # Create directory structure
+        status = run_rsync(top_dir,target,dry_run=dry_run,chmod=chmod,
+                           log=shard_log_file(log,'dirs'),
+                           excludes=excludes,
+                           extra_args=files_from_args(dirs_list))
+        if status != 0:
+            logging.error("Failed to create directory structure")
+            return status
+        # Run rsyncs for each shard concurrently
+        processes = []
+        try:
+            for i,shard_list in enumerate(shard_lists):
+                rsync_cmd = build_rsync_cmd(
+                    top_dir,target,dry_run=dry_run,chmod=chmod,
+                    excludes=excludes,
+                    extra_args=files_from_args(shard_list))
+                print("Shard %02d rsync command: %s" % (i+1,
+                                                        ' '.join(rsync_cmd)))
+                shard_log = shard_log_file(log,"shard%02d" % (i+1))
+                if shard_log is None:
+                    fpout = sys.stdout
+                else:
+                    print("Shard %02d writing output to %s" % (i+1,
+                                                               shard_log))
+                    fpout = io.open(shard_log,'wt')
+                processes.append(subprocess.Popen(rsync_cmd,
+                                                  stdout=fpout,
+                                                  stderr=subprocess.STDOUT))
+                if shard_log is not None:
+                    fpout.close()
+            returncodes = [p.wait() for p in processes]
+        except KeyboardInterrupt as ex:
+            print("KeyboardInterrupt: stopping rsync processes")
+            for p in processes:
+                if p.poll() is None:
+                    p.kill()
+            return -1
+        for i,returncode in enumerate(returncodes):
+            print("Shard %02d rsync returncode: %s" % (i+1,returncode))
+        for returncode in returncodes:
+            if returncode != 0:
+                status = returncode
+                break
+        # Remove deleted files from the target
+        if mirror and status == 0:
+            status = run_rsync(source,target,dry_run=dry_run,mirror=True,
+                               log=shard_log_file(log,'delete'),
+                               excludes=excludes,
+                               extra_args=['--existing',
+                                           '--ignore-existing'])
+        # Set attributes for directories
+        if status == 0:
+            status = run_rsync(top_dir,target,dry_run=dry_run,chmod=chmod,
+                               log=shard_log_file(log,'attrs'),
+                               excludes=excludes,
+                               extra_args=files_from_args(dirs_list))
+        # Verify the copies
+        if verify and status == 0 and not dry_run:
+            nfailed = verify_transfer(source,target,
+                                      [shard[1] for shard in shards],
+                                      excludes=excludes,
+                                      nthreads=nthreads)
+            if nfailed:
+                logging.error("%d files failed verification" % nfailed)
+                status = 1
+    finally:
+        shutil.rmtree(tmp_dir)
+    return status
+
+def verify_transfer(source,target,shards,excludes=None,nthreads=1):
+    """Verify copied files against the source using checksums
+
+    If 'target' is local then files are compared directly
+    (using 'Md5Checker.cmp_files', i.e. sizes are checked
+    before MD5 sums are computed) in a pool of 'nthreads'
+    threads.
+
+    If 'target' is on a remote system then a 'rsync --checksum
+    --dry-run' is run concurrently for each shard; any file
+    which rsync would transfer is counted as a failure.
+
+    Arguments:
+      source: the directory which was copied
+      target: the directory the source was copied into
+      shards: list of lists of paths (relative to the parent
+        of 'source'), as returned by 'partition_source'
+      excludes: optional, a list of rsync filter patterns
+        (for remote targets; for local targets excluded files
+        should already have been omitted from 'shards')
+      nthreads: optional, number of threads to use for
+        local comparisons
+
+    Returns:
+      The number of files which failed verification.
+
+    """
+    source = os.path.abspath(source.rstrip(os.sep))
+    top_dir = os.path.dirname(source)
+    print("Verifying copies of %s in %s" % (source,target))
+    if is_remote(target):
+        tmp_dir = tempfile.mkdtemp(prefix="rsync_seq_data.")
+        try:
+            return _verify_remote(top_dir,target,shards,tmp_dir,
+                                  excludes=excludes)
+        finally:
+            shutil.rmtree(tmp_dir)
+    # Local target
+    def cmp_file(path):
+        f1 = os.path.join(top_dir,path)
+        f2 = os.path.join(target,path)
+        if os.path.islink(f1):
+            if os.path.islink(f2) and os.readlink(f1) == os.readlink(f2):
+                return (path,Md5Checker.LINKS_SAME)
+            return (path,Md5Checker.LINKS_DIFFER)
+        return (path,Md5Checker.cmp_files(f1,f2))
+    paths = [path for shard in shards for path in shard]
+    nfailed = 0
+    pool = ThreadPool(max(nthreads,1))
+    try:
+        for path,status in pool.imap_unordered(cmp_file,paths,
+                                               chunksize=16):
+            if status not in (Md5Checker.MD5_OK,Md5Checker.LINKS_SAME):
+                print("%s: FAILED" % path)
+                nfailed += 1
+    finally:
+        pool.close()
+        pool.join()
+    print("Verified %d files: %d failed" % (len(paths),nfailed))
+    return nfailed
+
+def _verify_remote(top_dir,target,shards,tmp_dir,excludes=None):
+    """Internal: verify files on a remote target using rsync --checksum
+
+    Runs a 'rsync --checksum --dry-run' concurrently for each
+    shard and returns the number of files which would be
+    transferred (i.e. which differ from the source).
+    """
+    processes = []
+    for i,shard in enumerate(shards):
+        shard_list = os.path.join(tmp_dir,"verify%02d" % (i+1))
+        write_files_from(shard,shard_list)
+        rsync_cmd = ['rsync','-a','--checksum','--dry-run',
+                     '--out-format=%i %n','-e','ssh',
+                     '--from0','--files-from=%s' % shard_list]
+        if excludes is not None:
+            for exclude in excludes:
+                rsync_cmd.append('--exclude=%s' % exclude)
+        rsync_cmd.extend([top_dir,target])
+        processes.append(subprocess.Popen(rsync_cmd,
+                                          stdout=subprocess.PIPE,
+                                          universal_newlines=True))
+    nfailed = 0
+    for p in processes:
+        stdout,stderr = p.communicate()
+        for line in stdout.split('\n'):
+            if line[:1] in ('<','>','c','h','*'):
+                # Item would be transferred, created or deleted
+                print("%s: FAILED" % line.split(' ',1)[-1])
+                nfailed += 1
+        if p.returncode != 0:
+            logging.error("rsync returned %s" % p.returncode)
+            nfailed += 1
+    return nfailed
+
 #######################################################################
 # Main program
 #######################################################################
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser(
-        version="%(prog)s "+__version__,
         description="Wrapper to rsync sequencing data: DIR will "
         "be rsync'ed to a subdirectory of BASE_DIR constructed "
         "from the year and platform i.e. BASE_DIR/YEAR/PLATFORM/. "
@@ -132,6 +547,8 @@ if __name__ == '__main__':
         "DIR name (over-ride using the --platform option). "
         "The output from rsync is written to a file "
         "rsync.DIR.log.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
     p.add_argument('--platform',action="store",dest="platform",
                    default=None,
                    help="explicitly specify the sequencer type")
@@ -154,6 +571,16 @@ if __name__ == '__main__':
     p.add_argument('--no-log',action='store_true',dest="no_log",default=False,
                    help="write rsync output directly stdout, don't create "
                    "a log file")
+    p.add_argument('--parallel',action='store',dest="parallel",type=int,
+                   default=None,metavar="N",
+                   help="partition DIR into N shards of similar total size "
+                   "and run N rsync processes concurrently (each writing "
+                   "to its own log file)")
+    p.add_argument('--verify',action='store_true',dest="verify",
+                   default=False,
+                   help="after the transfer, verify the copied files "
+                   "against DIR using checksums (in parallel if used "
+                   "with --parallel)")
     p.add_argument('data_dir',metavar="DIR",
                    help="path to directory with sequencing data")
     p.add_argument('base_dir',metavar="BASE_DIR",
@@ -188,11 +615,29 @@ if __name__ == '__main__':
     print("Platform   : %s" % platform)
     print("Destination: %s" % destination)
     print("Log file   : %s" % log_file)
-    print("Mirror mode: %s" % options.mirror)
+    print("Mirror mode: %s" % args.mirror)
     # Run rsync
-    status = run_rsync(data_dir,destination,dry_run=args.dry_run,
-                       log=log_file,chmod=args.chmod,mirror=args.mirror,
-                       excludes=args.exclude_pattern)
+    if args.parallel:
+        print("Parallel   : %s" % args.parallel)
+        status = run_parallel_rsync(data_dir,destination,args.parallel,
+                                    dry_run=args.dry_run,
+                                    log=log_file,chmod=args.chmod,
+                                    mirror=args.mirror,
+                                    excludes=args.exclude_pattern,
+                                    nthreads=args.parallel,
+                                    verify=args.verify)
+    else:
+        status = run_rsync(data_dir,destination,dry_run=args.dry_run,
+                           log=log_file,chmod=args.chmod,mirror=args.mirror,
+                           excludes=args.exclude_pattern)
+        if args.verify and status == 0 and not args.dry_run:
+            dirs,shards = partition_source(data_dir,1,
+                                           excludes=args.exclude_pattern)
+            if verify_transfer(data_dir,destination,
+                               [shard[1] for shard in shards],
+                               excludes=args.exclude_pattern):
+                logging.error("Verification failed")
+                status = 1
     print("Rsync returncode: %s" % status)
     if status != 0:
         logging.error("Rsync failure")
@@ -0,0 +1,177 @@
+#######################################################################
+# Tests for rsync_seq_data.py
+#######################################################################
+
+import unittest
+import os
+import io
+from bcftbx.utils import find_program
+from bcftbx.test.mock_data import TestUtils
+from rsync_seq_data import is_excluded
+from rsync_seq_data import partition_source
+from rsync_seq_data import run_parallel_rsync
+
+class TestIsExcluded(unittest.TestCase):
+    def test_is_excluded_no_patterns(self):
+        """is_excluded returns False when there are no patterns
+        """
+        self.assertFalse(is_excluded("run/Data/file.bcl",[]))
+    def test_is_excluded_name_pattern(self):
+        """is_excluded matches patterns without '/' against any component
+        """
+        self.assertTrue(is_excluded("run/Data/file.tmp",["*.tmp"]))
+        self.assertTrue(is_excluded("run/Thumbnail_Images/L001/a.jpg",
+                                    ["Thumbnail_Images"]))
+        self.assertTrue(is_excluded("Thumbnail_Images",
+                                    ["Thumbnail_Images"]))
+        self.assertFalse(is_excluded("run/Data/file.bcl",["*.tmp"]))
+        self.assertFalse(is_excluded("run/Thumbnail_Images_old/a.jpg",
+                                     ["Thumbnail_Images"]))
+    def test_is_excluded_trailing_slash(self):
+        """is_excluded ignores trailing '/' on patterns
+        """
+        self.assertTrue(is_excluded("run/Thumbnail_Images/L001/a.jpg",
+                                    ["Thumbnail_Images/"]))
+        self.assertTrue(is_excluded("run/Data/Intensities/L001/a.bcl",
+                                    ["Data/Intensities/"]))
+        self.assertFalse(is_excluded("run/Data/file.bcl",
+                                     ["Thumbnail_Images/"]))
+    def test_is_excluded_multi_component_pattern(self):
+        """is_excluded matches patterns with '/' against trailing components
+        """
+        self.assertTrue(is_excluded("run/Data/Intensities",
+                                    ["Data/Intensities"]))
+        self.assertTrue(is_excluded("run/Data/Intensities/L001/a.bcl",
+                                    ["Data/Intensities"]))
+        self.assertTrue(is_excluded("run/Data/Intensities/L001/a.bcl",
+                                    ["Intensities/L00*"]))
+        self.assertFalse(is_excluded("run/Data/file.bcl",
+                                     ["Data/Intensities"]))
+        self.assertFalse(is_excluded("run/Intensities/Data/a.bcl",
+                                     ["Data/Intensities"]))
+    def test_is_excluded_anchored_pattern(self):
+        """is_excluded matches patterns starting with '/' from the top
+        """
+        self.assertTrue(is_excluded("run/Data",["/run/Data"]))
+        self.assertTrue(is_excluded("run/Data/Intensities/a.bcl",
+                                    ["/run/Data"]))
+        self.assertTrue(is_excluded("run/Logs/a.log",["/*/Logs"]))
+        self.assertFalse(is_excluded("other/run/Data/a.bcl",
+                                     ["/run/Data"]))
+        self.assertFalse(is_excluded("run/other/Data/a.bcl",
+                                     ["/run/Data"]))
+
+class TestPartitionSource(unittest.TestCase):
+    def setUp(self):
+        # Create working directory for test files etc
+        self.wd = TestUtils.make_dir()
+        self.source = TestUtils.make_sub_dir(self.wd,"run")
+        TestUtils.make_sub_dir(self.source,"Data/Intensities")
+        TestUtils.make_sub_dir(self.source,"Logs")
+        TestUtils.make_file("a","a"*100,basedir=self.source)
+        TestUtils.make_file("b","b"*90,basedir=self.source)
+        TestUtils.make_file("Data/c","c"*50,basedir=self.source)
+        TestUtils.make_file("Data/Intensities/d","d"*40,
+                            basedir=self.source)
+        TestUtils.make_file("Data/Intensities/e","e"*10,
+                            basedir=self.source)
+        TestUtils.make_file("Logs/f","f"*10,basedir=self.source)
+    def tearDown(self):
+        # Remove the container dir
+        TestUtils.remove_dir(self.wd)
+    def test_partition_source_dirs(self):
+        """partition_source returns all the directories
+        """
+        dirs,shards = partition_source(self.source,2)
+        self.assertEqual(dirs[0],"run")
+        self.assertEqual(sorted(dirs),
+                         ["run",
+                          "run/Data",
+                          "run/Data/Intensities",
+                          "run/Logs"])
+    def test_partition_source_balanced_shards(self):
+        """partition_source divides files into balanced shards
+        """
+        dirs,shards = partition_source(self.source,2)
+        self.assertEqual(len(shards),2)
+        self.assertEqual(sorted([size for size,files in shards]),
+                         [150,150])
+        for size,files in shards:
+            self.assertEqual(size,
+                             sum([os.path.getsize(
+                                 os.path.join(self.wd,f)) for f in files]))
+        self.assertEqual(sorted([f for size,files in shards
+                                 for f in files]),
+                         ["run/Data/Intensities/d",
+                          "run/Data/Intensities/e",
+                          "run/Data/c",
+                          "run/Logs/f",
+                          "run/a",
+                          "run/b"])
+    def test_partition_source_more_shards_than_files(self):
+        """partition_source handles more shards than files
+        """
+        dirs,shards = partition_source(self.source,8,nthreads=2)
+        self.assertEqual(len(shards),8)
+        self.assertEqual(len([s for s in shards if s[1]]),6)
+        self.assertEqual(len([s for s in shards if not s[1]]),2)
+    def test_partition_source_excludes(self):
+        """partition_source omits excluded files and directories
+        """
+        dirs,shards = partition_source(self.source,2,
+                                       excludes=["Intensities/","*.log",
+                                                 "/run/Logs"])
+        self.assertEqual(sorted(dirs),["run","run/Data"])
+        self.assertEqual(sorted([f for size,files in shards
+                                 for f in files]),
+                         ["run/Data/c",
+                          "run/a",
+                          "run/b"])
+        self.assertEqual(sorted([size for size,files in shards]),
+                         [100,140])
+
+class TestRunParallelRsync(unittest.TestCase):
+    def setUp(self):
+        # Skip if rsync is not available
+        if find_program('rsync') is None:
+            raise unittest.SkipTest("'rsync' not found")
+        # Create working directory for test files etc
+        self.wd = TestUtils.make_dir()
+        self.source = TestUtils.make_sub_dir(self.wd,"run")
+        TestUtils.make_sub_dir(self.source,"Data/Intensities")
+        TestUtils.make_sub_dir(self.source,"Thumbnail_Images")
+        for i in range(10):
+            TestUtils.make_file("Data/Intensities/s%d.bcl" % i,
+                                "Data %d\n" % i * (i+1),
+                                basedir=self.source)
+        TestUtils.make_file("Thumbnail_Images/a.jpg","Image",
+                            basedir=self.source)
+        TestUtils.make_file("RunInfo.xml","<RunInfo />",
+                            basedir=self.source)
+        TestUtils.make_sym_link("RunInfo.xml","info.xml",
+                                basedir=self.source)
+        self.target = TestUtils.make_sub_dir(self.wd,"target")
+        self.log = os.path.join(self.wd,"rsync.log")
+    def tearDown(self):
+        # Remove the container dir
+        TestUtils.remove_dir(self.wd)
+    def test_run_parallel_rsync_with_verify(self):
+        """run_parallel_rsync copies and verifies a directory
+        """
+        status = run_parallel_rsync(self.source,self.target,3,
+                                    log=self.log,
+                                    excludes=["Thumbnail_Images"],
+                                    verify=True)
+        self.assertEqual(status,0)
+        copy = os.path.join(self.target,"run")
+        for i in range(10):
+            f = os.path.join("Data","Intensities","s%d.bcl" % i)
+            with io.open(os.path.join(copy,f),'rt') as fp:
+                self.assertEqual(fp.read(),"Data %d\n" % i * (i+1))
+        self.assertEqual(os.readlink(os.path.join(copy,"info.xml")),
+                         "RunInfo.xml")
+        self.assertFalse(os.path.exists(os.path.join(copy,
+                                                     "Thumbnail_Images")))
+        for name in ("dirs","shard01","shard02","shard03","attrs"):
+            self.assertTrue(os.path.exists(
+                os.path.join(self.wd,"rsync.%s.log" % name)))
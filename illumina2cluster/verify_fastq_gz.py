@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+#     verify_fastq_gz.py: check integrity of fastq.gz files in a run
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# verify_fastq_gz.py
+#
+#########################################################################
+
+"""verify_fastq_gz.py
+
+Checks that all the fastq.gz files from an Illumina sequencing run
+decompress cleanly (i.e. that the CRC and uncompressed size of each
+gzip member are correct), and optionally that each file contains a
+whole number of Fastq records.
+
+"""
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import os
+import sys
+import io
+import argparse
+import logging
+logging.basicConfig(format="%(levelname)s %(message)s")
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+from bcftbx.IlluminaData import IlluminaData
+from bcftbx.IlluminaData import IlluminaDataError
+from bcftbx.gzipcheck import check_gzip_files
+from bcftbx.gzipcheck import list_fastqs
+from bcftbx.gzipcheck import GzipCheckRecord
+from bcftbx.gzipcheck import GzipCheckResult
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        description="Check that the fastq.gz files in the Illumina "
+        "analysis directory DIR decompress without errors. The "
+        "results for each file are reported as tab-delimited lines "
+        "with the file name, status (OK, FAILED or SKIPPED), number "
+        "of gzip members, uncompressed size, number of lines (if "
+        "checked) and error message.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('--unaligned-dir',action='store',dest='unaligned_dir',
+                   default='Unaligned',
+                   help="specify an alternative name for the "
+                   "'Unaligned' directory containing the fastq.gz "
+                   "files")
+    p.add_argument('-n','--nprocs',action='store',dest='nprocs',
+                   type=int,default=1,
+                   help="number of processes to use for checking "
+                   "files (default: 1)")
+    p.add_argument('--check-lines',action='store_true',dest='check_lines',
+                   help="also check that the number of lines in each "
+                   "file is a multiple of 4")
+    p.add_argument('--report',action='store',dest='report_file',
+                   default=None,
+                   help="write the report for each file to REPORT_FILE "
+                   "(default: write to stdout)")
+    p.add_argument('--record',action='store',dest='record_file',
+                   default=None,
+                   help="keep a record of validated files in "
+                   "RECORD_FILE; files which are recorded as validated "
+                   "and which haven't changed since will be skipped")
+    p.add_argument('analysis_dir',metavar="DIR",
+                   help="Illumina analysis directory")
+    # Parse command line
+    args = p.parse_args()
+    # Locate the fastqs
+    try:
+        illumina_data = IlluminaData(args.analysis_dir,
+                                     unaligned_dir=args.unaligned_dir)
+    except IlluminaDataError as ex:
+        logging.error("Failed to get data from %s: %s" %
+                      (args.analysis_dir,ex))
+        sys.exit(1)
+    fastqs = list_fastqs(illumina_data)
+    print("Checking %d fastq.gz files" % len(fastqs))
+    # Check the files
+    record = None
+    if args.record_file:
+        record = GzipCheckRecord(args.record_file)
+    if args.report_file:
+        fp = io.open(args.report_file,'wt')
+    else:
+        fp = sys.stdout
+    counts = { GzipCheckResult.OK: 0,
+               GzipCheckResult.FAILED: 0,
+               GzipCheckResult.SKIPPED: 0 }
+    try:
+        for result in check_gzip_files(fastqs,nprocs=args.nprocs,
+                                       check_lines=args.check_lines,
+                                       record=record):
+            fp.write(u"%s\n" % result)
+            fp.flush()
+            counts[result.status] += 1
+            if not result.ok:
+                logging.error("%s: %s" % (result.filen,result.error))
+    finally:
+        if args.report_file:
+            fp.close()
+        if record is not None:
+            record.close()
+    print("%d OK, %d failed, %d skipped" % (counts[GzipCheckResult.OK],
+                                            counts[GzipCheckResult.FAILED],
+                                            counts[GzipCheckResult.SKIPPED]))
+    sys.exit(1 if counts[GzipCheckResult.FAILED] else 0)
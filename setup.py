@@ -40,7 +40,9 @@ setup(name = "genomics-bcftbx",
                           'xlrd >= 0.7.1',
                           'xlutils >= 1.4.1',
                           'xlsxwriter >= 0.8.4',
-                          'future',],
+                          'future',
+                          'scandir; python_version < "3.5"',
+                          'futures; python_version < "3"',],
       # Enable 'python setup.py test'
       test_suite='nose.collector',
       tests_require=['nose'],
@@ -43,6 +43,10 @@ Jobs by node:
                          1 (0/0)         5 (0/0)
 --
 
+The 'cluster_usage' function returns a summary of the current usage
+which can be used to adjust the number of jobs that a pipeline runs at
+once (see the 'AdaptiveThrottle' class in the 'bcftbx.Pipeline'
+module).
 """
 
 #######################################################################
@@ -50,6 +54,7 @@ Jobs by node:
 #######################################################################
 
 import os
+import getpass
 import subprocess
 import logging
 
@@ -222,7 +227,8 @@ def qstat(user=None):
         cmd = ['qstat','-u',user]
         # Run the qstat
         try:
-            p = subprocess.Popen(cmd,stdout=subprocess.PIPE)
+            p = subprocess.Popen(cmd,stdout=subprocess.PIPE,
+                                 universal_newlines=True)
         except Exception as ex:
             logging.error("Exception when running qstat: %s" % ex)
             return []
@@ -256,6 +262,35 @@ def qstat(user=None):
                 pass
         return jobs
 
+def cluster_usage(queue=None,user=None):
+    """Return a summary of the current cluster usage
+
+    Runs qstat once for all users and counts the running and
+    pending (i.e. queued or held) jobs. Pending jobs are not
+    yet assigned to a queue, so if 'queue' is specified then
+    only the running jobs are restricted to that queue.
+
+    Arguments:
+      queue: (optional) only count running jobs in this queue
+      user: (optional) user to count 'own' jobs for (defaults
+        to the current user)
+
+    Returns:
+      Dictionary with the items 'running', 'pending',
+      'own_running' and 'own_pending'.
+    """
+    if user is None:
+        user = getpass.getuser()
+    qstatus = Qstat(user='*')
+    running = qstatus.filter('state','r*')
+    if queue is not None:
+        running = running.filter('queue_name',queue)
+    pending = qstatus.filter('state','*qw')
+    return dict(running=len(running),
+                pending=len(pending),
+                own_running=len(running.filter('user',user)),
+                own_pending=len(pending.filter('user',user)))
+
 #######################################################################
 # Main program
 #######################################################################
@@ -19,7 +19,7 @@ Compare the contents of two directories.
 # Module metadata
 #######################################################################
 
-__version__ = '0.1.1'
+__version__ = '0.2.0'
 
 #######################################################################
 # Import modules that this module depends on
@@ -27,10 +27,15 @@ __version__ = '0.1.1'
 
 import sys
 import os
+import io
 import argparse
 import logging
 import itertools
-from multiprocessing import Pool
+import functools
+import collections
+import time
+import json
+from multiprocessing.pool import ThreadPool
 
 # Put .. onto Python search path for modules
 SHARE_DIR = os.path.abspath(
@@ -38,6 +43,7 @@ SHARE_DIR = os.path.abspath(
         os.path.join(os.path.dirname(sys.argv[0]),'..')))
 sys.path.append(SHARE_DIR)
 import bcftbx.Md5sum as Md5sum
+import bcftbx.utils as utils
 
 #######################################################################
 # Classes
@@ -55,7 +61,8 @@ class CmpResult(object):
         Md5sum.Md5Checker.MISSING_TARGET: 'FAILED: target missing',
         Md5sum.Md5Checker.LINKS_SAME: 'OK',
         Md5sum.Md5Checker.LINKS_DIFFER: 'FAILED: symlink targets don\'t match',
-        Md5sum.Md5Checker.TYPES_DIFFER: 'FAILED: different types'
+        Md5sum.Md5Checker.TYPES_DIFFER: 'FAILED: different types',
+        Md5sum.Md5Checker.SIZES_DIFFER: 'FAILED: sizes don\'t match'
     }
     def __init__(self,path,path2,status):
         """Create a new CmpResult
@@ -80,6 +87,93 @@ class CmpResult(object):
 
         """
         return self._status_messages[self.status]
+    @property
+    def ok(self):
+        """Return True if the comparison was successful
+
+        """
+        return self.status in (Md5sum.Md5Checker.MD5_OK,
+                               Md5sum.Md5Checker.LINKS_SAME)
+
+class JsonReport(object):
+    """Class to write comparison results as a JSON report
+
+    Results are written to the underlying file as they are
+    added (rather than being accumulated in memory), so
+    arbitrarily large comparisons can be reported.
+
+    The report is a JSON object of the form:
+
+    {
+      "dir1": "/path/to/dir1",
+      "dir2": "/path/to/dir2",
+      "results": [
+         { "path": "relative/path",
+           "status": 0,
+           "message": "OK",
+           "ok": true },
+         ...
+      ],
+      "counts": { "0": 10, ... },
+      "examined": 10,
+      "verified": 10
+    }
+
+    Example usage:
+
+    >>> with io.open("report.json","wt") as fp:
+    ...   report = JsonReport(fp,dir1,dir2)
+    ...   for result in results:
+    ...     report.add(result)
+    ...   report.close(counts)
+
+    """
+    def __init__(self,fp,dir1,dir2):
+        """Create a new JsonReport
+
+        Arguments:
+          fp  : file-like object to write the report to
+          dir1: 'reference' directory for the comparison
+          dir2: directory being compared against reference
+
+        """
+        self._fp = fp
+        self._dir1 = os.path.abspath(dir1)
+        self._nresults = 0
+        self._fp.write('{"dir1": %s, "dir2": %s, "results": [' %
+                       (json.dumps(self._dir1),
+                        json.dumps(os.path.abspath(dir2))))
+    def add(self,result):
+        """Write a CmpResult to the report
+
+        Arguments:
+          result: CmpResult instance
+
+        """
+        if self._nresults:
+            self._fp.write(',')
+        self._fp.write('\n  %s' %
+                       json.dumps(dict(path=result.relpath(self._dir1),
+                                       status=result.status,
+                                       message=result.status_message,
+                                       ok=result.ok),
+                                  sort_keys=True))
+        self._nresults += 1
+    def close(self,counts):
+        """Write the summary counts and finish the report
+
+        Arguments:
+          counts: dictionary of counts for each result code
+            (as returned by 'cmp_dirs')
+
+        """
+        examined,verified = summarise_counts(counts)
+        self._fp.write('\n ],\n "counts": %s,\n "examined": %d,'
+                       '\n "verified": %d}\n' %
+                       (json.dumps(dict([(str(x),counts[x])
+                                         for x in counts]),
+                                   sort_keys=True),
+                        examined,verified))
 
 #######################################################################
 # Functions
@@ -96,25 +190,58 @@ def yield_filepairs(dir1,dir2,include_dirs=False):
     but the second may not. Also additional files may exist
     under dir2 but these will not be returned.
 
+    Symbolic links (including links to directories) are returned
+    as pairs, but links to directories are not traversed.
+
     """
     dir1 = os.path.abspath(dir1)
     dir2 = os.path.abspath(dir2)
-    for d in os.walk(dir1,followlinks=True):
-        d1 = os.path.normpath(d[0])
-        if os.path.islink(d1):
-            yield (d1,os.path.normpath(
-                os.path.join(dir2,os.path.relpath(d1,dir1))))
-        else:
-            if include_dirs:
-                yield (d1,os.path.normpath(
-                    os.path.join(dir2,os.path.relpath(d1,dir1))))
-            for f in d[2]:
-                # File in dir1
-                f1 = os.path.join(d1,f)
-                f2 = os.path.join(dir2,os.path.relpath(f1,dir1))
-                yield (f1,f2)
-
-def cmp_filepair(file_pair):
+    if include_dirs:
+        yield (dir1,dir2)
+    for entry in utils.scan_tree(dir1):
+        f1 = entry.path
+        if include_dirs or entry.is_symlink() or \
+           not entry.is_dir(follow_symlinks=False):
+            f2 = os.path.join(dir2,os.path.relpath(f1,dir1))
+            yield (f1,f2)
+
+def yield_extra_filepairs(dir1,dir2):
+    """Return pairs of files which only exist under dir2
+
+    Walk directory structure under dir2 and iteratively yield
+    file pair tuples (f1,f2), where f2 is a file, directory
+    or link under dir2 which has no counterpart f1 under dir1
+    (i.e. the complement of 'yield_filepairs').
+
+    The contents of each directory under dir1 are listed
+    once and compared against the corresponding directory
+    under dir2, rather than checking for each file
+    individually.
+
+    Links to directories are not traversed.
+
+    """
+    dir1 = os.path.abspath(dir1)
+    dir2 = os.path.abspath(dir2)
+    current_dir = None
+    names = set()
+    for entry in utils.scan_tree(dir2):
+        # Entries from the same directory are returned
+        # together, so only need to list the counterpart
+        # directory once
+        parent = os.path.dirname(entry.path)
+        if parent != current_dir:
+            current_dir = parent
+            try:
+                names = set(os.listdir(
+                    os.path.join(dir1,os.path.relpath(parent,dir2))))
+            except OSError:
+                names = set()
+        if entry.name not in names:
+            f1 = os.path.join(dir1,os.path.relpath(entry.path,dir2))
+            yield (f1,entry.path)
+
+def cmp_filepair(file_pair,level=Md5sum.Md5Checker.CMP_MD5):
     """Compare a pair of files
 
     'file_pair' is a tuple consisting of a pair of file paths
@@ -123,8 +250,15 @@ def cmp_filepair(file_pair):
     The two paths are compared and a CmpResult object is
     returned.
 
+    Regular files are compared in tiers (type, then size, then
+    sampled blocks, then full MD5 sums) up to the specified
+    'level' (see 'Md5Checker.cmp_files').
+
     Arguments:
       file_pair: tuple 
+      level: (optional) Md5Checker constant specifying the
+        highest level of comparison for files (defaults to
+        CMP_MD5 i.e. full MD5 sums)
 
     """
     f1,f2 = file_pair
@@ -135,16 +269,14 @@ def cmp_filepair(file_pair):
         if not os.path.lexists(f2):
             result = Md5sum.Md5Checker.MISSING_TARGET
         elif os.path.islink(f1):
-            print("%s: is link" % f1)
             # Compare links
             if os.path.islink(f2):
-                print("%s: is link" % f2)
                 if os.readlink(f1) == os.readlink(f2):
                     result = Md5sum.Md5Checker.LINKS_SAME
                 else:
                     result = Md5sum.Md5Checker.LINKS_DIFFER
             else:
-                print("%s: is not link" % f2)
+                logging.debug("%s: is not link" % f2)
                 result = Md5sum.Md5Checker.TYPES_DIFFER
         elif os.path.isdir(f1):
             # Compare directories
@@ -154,17 +286,75 @@ def cmp_filepair(file_pair):
                 result = Md5sum.Md5Checker.TYPES_DIFFER
         else:
             # Compare files
-            result = Md5sum.Md5Checker.md5cmp_files(f1,f2)
+            result = Md5sum.Md5Checker.cmp_files(f1,f2,level=level)
     return CmpResult(f1,f2,result)
 
-def cmp_dirs(dir1,dir2,n=1):
+def bounded_imap(func,iterable,n=1,max_pending=None):
+    """Apply a function to each item of an iterable using threads
+
+    Works like 'itertools.imap' (and the Python 3 'map'
+    function), yielding the results in the same order as the
+    inputs; however if 'n' is greater than one then the
+    function calls are run in a pool of 'n' threads.
+
+    Unlike 'ThreadPool.imap', items are only fetched from the
+    iterable as results are consumed, so that no more than
+    'max_pending' items are held in memory at any one time.
+
+    Arguments:
+      func: function to apply to each item
+      iterable: iterable supplying the items
+      n: number of threads to use (defaults to 1 i.e. all
+        calls are made serially in the current thread)
+      max_pending: maximum number of outstanding function
+        calls (defaults to four times the number of threads)
+
+    Returns:
+      Yields the result of 'func' for each item.
+    """
+    if n <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+    if max_pending is None:
+        max_pending = 4*n
+    pool = ThreadPool(n)
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(pool.apply_async(func,(item,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+
+def cmp_dirs(dir1,dir2,n=1,level=Md5sum.Md5Checker.CMP_MD5,
+             report_extra=False,json_report=None,progress_interval=None):
     """Compare the contents of a pair of directories
 
+    The directories are traversed and compared incrementally,
+    with the result for each file being printed as soon as it
+    is available (so the whole list of files is never held in
+    memory).
+
     Arguments:
       dir1: 'reference' directory for comparison
       dir2: directory to compare against reference
-      n:    number of processors to use (defaults to 1
-            i.e. single core)
+      n:    number of threads to use for comparing files
+            (defaults to 1 i.e. single thread)
+      level: highest level of comparison to use for files
+            (defaults to CMP_MD5 i.e. full MD5 sums)
+      report_extra: if True then also report files under
+            dir2 which are not present under dir1 (these are
+            reported as MISSING_SOURCE; default is to ignore
+            them)
+      json_report: (optional) JsonReport instance which each
+            result will also be written to
+      progress_interval: (optional) if set then report the
+            progress to stderr at this interval (in seconds)
 
     Returns:
       Dictionary where keys are comparison result codes
@@ -173,51 +363,112 @@ def cmp_dirs(dir1,dir2,n=1):
 
     """
     counts = {}
-    if n == 1:
-        mapper = itertools.imap
-    else:
-        pool = Pool(n)
-        mapper = pool.imap
-    for result in mapper(cmp_filepair,yield_filepairs(dir1,dir2)):
+    file_pairs = yield_filepairs(dir1,dir2)
+    if report_extra:
+        file_pairs = itertools.chain(file_pairs,
+                                     yield_extra_filepairs(dir1,dir2))
+    start_time = time.time()
+    last_report = start_time
+    nexamined = 0
+    nfailed = 0
+    for result in bounded_imap(functools.partial(cmp_filepair,level=level),
+                               file_pairs,n=n):
         print("%s: %s" % (result.relpath(dir1),result.status_message))
+        sys.stdout.flush()
+        if json_report is not None:
+            json_report.add(result)
         try:
             counts[result.status] += 1
         except KeyError:
             counts[result.status] = 1
-    if n > 1:
-        pool.close()
-        pool.join()
+        nexamined += 1
+        if not result.ok:
+            nfailed += 1
+        if progress_interval is not None:
+            now = time.time()
+            if now - last_report >= progress_interval:
+                last_report = now
+                sys.stderr.write("%d examined, %d failed (%.1f/s)\n" %
+                                 (nexamined,nfailed,
+                                  nexamined/(now - start_time)))
     return counts
 
+def summarise_counts(counts):
+    """Return the total and verified numbers from comparison counts
+
+    Arguments:
+      counts: dictionary of counts for each result code
+        (as returned by 'cmp_dirs')
+
+    Returns:
+      Tuple (examined,verified) with the total number of
+      items examined and the number which were verified as
+      matching.
+    """
+    examined = sum([counts[x] for x in counts])
+    verified = 0
+    for status in (Md5sum.Md5Checker.MD5_OK,Md5sum.Md5Checker.LINKS_SAME):
+        try:
+            verified += counts[status]
+        except KeyError:
+            pass
+    return (examined,verified)
+
 #######################################################################
 # Main
 #######################################################################
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser(
-        version="%(prog)s "+__version__,
         description="Compare contents of DIR1 against "
         "corresponding files and directories in DIR2. "
         "Files are compared using MD5 sums, symlinks "
-        "using their targets.")
-    p.add_argument('-n',action='store',dest='n_processors',
+        "using their targets. Files and directories "
+        "which only exist in DIR2 are ignored unless "
+        "--report-extra is specified.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-n',action='store',dest='n_threads',
                    default=1,type=int,
-                   help="specify number of cores to use")
+                   help="specify number of threads to use for "
+                   "comparing files")
+    p.add_argument('--level',action='store',dest='level',
+                   default='md5',
+                   choices=Md5sum.Md5Checker.CMP_LEVEL_NAMES,
+                   help="highest level of comparison to use for files: "
+                   "'type' (existence and type only), 'size' (also "
+                   "compare sizes), 'sample' (also compare MD5 sums of "
+                   "blocks sampled from the start, middle and end), or "
+                   "'md5' (also compare full MD5 sums; default)")
+    p.add_argument('--report-extra',action='store_true',
+                   dest='report_extra',
+                   help="also report files and directories which only "
+                   "exist in DIR2 (these are counted as failures)")
+    p.add_argument('--json',action='store',dest='json_file',
+                   default=None,
+                   help="also write the results as a JSON report to "
+                   "JSON_FILE")
+    p.add_argument('--progress',action='store',dest='progress',
+                   default=None,type=float,metavar='SECONDS',
+                   help="report progress (number of items examined "
+                   "and rate) to stderr every SECONDS seconds")
     p.add_argument('dir1',metavar="DIR1",help="source directory")
     p.add_argument('dir2',metavar="DIR2",help="target directory to compare "
                    "against DIR1")
     args = p.parse_args()
-    counts = cmp_dirs(args.dir1,args.dir2,n=args.n_processors)
-    if counts:
-        total = sum([counts[x] for x in counts])
-    else:
-        total = 0
-    verified = 0
-    for status in (Md5sum.Md5Checker.MD5_OK,Md5sum.Md5Checker.LINKS_SAME):
-        try:
-            verified += counts[status]
-        except KeyError:
-            pass
+    level = Md5sum.Md5Checker.CMP_LEVEL_NAMES.index(args.level)
+    json_fp = None
+    json_report = None
+    if args.json_file:
+        json_fp = io.open(args.json_file,'wt')
+        json_report = JsonReport(json_fp,args.dir1,args.dir2)
+    counts = cmp_dirs(args.dir1,args.dir2,n=args.n_threads,level=level,
+                      report_extra=args.report_extra,
+                      json_report=json_report,
+                      progress_interval=args.progress)
+    if json_report is not None:
+        json_report.close(counts)
+        json_fp.close()
+    total,verified = summarise_counts(counts)
     print("Verified %d out of total %d examined" % (verified,total))
     sys.exit(0 if total == verified else 1)
-
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+#
+#     job_metrics_summary.py: summarise job metrics from PipelineRunner
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# job_metrics_summary.py
+#
+#########################################################################
+
+"""job_metrics_summary.py
+
+Summarise the job metrics records written by a 'PipelineRunner'
+(via its 'metrics_file' argument), either as JSON lines or as CSV.
+For each pipeline in the file(s) it reports a summary of the form:
+
+--
+Pipeline 20200612101530.12345
+Jobs            : 120 (2 failed, 0 skipped)
+Makespan        : 1:02:10
+Throughput      : 115.8 jobs/hour
+Slot utilisation: 87.2% (of 8 slots)
+Queue wait      : mean 0:00:41 max 0:05:12
+Slowest jobs:
+    0:20:31 fastqc.PJB1 (job 1234)
+    ...
+--
+
+The slot utilisation is the total slot-time used by the jobs
+(the run time of each job multiplied by the number of slots it
+used) as a percentage of the makespan multiplied by the number of
+slots available. The number of slots can be specified on the
+command line; otherwise the peak number of slots observed to be in
+use at once is used.
+"""
+
+#######################################################################
+# Module metadata
+#######################################################################
+
+__version__ = "0.1.0"
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import sys
+import io
+import csv
+import json
+import argparse
+import collections
+import logging
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Fields in the metrics records which hold numbers
+NUMERIC_FIELDS = ('exit_status',
+                  'submit_time',
+                  'start_time',
+                  'end_time',
+                  'queue_wait',
+                  'run_time',
+                  'nslots',
+                  'max_rss',
+                  'cpu_time')
+
+#######################################################################
+# Functions
+#######################################################################
+
+def read_metrics(metrics_file):
+    """Read the job metrics records from a file
+
+    The file is read as CSV if the name ends with
+    '.csv', otherwise as JSON lines.
+
+    Arguments:
+      metrics_file (str): path to the file to read
+
+    Returns:
+      List of dictionaries (one for each record), with
+      values for the fields in 'NUMERIC_FIELDS' converted
+      to numbers (or None if the value is missing).
+    """
+    records = []
+    if metrics_file.endswith('.csv'):
+        with open(metrics_file) as fp:
+            for record in csv.DictReader(fp):
+                records.append(dict(record))
+    else:
+        with io.open(metrics_file,'rt') as fp:
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logging.warning("%s: bad record ignored: %s" %
+                                    (metrics_file,line))
+    for record in records:
+        for field in NUMERIC_FIELDS:
+            value = record.get(field)
+            if value in ('',None):
+                record[field] = None
+            else:
+                try:
+                    record[field] = float(value)
+                except ValueError:
+                    record[field] = None
+    return records
+
+def peak_slots(records):
+    """Return the peak number of slots in use at once
+
+    Arguments:
+      records (list): job metrics records
+
+    Returns:
+      Maximum of the total number of slots used by the
+      jobs which were running at the same time.
+    """
+    events = []
+    for record in records:
+        if record['start_time'] is None or record['end_time'] is None:
+            continue
+        nslots = record['nslots'] or 1
+        events.append((record['start_time'],1,nslots))
+        events.append((record['end_time'],0,-nslots))
+    # Jobs ending at the same time as others start are
+    # sorted first
+    peak = 0
+    nslots = 0
+    for t,start,n in sorted(events):
+        nslots += n
+        peak = max(peak,nslots)
+    return int(peak)
+
+def summarise_metrics(records,slots=None,nslowest=5):
+    """Summarise job metrics for each pipeline
+
+    Arguments:
+      records (list): job metrics records (e.g. from
+        'read_metrics')
+      slots (int): (optional) number of slots available to
+        the pipelines (defaults to the peak number of slots
+        used by each pipeline)
+      nslowest (int): number of the slowest jobs to report
+        for each pipeline (default: 5)
+
+    Returns:
+      Ordered dictionary where the keys are the pipeline ids
+      and the values are dictionaries with the summary for
+      that pipeline.
+    """
+    pipelines = collections.OrderedDict()
+    for record in records:
+        pipelines.setdefault(record.get('pipeline'),[]).append(record)
+    summaries = collections.OrderedDict()
+    for pipeline in pipelines:
+        jobs = pipelines[pipeline]
+        ran = [job for job in jobs if job['run_time'] is not None]
+        summary = dict(njobs=len(jobs),
+                       nfailed=len([job for job in jobs
+                                    if job['exit_status'] not in (0,None)]),
+                       nskipped=len([job for job in jobs
+                                     if job.get('status') in ('Skipped',
+                                                              'Up to date')]),
+                       makespan=None,
+                       throughput=None,
+                       slots=slots,
+                       utilisation=None,
+                       mean_queue_wait=None,
+                       max_queue_wait=None,
+                       slowest=sorted(ran,key=lambda job: job['run_time'],
+                                      reverse=True)[:nslowest])
+        start_times = [job['submit_time'] for job in jobs
+                       if job['submit_time'] is not None]
+        end_times = [job['end_time'] for job in jobs
+                     if job['end_time'] is not None]
+        if start_times and end_times:
+            summary['makespan'] = max(end_times) - min(start_times)
+        if summary['makespan']:
+            summary['throughput'] = len(jobs)/summary['makespan']*3600.0
+            if summary['slots'] is None:
+                summary['slots'] = peak_slots(ran)
+            if summary['slots']:
+                slot_time = sum([job['run_time']*(job['nslots'] or 1)
+                                 for job in ran])
+                summary['utilisation'] = slot_time/\
+                                         (summary['makespan']*summary['slots'])
+        queue_waits = [job['queue_wait'] for job in jobs
+                       if job['queue_wait'] is not None]
+        if queue_waits:
+            summary['mean_queue_wait'] = sum(queue_waits)/len(queue_waits)
+            summary['max_queue_wait'] = max(queue_waits)
+        summaries[pipeline] = summary
+    return summaries
+
+def format_time(t):
+    """Format a time interval in seconds as 'H:MM:SS'
+
+    Returns 'n/a' if the time is None.
+    """
+    if t is None:
+        return "n/a"
+    t = int(round(t))
+    return "%d:%02d:%02d" % (t//3600,(t%3600)//60,t%60)
+
+def report(summaries,fp=sys.stdout):
+    """Write a report of the pipeline summaries
+
+    Arguments:
+      summaries (dict): summaries returned by
+        'summarise_metrics'
+      fp (file): (optional) stream to write the report to
+        (defaults to stdout)
+    """
+    for pipeline in summaries:
+        summary = summaries[pipeline]
+        fp.write(u"Pipeline %s\n" % pipeline)
+        fp.write(u"Jobs            : %d (%d failed, %d skipped)\n" %
+                 (summary['njobs'],summary['nfailed'],summary['nskipped']))
+        fp.write(u"Makespan        : %s\n" % format_time(summary['makespan']))
+        if summary['throughput'] is not None:
+            fp.write(u"Throughput      : %.1f jobs/hour\n" %
+                     summary['throughput'])
+        if summary['utilisation'] is not None:
+            fp.write(u"Slot utilisation: %.1f%% (of %d slots)\n" %
+                     (summary['utilisation']*100.0,summary['slots']))
+        fp.write(u"Queue wait      : mean %s max %s\n" %
+                 (format_time(summary['mean_queue_wait']),
+                  format_time(summary['max_queue_wait'])))
+        if summary['slowest']:
+            fp.write(u"Slowest jobs:\n")
+            for job in summary['slowest']:
+                fp.write(u"    %s %s (job %s)\n" %
+                         (format_time(job['run_time']),job.get('name'),
+                          job.get('job_id')))
+        fp.write(u"\n")
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(
+        description="Summarise the job metrics written by a "
+        "PipelineRunner: reports the throughput, slot utilisation, "
+        "queue wait times and slowest jobs for each pipeline")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-s','--slots',type=int,default=None,
+                   help="number of slots available to the pipelines "
+                   "(default: use the peak number of slots in use)")
+    p.add_argument('-n','--slowest',type=int,default=5,
+                   help="number of slowest jobs to report for each "
+                   "pipeline (default: 5)")
+    p.add_argument('metrics_files',metavar="METRICS_FILE",nargs='+',
+                   help="job metrics file (CSV if the name ends with "
+                   "'.csv', otherwise JSON lines)")
+    args = p.parse_args()
+    records = []
+    for metrics_file in args.metrics_files:
+        records.extend(read_metrics(metrics_file))
+    report(summarise_metrics(records,slots=args.slots,
+                             nslowest=args.slowest))
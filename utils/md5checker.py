@@ -22,7 +22,7 @@ to perform the underlying operations.
 # Module metadata
 #######################################################################
 
-__version__ = "0.4.3"
+__version__ = "0.5.0"
 
 #######################################################################
 # Import modules that this module depends on
@@ -44,7 +44,7 @@ import bcftbx.Md5sum as Md5sum
 # Functions
 #######################################################################
 
-def compute_md5sums(dirn,output_file=None,relative=False):
+def compute_md5sums(dirn,output_file=None,relative=False,cache=None):
     """Compute and write MD5 sums for all files in a directory
 
     Walks the directory tree under the specified directory and
@@ -60,6 +60,7 @@ def compute_md5sums(dirn,output_file=None,relative=False):
       output_file: (optional) name of file to write MD5 sums to
       relative: if True then output file paths relative to
         the supplied directory (otherwise write absolute paths)
+      cache: (optional) Md5Cache instance to use for checksums
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -69,7 +70,8 @@ def compute_md5sums(dirn,output_file=None,relative=False):
         fp = io.open(output_file,'wt')
     else:
         fp = sys.stdout
-    for filen,chksum in Md5sum.Md5Checker.compute_md5sums(dirn):
+    for filen,chksum in Md5sum.Md5Checker.compute_md5sums(dirn,
+                                                          cache=cache):
         if not relative:
             filen = os.path.join(dirn,filen)
         fp.write(u"%s  %s\n" % (chksum,filen))
@@ -77,7 +79,7 @@ def compute_md5sums(dirn,output_file=None,relative=False):
         fp.close()
     return retval
 
-def compute_md5sum_for_file(filen,output_file=None):
+def compute_md5sum_for_file(filen,output_file=None,cache=None):
     """Compute and write MD5 sum for specifed file
 
     Computes the MD5 sum for a file, and writes the sum and the file
@@ -89,6 +91,7 @@ def compute_md5sum_for_file(filen,output_file=None):
     Arguments:
       filen: file to compute the MD5 sum for
       output_file: (optional) name of file to write MD5 sum to
+      cache: (optional) Md5Cache instance to use for checksums
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -100,7 +103,7 @@ def compute_md5sum_for_file(filen,output_file=None):
     else:
         fp = sys.stdout
     try:
-        chksum = Md5sum.md5sum(filen)
+        chksum = Md5sum.Md5Checker.md5sum(filen,cache=cache)
         fp.write(u"%s  %s\n" % (chksum,filen))
     except IOError as ex:
         # Error accessing file, report and skip
@@ -110,7 +113,8 @@ def compute_md5sum_for_file(filen,output_file=None):
         fp.close()
     return retval
 
-def verify_md5sums(chksum_file,verbose=False):
+def verify_md5sums(chksum_file,verbose=False,cache=None,
+                   order=Md5sum.Md5Checker.ORDER_MANIFEST,nthreads=1):
     """Check the MD5 sums for all entries specified in a file
 
     For all entries in the supplied file, check the MD5 sum is
@@ -125,19 +129,28 @@ def verify_md5sums(chksum_file,verbose=False):
       verbose: (optional) if True then report status for all
         files checked, plus a summary; otherwise only report
         failures
+      cache: (optional) Md5Cache instance to use for checksums
+      order: (optional) order to verify the files in (see
+        'Md5Checker.verify_md5sums'; default is the order they
+        appear in the input file)
+      nthreads: (optional) number of threads to use for
+        verification (default: 1)
 
     Returns:
       Zero on success, 1 if errors were encountered
 
     """
     # Set up reporter object
-    reporter = Md5sum.Md5CheckReporter(Md5sum.Md5Checker.verify_md5sums(chksum_file),
-                                       verbose=verbose)
+    reporter = Md5sum.Md5CheckReporter(
+        Md5sum.Md5Checker.verify_md5sums(chksum_file,cache=cache,
+                                         order=order,nthreads=nthreads),
+        verbose=verbose)
     # Summarise
     if verbose: reporter.summary()
     return reporter.status
 
-def diff_directories(dirn1,dirn2,verbose=False):
+def diff_directories(dirn1,dirn2,verbose=False,cache=None,
+                     level=Md5sum.Md5Checker.CMP_MD5):
     """Check one directory against another using MD5 sums
 
     This compares one directory against another by computing the
@@ -158,19 +171,25 @@ def diff_directories(dirn1,dirn2,verbose=False):
       dirn2: "target" directory to be compared to dirn1
       verbose: (optional) if True then report status for all
         files checked; otherwise only report summary
+      cache: (optional) Md5Cache instance to use for checksums
+      level: (optional) highest level of comparison to perform
+        (see 'Md5Checker.cmp_files'; defaults to full MD5 sums)
 
     Returns:
       Zero on success, 1 if errors were encountered
 
     """
     # Set up reporter object
-    reporter = Md5sum.Md5CheckReporter(Md5sum.Md5Checker.md5cmp_dirs(dirn1,dirn2),
-                                       verbose=verbose)
+    reporter = Md5sum.Md5CheckReporter(
+        Md5sum.Md5Checker.md5cmp_dirs(dirn1,dirn2,cache=cache,
+                                      level=level),
+        verbose=verbose)
     # Summarise
     if verbose: reporter.summary()
     return reporter.status
 
-def diff_files(filen1,filen2,verbose=False):
+def diff_files(filen1,filen2,verbose=False,cache=None,
+               level=Md5sum.Md5Checker.CMP_MD5):
     """Check that the MD5 sums of two files match
 
     This compares two files by computing the MD5 sums for each.
@@ -180,6 +199,9 @@ def diff_files(filen1,filen2,verbose=False):
       filen2: "target" file to be compared with filen1
       verbose: (optional) if True then report status for all
         files checked; otherwise only report summary
+      cache: (optional) Md5Cache instance to use for checksums
+      level: (optional) highest level of comparison to perform
+        (see 'Md5Checker.cmp_files'; defaults to full MD5 sums)
 
     Returns:
       Zero on success, 1 if errors were encountered
@@ -188,10 +210,14 @@ def diff_files(filen1,filen2,verbose=False):
     # Set up reporter object
     reporter = Md5sum.Md5CheckReporter()
     # Compare files
-    reporter.add_result(filen1,Md5sum.Md5Checker.md5cmp_files(filen1,filen2))
+    status = Md5sum.Md5Checker.cmp_files(filen1,filen2,level=level,
+                                         cache=cache)
+    reporter.add_result(filen1,status)
     if verbose:
         if reporter.n_ok:
             print("OK: MD5 sums match")
+        elif status == Md5sum.Md5Checker.SIZES_DIFFER:
+            print("FAILED: file sizes don't match")
         elif reporter.n_failed:
             print("FAILED: MD5 sums don't match")
         else:
@@ -249,6 +275,16 @@ if __name__ == "__main__":
                                  "matching MD5 sums. Note that files that "
                                  "are only present in TARGET_DIR are not "
                                  "reported.")
+    group.add_argument('--level',action="store",dest="level",
+                       default='md5',
+                       choices=Md5sum.Md5Checker.CMP_LEVEL_NAMES,
+                       help="highest level of comparison to use with "
+                       "-d: 'type' (existence and type only), 'size' "
+                       "(also compare sizes), 'sample' (also compare MD5 "
+                       "sums of blocks sampled from the start, middle and "
+                       "end of each file), or 'md5' (also compare full MD5 "
+                       "sums; default). Each level stops at the first "
+                       "difference found")
 
     # File differencing
     group = p.add_argument_group("File comparison (-d, --diff)",
@@ -274,6 +310,45 @@ if __name__ == "__main__":
                                  "relative to the current directory. "
                                  "This option behaves the same as the Linux "
                                  "'md5sum' tool.")
+    group.add_argument('--order',action="store",dest="order",
+                       default='manifest',
+                       choices=Md5sum.Md5Checker.ORDER_NAMES,
+                       help="order to read files in when verifying: "
+                       "'manifest' (order listed in CHKSUM_FILE; default), "
+                       "'inode' (by device and inode number) or "
+                       "'directory' (by parent directory). Results are "
+                       "always reported in the order listed in "
+                       "CHKSUM_FILE")
+    group.add_argument('-n','--threads',action="store",dest="nthreads",
+                       type=int,default=1,
+                       help="number of threads to use when verifying "
+                       "(default: 1)")
+
+    # Checksum cache
+    group = p.add_argument_group("Checksum cache",
+                                 "Optionally store MD5 sums in a persistent "
+                                 "cache, so that files whose size, "
+                                 "modification time and inode haven't "
+                                 "changed since the last run are not "
+                                 "read again.")
+    group.add_argument('--cache',action="store",dest="cache_file",
+                       default=None,
+                       help="use CACHE_FILE (an SQLite database, which "
+                       "will be created if it doesn't exist) to store and "
+                       "look up MD5 sums")
+    cache_mode = group.add_mutually_exclusive_group()
+    cache_mode.add_argument('--trust-cache',action="store_false",
+                            dest="rehash",default=False,
+                            help="reuse cached MD5 sums for files which "
+                            "appear to be unchanged (default)")
+    cache_mode.add_argument('--rehash',action="store_true",dest="rehash",
+                            help="recompute all MD5 sums regardless of "
+                            "the cached values, and update the cache")
+    group.add_argument('--verify-fraction',action="store",
+                       dest="verify_fraction",type=float,default=0.0,
+                       help="recompute a randomly sampled fraction "
+                       "VERIFY_FRACTION (between 0 and 1) of the cached "
+                       "MD5 sums as a check on the cache (default: 0)")
 
     # Process the command line
     arguments,args = p.parse_known_args()
@@ -281,6 +356,15 @@ if __name__ == "__main__":
     # Set up logging output
     logging.basicConfig(format='%(message)s')
 
+    # Set up checksum cache
+    cache = None
+    if arguments.cache_file:
+        if not 0.0 <= arguments.verify_fraction <= 1.0:
+            p.error("--verify-fraction: must be between 0 and 1")
+        cache = Md5sum.Md5Cache(arguments.cache_file,
+                                rehash=arguments.rehash,
+                                verify_fraction=arguments.verify_fraction)
+
     # Figure out mode of operation
     if arguments.check:
         # Running in "check" mode
@@ -291,13 +375,21 @@ if __name__ == "__main__":
             p.error("Checksum '%s' file not found (or is not a file)" % 
                     chksum_file)
         # Do the verification
+        if arguments.nthreads < 1:
+            p.error("-n: number of threads must be at least 1")
         status = verify_md5sums(chksum_file,
-                                verbose=arguments.verbose)
+                                verbose=arguments.verbose,
+                                cache=cache,
+                                order=Md5sum.Md5Checker.ORDER_NAMES.index(
+                                    arguments.order),
+                                nthreads=arguments.nthreads)
     elif arguments.diff:
         # Running in "diff" mode
         if len(args) != 2:
             p.error("-d: takes two arguments but got %s: %s"
                     % (len(args),args))
+        # Comparison level
+        level = Md5sum.Md5Checker.CMP_LEVEL_NAMES.index(arguments.level)
         # Get directories/files as absolute paths
         source = os.path.abspath(args[0])
         target = os.path.abspath(args[1])
@@ -310,14 +402,18 @@ if __name__ == "__main__":
                    "originals in %s" % (target,source),arguments.verbose)
             status = diff_directories(source,
                                       target,
-                                      verbose=arguments.verbose)
+                                      verbose=arguments.verbose,
+                                      cache=cache,
+                                      level=level)
         elif os.path.isfile(source) and os.path.isfile(target):
             # Compare two files
             report("Checking MD5 sums for %s and %s" % (source,target),
                    arguments.verbose)
             status = diff_files(source,
                                 target,
-                                verbose=arguments.verbose)
+                                verbose=arguments.verbose,
+                                cache=cache,
+                                level=level)
         else:
             p.error("Supplied arguments must be a pair of directories "
                     "or a pair of files")
@@ -332,11 +428,18 @@ if __name__ == "__main__":
             output_file = arguments.chksum_file
         # Generate the checksums
         if os.path.isdir(args[0]):
-            status = compute_md5sums(args[0],output_file)
+            status = compute_md5sums(args[0],output_file,cache=cache)
         elif os.path.isfile(args[0]):
-            status = compute_md5sum_for_file(args[0],output_file)
+            status = compute_md5sum_for_file(args[0],output_file,cache=cache)
         else:
             p.error("Cannot generate checksums for '%s': not a "
                     "directory or file" % args[0])
+    # Report on cache usage
+    if cache is not None:
+        cache.close()
+        if arguments.verbose and (arguments.check or arguments.diff):
+            print("Cache: %d hits, %d misses, %d verified, %d stale"
+                  % (cache.n_hits,cache.n_misses,cache.n_verified,
+                     cache.n_stale))
     # Finish
     sys.exit(status)
@@ -0,0 +1,97 @@
+#######################################################################
+# Tests for cluster_load.py
+#######################################################################
+
+import unittest
+import os
+import tempfile
+import shutil
+import atexit
+from bcftbx.mockGE import setup_mock_GE
+from bcftbx.mockGE import MockGE
+from bcftbx.Pipeline import AdaptiveThrottle
+from cluster_load import Qstat
+from cluster_load import cluster_usage
+
+class TestClusterUsageWithMockGE(unittest.TestCase):
+    """Tests for 'cluster_usage' using mockGE to generate load
+    """
+    def setUp(self):
+        # Work in a temporary directory
+        self.cwd = os.getcwd()
+        self.top_dir = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree,self.top_dir,True)
+        os.chdir(self.top_dir)
+        # Set up mockGE utilities (runs up to 4 jobs at once)
+        self.database_dir = tempfile.mkdtemp(dir=self.top_dir)
+        self.bin_dir = tempfile.mkdtemp(dir=self.top_dir)
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.old_path
+        setup_mock_GE(bindir=self.bin_dir,
+                      database_dir=self.database_dir)
+        self.mock_ge = MockGE(database_dir=self.database_dir)
+
+    def tearDown(self):
+        self.mock_ge.stop()
+        os.environ['PATH'] = self.old_path
+        os.chdir(self.cwd)
+
+    def add_load(self,njobs):
+        # Submit an array job with long running tasks, and
+        # return the job id
+        self.mock_ge.qsub(['-b','y','-N','load','-t','1-%d' % njobs,
+                           'sleep','5'])
+        return Qstat(user='*').filter('name','load').jobs[0].id
+
+    def remove_load(self,job_id):
+        # Delete the tasks of the load job
+        self.mock_ge.qdel([job_id])
+        self.mock_ge.update_jobs()
+
+    def test_cluster_usage_no_load(self):
+        """cluster_usage: reports no jobs when cluster is empty
+        """
+        self.assertEqual(cluster_usage(),
+                         dict(running=0,pending=0,
+                              own_running=0,own_pending=0))
+
+    def test_cluster_usage_with_load(self):
+        """cluster_usage: reports running and pending jobs
+        """
+        job_id = self.add_load(6)
+        try:
+            self.assertEqual(cluster_usage(),
+                             dict(running=4,pending=2,
+                                  own_running=4,own_pending=2))
+            self.assertEqual(cluster_usage(user='nobody'),
+                             dict(running=4,pending=2,
+                                  own_running=0,own_pending=0))
+            self.assertEqual(cluster_usage(queue='other.q')['running'],0)
+        finally:
+            self.remove_load(job_id)
+        self.assertEqual(cluster_usage()['running'],0)
+
+    def test_adaptive_throttle_with_cluster_usage(self):
+        """AdaptiveThrottle: follows cluster load reported by cluster_usage
+        """
+        class Pipeline(object):
+            # Pipeline which is using all its slots
+            max_concurrent_jobs = 8
+            def nRunning(self):
+                return throttle.target
+            def nWaiting(self):
+                return 100
+        throttle = AdaptiveThrottle(2,10,cluster_usage,interval=0,
+                                    max_pending=1)
+        pipeline = Pipeline()
+        # Busy cluster
+        job_id = self.add_load(8)
+        try:
+            self.assertEqual(throttle.update(pipeline),4)
+            self.assertEqual(throttle.update(pipeline),2)
+            self.assertEqual(throttle.update(pipeline),2)
+        finally:
+            self.remove_load(job_id)
+        # Quiet cluster
+        self.assertEqual(throttle.update(pipeline),3)
+        self.assertEqual(throttle.update(pipeline),4)
@@ -6,10 +6,16 @@ import unittest
 import os
 import tempfile
 import shutil
+import json
+import io
 from bcftbx.Md5sum import Md5Checker
 from bcftbx.test.mock_data import TestUtils,ExampleDirLanguages
 from cmpdirs import yield_filepairs
+from cmpdirs import yield_extra_filepairs
+from cmpdirs import bounded_imap
+from cmpdirs import JsonReport
 from cmpdirs import cmp_filepair
+from cmpdirs import CmpResult
 from cmpdirs import cmp_dirs
 
 class TestYieldFilepairs(unittest.TestCase):
@@ -27,8 +33,9 @@ class TestYieldFilepairs(unittest.TestCase):
         # Get all files, links and directories in the example directory
         expected = self.d.filelist(include_links=True,include_dirs=True)
         # Remove any (non-link) directories from the expected list
-        expected = filter(lambda x: os.path.islink(x) or not os.path.isdir(x),
-                          expected)
+        expected = list(filter(lambda x: os.path.islink(x) or
+                               not os.path.isdir(x),
+                               expected))
         print("Expected = %s" % expected)
         # Get all file pairs from the example dir and a
         # dummy target directory name
@@ -69,6 +76,19 @@ class TestCmpFilepair(unittest.TestCase):
         f2 = TestUtils.make_file('test_file2',"lorum ipsum",basedir=self.wd)
         result = cmp_filepair((f1,f2))
         self.assertEqual(result.status,Md5Checker.MD5_FAILED)
+    def test_cmp_filepair_different_sizes(self):
+        """cmp_filepair flags mismatch between files with different sizes
+        """
+        # Make two different files and compare them
+        f1 = TestUtils.make_file('test_file1',"Lorum ipsum",basedir=self.wd)
+        f2 = TestUtils.make_file('test_file2',"Lorum ipsum dolor",
+                                 basedir=self.wd)
+        result = cmp_filepair((f1,f2))
+        self.assertEqual(result.status,Md5Checker.MD5_FAILED)
+        result = cmp_filepair((f1,f2),level=Md5Checker.CMP_SIZE)
+        self.assertEqual(result.status,Md5Checker.SIZES_DIFFER)
+        result = cmp_filepair((f1,f2),level=Md5Checker.CMP_TYPE)
+        self.assertEqual(result.status,Md5Checker.MD5_OK)
     def test_cmp_filepair_identical_links(self):
         """cmp_filepair matches identical links
         """
@@ -102,6 +122,86 @@ class TestCmpFilepair(unittest.TestCase):
         result = cmp_filepair((f1,f2))
         self.assertEqual(result.status,Md5Checker.TYPES_DIFFER)
 
+class TestYieldExtraFilepairs(unittest.TestCase):
+    def setUp(self):
+        # Create reference and copy directory structures
+        self.dref = ExampleDirLanguages()
+        self.dref.create_directory()
+        self.dcpy = ExampleDirLanguages()
+        self.dcpy.create_directory()
+    def tearDown(self):
+        # Delete example directory structures
+        self.dref.delete_directory()
+        self.dcpy.delete_directory()
+    def test_yield_extra_filepairs_identical_dirs(self):
+        """yield_extra_filepairs returns nothing for identical directories
+        """
+        pairs = list(yield_extra_filepairs(self.dref.dirn,self.dcpy.dirn))
+        self.assertEqual(pairs,[])
+    def test_yield_extra_filepairs(self):
+        """yield_extra_filepairs returns files only present in target
+        """
+        self.dcpy.add_file("extra","Additional file")
+        self.dcpy.add_file("new_dir/extra2","Another file")
+        pairs = sorted(yield_extra_filepairs(self.dref.dirn,self.dcpy.dirn))
+        expected = [(os.path.join(self.dref.dirn,f),
+                     os.path.join(self.dcpy.dirn,f))
+                    for f in ("extra","new_dir","new_dir/extra2")]
+        self.assertEqual(pairs,expected)
+
+class TestBoundedImap(unittest.TestCase):
+    def test_bounded_imap_serial(self):
+        """bounded_imap returns results in order using single thread
+        """
+        self.assertEqual(list(bounded_imap(lambda x: x*x,range(10))),
+                         [x*x for x in range(10)])
+    def test_bounded_imap_threads(self):
+        """bounded_imap returns results in order using multiple threads
+        """
+        self.assertEqual(list(bounded_imap(lambda x: x*x,range(100),n=4)),
+                         [x*x for x in range(100)])
+    def test_bounded_imap_limits_pending_items(self):
+        """bounded_imap doesn't consume iterable ahead of results
+        """
+        consumed = []
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+        results = bounded_imap(lambda x: x,items(),n=2,max_pending=5)
+        self.assertEqual(next(results),0)
+        self.assertTrue(len(consumed) <= 5)
+        self.assertEqual(list(results),list(range(1,100)))
+
+class TestJsonReport(unittest.TestCase):
+    def test_json_report(self):
+        """JsonReport writes a valid JSON report
+        """
+        fp = io.StringIO()
+        report = JsonReport(fp,'/data/dir1','/data/dir2')
+        report.add(CmpResult('/data/dir1/a','/data/dir2/a',
+                             Md5Checker.MD5_OK))
+        report.add(CmpResult('/data/dir1/b','/data/dir2/b',
+                             Md5Checker.MISSING_SOURCE))
+        report.close({ Md5Checker.MD5_OK: 1,
+                       Md5Checker.MISSING_SOURCE: 1 })
+        data = json.loads(fp.getvalue())
+        self.assertEqual(data['dir1'],'/data/dir1')
+        self.assertEqual(data['dir2'],'/data/dir2')
+        self.assertEqual([r['path'] for r in data['results']],['a','b'])
+        self.assertEqual([r['ok'] for r in data['results']],[True,False])
+        self.assertEqual(data['examined'],2)
+        self.assertEqual(data['verified'],1)
+    def test_json_report_no_results(self):
+        """JsonReport writes a valid JSON report when there are no results
+        """
+        fp = io.StringIO()
+        report = JsonReport(fp,'/data/dir1','/data/dir2')
+        report.close({})
+        data = json.loads(fp.getvalue())
+        self.assertEqual(data['results'],[])
+        self.assertEqual(data['examined'],0)
+
 class TestCmpDirs(unittest.TestCase):
     def setUp(self):
         # Create reference example directory structure which
@@ -139,4 +239,27 @@ class TestCmpDirs(unittest.TestCase):
         self.assertEqual(count[Md5Checker.LINKS_SAME],6)
         self.assertEqual(count[Md5Checker.MD5_FAILED],1)
         self.assertEqual(count[Md5Checker.LINKS_DIFFER],1)
-
+    def test_cmp_dirs_extra_files_in_target(self):
+        """cmp_dirs reports files which only exist in target
+        """
+        self.dcpy.add_file("extra","Additional file")
+        self.dcpy.add_link("destination","place/you/want/to/go")
+        count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,report_extra=True)
+        self.assertEqual(count[Md5Checker.MD5_OK],7)
+        self.assertEqual(count[Md5Checker.LINKS_SAME],6)
+        self.assertEqual(count[Md5Checker.MISSING_SOURCE],2)
+        # Extra files are ignored by default
+        count = cmp_dirs(self.dref.dirn,self.dcpy.dirn)
+        self.assertFalse(Md5Checker.MISSING_SOURCE in count)
+    def test_cmp_dirs_multiple_threads(self):
+        """cmp_dirs works for different directories using multiple threads
+        """
+        self.dref.add_file("more","Yet another file")
+        self.dcpy.add_file("more","Yet another file, again")
+        self.dref.add_link("where_to","somewhere")
+        self.dcpy.add_link("where_to","somewhere/else")
+        count = cmp_dirs(self.dref.dirn,self.dcpy.dirn,n=4)
+        self.assertEqual(count[Md5Checker.MD5_OK],7)
+        self.assertEqual(count[Md5Checker.LINKS_SAME],6)
+        self.assertEqual(count[Md5Checker.MD5_FAILED],1)
+        self.assertEqual(count[Md5Checker.LINKS_DIFFER],1)
@@ -0,0 +1,134 @@
+#######################################################################
+# Tests for job_metrics_summary.py
+#######################################################################
+
+import unittest
+import os
+import io
+import tempfile
+import shutil
+from job_metrics_summary import read_metrics
+from job_metrics_summary import peak_slots
+from job_metrics_summary import summarise_metrics
+from job_metrics_summary import format_time
+from job_metrics_summary import report
+
+# Example metrics (JSON lines)
+METRICS_JSON = u"""{"pipeline":"p1","name":"qc.1","job_id":"1","status":"Finished","exit_status":0,"submit_time":0.0,"start_time":10.0,"end_time":110.0,"queue_wait":10.0,"run_time":100.0,"queue":"serial.q","nslots":1,"max_rss":1024,"cpu_time":90.0}
+{"pipeline":"p1","name":"qc.2","job_id":"2","status":"Finished","exit_status":1,"submit_time":0.0,"start_time":20.0,"end_time":60.0,"queue_wait":20.0,"run_time":40.0,"queue":"serial.q","nslots":2,"max_rss":2048,"cpu_time":70.0}
+{"pipeline":"p1","name":"qc.3","job_id":null,"status":"Skipped","exit_status":null,"submit_time":null,"start_time":null,"end_time":null,"queue_wait":null,"run_time":null,"queue":null,"nslots":null,"max_rss":null,"cpu_time":null}
+{"pipeline":"p2","name":"qc.1","job_id":"3","status":"Finished","exit_status":0,"submit_time":200.0,"start_time":200.0,"end_time":300.0,"queue_wait":0.0,"run_time":100.0,"queue":"serial.q","nslots":1,"max_rss":1024,"cpu_time":90.0}
+"""
+
+# Example metrics (CSV)
+METRICS_CSV = u"""pipeline,name,label,group,job_id,working_dir,status,exit_status,submit_time,start_time,end_time,queue_wait,run_time,queue,nslots,max_rss,cpu_time
+p1,qc.1,1,"a,b",1,/data,Finished,0,0.0,10.0,110.0,10.0,100.0,serial.q,1,1024,90.0
+p1,qc.2,2,"a,b",2,/data,Finished,1,0.0,20.0,60.0,20.0,40.0,serial.q,2,2048,70.0
+"""
+
+class TestReadMetrics(unittest.TestCase):
+    """Tests for the 'read_metrics' function
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def _write(self,name,contents):
+        metrics_file = os.path.join(self.wd,name)
+        with io.open(metrics_file,'wt') as fp:
+            fp.write(contents)
+        return metrics_file
+
+    def test_read_metrics_json(self):
+        """read_metrics: read records from JSON lines file
+        """
+        records = read_metrics(self._write("metrics.json",METRICS_JSON))
+        self.assertEqual(len(records),4)
+        self.assertEqual(records[1]['name'],'qc.2')
+        self.assertEqual(records[1]['run_time'],40.0)
+        self.assertEqual(records[2]['run_time'],None)
+
+    def test_read_metrics_csv(self):
+        """read_metrics: read records from CSV file
+        """
+        records = read_metrics(self._write("metrics.csv",METRICS_CSV))
+        self.assertEqual(len(records),2)
+        self.assertEqual(records[0]['group'],'a,b')
+        self.assertEqual(records[1]['nslots'],2.0)
+        self.assertEqual(records[1]['exit_status'],1.0)
+
+class TestSummariseMetrics(unittest.TestCase):
+    """Tests for the 'summarise_metrics' function
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        metrics_file = os.path.join(self.wd,"metrics.json")
+        with io.open(metrics_file,'wt') as fp:
+            fp.write(METRICS_JSON)
+        self.records = read_metrics(metrics_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def test_peak_slots(self):
+        """peak_slots: return peak number of slots in use
+        """
+        self.assertEqual(peak_slots(self.records),3)
+        self.assertEqual(peak_slots(self.records[:1]+self.records[3:]),1)
+        self.assertEqual(peak_slots([]),0)
+
+    def test_summarise_metrics(self):
+        """summarise_metrics: summarise each pipeline
+        """
+        summaries = summarise_metrics(self.records,nslowest=1)
+        self.assertEqual(list(summaries.keys()),['p1','p2'])
+        summary = summaries['p1']
+        self.assertEqual(summary['njobs'],3)
+        self.assertEqual(summary['nfailed'],1)
+        self.assertEqual(summary['nskipped'],1)
+        self.assertEqual(summary['makespan'],110.0)
+        self.assertAlmostEqual(summary['throughput'],3/110.0*3600.0)
+        self.assertEqual(summary['slots'],3)
+        self.assertAlmostEqual(summary['utilisation'],180.0/330.0)
+        self.assertEqual(summary['mean_queue_wait'],15.0)
+        self.assertEqual(summary['max_queue_wait'],20.0)
+        self.assertEqual([job['name'] for job in summary['slowest']],
+                         ['qc.1'])
+        summary = summaries['p2']
+        self.assertEqual(summary['njobs'],1)
+        self.assertEqual(summary['makespan'],100.0)
+        self.assertEqual(summary['utilisation'],1.0)
+
+    def test_summarise_metrics_with_slots(self):
+        """summarise_metrics: use specified number of slots for utilisation
+        """
+        summary = summarise_metrics(self.records,slots=4)['p1']
+        self.assertEqual(summary['slots'],4)
+        self.assertAlmostEqual(summary['utilisation'],180.0/440.0)
+
+    def test_report(self):
+        """report: write summary for each pipeline
+        """
+        fp = io.StringIO()
+        report(summarise_metrics(self.records),fp=fp)
+        output = fp.getvalue()
+        self.assertTrue("Pipeline p1\n" in output)
+        self.assertTrue("Jobs            : 3 (1 failed, 1 skipped)\n"
+                        in output)
+        self.assertTrue("Makespan        : 0:01:50\n" in output)
+        self.assertTrue("Slot utilisation: 54.5% (of 3 slots)\n" in output)
+        self.assertTrue("    0:01:40 qc.1 (job 1)\n" in output)
+        self.assertTrue("Pipeline p2\n" in output)
+
+class TestFormatTime(unittest.TestCase):
+    """Tests for the 'format_time' function
+    """
+    def test_format_time(self):
+        """format_time: format time intervals
+        """
+        self.assertEqual(format_time(None),"n/a")
+        self.assertEqual(format_time(0),"0:00:00")
+        self.assertEqual(format_time(61.4),"0:01:01")
+        self.assertEqual(format_time(90061),"25:01:01")
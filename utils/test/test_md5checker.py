@@ -8,6 +8,7 @@ import io
 import tempfile
 import shutil
 from bcftbx.test.mock_data import TestUtils,ExampleDirScooby
+from bcftbx.Md5sum import Md5Cache
 from md5checker import diff_directories
 from md5checker import diff_files
 from md5checker import compute_md5sum_for_file
@@ -151,6 +152,20 @@ class TestDiffDirectoriesFunction(unittest.TestCase):
         self.assertNotEqual(diff_directories(self.dir2.dirn,
                                              self.dir1.dirn),0)
 
+    def test_same_dirs_with_cache(self):
+        """diff_directories: identical directories using checksum cache
+
+        """
+        cache_file = os.path.join(self.empty_dir1,"md5cache.sqlite")
+        with Md5Cache(cache_file) as cache:
+            self.assertEqual(diff_directories(self.dir1.dirn,self.dir2.dirn,
+                                              cache=cache),0)
+            self.assertEqual(cache.n_hits,0)
+        with Md5Cache(cache_file) as cache:
+            self.assertEqual(diff_directories(self.dir1.dirn,self.dir2.dirn,
+                                              cache=cache),0)
+            self.assertEqual(cache.n_misses,0)
+
     def test_broken_links(self):
         """diff_directories: handle broken links
 